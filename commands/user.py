@@ -534,9 +534,9 @@ class RecallCreatureCommand(commands.Command):
         if creature is None:
             # Not a valid name; try to find all creatures that match instead.
             options = []
-            for creature in things.creatures.creatureLoader.getAllFactories():
-                if name in creature.getName().lower():
-                    options.append(creature.getName())
+            for creatureName in things.creatures.creatureLoader.getNames():
+                if name in creatureName.lower():
+                    options.append(creatureName)
             if len(options) == 1:
                 # Exactly one match, so we've found what the user wants.
                 creature = things.creatures.creatureLoader.getFactory(options[0])
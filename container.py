@@ -48,13 +48,29 @@ WIELDABLES,
 ) = range(-18, 0)
 
 
+## Maps the IDs in SPECIAL_CONTAINERS to distinct bit flags. The GameMap uses
+# these to keep track of which special Containers each Cell has members of;
+# see GameMap.containerMask.
+SPECIAL_CONTAINER_TO_BIT = dict([(containerID, 1 << i) 
+        for i, containerID in enumerate(SPECIAL_CONTAINERS)])
+
+
+## Return the bitwise OR of the bit flags for the given special Container IDs.
+def getSpecialBits(*containerIDs):
+    result = 0
+    for containerID in containerIDs:
+        result |= SPECIAL_CONTAINER_TO_BIT[containerID]
+    return result
+
+
 ## This class is basically a wrapper around the builtin set class, though it's
 # very slightly smarter (you can set a callback to get notified when it empties,
 # and we may add more later). 
 # As a general rule, you should create new Containers by calling 
 # GameMap.makeContainer() instead of by making them directly. That way the 
-# GameMap can track the container for you. Only create Containers yourself if
-# they are transient (won't last beyond the current function call). 
+# GameMap can track the container for you (for as long as you hold onto it).
+# Only create Containers yourself if they are transient (won't last beyond the
+# current function call). 
 class Container:
     ## \param id Identifier for the Container. Uses a unique
     #         (auto-incrementing) numeric id by default. We only allow 
@@ -157,6 +173,29 @@ class Container:
 
 
 
+## A Container that is always empty. Since there's nothing in it, one
+# instance can be shared by everyone; see EMPTY_CONTAINER.
+class EmptyContainer(Container):
+    ## Refuse new members.
+    def subscribe(self, member):
+        raise RuntimeError("Tried to add %s to the shared empty Container." % member)
+
+
+    ## As subscribe().
+    def unionAdd(self, alt):
+        raise RuntimeError("Tried to add %s to the shared empty Container." % alt)
+
+
+    def __unicode__(self):
+        return u"<EmptyContainer %s>" % self.id
+
+
+## Shared EmptyContainer, returned by GameMap.getContainer() when asked for a
+# Container that doesn't exist.
+EMPTY_CONTAINER = EmptyContainer()
+
+
+
 ## Register Containers as a [de]serializable object class.
 util.serializer.registerObjectClass(Container.__name__, 
         lambda **kwargs: Container())
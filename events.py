@@ -1,58 +1,132 @@
+import bisect
 import threading
+import time
 
-## This module handles the event-passing system between the UI and the 
+## This module handles the event-passing system between the UI and the
 # devices. Objects may publish events, subscribe to them, and unsubscribe from
 # them.
-
-## Maps event types to lists of (priority, function) tuples to call when
-# those events occur.
+#
+# Events get published from several threads at once (the UI's, and those
+# executing Commands), and subscribers come and go while that happens. So
+# that publishing never has to wait on anyone, each event type's subscribers
+# are kept in a tuple that is never modified: subscribing or unsubscribing
+# builds a new tuple and swaps it in, and publish() just calls everyone in
+# whichever tuple was current when it started.
+
+## Maps event types to tuples of Subscriptions, sorted by priority, and then
+# by the order they subscribed in.
 eventToSubscriberMap = {}
 
 ## As eventToSubscriberMap, except that these subscribers only care about the
-# next event (i.e. they unsubscribe as soon as the event happens once).
+# next event (i.e. they unsubscribe as soon as the event happens once), and
+# are called in the order they subscribed in, after everyone else.
 eventToOneShotSubscribers = {}
 
-## Lock around the above two dicts.
+## Maps event types to how many of their Subscriptions in
+# eventToSubscriberMap have been cancelled but not yet removed.
+eventToNumCancelled = {}
+
+## Lock around changing the above three dicts. Only needed for changes.
 subscriberLock = threading.Lock()
 
+## Number of Subscriptions made so far; used to keep subscribers of equal
+# priority in the order they subscribed in.
+numSubscriptions = 0
+
+## Whether to record how long each event takes to dispatch.
+isTimingEnabled = False
+## Maps event types to [number of publishes, total seconds, most seconds]
+# lists describing how long they've taken to dispatch, while timing is
+# enabled. Times include any events published by the subscribers.
+eventToDispatchTimes = {}
+## Lock around changing eventToDispatchTimes.
+timingLock = threading.Lock()
+
+
+
+## A function that is subscribed to an event. Returned by subscribe(), so
+# that the subscriber can unsubscribe again quickly.
+class Subscription:
+    def __init__(self, eventType, func, priority, sequence):
+        self.eventType = eventType
+        self.func = func
+        self.priority = priority
+        ## Order we were made in, relative to other Subscriptions.
+        self.sequence = sequence
+        ## False once we've been cancelled.
+        self.isActive = True
+
+
+    ## Order by priority, then by age.
+    def __lt__(self, alt):
+        return (self.priority, self.sequence) < (alt.priority, alt.sequence)
+
+
+    ## Stop calling our function when our event occurs. This just marks us
+    # as inactive; we get removed from our event's subscribers for real once
+    # enough of them have been cancelled.
+    def cancel(self):
+        with subscriberLock:
+            if not self.isActive:
+                return
+            self.isActive = False
+            subscribers = eventToSubscriberMap.get(self.eventType, ())
+            numCancelled = eventToNumCancelled.get(self.eventType, 0) + 1
+            if numCancelled * 2 > len(subscribers):
+                eventToSubscriberMap[self.eventType] = tuple(
+                        s for s in subscribers if s.isActive)
+                numCancelled = 0
+            eventToNumCancelled[self.eventType] = numCancelled
+
+
+
 ## Pass the given event to all subscribers.
 def publish(eventType, *args, **kwargs):
-    for priority, subscribeFunc in eventToSubscriberMap.get(eventType, []):
-        subscribeFunc(*args, **kwargs)
-    with subscriberLock:
-        if eventType in eventToOneShotSubscribers:
-            for subscribeFunc in eventToOneShotSubscribers[eventType]:
-                subscribeFunc(*args, **kwargs)
-            del eventToOneShotSubscribers[eventType]
+    if isTimingEnabled:
+        start = time.time()
+    for subscription in eventToSubscriberMap.get(eventType, ()):
+        if subscription.isActive:
+            subscription.func(*args, **kwargs)
+    if eventType in eventToOneShotSubscribers:
+        with subscriberLock:
+            oneShotFuncs = eventToOneShotSubscribers.pop(eventType, ())
+        for subscribeFunc in oneShotFuncs:
+            subscribeFunc(*args, **kwargs)
+    if isTimingEnabled:
+        recordDispatchTime(eventType, time.time() - start)
 
 
 ## Add a new function to the list of those to call when the event occurs.
 # \param priority Determines what order functions are called in when the event
 #        occurs. Lower numbers go sooner.
+# \return A Subscription, which can be cancelled to unsubscribe.
 def subscribe(eventType, func, priority = 100):
+    global numSubscriptions
     with subscriberLock:
-        if eventType not in eventToSubscriberMap:
-            eventToSubscriberMap[eventType] = []
-        eventToSubscriberMap[eventType].append((priority, func))
-        eventToSubscriberMap[eventType].sort()
+        subscription = Subscription(eventType, func, priority,
+                numSubscriptions)
+        numSubscriptions += 1
+        subscribers = eventToSubscriberMap.get(eventType, ())
+        index = bisect.bisect(subscribers, subscription)
+        eventToSubscriberMap[eventType] = (subscribers[:index] +
+                (subscription,) + subscribers[index:])
+    return subscription
 
 
 ## Add a new function to do a one-shot subscription.
 def oneShotSubscribe(eventType, func):
     with subscriberLock:
-        if eventType not in eventToOneShotSubscribers:
-            eventToOneShotSubscribers[eventType] = []
-        eventToOneShotSubscribers[eventType].append(func)
+        eventToOneShotSubscribers[eventType] = (
+                eventToOneShotSubscribers.get(eventType, ()) + (func,))
 
 
-## Remove a function from the list of subscribers.
+## Remove a function from the list of subscribers. If you kept the
+# Subscription that subscribe() returned, cancelling it is quicker.
 def unsubscribe(eventType, func):
-    with subscriberLock:
-        curSubscribers = eventToSubscriberMap.get(eventType, [])
-        for i, (priority, subscriberFunc) in enumerate(curSubscribers):
-            if func == subscriberFunc:
-                del curSubscribers[i]
-                return
+    for subscription in eventToSubscriberMap.get(eventType, ()):
+        if subscription.isActive and subscription.func == func:
+            subscription.cancel()
+            return
 
 
 ## Call the specified function with the provided arguments, and then wait for
@@ -74,5 +148,23 @@ def executeAndWaitFor(eventType, func, *args, **kwargs):
         return result
 
 
-
-
+## Note that dispatching the given event took the given number of seconds.
+def recordDispatchTime(eventType, duration):
+    with timingLock:
+        if eventType not in eventToDispatchTimes:
+            eventToDispatchTimes[eventType] = [0, 0, 0]
+        times = eventToDispatchTimes[eventType]
+        times[0] += 1
+        times[1] += duration
+        times[2] = max(times[2], duration)
+
+
+## Return a list of (event type, number of publishes, total seconds, most
+# seconds) tuples describing how long events have taken to dispatch since
+# timing was enabled, slowest in total first.
+def getDispatchTimes():
+    with timingLock:
+        result = [(eventType,) + tuple(times)
+                for eventType, times in eventToDispatchTimes.iteritems()]
+    result.sort(key = lambda entry: entry[2], reverse = True)
+    return result
@@ -0,0 +1,128 @@
+import events
+
+import threading
+import time
+
+
+## Subscribers are called in order of priority, and in the order they
+# subscribed in when their priorities are the same.
+def test_subscribeOrder():
+    calls = []
+    for name, priority in [('a', 100), ('b', 50), ('c', 100), ('d', 150),
+            ('e', 50)]:
+        events.subscribe('test order',
+                lambda name = name: calls.append(name), priority)
+    events.publish('test order')
+    assert(calls == ['b', 'e', 'a', 'c', 'd'])
+
+
+## Cancelled Subscriptions and unsubscribed functions stop being called, and
+# the remaining subscribers stay in order as cancelled ones get cleared out.
+def test_unsubscribe():
+    calls = []
+    subscriptions = []
+    for i in xrange(10):
+        subscriptions.append(events.subscribe('test unsubscribe',
+                lambda i = i: calls.append(i)))
+    def func():
+        calls.append('func')
+    events.subscribe('test unsubscribe', func, 0)
+    for i in [1, 3, 4, 5, 7, 8]:
+        subscriptions[i].cancel()
+    # Cancelling twice is harmless.
+    subscriptions[1].cancel()
+    events.unsubscribe('test unsubscribe', func)
+    events.publish('test unsubscribe')
+    assert(calls == [0, 2, 6, 9])
+    assert(len(events.eventToSubscriberMap['test unsubscribe']) < 11)
+
+
+## Subscribing while an event is being published affects only later
+# publishes, but cancelling takes effect immediately.
+def test_changeWhilePublishing():
+    calls = []
+    def first():
+        calls.append('first')
+        secondSubscription.cancel()
+        events.subscribe('test change', lambda: calls.append('third'))
+    def second():
+        calls.append('second')
+    events.subscribe('test change', first, 0)
+    secondSubscription = events.subscribe('test change', second)
+    events.publish('test change')
+    assert(calls == ['first'])
+    del calls[:]
+    events.publish('test change')
+    assert(calls == ['first', 'third'])
+
+
+## One-shot subscribers are called once, after everyone else, with the
+# event's arguments.
+def test_oneShotSubscribe():
+    calls = []
+    events.subscribe('test one-shot', lambda value: calls.append('normal'))
+    events.oneShotSubscribe('test one-shot', calls.append)
+    events.publish('test one-shot', 1)
+    events.publish('test one-shot', 2)
+    assert(calls == ['normal', 1, 'normal'])
+
+
+## executeAndWaitFor() waits for the event from another thread, and returns
+# its argument.
+def test_executeAndWaitFor():
+    def publishLater():
+        time.sleep(.05)
+        events.publish('test wait', 'done')
+    result = events.executeAndWaitFor('test wait',
+            lambda: threading.Thread(target = publishLater).start())
+    assert(result == 'done')
+
+
+## Dispatch times are recorded only while timing is enabled.
+def test_dispatchTimes():
+    events.subscribe('test timing', lambda: time.sleep(.01))
+    events.publish('test timing')
+    events.isTimingEnabled = True
+    try:
+        events.publish('test timing')
+        events.publish('test timing')
+    finally:
+        events.isTimingEnabled = False
+    times = dict((entry[0], entry[1:])
+            for entry in events.getDispatchTimes())
+    count, total, most = times['test timing']
+    assert(count == 2)
+    assert(total >= .02)
+    assert(total >= most >= .01)
+
+
+## Publish events with many subscribers from several threads while others
+# subscribe and unsubscribe.
+def speedTest_publish():
+    for i in xrange(20):
+        events.subscribe('test speed', lambda value: None, i % 3)
+    def churn():
+        for i in xrange(2000):
+            events.subscribe('test speed', lambda value: None).cancel()
+    def publish():
+        for i in xrange(20000):
+            events.publish('test speed', i)
+    threads = [threading.Thread(target = churn)]
+    threads.extend(threading.Thread(target = publish) for i in xrange(4))
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print "Published 80000 events in %.2fs" % (time.time() - start)
+
+
+
+if __name__ == '__main__':
+    test_subscribeOrder()
+    test_unsubscribe()
+    test_changeWhilePublishing()
+    test_oneShotSubscribe()
+    test_executeAndWaitFor()
+    test_dispatchTimes()
+    speedTest_publish()
@@ -12,7 +12,7 @@ import sys
 
 ## Valid UI modes. These need to match the ordering of the "choices" parameter
 # in the pyrel module's commandline argument parser.
-[WX, CURSES, QT] = range(3)
+[WX, CURSES, QT, HEADLESS] = range(4)
 
 ## This class serves as a wrapper that provides access to the classes 
 # defined in a specific UI layer.
@@ -50,6 +50,8 @@ def setUIMode(mode):
         import cursesPyrel as guiPackage
     elif mode == QT:
         import qtPyrel as guiPackage
+    elif mode == HEADLESS:
+        import headlessPyrel as guiPackage
 
 
 ## Perform any necessary UI initialization (creating windows, etc.).
@@ -4,16 +4,14 @@ import artist
 import events
 import container
 import gui.colors
-import gui.flavors
 import procs.procData.element
 import util.fieldOfView
 import util.threads
 
 import numpy
 
-## Ordered list of what we want to draw -- the first thing to match gets 
-# displayed.
-DRAW_ORDER = [container.UPDATERS, container.ITEMS, container.TERRAIN]
+## Stats we show in the player status column, in order.
+STATUS_STAT_NAMES = ['STR', 'INT', 'WIS', 'DEX', 'CON', 'CHA']
 
 
 
@@ -54,6 +52,9 @@ class AsciiArtist(artist.Artist):
         ## Set of dirty cells -- cells that have been modified since the last
         # time we drew them.
         self.dirtyCells = set()
+        ## Number of map cells we had to redraw the last time we drew the
+        # map.
+        self.numDirtyCells = 0
         ## Maps cells to textual descriptions of what's displayed in them.
         self.cellToInfo = dict()
         ## Numpy array of booleans indicating if the given cell is visible
@@ -93,48 +94,7 @@ class AsciiArtist(artist.Artist):
     ## Return a (symbol, color) tuple indicating what to draw at the specified
     # map location.
     def getDisplayData(self, cellPos):
-        # Find the highest-priority item in the cell and set that as the 
-        # thing to be drawn.
-        allThings = self.player.coordsToCell[cellPos]
-        if not allThings:
-            # Nothing there; draw a . instead for visible cells, and nothing
-            # for non-visible ones.
-            if self.player.canSee(cellPos):
-                return ('.', 'WHITE')
-            return (' ', 'BLACK')
-        bestThing = None
-        bestLayerIndex = None
-        layers = set(DRAW_ORDER)
-        for thing in allThings:
-            memberships = self.gameMap.getMembershipsFor(thing)
-            for layer in layers.intersection(memberships):
-                layerIndex = DRAW_ORDER.index(layer)
-                if (bestThing is None or
-                        (layerIndex < bestLayerIndex and layer in memberships)):
-                    bestThing = thing
-                    bestLayerIndex = layerIndex
-            if bestLayerIndex == 0:
-                # Not going to get better than this.
-                break
-
-        if bestThing is None:
-            return None
-        
-        symbol = bestThing.display['ascii']['symbol']
-        color = bestThing.display['ascii']['color']
-        if color == 'flavor':
-            # Get the color based on the flavor of the item.
-            color = gui.flavors.getColorNameForFlavor(bestThing.flavor)
-            color = gui.colors.getColor(color)
-        # \todo Is there a better way to do this check?
-        elif type(color) in [str, unicode]:
-            # Map from a color name to the color tuple.
-            color = gui.colors.getColor(color)
-
-        # Darken the color if the cell is not in the player's field of view.
-        if not self.fovMap[cellPos]:
-            color = [c / 2 for c in color]
-        return (symbol, color)
+        return self.player.glyphLayer.getGlyph(cellPos)
 
 
     ## Draw the game view ASCII-style (i.e. one character per tile).
@@ -214,24 +174,35 @@ class AsciiArtist(artist.Artist):
         # Copy the player's visibility map so we're ready for next time.
         self.fovMap[:] = player.fovMap
 
-        # Make a copy since other threads may be modifying self.dirtyCells
-        # while we're busy drawing.
-        cellsToDraw = list(self.dirtyCells)
         if shouldRedrawAll:
-            cellsToDraw = [(x, y)
-                    for x in xrange(xMin, xMax)
-                    for y in xrange(yMin, yMax)]
-
-        for x, y in cellsToDraw:
-            if x < xMin or x > xMax or y < yMin or y > yMax:
-                continue
-            symbol, color = self.getDisplayData((x, y))
-            self.drawChar(dc, symbol, color, 
-                    x - xMin + self.numPlayerColumns, y - yMin)
+            self.numDirtyCells = (xMax - xMin) * (yMax - yMin)
+            self.drawAllCells(dc, xMin, xMax, yMin, yMax)
+        else:
+            self.numDirtyCells = len(self.dirtyCells)
+            # Make a copy since other threads may be modifying 
+            # self.dirtyCells while we're busy drawing.
+            for x, y in list(self.dirtyCells):
+                if x < xMin or x > xMax or y < yMin or y > yMax:
+                    continue
+                symbol, color = self.getDisplayData((x, y))
+                self.drawChar(dc, symbol, color, 
+                        x - xMin + self.numPlayerColumns, y - yMin)
         self.boundingBox = (xMin, xMax, yMin, yMax)
         self.dirtyCells.clear()
 
 
+    ## Draw every map cell in the given range (with the maximums exclusive).
+    def drawAllCells(self, dc, xMin, xMax, yMin, yMax):
+        # Look up everything in view at once.
+        glyphLayer = self.player.glyphLayer
+        symbols, colors = glyphLayer.getGlyphIndices(xMin, xMax, yMin, yMax)
+        for x, column in enumerate(symbols.tolist()):
+            for y, symbolIndex in enumerate(column):
+                self.drawChar(dc, glyphLayer.symbols[symbolIndex], 
+                        glyphLayer.colors[colors.item(x, y)],
+                        x + self.numPlayerColumns, y)
+
+
     ## Draw the player status information, a fairly narrow but long column.
     def drawPlayerStatus(self, dc):
         player = self.gameMap.getContainer(container.PLAYERS)[0]
@@ -265,7 +236,7 @@ class AsciiArtist(artist.Artist):
 
         # Draw current stat values
         # \todo Recognize drained stats (how?)
-        for statName in ['STR', 'INT', 'WIS', 'DEX', 'CON', 'CHA']:
+        for statName in STATUS_STAT_NAMES:
             curVal = player.getStat(statName)
             self.writeString(dc, (255, 255, 255), 0, curRow, 
                     "%s:" % statName)
@@ -287,6 +258,20 @@ class AsciiArtist(artist.Artist):
                 curRow += 1
 
 
+    ## Return a tuple of everything drawPlayerStatus() shows, so that artists
+    # can tell whether it needs drawing again.
+    def getPlayerStatus(self):
+        player = self.gameMap.getContainer(container.PLAYERS)[0]
+        result = [player.curHitpoints, player.getStat('maxHitpoints'),
+                player.getStat('curSpellpoints'),
+                player.getStat('maxSpellpoints')]
+        result.extend(player.getStat(statName)
+                for statName in STATUS_STAT_NAMES)
+        result.extend(player.getStat('resist %s' % element.name) <= 0
+                for element in procs.procData.element.getAllElements())
+        return tuple(result)
+
+
     ## Display a one-line string at the provided position.
     # The color is a color name, and not a UI-native color
     # \param info Optional string describing the contents being drawn.
@@ -1,4 +1,6 @@
+import Queue
 import threading
+import traceback
 import types
 
 import commands
@@ -8,6 +10,11 @@ import gui
 
 
 
+## Most Commands that may wait to be executed; keys pressed while this many
+# are already waiting are dropped, so that holding down a movement key doesn't
+# leave the player walking long after it's released.
+MAX_PENDING_COMMANDS = 2
+
 ## Encapsulates the common data structures and routines used in the main
 # frame across UI implementations to handle communications between user
 # command execution and their respective prompts
@@ -16,6 +23,15 @@ class CommandHandler(object):
         super(CommandHandler, self).__init__()
         ## Current active prompt.
         self.curPrompt = None
+        ## Command IDs waiting to be executed by our command thread.
+        self.pendingCommands = Queue.Queue(MAX_PENDING_COMMANDS)
+        ## Whether we have a thread executing Commands from
+        # self.pendingCommands. There's never more than one, and it stops
+        # once the queue is empty.
+        self.isCommandThreadRunning = False
+        ## Lock around self.pendingCommands and self.isCommandThreadRunning,
+        # so no command ID gets left in the queue as the thread stops.
+        self.commandLock = threading.Lock()
         events.subscribe('resolve prompt', self.onResolvePrompt)
         events.subscribe('execute command', self.executeCommandId)
         events.subscribe('command execution complete', self.update)
@@ -48,9 +64,60 @@ class CommandHandler(object):
                     # Resolve a new prompt.
                     gui.prompt.resolvePrompt(nextPrompt)
         else:
-            # Create a new Command in a new thread to handle the input.
-            threading.Thread(target = self.executeCommandId,
-                    args = [gui.keymap.convertKeyToCommand(keyEvent)]).start()
+            # Hand the input off to our command thread.
+            self.queueCommandId(gui.keymap.convertKeyToCommand(keyEvent))
+
+
+    ## Have our command thread execute the given command ID once it's done
+    # with the ones before it. Commands can't run in the thread that takes
+    # input, as they block while their prompts are up.
+    # \return False if too many Commands are waiting already, so the command
+    #         ID was dropped.
+    def queueCommandId(self, commandId):
+        if commandId is None:
+            # Not a valid input.
+            return True
+        with self.commandLock:
+            try:
+                self.pendingCommands.put_nowait(commandId)
+            except Queue.Full:
+                return False
+            if not self.isCommandThreadRunning:
+                self.isCommandThreadRunning = True
+                threading.Thread(target = self.executePendingCommands).start()
+        return True
+
+
+    ## Execute queued command IDs, in order, until there are none left.
+    def executePendingCommands(self):
+        try:
+            while True:
+                with self.commandLock:
+                    try:
+                        commandId = self.pendingCommands.get_nowait()
+                    except Queue.Empty:
+                        self.isCommandThreadRunning = False
+                        return
+                self.runCommand(commandId)
+        except:
+            # A Command ended the thread (e.g. by exiting after the player
+            # died); let a new thread handle anything queued in the meantime.
+            with self.commandLock:
+                if self.pendingCommands.empty():
+                    self.isCommandThreadRunning = False
+                else:
+                    threading.Thread(
+                            target = self.executePendingCommands).start()
+            raise
+
+
+    ## Execute a command ID from our queue, reporting any errors rather than
+    # letting them stop our command thread.
+    def runCommand(self, commandId):
+        try:
+            self.executeCommandId(commandId)
+        except Exception:
+            traceback.print_exc()
 
 
     ## Given an input command ID, construct a Command and execute it.
@@ -3,6 +3,8 @@ import container
 import gui.colors
 import util.threads
 
+import numpy
+
 
 ## Artist that imitates an ASCII-mode drawing style.
 # Provides a common UI drawing abstractions for prompts
@@ -14,6 +16,14 @@ class AsciiArtist(gui.base.artists.ascii.AsciiArtist):
         # used to determine if full screen redraw is required when map
         # display shifts
         self.lastUpperLeftCorner = (None, None)
+        ## GlyphLayer that the two arrays below are for.
+        self.glyphTableLayer = None
+        ## Array mapping indices into our GlyphLayer's symbols to their
+        # character codes.
+        self.symbolToChar = numpy.zeros(0, dtype = numpy.int32)
+        ## Array mapping indices into our GlyphLayer's colors to the color
+        # pairs we draw them with.
+        self.colorToPair = numpy.zeros(0, dtype = numpy.int16)
 
 
     ## A single text character is the highest resolution
@@ -54,6 +64,35 @@ class AsciiArtist(gui.base.artists.ascii.AsciiArtist):
                     self.drawChar(dc, symbol, color, x-xMin, y-yMin)
 
 
+    ## Draw every map cell in the given range (with the maximums exclusive),
+    # as a single block of our GlyphLayer's symbols and colors.
+    def drawAllCells(self, dc, xMin, xMax, yMin, yMax):
+        glyphLayer = self.player.glyphLayer
+        symbols, colors = glyphLayer.getGlyphIndices(xMin, xMax, yMin, yMax)
+        self.updateGlyphTables(dc, glyphLayer)
+        dc.cellBuffer.drawBlock(self.numPlayerColumns, 0,
+                self.symbolToChar[symbols], self.colorToPair[colors])
+
+
+    ## Bring self.symbolToChar and self.colorToPair up to date with the
+    # symbols and colors the given GlyphLayer knows about.
+    def updateGlyphTables(self, dc, glyphLayer):
+        if glyphLayer is not self.glyphTableLayer:
+            self.glyphTableLayer = glyphLayer
+            self.symbolToChar = self.symbolToChar[:0]
+            self.colorToPair = self.colorToPair[:0]
+        numSymbols = len(self.symbolToChar)
+        if numSymbols < len(glyphLayer.symbols):
+            newChars = [ord(symbol)
+                    for symbol in glyphLayer.symbols[numSymbols:]]
+            self.symbolToChar = numpy.append(self.symbolToChar,
+                    numpy.array(newChars, dtype = numpy.int32))
+        numColors = len(self.colorToPair)
+        if numColors < len(glyphLayer.colors):
+            self.colorToPair = numpy.append(self.colorToPair,
+                    dc.getColorPairs(glyphLayer.colors[numColors:]))
+
+
     ## Draw a character of the specified color at the specified position.
     # \param dc drawingcontext for lower level graphics drawing
     # \param color either rgb tuple or name of color in gui.colors map
@@ -62,9 +101,11 @@ class AsciiArtist(gui.base.artists.ascii.AsciiArtist):
 
 
     ## Draw a rectangle of the specified color over the given cell range.
+    # If width or height is -1, that means "the full width" or "the full
+    # height".
+    # \todo Use the color; we just blank the region for now.
     def drawRectangle(self, dc, color, x, y, width, height):
-        # \todo actually clear the region in question.
-        dc.window.erase()
+        dc.cellBuffer.fill(x, y, width, height)
 
     ## Display a one-line string at the provided position.
     # The color is a color name, and not a UI-native color
@@ -76,10 +117,5 @@ class AsciiArtist(gui.base.artists.ascii.AsciiArtist):
 
     ## Copy the map bitmap over by the specified offset.
     def copyMapTo(self, dc, xOffset, yOffset):
-        dc.window.overwrite(dc.window,
-                            min(xOffset,0),
-                            min(yOffset,0),
-                            max(xOffset,0),
-                            max(yOffset,0),
-                            self.numRows - max(0,xOffset),
-                            self.numColumns - max(0,yOffset))
+        dc.cellBuffer.scroll(self.numPlayerColumns, self.numColumns,
+                             0, self.numRows, xOffset, yOffset)
@@ -0,0 +1,133 @@
+## This module holds an off-screen copy of the curses display, so we can
+# send the terminal only what has changed since the last frame.
+#
+# Talking to curses one character at a time is slow: every addstr call has
+# to go through the curses library, and a full redraw of a big terminal is
+# thousands of them. So the artist and prompts draw into a CellBuffer
+# instead, which records the character and color pair for each cell in
+# NumPy arrays. Once a frame is done, we compare those arrays against what
+# we last sent to the window, and gather the changed cells in each row into
+# runs of the same color pair, so that each run takes a single addstr call.
+
+import numpy
+
+## Character code for cells we don't know the contents of.
+UNKNOWN = -1
+
+
+
+class CellBuffer:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        ## Character code to show in each cell, indexed by [x, y].
+        self.chars = numpy.empty((width, height), dtype = numpy.int32)
+        self.chars.fill(ord(' '))
+        ## Curses color pair to show each cell in.
+        self.pairs = numpy.zeros((width, height), dtype = numpy.int16)
+        ## What we last sent to the window for each cell; initially nothing
+        # we know about, so the first flush sends everything.
+        self.shownChars = numpy.empty((width, height), dtype = numpy.int32)
+        self.shownChars.fill(UNKNOWN)
+        ## Color pair we last sent to the window for each cell.
+        self.shownPairs = numpy.zeros((width, height), dtype = numpy.int16)
+
+
+    ## Draw the given string, starting at the given cell and heading right,
+    # in the given color pair. Anything that falls outside the buffer is
+    # dropped.
+    def drawText(self, text, x, y, pair):
+        if not (0 <= y < self.height) or x >= self.width:
+            return
+        if x < 0:
+            text = text[-x:]
+            x = 0
+        text = text[:self.width - x]
+        if not text:
+            return
+        if len(text) == 1:
+            self.chars[x, y] = ord(text)
+            self.pairs[x, y] = pair
+            return
+        self.chars[x:x + len(text), y] = [ord(char) for char in text]
+        self.pairs[x:x + len(text), y] = pair
+
+
+    ## Draw a block of cells at once.
+    # \param x Column of the left edge of the block.
+    # \param y Row of the top edge of the block.
+    # \param chars Array of character codes, indexed by [x, y].
+    # \param pairs Matching array of color pairs.
+    def drawBlock(self, x, y, chars, pairs):
+        width = min(chars.shape[0], self.width - x)
+        height = min(chars.shape[1], self.height - y)
+        if width <= 0 or height <= 0:
+            return
+        self.chars[x:x + width, y:y + height] = chars[:width, :height]
+        self.pairs[x:x + width, y:y + height] = pairs[:width, :height]
+
+
+    ## Blank out the given rectangle of cells. A width or height of -1 means
+    # "all the way to the edge".
+    def fill(self, x = 0, y = 0, width = -1, height = -1):
+        if width == -1:
+            width = self.width - x
+        if height == -1:
+            height = self.height - y
+        self.chars[x:x + width, y:y + height] = ord(' ')
+        self.pairs[x:x + width, y:y + height] = 0
+
+
+    ## Move the contents of the given rectangle of cells (with the maximums
+    # exclusive) by the given offset. Cells the rectangle moves away from
+    # keep their old contents, and nothing moves outside of the rectangle.
+    def scroll(self, xMin, xMax, yMin, yMax, dx, dy):
+        width = xMax - xMin - abs(dx)
+        height = yMax - yMin - abs(dy)
+        if width <= 0 or height <= 0:
+            return
+        source = (slice(xMin + max(0, -dx), xMin + max(0, -dx) + width),
+                slice(yMin + max(0, -dy), yMin + max(0, -dy) + height))
+        target = (slice(xMin + max(0, dx), xMin + max(0, dx) + width),
+                slice(yMin + max(0, dy), yMin + max(0, dy) + height))
+        # Copy, since the source and target may overlap.
+        self.chars[target] = self.chars[source].copy()
+        self.pairs[target] = self.pairs[source].copy()
+
+
+    ## Forget what the window shows, so the next flush sends everything.
+    def invalidate(self):
+        self.shownChars.fill(UNKNOWN)
+
+
+    ## Return a list of (x, y, text, pair) tuples of the runs of text that
+    # need to be sent to the window to bring it up to date, and assume that
+    # they will be. Each run is a stretch of cells in one row that share a
+    # color pair and includes at least one changed cell; unchanged cells
+    # between changed ones in the same run get sent along with them, as
+    # that's cheaper than starting a new run.
+    def getChangedRuns(self):
+        # Work in [y, x] order, so each row is contiguous.
+        chars = self.chars.T
+        pairs = self.pairs.T
+        isChanged = (chars != self.shownChars.T) | (pairs != self.shownPairs.T)
+        result = []
+        for y in numpy.nonzero(isChanged.any(axis = 1))[0].tolist():
+            changedXs = numpy.nonzero(isChanged[y])[0]
+            start, end = changedXs[0], changedXs[-1] + 1
+            rowPairs = pairs[y, start:end]
+            # Split the row wherever the color pair changes.
+            breaks = numpy.nonzero(rowPairs[1:] != rowPairs[:-1])[0] + 1
+            runStarts = [0] + breaks.tolist()
+            runEnds = breaks.tolist() + [end - start]
+            rowChanges = isChanged[y, start:end]
+            rowChars = chars[y, start:end].tolist()
+            for runStart, runEnd in zip(runStarts, runEnds):
+                if not rowChanges[runStart:runEnd].any():
+                    continue
+                text = u''.join(map(unichr, rowChars[runStart:runEnd]))
+                result.append((start + runStart, y, text,
+                        rowPairs.item(runStart)))
+        self.shownChars[:] = self.chars
+        self.shownPairs[:] = self.pairs
+        return result
@@ -2,6 +2,8 @@ import curses
 
 import gui.colors
 
+import numpy
+
 
 ## Finds the magnitude of distance (squared) between two rgb vectors
 # \param rgb1 - (red, green, blue) tuple
@@ -35,10 +37,16 @@ XTERM_16_RGB_COLORS = [
 # This class implements a singleton cache shared by all DrawingContext
 # instances.  It will map any rgb color tuple to its nearest xterm color
 class TermColorMap(dict):
-    def __init__(self):
+    ## \param numColors Number of colors the terminal supports; by default,
+    #        ask curses, and set up a color pair for each color. If given,
+    #        we just work out colors, without touching the terminal.
+    def __init__(self, numColors = None):
         super(TermColorMap, self).__init__()
 
-        if curses.COLORS >= 256:
+        shouldInitPairs = numColors is None
+        if numColors is None:
+            numColors = curses.COLORS
+        if numColors >= 256:
             #  of a 256 color term.
             self.COLORS = 256
             cincr = [0] + [95+40*n for n in range(5)]
@@ -46,72 +54,102 @@ class TermColorMap(dict):
             rgbToTerm = dict(zip(range(16, len(rgbToTerm)+16), rgbToTerm))
             rgbToTerm.update(zip(range(232,256),
                                  [(n,n,n) for n in range(8,248,10)]))
-        elif curses.COLORS in [8,16]:
-            self.COLORS = curses.COLORS
+        elif numColors in [8,16]:
+            self.COLORS = numColors
             rgbToTerm = dict(zip(range(self.COLORS),
                                  XTERM_16_RGB_COLORS[:self.COLORS]))
         #initialize a corresponding color_pair (foreground, background)
         #with background set to black for each of the 256 colors
         #These color pairs are used by DrawingContext drawing primitives
         for color in rgbToTerm.keys():
-            if color > 0:  # term color 0 is fixed to white in curses
+            if color > 0 and shouldInitPairs:  # term color 0 is fixed to white in curses
                 assert color < curses.COLOR_PAIRS
                 curses.init_pair(color, color, 0)
         self.rgbToTerm = rgbToTerm
+        ## Sorted array of the term color indices, and a matching array of
+        # their rgb values, for finding the nearest colors in bulk.
+        self.termIndices = numpy.array(sorted(rgbToTerm.keys()))
+        self.termRGBs = numpy.array([rgbToTerm[k] for k in self.termIndices],
+                                    dtype = numpy.float)
 
     ## Finds the standard 256 term color index closest to the given rgb color
     # \param rgb - (red, green, blue) tuple
     def __missing__(self, rgb):
-        term_color = min([(color_distance(rgb, v), k)
-                         for k, v in self.rgbToTerm.iteritems()])[1]
+        term_color = self.getTermColors([rgb]).item(0)
         self[rgb] = term_color
         return term_color
 
+    ## Finds the term color indices closest to each of a sequence of rgb
+    # colors at once. Ties go to the lowest index, as for single colors.
+    # \param rgbs - sequence or (N, 3) array of (red, green, blue) colors
+    def getTermColors(self, rgbs):
+        rgbs = numpy.asarray(rgbs, dtype = numpy.float).reshape(-1, 3)
+        # Squared distance from each color to each term color.
+        distances = ((rgbs[:, numpy.newaxis, :] -
+                      self.termRGBs[numpy.newaxis, :, :]) ** 2).sum(axis = 2)
+        return self.termIndices[distances.argmin(axis = 1)]
+
 ## Singleton instance of TermColorMap
 termColorMap = None
 
-## Manages TermColorMap singleton and access to its map
-# \param rgb color tuple
-def mapTermColor(rgb):
+## Manages TermColorMap singleton
+def getTermColorMap():
     global termColorMap
     if termColorMap is None:
         termColorMap = TermColorMap()
-    return termColorMap[rgb]
+    return termColorMap
+
+## Access to the TermColorMap singleton's map
+# \param rgb color tuple
+def mapTermColor(rgb):
+    return getTermColorMap()[rgb]
 
 ## Abstraction of lower level drawing primitives available to Artist
 # classes and prompt drawing methods.  Ideally, all calls to curses drawing
 # primitives should appear in this class.
+# Drawing goes into a cellBuffer.CellBuffer that outlives the context, and
+# reaches the window when flush() sends it whatever changed since last time.
 # \todo support more curses drawing attributes (reverse fg/bg colors, bold, blink?)
 class DrawingContext(object):
-    def __init__(self, window):
+    def __init__(self, window, cellBuffer):
         self.hasColors = curses.has_colors() and curses.COLORS >= 8
         self.window = window
-
-
-    ## method to ensure position text can be passed to curses API
-    def isTextInBounds(self, x, y, text):
-        yMin, xMin = self.window.getbegyx()
-        if x < xMin or y < yMin:
-            return False
-        yMax, xMax = self.window.getmaxyx()
-        if x > xMax or y > yMax:
-            return False
-        return True
+        self.cellBuffer = cellBuffer
 
 
     ## clears all text from window
     def Clear(self):
-        self.window.erase()
+        self.cellBuffer.fill()
+        # Whatever the window shows now, the next flush will overwrite it.
+        self.cellBuffer.invalidate()
+
+
+    ## Return the color pair to draw the given color with.
+    # \param color either rgb tuple or name of color in gui.colors map
+    def getColorPair(self, color):
+        if not self.hasColors or color is None:
+            return 0
+        if isinstance(color,basestring):
+            color = gui.colors.getColor(color)
+        return mapTermColor(tuple(color))
+
+
+    ## Return an array of the color pairs to draw each of the given rgb
+    # colors with.
+    def getColorPairs(self, rgbs):
+        if not self.hasColors:
+            return numpy.zeros(len(rgbs), dtype = numpy.int16)
+        return getTermColorMap().getTermColors(rgbs).astype(numpy.int16)
 
 
     ## draw positioned colored text to window
     def DrawText(self, text, x, y, color=None):
-        if not self.isTextInBounds(x, y, text):
-            return
-        if self.hasColors and color is not None:
-            if isinstance(color,basestring):
-                color = gui.colors.getColor(color)
-            term_color = mapTermColor(tuple(color))
-            self.window.addstr(y, x, text.encode('utf-8'), curses.color_pair(term_color))
-        else:
-            self.window.addstr(y, x, text.encode('utf-8'))
+        self.cellBuffer.drawText(text, x, y, self.getColorPair(color))
+
+
+    ## Send everything that's changed in our cellBuffer to the window, one
+    # addstr per run of same-colored text.
+    def flush(self):
+        for x, y, text, pair in self.cellBuffer.getChangedRuns():
+            self.window.addstr(y, x, text.encode('utf-8'),
+                    curses.color_pair(pair))
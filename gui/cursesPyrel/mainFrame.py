@@ -3,6 +3,7 @@ import curses
 import time
 
 import artists.ascii
+import cellBuffer
 import drawingcontext
 import events
 import gui.base
@@ -25,15 +26,19 @@ class MainFrame(frame.Frame,gui.base.CommandHandler):
         ## Whether or not we should force-clear the entire view the next
         # time we draw.
         self.shouldForceClear = True
+        ## Off-screen copy of our window's contents, which the artist draws
+        # into; kept between frames so we only send the window what changes.
+        self.cellBuffer = cellBuffer.CellBuffer(self.width, self.height)
         events.subscribe('user quit', self.onQuit)
 
     # draw map to window and flush buffer to screen
     def Refresh(self, shouldRedrawAll=False):
-        dc = drawingcontext.DrawingContext(self.window)
+        dc = drawingcontext.DrawingContext(self.window, self.cellBuffer)
         if self.shouldForceClear:
             dc.Clear()
         self.artist.draw(dc, self.width, self.height, self.curPrompt,
                          shouldRedrawAll or self.shouldForceClear)
+        dc.flush()
         self.shouldForceClear = False
         self.windowRefresh()
         curses.doupdate()
@@ -0,0 +1,249 @@
+import pyximport; pyximport.install()
+import mapgen.gameMap
+
+import gui
+import gui.base.artists.ascii
+import gui.colors
+import gui.cursesPyrel.artists.ascii
+import gui.cursesPyrel.cellBuffer
+import gui.cursesPyrel.drawingcontext
+import gui.glyphLayer_test
+import things.creatures.player
+import util.serializer_test
+
+import curses
+import numpy
+import random
+import time
+
+
+## Stands in for a curses window, recording what gets written to it.
+class DummyWindow:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        ## Maps (column, row) positions to the (character, attribute) tuple
+        # last written there.
+        self.screen = {}
+        ## Number of times addstr has been called.
+        self.numCalls = 0
+
+
+    def addstr(self, y, x, text, attribute = 0):
+        self.numCalls += 1
+        for i, char in enumerate(text.decode('utf-8')):
+            self.screen[(x + i, y)] = (char, attribute)
+
+
+    def getbegyx(self):
+        return (0, 0)
+
+
+    def getmaxyx(self):
+        return (self.height, self.width)
+
+
+
+## DrawingContext that doesn't need curses to be running.
+class DummyDrawingContext(gui.cursesPyrel.drawingcontext.DrawingContext):
+    def __init__(self, window, cellBuffer):
+        self.hasColors = True
+        self.window = window
+        self.cellBuffer = cellBuffer
+
+
+
+## DrawingContext that sends every piece of text straight to the window, the
+# way DrawingContexts used to.
+class SlowDrawingContext(DummyDrawingContext):
+    def isTextInBounds(self, x, y, text):
+        yMin, xMin = self.window.getbegyx()
+        if x < xMin or y < yMin:
+            return False
+        yMax, xMax = self.window.getmaxyx()
+        if x > xMax or y > yMax:
+            return False
+        return True
+
+
+    def DrawText(self, text, x, y, color = None):
+        if not self.isTextInBounds(x, y, text):
+            return
+        self.window.addstr(y, x, text.encode('utf-8'),
+                curses.color_pair(self.getColorPair(color)))
+
+
+    def flush(self):
+        pass
+
+
+
+## Curses artist that draws every map cell a character at a time, the way
+# the base AsciiArtist does.
+class CharByCharArtist(gui.cursesPyrel.artists.ascii.AsciiArtist):
+    def drawAllCells(self, dc, xMin, xMax, yMin, yMax):
+        gui.base.artists.ascii.AsciiArtist.drawAllCells(self, dc,
+                xMin, xMax, yMin, yMax)
+
+
+
+## Use a 256-color TermColorMap, and let color pairs be their own attributes,
+# so we can draw without a terminal.
+def setUpColors():
+    gui.cursesPyrel.drawingcontext.termColorMap = (
+            gui.cursesPyrel.drawingcontext.TermColorMap(256))
+    curses.color_pair = lambda pair: pair
+
+
+## Check that the window shows exactly what's in the given CellBuffer.
+def checkWindow(window, cellBuffer):
+    for x in xrange(cellBuffer.width):
+        for y in xrange(cellBuffer.height):
+            assert window.screen[(x, y)] == (unichr(cellBuffer.chars[x, y]),
+                    cellBuffer.pairs[x, y])
+
+
+## Make a level big enough to fill a 200x60 display.
+def makeBigLevel():
+    gui.messenger.message = lambda message: None
+    util.serializer_test.loadDataFiles()
+    random.seed(0)
+    gameMap = mapgen.gameMap.GameMap(240, 120)
+    things.creatures.player.debugMakePlayer(gameMap)
+    gameMap.makeLevel(1)
+    gameMap.getPlayer().updateFOV()
+    return gameMap
+
+
+## Bulk lookups of terminal colors find the same colors as looking them up
+# one at a time the old way.
+def test_getTermColors():
+    rng = random.Random(0)
+    rgbs = [tuple(gui.colors.getColor(name)) for name in gui.colors.COLOR_MAP]
+    # A few color names have something other than RGB values.
+    rgbs = [rgb for rgb in rgbs if len(rgb) == 3]
+    rgbs += [tuple(rng.randint(0, 255) for i in xrange(3))
+            for j in xrange(500)]
+    for numColors in [8, 16, 256]:
+        termColorMap = gui.cursesPyrel.drawingcontext.TermColorMap(numColors)
+        termColors = termColorMap.getTermColors(rgbs)
+        for rgb, termColor in zip(rgbs, termColors):
+            expected = min([
+                    (gui.cursesPyrel.drawingcontext.color_distance(rgb, v), k)
+                    for k, v in termColorMap.rgbToTerm.iteritems()])[1]
+            assert termColor == expected
+            assert termColorMap[rgb] == expected
+
+
+## Flushing a CellBuffer sends the window everything that changed, in
+# maximal runs of one color, and nothing if nothing changed.
+def test_getChangedRuns():
+    rng = random.Random(1)
+    width, height = 30, 8
+    cellBuffer = gui.cursesPyrel.cellBuffer.CellBuffer(width, height)
+    window = DummyWindow(width, height)
+    for frame in xrange(50):
+        for i in xrange(rng.randint(0, 20)):
+            text = u''.join(rng.choice(u'#.@\u00b7')
+                    for j in xrange(rng.randint(1, 10)))
+            cellBuffer.drawText(text, rng.randint(-5, width),
+                    rng.randint(-1, height), rng.randint(0, 3))
+        if rng.random() < .2:
+            cellBuffer.fill(rng.randint(0, 10), rng.randint(0, 4), -1,
+                    rng.randint(1, 3))
+        runs = cellBuffer.getChangedRuns()
+        for (x, y, text, pair), (nextX, nextY, nextText, nextPair) in zip(
+                runs, runs[1:]):
+            assert (y, x + len(text)) <= (nextY, nextX)
+            if y == nextY and x + len(text) == nextX:
+                # Adjacent runs should have been one run.
+                assert pair != nextPair
+        for x, y, text, pair in runs:
+            window.addstr(y, x, text.encode('utf-8'), pair)
+        checkWindow(window, cellBuffer)
+        assert cellBuffer.getChangedRuns() == []
+
+
+## Scrolling a rectangle of a CellBuffer moves its contents as expected.
+def test_scroll():
+    rng = random.Random(2)
+    for trial in xrange(50):
+        cellBuffer = gui.cursesPyrel.cellBuffer.CellBuffer(12, 9)
+        cellBuffer.chars[:] = numpy.arange(12 * 9).reshape(12, 9)
+        expected = cellBuffer.chars.copy()
+        xMin, yMin = rng.randint(0, 5), rng.randint(0, 4)
+        xMax, yMax = rng.randint(xMin + 1, 12), rng.randint(yMin + 1, 9)
+        dx, dy = rng.randint(-4, 4), rng.randint(-4, 4)
+        for x in xrange(xMin, xMax):
+            for y in xrange(yMin, yMax):
+                if xMin <= x - dx < xMax and yMin <= y - dy < yMax:
+                    expected[x, y] = cellBuffer.chars[x - dx, y - dy]
+        cellBuffer.scroll(xMin, xMax, yMin, yMax, dx, dy)
+        assert numpy.all(cellBuffer.chars == expected)
+
+
+## Drawing the map a block at a time, and only flushing what's changed,
+# shows the same thing as drawing everything a character at a time.
+def test_drawMap():
+    setUpColors()
+    gameMap = gui.glyphLayer_test.makeLevel()
+    rng = random.Random(3)
+    width, height = 80, 24
+    artist = gui.cursesPyrel.artists.ascii.AsciiArtist(gameMap)
+    cellBuffer = gui.cursesPyrel.cellBuffer.CellBuffer(width, height)
+    window = DummyWindow(width, height)
+    slowArtist = CharByCharArtist(gameMap)
+    for step in xrange(30):
+        gui.glyphLayer_test.takeRandomStep(gameMap, rng)
+        dc = DummyDrawingContext(window, cellBuffer)
+        artist.draw(dc, width, height, None, step % 10 == 0)
+        dc.flush()
+        slowBuffer = gui.cursesPyrel.cellBuffer.CellBuffer(width, height)
+        slowArtist.draw(DummyDrawingContext(None, slowBuffer), width, height,
+                None, True)
+        assert numpy.all(cellBuffer.chars == slowBuffer.chars)
+        assert numpy.all(cellBuffer.pairs == slowBuffer.pairs)
+        checkWindow(window, cellBuffer)
+
+
+## Time drawing a 200x60 display, sending each character to the window as
+# it's drawn, the way we used to, against drawing into a CellBuffer and
+# flushing it, both redrawing everything each frame and redrawing just what
+# changes as the player walks around.
+def speedTest_drawFrames():
+    setUpColors()
+    gameMap = makeBigLevel()
+    width, height = 200, 60
+    numFrames = 30
+    for label, artistClass, contextClass in [
+            ('character at a time', CharByCharArtist, SlowDrawingContext),
+            ('cell buffer', gui.cursesPyrel.artists.ascii.AsciiArtist,
+                DummyDrawingContext)]:
+        for shouldRedrawAll in [True, False]:
+            rng = random.Random(0)
+            artist = artistClass(gameMap)
+            cellBuffer = gui.cursesPyrel.cellBuffer.CellBuffer(width, height)
+            window = DummyWindow(width, height)
+            dc = contextClass(window, cellBuffer)
+            artist.draw(dc, width, height, None, True)
+            dc.flush()
+            window.numCalls = 0
+            drawTime = 0
+            for i in xrange(numFrames):
+                gui.glyphLayer_test.takeRandomStep(gameMap, rng)
+                start = time.time()
+                dc = contextClass(window, cellBuffer)
+                artist.draw(dc, width, height, None, shouldRedrawAll)
+                dc.flush()
+                drawTime += time.time() - start
+            print "%s, %s: %.1f frames per second, %d addstr calls per frame" % (label,
+                    ['changed cells', 'full redraws'][shouldRedrawAll],
+                    numFrames / drawTime, window.numCalls / numFrames)
+
+
+if __name__ == '__main__':
+    test_getTermColors()
+    test_getChangedRuns()
+    test_scroll()
+    test_drawMap()
+    speedTest_drawFrames()
@@ -0,0 +1,199 @@
+## This module keeps track of what to draw in each cell of the map, for the
+# artists of every front-end.
+#
+# What the player sees in a cell is the "top" Thing in their memory of that
+# cell, with its color darkened if the cell is out of their field of view.
+# Working that out means looking through the remembered Things and their
+# Container memberships, and resolving color names and flavors, which is far
+# too slow to do for every cell on every redraw. So each Player has a
+# GlyphLayer, which holds the symbol and color for each cell as indices into
+# tables of symbols and colors, and only works them out again for cells
+# whose memory has changed since (see Player.onCellChange() and
+# Player.updateFOV()). Whether a cell is in view comes from the Player's
+# field of view map.
+
+import container
+import gui.colors
+import gui.flavors
+
+import numpy
+
+## Ordered list of what we want to draw -- the first thing to match gets
+# displayed.
+DRAW_ORDER = [container.UPDATERS, container.ITEMS, container.TERRAIN]
+
+## Symbol index for cells where the player remembers nothing to draw.
+EMPTY = -1
+
+
+
+class GlyphLayer:
+    ## \param player The Player whose memory and field of view we show.
+    def __init__(self, player, width, height):
+        self.player = player
+        ## Index into self.symbols of the symbol to draw in each cell, or
+        # EMPTY.
+        self.symbolGrid = numpy.empty((width, height), dtype = numpy.int32)
+        self.symbolGrid.fill(EMPTY)
+        ## Index into self.colors of the color to draw each cell in, when it's
+        # in view.
+        self.colorGrid = numpy.zeros((width, height), dtype = numpy.int32)
+        ## Boolean array of which cells' entries in the above arrays are out
+        # of date.
+        self.isStale = numpy.ones((width, height), dtype = numpy.bool)
+        ## List of symbols we've drawn.
+        self.symbols = []
+        ## Maps symbols to their indices in self.symbols.
+        self.symbolToIndex = {}
+        ## List of RGB tuples we've drawn in.
+        self.colors = []
+        ## Maps RGB tuples to their indices in self.colors.
+        self.colorToIndex = {}
+        ## Maps indices in self.colors to the indices of the darkened versions
+        # of those colors, that we use for cells that are out of view.
+        self.dimColorIndices = []
+        ## Numpy version of self.dimColorIndices; None if it needs remaking.
+        self.dimColorArray = None
+        # Empty cells show as a white . in view, and as nothing out of view.
+        self.emptyVisibleGlyph = (self.getSymbolIndex('.'),
+                self.getColorIndex(gui.colors.getColor('WHITE')))
+        self.emptyHiddenGlyph = (self.getSymbolIndex(' '),
+                self.getColorIndex(gui.colors.getColor('BLACK')))
+
+
+    ## Get the index in self.symbols of the given symbol, adding it if
+    # necessary.
+    def getSymbolIndex(self, symbol):
+        if symbol not in self.symbolToIndex:
+            self.symbolToIndex[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return self.symbolToIndex[symbol]
+
+
+    ## Get the index in self.colors of the given color, adding it and its
+    # darkened version if necessary.
+    def getColorIndex(self, color):
+        color = tuple(color)
+        if color not in self.colorToIndex:
+            self.addColor(color)
+            dimIndex = self.addColor(tuple(c / 2 for c in color))
+            self.dimColorIndices[self.colorToIndex[color]] = dimIndex
+        return self.colorToIndex[color]
+
+
+    ## Add the given color to self.colors if it isn't already there, and
+    # return its index.
+    def addColor(self, color):
+        if color not in self.colorToIndex:
+            self.colorToIndex[color] = len(self.colors)
+            self.colors.append(color)
+            # Until we know better, colors darken to themselves.
+            self.dimColorIndices.append(len(self.colors) - 1)
+            self.dimColorArray = None
+        return self.colorToIndex[color]
+
+
+    ## Note that the player's memory of the given cells has changed.
+    # \param xs Either a single X coordinate or an array of them.
+    # \param ys Ditto, for Y coordinates.
+    def markStale(self, xs, ys):
+        self.isStale[xs, ys] = True
+
+
+    ## Note that the player's memory of every cell may have changed.
+    def markAllStale(self):
+        self.isStale[:] = True
+
+
+    ## Work out what to draw for the given cell, as of the player's memory.
+    def updateCell(self, x, y):
+        self.isStale[x, y] = False
+        thing = self.getTopThing(self.player.coordsToCell[(x, y)])
+        if thing is None:
+            self.symbolGrid[x, y] = EMPTY
+            return
+        symbol = thing.display['ascii']['symbol']
+        color = thing.display['ascii']['color']
+        if color == 'flavor':
+            # Get the color based on the flavor of the item.
+            color = gui.flavors.getColorNameForFlavor(thing.flavor)
+            color = gui.colors.getColor(color)
+        # \todo Is there a better way to do this check?
+        elif type(color) in [str, unicode]:
+            # Map from a color name to the color tuple.
+            color = gui.colors.getColor(color)
+        self.symbolGrid[x, y] = self.getSymbolIndex(symbol)
+        self.colorGrid[x, y] = self.getColorIndex(color)
+
+
+    ## Return the highest-priority Thing among the given ones, as per
+    # DRAW_ORDER, or None if none of them are drawable. Ties go to whichever
+    # comes first.
+    def getTopThing(self, things):
+        gameMap = self.player.gameMap
+        bestThing = None
+        bestLayerIndex = None
+        for thing in things:
+            try:
+                memberships = gameMap.getMembershipsFor(thing)
+            except KeyError:
+                # The player remembers a Thing the map has forgotten about.
+                continue
+            for layerIndex, layer in enumerate(DRAW_ORDER):
+                if layer in memberships:
+                    if bestThing is None or layerIndex < bestLayerIndex:
+                        bestThing = thing
+                        bestLayerIndex = layerIndex
+                    break
+            if bestLayerIndex == 0:
+                # Not going to get better than this.
+                break
+        return bestThing
+
+
+    ## Bring every stale cell in the given range up to date.
+    def refresh(self, xMin, xMax, yMin, yMax):
+        xs, ys = numpy.nonzero(self.isStale[xMin:xMax, yMin:yMax])
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            self.updateCell(xMin + x, yMin + y)
+
+
+    ## Return a (symbol, color) tuple indicating what to draw at the given
+    # location.
+    def getGlyph(self, pos):
+        x, y = pos
+        if self.isStale[x, y]:
+            self.updateCell(x, y)
+        isVisible = self.player.fovMap[x, y]
+        symbolIndex = self.symbolGrid.item(x, y)
+        if symbolIndex == EMPTY:
+            if isVisible:
+                symbolIndex, colorIndex = self.emptyVisibleGlyph
+            else:
+                symbolIndex, colorIndex = self.emptyHiddenGlyph
+        else:
+            colorIndex = self.colorGrid.item(x, y)
+            if not isVisible:
+                colorIndex = self.dimColorIndices[colorIndex]
+        return (self.symbols[symbolIndex], self.colors[colorIndex])
+
+
+    ## Return arrays of the indices into self.symbols and self.colors of
+    # what to draw in each cell in the given range (with the maximums
+    # exclusive).
+    def getGlyphIndices(self, xMin, xMax, yMin, yMax):
+        self.refresh(xMin, xMax, yMin, yMax)
+        region = (slice(xMin, xMax), slice(yMin, yMax))
+        isVisible = self.player.fovMap[region]
+        if self.dimColorArray is None:
+            self.dimColorArray = numpy.array(self.dimColorIndices,
+                    dtype = numpy.int32)
+        colors = self.colorGrid[region]
+        colors = numpy.where(isVisible, colors, self.dimColorArray[colors])
+        symbols = self.symbolGrid[region].copy()
+        isEmpty = symbols == EMPTY
+        for glyph, isShown in [(self.emptyVisibleGlyph, isEmpty & isVisible),
+                (self.emptyHiddenGlyph, isEmpty & ~isVisible)]:
+            symbols[isShown] = glyph[0]
+            colors[isShown] = glyph[1]
+        return symbols, colors
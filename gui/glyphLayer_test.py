@@ -0,0 +1,219 @@
+import pyximport; pyximport.install()
+import mapgen.gameMap
+
+import container
+import gui
+import gui.base.artists.ascii
+import gui.colors
+import gui.flavors
+import gui.glyphLayer
+import things.items.itemLoader
+import util.serializer_test
+
+import random
+import time
+
+
+## Artist that draws to a dict instead of a screen, so we can see what it
+# drew and how quickly.
+class DummyArtist(gui.base.artists.ascii.AsciiArtist):
+    def __init__(self, gameMap):
+        ## Maps (column, row) screen positions to the (symbol, color) tuple
+        # we drew there.
+        self.screen = {}
+        gui.base.artists.ascii.AsciiArtist.__init__(self, gameMap)
+
+
+    def getBiggestCharacterDimensions(self):
+        return (1, 1)
+
+
+    def draw(self, dc, width, height, curPrompt, shouldRedrawAll):
+        self.numColumns = width
+        self.numRows = height
+        self.drawMap(dc, shouldRedrawAll)
+        self.drawPlayerStatus(dc)
+
+
+    def drawChar(self, dc, symbol, color, x, y):
+        self.screen[(x, y)] = (symbol, tuple(color))
+
+
+    def copyMapTo(self, dc, xOffset, yOffset):
+        screen = dict(self.screen)
+        for (x, y), glyph in screen.iteritems():
+            if x >= self.numPlayerColumns:
+                self.screen[(x + xOffset, y + yOffset)] = glyph
+
+
+
+## DummyArtist that works out what to draw in each cell the way AsciiArtist
+# used to, straight from the player's memory.
+class SlowDummyArtist(DummyArtist):
+    def getDisplayData(self, cellPos):
+        return getDisplayDataSlowly(self.gameMap, self.player, cellPos)
+
+
+    def drawAllCells(self, dc, xMin, xMax, yMin, yMax):
+        for x in xrange(xMin, xMax):
+            for y in xrange(yMin, yMax):
+                symbol, color = self.getDisplayData((x, y))
+                self.drawChar(dc, symbol, color,
+                        x - xMin + self.numPlayerColumns, y - yMin)
+
+
+
+## Return a (symbol, color) tuple indicating what to draw at the specified
+# map location, working it out the way AsciiArtist used to.
+def getDisplayDataSlowly(gameMap, player, cellPos):
+    allThings = player.coordsToCell[cellPos]
+    bestThing = None
+    bestLayerIndex = None
+    layers = set(gui.glyphLayer.DRAW_ORDER)
+    for thing in allThings:
+        memberships = gameMap.getMembershipsFor(thing)
+        for layer in layers.intersection(memberships):
+            layerIndex = gui.glyphLayer.DRAW_ORDER.index(layer)
+            if (bestThing is None or
+                    (layerIndex < bestLayerIndex and layer in memberships)):
+                bestThing = thing
+                bestLayerIndex = layerIndex
+        if bestLayerIndex == 0:
+            break
+
+    if bestThing is None:
+        # Nothing there; draw a . instead for visible cells, and nothing
+        # for non-visible ones.
+        if player.canSee(cellPos):
+            return ('.', tuple(gui.colors.getColor('WHITE')))
+        return (' ', tuple(gui.colors.getColor('BLACK')))
+
+    symbol = bestThing.display['ascii']['symbol']
+    color = bestThing.display['ascii']['color']
+    if color == 'flavor':
+        color = gui.flavors.getColorNameForFlavor(bestThing.flavor)
+        color = gui.colors.getColor(color)
+    elif type(color) in [str, unicode]:
+        color = gui.colors.getColor(color)
+    if not player.fovMap[cellPos]:
+        color = [c / 2 for c in color]
+    return (symbol, tuple(color))
+
+
+## Make a 120x120 level, with the player's field of view up to date.
+def makeLevel():
+    # Item generation sometimes has things to say; normally the UI would
+    # listen.
+    gui.messenger.message = lambda message: None
+    gameMap = util.serializer_test.makeLevel()
+    gameMap.getPlayer().updateFOV()
+    return gameMap
+
+
+## Move the player a step in a random direction, if they can, and maybe drop
+# an item next to them.
+def takeRandomStep(gameMap, rng):
+    player = gameMap.getPlayer()
+    x, y = player.pos
+    target = (x + rng.randint(-1, 1), y + rng.randint(-1, 1))
+    if (0 < target[0] < gameMap.width - 1 and 0 < target[1] < gameMap.height - 1
+            and not gameMap.getHasIntersection(target, container.BLOCKERS)):
+        gameMap.moveMe(player, player.pos, target)
+        if rng.random() < .2:
+            things.items.itemLoader.makeItem(('potion', 'Cure Light Wounds'),
+                    0, gameMap, (x, y))
+    player.updateFOV()
+
+
+## GlyphLayers show the same thing in every cell that the player's memory
+# says to, as the player walks around, and things come and go.
+def test_glyphLayer():
+    gameMap = makeLevel()
+    player = gameMap.getPlayer()
+    glyphLayer = player.glyphLayer
+    rng = random.Random(0)
+    for step in xrange(40):
+        if step % 10 == 0:
+            symbols, colors = glyphLayer.getGlyphIndices(0, gameMap.width,
+                    0, gameMap.height)
+            for x in xrange(gameMap.width):
+                for y in xrange(gameMap.height):
+                    expected = getDisplayDataSlowly(gameMap, player, (x, y))
+                    assert glyphLayer.getGlyph((x, y)) == expected
+                    assert (glyphLayer.symbols[symbols[x, y]],
+                            glyphLayer.colors[colors[x, y]]) == expected
+        takeRandomStep(gameMap, rng)
+    assert not glyphLayer.isStale.all()
+
+
+## Redrawing only the cells that have changed gives the same display as
+# redrawing everything.
+def test_drawMap():
+    gameMap = makeLevel()
+    rng = random.Random(1)
+    artist = DummyArtist(gameMap)
+    slowArtist = SlowDummyArtist(gameMap)
+    width, height = 80, 24
+    artist.draw(None, width, height, None, True)
+    for step in xrange(30):
+        takeRandomStep(gameMap, rng)
+        artist.draw(None, width, height, None, False)
+        slowArtist.draw(None, width, height, None, True)
+        for x in xrange(artist.numPlayerColumns, width):
+            for y in xrange(height):
+                assert artist.screen[(x, y)] == slowArtist.screen[(x, y)]
+
+
+## A Thing in view joining or leaving one of the Containers in DRAW_ORDER,
+# without moving, changes what gets drawn in its cell, even if the cell was
+# drawn in between (e.g. before a new Item joins ITEMS).
+def test_membershipChange():
+    gameMap = makeLevel()
+    player = gameMap.getPlayer()
+    glyphLayer = player.glyphLayer
+    pos = [(x, y) for x in xrange(gameMap.width)
+            for y in xrange(gameMap.height)
+            if player.fovMap[x, y] and
+            not gameMap.getHasIntersection((x, y), container.BLOCKERS) and
+            not gameMap.getHasIntersection((x, y), container.UPDATERS) and
+            not gameMap.getHasIntersection((x, y), container.ITEMS)][0]
+    floorGlyph = glyphLayer.getGlyph(pos)
+    item = things.items.itemLoader.makeItem(('potion', 'Cure Light Wounds'),
+            0, gameMap, pos)
+    itemGlyph = glyphLayer.getGlyph(pos)
+    assert itemGlyph != floorGlyph
+    gameMap.removeSubscriber(item, container.ITEMS)
+    assert glyphLayer.getGlyph(pos) == floorGlyph
+    gameMap.addSubscriber(item, container.ITEMS)
+    assert glyphLayer.getGlyph(pos) == itemGlyph
+
+
+## Time drawing frames of an 80x24 display with a DummyArtist, working out
+# what to draw the old way and with the GlyphLayer, both redrawing
+# everything every frame and redrawing just what changes as the player walks
+# around.
+def speedTest_drawFrames():
+    gameMap = makeLevel()
+    numFrames = 100
+    for label, artistClass in [('old lookups', SlowDummyArtist),
+            ('glyph layer', DummyArtist)]:
+        for shouldRedrawAll in [True, False]:
+            rng = random.Random(0)
+            artist = artistClass(gameMap)
+            artist.draw(None, 80, 24, None, True)
+            drawTime = 0
+            for i in xrange(numFrames):
+                takeRandomStep(gameMap, rng)
+                start = time.time()
+                artist.draw(None, 80, 24, None, shouldRedrawAll)
+                drawTime += time.time() - start
+            print "%s, %s: %.1f frames per second" % (label,
+                    ['changed cells', 'full redraws'][shouldRedrawAll],
+                    numFrames / drawTime)
+
+
+if __name__ == '__main__':
+    test_glyphLayer()
+    test_drawMap()
+    test_membershipChange()
+    speedTest_drawFrames()
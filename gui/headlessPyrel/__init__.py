@@ -0,0 +1,39 @@
+""" This is the headless module for Pyrel: it draws to memory instead of a
+screen, and takes its input from a script, so we can time the game and its
+drawing without a display.
+"""
+## Path to a file of inputs to feed the game, or None to walk around at
+# random instead; see mainApp.parseScript().
+scriptPath = None
+## Number of random steps to take when there's no script.
+numTurns = 100
+
+## Set where our inputs come from. Call before init().
+def configure(newScriptPath, newNumTurns):
+    global scriptPath, numTurns
+    scriptPath = newScriptPath
+    numTurns = newNumTurns
+
+
+## Point the gui module's prompts, messages, animations and keymap at ours.
+def setModules():
+    # Save this import until right before we need it.
+    import gui
+    import prompt
+    import messageFrame
+    import animation
+    import keymap
+    gui.prompt.setModule(prompt)
+    gui.messenger.setModule(messageFrame)
+    gui.animation.setModule(animation)
+    gui.keymap = keymap.HeadlessKeymap()
+
+
+def init(gameMap):
+    setModules()
+    import mainApp
+    if scriptPath is not None:
+        script = mainApp.parseScript(open(scriptPath, 'r').read())
+    else:
+        script = mainApp.makeRandomWalk(numTurns)
+    mainApp.Run(gameMap, script)
@@ -0,0 +1,99 @@
+import gui.base.artists.ascii
+import util.threads
+
+import numpy
+
+
+## Artist that draws ASCII-style into a grid of characters in memory, and
+# keeps count of how much work each frame took.
+class HeadlessAsciiArtist(gui.base.artists.ascii.AsciiArtist):
+    def __init__(self, gameMap):
+        ## Character shown in each cell of the display, indexed by [x, y].
+        # Resized to fit the display when we draw.
+        self.screen = numpy.empty((0, 0), dtype = 'U1')
+        ## RGB color of each cell of the display, indexed by [x, y].
+        self.colors = numpy.zeros((0, 0, 3))
+        ## Number of times getDisplayData() has been called since the last
+        # frame began.
+        self.numDisplayDataCalls = 0
+        super(HeadlessAsciiArtist, self).__init__(gameMap)
+
+
+    ## A single text character is the highest resolution
+    # of text-based display
+    def getBiggestCharacterDimensions(self):
+        return (1, 1)
+
+
+    ## Draw the game view into our grid, then overlay animations and the
+    # current prompt, if any.
+    # \param dc unused; we draw into self.screen and self.colors.
+    # \param width Number of columns in the display.
+    # \param height Number of rows in the display.
+    # \param curPrompt current prompt to overlay on map, if any
+    # \param shouldRedrawAll flag to refresh the whole screen or only dirty data
+    @util.threads.classLocked
+    def draw(self, dc, width, height, curPrompt, shouldRedrawAll):
+        if self.screen.shape != (width, height):
+            shouldRedrawAll = True
+            self.screen = numpy.empty((width, height), dtype = 'U1')
+            self.screen.fill(u' ')
+            self.colors = numpy.zeros((width, height, 3))
+            self.numColumns = width
+            self.numRows = height
+        self.numDisplayDataCalls = 0
+        self.drawMap(dc, shouldRedrawAll)
+        self.drawPlayerStatus(dc)
+        self.drawOverlay(dc)
+        if curPrompt:
+            curPrompt.draw(dc, self, self.gameMap)
+
+
+    ## Draws the animation overlay
+    def drawOverlay(self, dc):
+        if self.overlayData and self.boundingBox:
+            xMin, xMax, yMin, yMax = self.boundingBox
+            for tile, symbol, color in self.overlayData:
+                x, y = tile
+                if xMin <= x <= xMax and yMin <= y <= yMax:
+                    self.drawChar(dc, symbol, color,
+                            x - xMin + self.numPlayerColumns, y - yMin)
+
+
+    ## Count the call, and work out what to draw at the given map location.
+    def getDisplayData(self, cellPos):
+        self.numDisplayDataCalls += 1
+        return super(HeadlessAsciiArtist, self).getDisplayData(cellPos)
+
+
+    ## Draw a character of the specified color at the specified position.
+    def drawChar(self, dc, symbol, color, x, y):
+        if 0 <= x < self.numColumns and 0 <= y < self.numRows:
+            self.screen[x, y] = symbol
+            self.colors[x, y] = color[:3]
+
+
+    ## Blank out the given cell range. If width or height is -1, that means
+    # "the full width" or "the full height".
+    def drawRectangle(self, dc, color, x, y, width, height):
+        if width == -1:
+            width = self.numColumns - x
+        if height == -1:
+            height = self.numRows - y
+        self.screen[x:x + width, y:y + height] = u' '
+        self.colors[x:x + width, y:y + height] = 0
+
+
+    ## Move the map display over by the specified offset. Whatever moves off
+    # one edge comes back on the other, but drawMap() redraws those cells.
+    def copyMapTo(self, dc, xOffset, yOffset):
+        for grid in [self.screen, self.colors]:
+            region = grid[self.numPlayerColumns:]
+            region[:] = numpy.roll(numpy.roll(region, xOffset, axis = 0),
+                    yOffset, axis = 1)
+
+
+    ## Return what the display shows, as a string with a line per row.
+    def getText(self):
+        return u'\n'.join(u''.join(self.screen[:, y])
+                for y in xrange(self.screen.shape[1]))
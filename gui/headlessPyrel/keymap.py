@@ -0,0 +1,28 @@
+## Handles conversion from input keystrokes to the enumerated list of
+# abstract inputs in the commands package. Scripted keystrokes are plain
+# character codes, so the base Keymap does nearly everything.
+
+import gui.base.keymap
+
+## Character codes for the keys that aren't characters.
+(BACKSPACE, RETURN, ESCAPE, DELETE) = (8, 13, 27, 127)
+
+class HeadlessKeymap(gui.base.keymap.Keymap):
+    ## return the keycode from the input
+    # For scripts, this is a direct mapping
+    def getKey(self, input):
+        return input
+
+
+    def isReturnKey(self, input):
+        return input in [10, RETURN]
+
+
+    ## return True if the key is a "delete" key, i.e. Del or BS
+    # Also return the direction in which we should delete
+    def isDeleteKey(self, input):
+        isDelete = input in [BACKSPACE, DELETE]
+        direction = gui.base.keymap.BEFORE
+        if input == DELETE:
+            direction = gui.base.keymap.AFTER
+        return (isDelete, direction)
@@ -0,0 +1,129 @@
+## This module runs the game from a script of inputs instead of a user, and
+# reports how long it took to play and to draw.
+#
+# A script is a sequence of whitespace-separated inputs, with anything after
+# a # on a line ignored. Each input is one of:
+# - the name of a command ID in the commands package, e.g. MOVE_6 or
+#   LIST_INVENTORY, which is sent as that command (or, if a prompt is up,
+#   as the key for that command);
+# - ESCAPE, RETURN or BACKSPACE, for those keys;
+# - a single character, for the key that types it.
+
+import commands
+import events
+import keymap
+import mainFrame
+
+import random
+import time
+
+## Kinds of input we can feed the game.
+(COMMAND, KEY) = range(2)
+
+## Names of the keys that scripts can use that aren't characters.
+KEY_NAMES = {
+        'BACKSPACE': keymap.BACKSPACE,
+        'ESCAPE': keymap.ESCAPE,
+        'RETURN': keymap.RETURN,
+}
+
+## Singleton instance of the PyrelHeadlessApp.
+app = None
+
+## This class feeds the game its script, and reports on how it went.
+class PyrelHeadlessApp(object):
+    ## \param script List of (COMMAND, command ID) and (KEY, character code)
+    #        tuples to feed to the game, in order.
+    def __init__(self, gameMap, script):
+        self.gameMap = gameMap
+        self.script = script
+        ## List of how long, in seconds, the game took to respond to each
+        # input in the script, drawing included.
+        self.inputTimes = []
+        self.mainFrame = None
+
+
+    def MainLoop(self):
+        self.mainFrame = mainFrame.MainFrame(self.gameMap)
+        self.mainFrame.Refresh(True)
+        for inputType, value in self.script:
+            if self.mainFrame.amQuitting:
+                break
+            start = time.time()
+            if inputType == COMMAND:
+                self.mainFrame.receiveCommand(value)
+            else:
+                self.mainFrame.receiveKey(value)
+            self.inputTimes.append(time.time() - start)
+        # Cancel anything the script left hanging, so that the threads of
+        # the Commands that asked for them can finish.
+        for i in xrange(10):
+            if self.mainFrame.curPrompt is None:
+                break
+            self.mainFrame.receiveKey(keymap.ESCAPE)
+
+
+    ## Return a list of lines describing how long the game took to respond
+    # to its inputs, and what it took to draw.
+    def getReport(self):
+        frameStats = self.mainFrame.frameStats
+        drawTimes = sorted(stats[0] for stats in frameStats)
+        numFullRedraws = sum(stats[3] for stats in frameStats)
+        inputTimes = sorted(self.inputTimes)
+        result = ["%d inputs, %d frames (%d full redraws)" % (
+                len(inputTimes), len(frameStats), numFullRedraws)]
+        for label, times in [('Input', inputTimes), ('Draw', drawTimes)]:
+            if times:
+                result.append("%s times: mean %.2fms, median %.2fms, max %.2fms, total %.2fs" % (label,
+                        sum(times) / len(times) * 1000,
+                        times[len(times) / 2] * 1000, times[-1] * 1000,
+                        sum(times)))
+        if frameStats:
+            result.append("Per frame: %.1f dirty cells, %.1f getDisplayData calls" % (
+                    sum(stats[1] for stats in frameStats) /
+                        float(len(frameStats)),
+                    sum(stats[2] for stats in frameStats) /
+                        float(len(frameStats))))
+        for eventType, count, total, most in events.getDispatchTimes()[:5]:
+            result.append("Event [%s]: %d publishes, total %.2fms, max %.2fms" % (
+                    eventType, count, total * 1000, most * 1000))
+        return result
+
+
+## Turn the given script text into a list of (COMMAND, command ID) and (KEY,
+# character code) tuples.
+def parseScript(text):
+    result = []
+    for line in text.splitlines():
+        for token in line.split('#')[0].split():
+            if token in KEY_NAMES:
+                result.append((KEY, KEY_NAMES[token]))
+            elif len(token) == 1:
+                result.append((KEY, ord(token)))
+            elif isinstance(getattr(commands, token, None), int):
+                result.append((COMMAND, getattr(commands, token)))
+            else:
+                raise ValueError("Unrecognized script input [%s]" % token)
+    return result
+
+
+## Make a script of the given number of random steps (resting included).
+def makeRandomWalk(numTurns):
+    return [(COMMAND, random.randint(commands.MOVE_1, commands.MOVE_9))
+            for i in xrange(numTurns)]
+
+
+## mainApp module interface from gui
+## access app singleton instance
+def getApp():
+    return app
+
+## Run the given script through the game, and print our report.
+def Run(gameMap, script):
+    global app
+    events.isTimingEnabled = True
+    app = PyrelHeadlessApp(gameMap, script)
+    app.MainLoop()
+    print app.mainFrame.artist.getText().encode('utf-8')
+    for line in app.getReport():
+        print line
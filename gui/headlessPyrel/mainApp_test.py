@@ -0,0 +1,89 @@
+import pyximport; pyximport.install()
+import mapgen.gameMap
+
+import commands
+import gui
+import gui.glyphLayer_test
+import gui.headlessPyrel
+import gui.headlessPyrel.mainApp
+
+import random
+
+
+## Make a level, and get the headless UI ready to play it.
+def setUp():
+    gameMap = gui.glyphLayer_test.makeLevel()
+    gui.setUIMode(gui.HEADLESS)
+    gui.headlessPyrel.setModules()
+    return gameMap
+
+
+## Run the given script through the given level, and return the app that
+# ran it.
+def playScript(gameMap, script):
+    app = gui.headlessPyrel.mainApp.PyrelHeadlessApp(gameMap, script)
+    gui.headlessPyrel.mainApp.app = app
+    app.MainLoop()
+    return app
+
+
+## Scripts turn into the right commands and keys, and nonsense is rejected.
+def test_parseScript():
+    mainApp = gui.headlessPyrel.mainApp
+    script = mainApp.parseScript("""MOVE_6 LIST_INVENTORY # look at stuff
+            ESCAPE a
+            # nothing here
+            REST""")
+    assert script == [(mainApp.COMMAND, commands.MOVE_6),
+            (mainApp.COMMAND, commands.LIST_INVENTORY),
+            (mainApp.KEY, 27), (mainApp.KEY, ord('a')),
+            (mainApp.COMMAND, commands.REST)]
+    try:
+        mainApp.parseScript("MOVE_6 NOT_A_COMMAND")
+        assert False
+    except ValueError:
+        pass
+
+
+## Playing a script responds to every input, prompts included, and leaves
+# the display showing what the player sees.
+def test_playScript():
+    gameMap = setUp()
+    player = gameMap.getPlayer()
+    startPos = player.pos
+    random.seed(1)
+    script = gui.headlessPyrel.mainApp.makeRandomWalk(20)
+    script += gui.headlessPyrel.mainApp.parseScript(
+            "LIST_INVENTORY ESCAPE INSPECT_ITEM a ESCAPE LIST_EQUIPMENT")
+    script += gui.headlessPyrel.mainApp.makeRandomWalk(20)
+    app = playScript(gameMap, script)
+    frame = app.mainFrame
+    assert len(app.inputTimes) == len(script)
+    assert frame.curPrompt is None
+    assert len(frame.frameStats) >= len(script)
+    assert player.pos != startPos
+
+    # Incremental redraws have kept the map display up to date.
+    artist = frame.artist
+    xMin, xMax, yMin, yMax = artist.boundingBox
+    for x in xrange(xMin, xMax):
+        for y in xrange(yMin, yMax):
+            symbol, color = player.glyphLayer.getGlyph((x, y))
+            assert (artist.screen[x - xMin + artist.numPlayerColumns,
+                    y - yMin] == symbol)
+
+
+## Time a 200-step random walk, and print how long it took to play and to
+# draw.
+def speedTest_playScript():
+    gameMap = setUp()
+    random.seed(0)
+    app = playScript(gameMap, gui.headlessPyrel.mainApp.makeRandomWalk(200))
+    for line in app.getReport():
+        print line
+
+
+if __name__ == '__main__':
+    test_parseScript()
+    test_playScript()
+    speedTest_playScript()
@@ -0,0 +1,149 @@
+## Main game "window": drives the game with scripted input, and draws it into
+# memory, keeping track of how long each frame took to draw.
+
+import artists.ascii
+import events
+import gui
+import gui.base
+import keymap
+
+import threading
+import time
+
+
+## This handles input for the game and draws it, a frame at a time. Unlike
+# the other front-ends, it waits for the game to finish responding to each
+# input before taking the next one, so a given script always plays out the
+# same way.
+class MainFrame(gui.base.CommandHandler):
+    ## \param width Number of columns in the display.
+    # \param height Number of rows in the display.
+    def __init__(self, gameMap, width = 80, height = 24):
+        gui.base.CommandHandler.__init__(self)
+        self.gameMap = gameMap
+        self.width = width
+        self.height = height
+        ## Artist to use for drawing the game.
+        self.artist = artists.ascii.HeadlessAsciiArtist(self.gameMap)
+        ## Whether or not we should force-clear the entire view the next
+        # time we draw.
+        self.shouldForceClear = True
+        ## Whether there was a prompt on display last time we drew.
+        self.wasPromptShown = False
+        ## List of (draw time in seconds, number of dirty cells, number of
+        # getDisplayData() calls, whether we redrew everything) tuples, one
+        # for each frame we've drawn.
+        self.frameStats = []
+        ## Number of Commands we've started that haven't finished yet.
+        self.numRunningCommands = 0
+        ## Condition to wait on for Commands to finish or to ask for prompts.
+        self.commandCondition = threading.Condition()
+        ## Whether the user has asked to quit.
+        self.amQuitting = False
+        events.subscribe('new game map', self.onNewGameMap)
+        events.subscribe('user quit', self.onQuit)
+
+
+    ## A new GameMap was created; switch over to using it.
+    def onNewGameMap(self, newMap):
+        self.gameMap = newMap
+        self.shouldForceClear = True
+
+
+    # used by CommandHandler to determine if prompt cancel key was pressed
+    def doesKeyCancelPrompt(self, code):
+        return code == keymap.ESCAPE
+
+
+    ## Draw the game, and record how long it took.
+    def Refresh(self, shouldRedrawAll = False):
+        isPromptShown = self.curPrompt is not None
+        # Prompts draw over the map, so redraw everything while one is up
+        # and once it's gone.
+        shouldRedrawAll = (shouldRedrawAll or self.shouldForceClear or
+                isPromptShown or self.wasPromptShown)
+        start = time.time()
+        self.artist.draw(None, self.width, self.height, self.curPrompt,
+                shouldRedrawAll)
+        self.frameStats.append((time.time() - start,
+                self.artist.numDirtyCells, self.artist.numDisplayDataCalls,
+                shouldRedrawAll))
+        self.shouldForceClear = False
+        self.wasPromptShown = isPromptShown
+
+
+    ## Feed the game a command ID, as if the user had pressed its key, and
+    # wait until the game is done with it before drawing the result. If
+    # there's a prompt up, it gets the key for the command instead.
+    def receiveCommand(self, commandId):
+        if self.curPrompt is not None:
+            self.receiveKey(gui.keymap.convertCommandToKey(commandId))
+            return
+        if commandId is None:
+            # Not a valid input.
+            return
+        with self.commandCondition:
+            self.numRunningCommands += 1
+        if not self.queueCommandId(commandId):
+            with self.commandCondition:
+                self.numRunningCommands -= 1
+        self.waitForGame()
+        self.Refresh()
+
+
+    ## Feed the game a keystroke, wait until the game is done with it, and
+    # draw the result.
+    def receiveKey(self, code):
+        if self.curPrompt is None:
+            self.receiveCommand(gui.keymap.convertKeyToCommand(code))
+            return
+        self.receiveKeyInput(code)
+        self.waitForGame()
+        self.Refresh()
+
+
+    ## Execute the given command ID, and let anyone waiting on us know when
+    # it's done.
+    def runCommand(self, commandId):
+        try:
+            super(MainFrame, self).runCommand(commandId)
+        finally:
+            with self.commandCondition:
+                self.numRunningCommands -= 1
+                self.commandCondition.notifyAll()
+
+
+    ## Wait until every Command we've started has either finished or is
+    # waiting on a prompt.
+    def waitForGame(self):
+        with self.commandCondition:
+            while self.numRunningCommands and self.curPrompt is None:
+                self.commandCondition.wait()
+
+
+    ## Some other part of the code wants a prompt to be resolved; handle it,
+    # and let waitForGame() know it's our turn for input.
+    def onResolvePrompt(self, newPrompt):
+        with self.commandCondition:
+            super(MainFrame, self).onResolvePrompt(newPrompt)
+            self.commandCondition.notifyAll()
+
+
+    ## Handle drawing an animation sequence. We don't wait between frames,
+    # as there's nobody to watch them.
+    def receiveAnimation(self, generator):
+        for frame in generator:
+            self.artist.setOverlay(frame)
+            self.Refresh()
+        self.artist.setOverlay(None)
+        self.Refresh(True)
+
+
+    ## Update our game state. We draw the result once the game is ready for
+    # more input.
+    def update(self):
+        self.gameMap.update()
+
+
+    def onQuit(self):
+        self.amQuitting = True
@@ -0,0 +1,8 @@
+## Keeps the message history in memory, since there's nowhere to show it.
+
+## List of messages, oldest first.
+messages = []
+
+# application interface to append message to history
+def message(*args):
+    messages.append(" ".join(map(unicode, args)))
@@ -0,0 +1,20 @@
+## This module provides overrides for prompts in gui/base/prompt.py
+## additionally, it implements TargetPrompt class, as well as the
+## receivePrompt method to pass prompts to the appropriate ui handler
+import gui.base.prompt
+import gui.colors
+import keymap
+
+## This Prompt lets the user select a tile or creature on the map, and stick
+# it into the TARGETED container in the game map.
+class TargetPrompt(gui.base.prompt.TargetPrompt):
+    def doesKeySelectTarget(self, input):
+        return input in [10, keymap.RETURN]
+
+
+    ## Mark our current tile, and print a description of its contents.
+    def draw(self, dc, artist, gameMap):
+        super(TargetPrompt, self).draw(dc, artist, gameMap)
+
+        x, y, dx, dy = artist.getTileBox(self.targetTile)
+        artist.drawChar(dc, 'X', gui.colors.getColor('YELLOW'), x, y)
@@ -1,7 +1,16 @@
 ## Artist that imitates an ASCII-mode drawing style.
+#
+# We keep a picture of the whole display in a single pixmap, and only draw
+# into it what has changed since the last frame: the cells the base
+# AsciiArtist says are dirty, the player status column when the player's
+# stats change, and the whole map, shifted over, when the view scrolls.
+# Each map cell is drawn by copying a ready-made tile from our glyph
+# atlas, which has a pixmap of each (symbol, color) pair we've drawn, rather
+# than by rendering text. We also note which parts of the pixmap changed, so
+# the panel can ask Qt to repaint just those parts of the window.
 
-from PyQt4.QtCore import Qt
-from PyQt4.QtGui import * 
+from PyQt4.QtCore import Qt, QRect
+from PyQt4.QtGui import *
 
 import gui.base.artists.ascii
 import container
@@ -9,22 +18,32 @@ import gui.colors
 import gui.flavors
 import util.threads
 
-## Ordered list of what we want to draw -- the first thing to match gets 
-# displayed.
-DRAW_ORDER = [container.UPDATERS, container.ITEMS, container.TERRAIN]
-
 
 
 class QtAsciiArtist(gui.base.artists.ascii.AsciiArtist):
     def __init__(self, gameMap):
-        ## Bitmap for drawing the map. It'll be recreated as needed, typically
-        # when the window is resized.
-        self.mapBitmap = None
-        ## Bitmap for drawing the player; ditto.
-        self.playerBitmap = None
-        ## Bitmap for drawing temporary overlays.
-        self.overlayBitmap = None
-        ## List of [(position, symbol, color)] tuples to draw on top of 
+        ## Pixmap holding the whole display. It'll be recreated as needed,
+        # typically when the window is resized.
+        self.screenBitmap = None
+        ## Maps (symbol, color) tuples to pixmaps of that symbol drawn in
+        # that color, one cell in size.
+        self.glyphTiles = {}
+        ## Value of self.getPlayerStatus() when we last drew the player
+        # status column, or None if it needs drawing.
+        self.lastPlayerStatus = None
+        ## Whether the last frame drew a prompt over the display, which we
+        # will need to draw over in turn.
+        self.wasPromptDrawn = False
+        ## List of (x, y) cells that we've drawn to since the last call to
+        # takeDirtyRects().
+        self.dirtyDisplayCells = []
+        ## List of (x, y, width, height) rectangles of cells that we've drawn
+        # to since the last call to takeDirtyRects().
+        self.dirtyDisplayRects = []
+        ## Whether everything has been drawn to since the last call to
+        # takeDirtyRects().
+        self.isDisplayDirty = False
+        ## List of [(position, symbol, color)] tuples to draw on top of
         # everything else.
         self.overlayData = None
         ## Point size to use for drawing.
@@ -33,7 +52,7 @@ class QtAsciiArtist(gui.base.artists.ascii.AsciiArtist):
         self.font = QFont("Courier", self.pointSize)
         self.font.setStyleHint(QFont.Monospace)
         self.fontMetrics = QFontMetrics(self.font)
-        
+
         gui.base.artists.ascii.AsciiArtist.__init__(self, gameMap)
 
 
@@ -42,8 +61,8 @@ class QtAsciiArtist(gui.base.artists.ascii.AsciiArtist):
     def getBiggestCharacterDimensions(self):
         fontMetrics = QFontMetrics(self.font)
         biggestChar = [0, 0]
-        # Unicode characters can be 
-        # unusually large; we'll assume we don't use those. 
+        # Unicode characters can be
+        # unusually large; we'll assume we don't use those.
         # \todo Find a better way to enumerate all draw-able (i.e. non-control-
         # character) ASCII chars.
         # \todo There's probably a better way to accomplish this in general,
@@ -59,60 +78,134 @@ class QtAsciiArtist(gui.base.artists.ascii.AsciiArtist):
             if height > biggestChar[1]:
                 biggestChar[1] = height
         return biggestChar
-   
 
-    ## Draw the game view ASCII-style (i.e. one character per tile).
-    # We do this by generating an array of characters to display.
+
+    ## Return True if our picture of the display is the right size for a
+    # window of the given size.
+    def isSizedFor(self, pixelWidth, pixelHeight):
+        return (self.screenBitmap is not None and
+                self.getGridSize(pixelWidth, pixelHeight) ==
+                (self.numColumns, self.numRows))
+
+
+    ## Return the number of (columns, rows) needed to completely fill a
+    # window of the given size.
+    def getGridSize(self, pixelWidth, pixelHeight):
+        return (int(float(pixelWidth) / self.charWidth) + 1,
+                int(float(pixelHeight) / self.charHeight) + 1)
+
+
+    ## Bring our picture of the display up to date, drawing only what has
+    # changed unless told otherwise. Call takeDirtyRects() afterwards to
+    # find out what changed, and paint() to show it.
+    # \param qp Unused; we draw to our own pixmap.
     @util.threads.classLocked
-    def draw(self,qp, pixelWidth, pixelHeight, curPrompt, shouldRedrawAll): 
-        # Have enough rows/columns to completely fill the window.
-        numColumns = int(float(pixelWidth) / self.charWidth) + 1
-        numRows = int(float(pixelHeight) / self.charHeight) + 1
-        if (self.mapBitmap is None or numColumns != self.numColumns or 
-                numRows != self.numRows):
-            # Size of the display has changed, so a) we have to redraw 
-            # everything, and b) we need new bitmaps to draw to.
+    def draw(self, qp, pixelWidth, pixelHeight, curPrompt, shouldRedrawAll):
+        if not self.isSizedFor(pixelWidth, pixelHeight):
+            # Size of the display has changed, so a) we have to redraw
+            # everything, and b) we need a new pixmap to draw to.
+            shouldRedrawAll = True
+            self.numColumns, self.numRows = self.getGridSize(
+                    pixelWidth, pixelHeight)
+            # Note we use a multiple of the char width/height here instead
+            # of the actual size of the window.
+            self.screenBitmap = QPixmap(self.numColumns * self.charWidth,
+                    self.numRows * self.charHeight)
+        if self.wasPromptDrawn:
+            # Get rid of the old prompt.
             shouldRedrawAll = True
-            # Note we use a multiple of the char width/height here instead 
-            # of the actual size of the window. 
-            size = (numColumns * self.charWidth, numRows * self.charHeight)
-            self.mapBitmap = QPixmap(*size)
-            self.playerBitmap = QPixmap(*size)
-            self.numColumns = numColumns
-            self.numRows = numRows
-
-        mapPainter = QPainter(self.mapBitmap)
+
+        painter = QPainter(self.screenBitmap)
         blackBrush = QBrush(Qt.black)
-        mapPainter.setBackground(blackBrush)
-        mapPainter.setBrush(blackBrush)
-        mapPainter.setFont(self.font)
-        self.drawMap(mapPainter, shouldRedrawAll)
-        qp.setBackground(blackBrush)
-        qp.drawPixmap(0, 0, self.mapBitmap)
-
-        playerPainter = QPainter(self.playerBitmap)
-        playerPainter.setBackground(blackBrush)
-        playerPainter.eraseRect(0, 0, self.numPlayerColumns * self.charWidth, 
-                self.numRows * self.charHeight)
-        playerPainter.setBrush(blackBrush)
-        playerPainter.setFont(self.font)
-        self.drawPlayerStatus(playerPainter)
-        qp.setBackground(blackBrush)
-        qp.drawPixmap(0, 0, self.playerBitmap)
-        
+        painter.setBackground(blackBrush)
+        painter.setBrush(blackBrush)
+        painter.setFont(self.font)
+        if shouldRedrawAll:
+            painter.eraseRect(0, 0, self.numColumns * self.charWidth,
+                    self.numRows * self.charHeight)
+            self.isDisplayDirty = True
+            self.lastPlayerStatus = None
+        self.drawMap(painter, shouldRedrawAll)
+
+        playerStatus = self.getPlayerStatus()
+        if playerStatus != self.lastPlayerStatus:
+            self.drawRectangle(painter, 'BLACK', 0, 0,
+                    self.numPlayerColumns, -1)
+            self.drawPlayerStatus(painter)
+            self.lastPlayerStatus = playerStatus
+
+        # Prompts and overlays go on top; we'll draw over them next frame.
         if curPrompt:
-            curPrompt.draw(qp, self, self.gameMap)
-        self.drawOverlay(qp)
+            curPrompt.draw(painter, self, self.gameMap)
+            self.isDisplayDirty = True
+        self.wasPromptDrawn = bool(curPrompt)
+        self.drawOverlay(painter)
+        painter.end()
+
+
+    ## Show the given rectangle of our picture of the display.
+    def paint(self, qp, rect):
+        if self.screenBitmap is not None:
+            qp.drawPixmap(rect, self.screenBitmap, rect)
+
+
+    ## Return a list of QRects, in pixels, of the parts of our picture of
+    # the display that have changed since the last call, and start afresh.
+    # Dirty cells in the same row next to each other are merged into one
+    # rectangle.
+    def takeDirtyRects(self):
+        if self.isDisplayDirty:
+            rects = [(0, 0, self.numColumns, self.numRows)]
+        else:
+            rects = list(self.dirtyDisplayRects)
+            # [x, y, width] lists of runs of dirty cells.
+            runs = []
+            for x, y in sorted(set(self.dirtyDisplayCells),
+                    key = lambda cell: (cell[1], cell[0])):
+                if (runs and runs[-1][1] == y and
+                        runs[-1][0] + runs[-1][2] == x):
+                    runs[-1][2] += 1
+                else:
+                    runs.append([x, y, 1])
+            rects.extend((x, y, width, 1) for x, y, width in runs)
+        self.dirtyDisplayCells = []
+        self.dirtyDisplayRects = []
+        self.isDisplayDirty = False
+        return [QRect(x * self.charWidth, y * self.charHeight,
+                width * self.charWidth, height * self.charHeight)
+                for x, y, width, height in rects]
 
 
-    ## Draw overlay data if there is any
+    ## Draw overlay data if there is any. We mark the cells we draw over as
+    # dirty, so they get drawn again once the overlay is gone.
     def drawOverlay(self, qp):
-        if self.overlayData is None:
-            return    
+        if not self.overlayData or not self.boundingBox:
+            return
 
+        xMin, xMax, yMin, yMax = self.boundingBox
         for tile, symbol, color in self.overlayData:
             x, y = tile
-            self.drawChar(qp, symbol, color, x + self.numPlayerColumns, y)
+            if xMin <= x <= xMax and yMin <= y <= yMax:
+                self.drawChar(qp, symbol, color,
+                        x - xMin + self.numPlayerColumns, y - yMin)
+                self.dirtyCells.add(tuple(tile))
+
+
+    ## Return the glyph atlas tile for the given symbol and color, making it
+    # if necessary.
+    def getGlyphTile(self, symbol, color):
+        key = (symbol, tuple(color))
+        if key not in self.glyphTiles:
+            tile = QPixmap(self.charWidth, self.charHeight)
+            tile.fill(Qt.black)
+            painter = QPainter(tile)
+            painter.setFont(self.font)
+            painter.setPen(QColor(*color))
+            # y position needs to be the baseline of the font
+            painter.drawText(0, self.fontMetrics.ascent(), symbol)
+            painter.end()
+            self.glyphTiles[key] = tile
+        return self.glyphTiles[key]
 
 
     ## Draw a character of the specified color at the specified position.
@@ -120,13 +213,10 @@ class QtAsciiArtist(gui.base.artists.ascii.AsciiArtist):
         if type(color) in [str, unicode]:
             # Color is a color-string; convert it.
             color = gui.colors.getColor(color)
-        qp.setPen(QColor(*color))
-        x = x * self.charWidth
-        y = y * self.charHeight
-        qp.eraseRect(x, y, self.charWidth, self.charHeight)
-        # y position needs to be the baseline of the font, so add ascent
-        y += self.fontMetrics.ascent()
-        qp.drawText(x, y, char)
+        qp.drawPixmap(x * self.charWidth, y * self.charHeight,
+                self.getGlyphTile(char, color))
+        if not self.isDisplayDirty:
+            self.dirtyDisplayCells.append((x, y))
 
 
     ## Draw a rectangle of the specified color over the given cell range.
@@ -136,8 +226,9 @@ class QtAsciiArtist(gui.base.artists.ascii.AsciiArtist):
             width = self.numColumns
         if height == -1:
             height = self.numRows
-        qp.eraseRect(x * self.charWidth, y * self.charHeight, 
+        qp.eraseRect(x * self.charWidth, y * self.charHeight,
                 width * self.charWidth, height * self.charHeight)
+        self.dirtyDisplayRects.append((x, y, width, height))
 
 
 
@@ -151,10 +242,21 @@ class QtAsciiArtist(gui.base.artists.ascii.AsciiArtist):
         y = yPos * self.charHeight
         qp.eraseRect(x, y, self.charWidth * len(string), self.charHeight)
         qp.drawText(x, y + self.fontMetrics.ascent(), string)
+        self.dirtyDisplayRects.append((xPos, yPos, len(string), 1))
 
 
-    ## Copy the map bitmap over by the specified offset.
+    ## Shift the map portion of our picture of the display over by the
+    # specified offset, in cells. drawMap() then fills in the cells that
+    # this exposes.
     def copyMapTo(self, qp, xOffset, yOffset):
-        copy = self.mapBitmap.copy()
-        qp.drawPixmap(xOffset * self.charWidth, yOffset * self.charHeight, copy)
-
+        mapRect = QRect(self.numPlayerColumns * self.charWidth, 0,
+                (self.numColumns - self.numPlayerColumns) * self.charWidth,
+                self.numRows * self.charHeight)
+        # We can't draw a pixmap onto itself, so copy the map out first.
+        copy = self.screenBitmap.copy(mapRect)
+        qp.setClipRect(mapRect)
+        qp.drawPixmap(mapRect.x() + xOffset * self.charWidth,
+                yOffset * self.charHeight, copy)
+        qp.setClipping(False)
+        self.dirtyDisplayRects.append((self.numPlayerColumns, 0,
+                self.numColumns - self.numPlayerColumns, self.numRows))
@@ -61,12 +61,20 @@ class MainPanel(QtGui.QWidget, gui.base.CommandHandler):
         self.setBackgroundRole(QtGui.QPalette.NoRole)
         self.refresh.connect(self.doRefresh)
         events.subscribe('new level generation', self.onLevelGeneration)
-        events.subscribe('refresh screen', self.doRefresh)
+        events.subscribe('refresh screen', self.refresh.emit)
         events.subscribe('user quit', self.onQuit)
 
 
+    ## Bring our artist's picture of the game up to date, and have Qt
+    # repaint just the parts of the window that changed. Only call this in
+    # the main thread; elsewhere, emit self.refresh instead.
     def doRefresh(self):
-        self.repaint()
+        self.artist.draw(None, self.width(), self.height(), self.curPrompt,
+                self.shouldForceClear)
+        self.shouldForceClear = False
+        for rect in self.artist.takeDirtyRects():
+            # Our update() method updates the game, not the widget.
+            QtGui.QWidget.update(self, rect)
 
 
     def doesKeyCancelPrompt(self, keyEvent):
@@ -81,8 +89,8 @@ class MainPanel(QtGui.QWidget, gui.base.CommandHandler):
 
 
     ## Handle a request for a new Prompt.
-    def receivePrompt(self, prompt):
-        super(MainPanel, self).receivePrompt(prompt)
+    def onResolvePrompt(self, prompt):
+        super(MainPanel, self).onResolvePrompt(prompt)
         # Draw the new prompt. We use a signal because this function
         # is not necessarily called in the main thread.
         self.refresh.emit()
@@ -103,21 +111,23 @@ class MainPanel(QtGui.QWidget, gui.base.CommandHandler):
 
     ## Update our game state.
     def update(self):
-        self.doRefresh()
+        self.refresh.emit()
         self.gameMap.update()
 
 
     ## Hand painting jobs off to our artist.
-    def paintEvent(self, event = None):
+    def paintEvent(self, event):
+        if not self.artist.isSizedFor(self.width(), self.height()):
+            # We've just been shown or resized, so there's nothing yet to
+            # paint from. We're about to paint everything anyway, so we
+            # don't need to know what changed.
+            self.artist.draw(None, self.width(), self.height(),
+                    self.curPrompt, True)
+            self.artist.takeDirtyRects()
+            self.shouldForceClear = False
         qp = QtGui.QPainter()
         qp.begin(self)
-        if self.shouldForceClear:
-            qp.setBackground(QtGui.QBrush(QtCore.Qt.black))
-            qp.eraseRect(qp.window())
-        client = qp.window()
-        self.artist.draw(qp, client.width(), client.height(), self.curPrompt,
-                self.shouldForceClear)
-        self.shouldForceClear = False
+        self.artist.paint(qp, event.rect())
         qp.end()
 
 
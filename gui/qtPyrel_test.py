@@ -0,0 +1,129 @@
+import pyximport; pyximport.install()
+import mapgen.gameMap
+
+import events
+import gui.glyphLayer_test
+
+from nose.exc import SkipTest
+import os
+import random
+import sys
+
+## Map cells in the display we draw: an 80x24 view, plus one resized to
+# 100x30.
+SIZES = [(80, 24), (100, 30)]
+
+
+## Return the QApplication, making it if necessary, or skip the test if there
+# is nothing to draw with. Run the tests under xvfb-run, or with
+# QT_QPA_PLATFORM=offscreen for Qt builds that support it.
+def getApp():
+    try:
+        import PyQt4.QtGui
+    except ImportError:
+        raise SkipTest("PyQt4 is not available")
+    if (sys.platform.startswith('linux') and not os.environ.get('DISPLAY')
+            and not os.environ.get('QT_QPA_PLATFORM')):
+        raise SkipTest("No display to draw with; try xvfb-run")
+    app = PyQt4.QtGui.QApplication.instance()
+    if app is None:
+        app = PyQt4.QtGui.QApplication([])
+    return app
+
+
+## Artist draws the given frame incrementally, then show just the rectangles
+# it says changed on the given "window" image, and check both its picture of
+# the display and the window against those of an artist that redraws
+# everything every frame.
+def checkFrame(artist, reference, window, pixelSize, curPrompt):
+    import PyQt4.QtGui as QtGui
+    artist.draw(None, pixelSize[0], pixelSize[1], curPrompt, False)
+    reference.draw(None, pixelSize[0], pixelSize[1], curPrompt, True)
+    reference.takeDirtyRects()
+    image = artist.screenBitmap.toImage()
+    assert image == reference.screenBitmap.toImage()
+    painter = QtGui.QPainter(window)
+    for rect in artist.takeDirtyRects():
+        assert window.rect().contains(rect)
+        artist.paint(painter, rect)
+    painter.end()
+    assert window.toImage() == image
+
+
+## Draw the game with a QtAsciiArtist through walking around, scrolling,
+# resizing, prompts, and animation overlays, and make certain that what it
+# draws, and what it says it has changed, match redrawing everything.
+def test_drawFrames():
+    getApp()
+    import PyQt4.QtGui as QtGui
+    import gui.qtPyrel.artists.ascii
+    import gui.qtPyrel.prompt
+    gameMap = gui.glyphLayer_test.makeLevel()
+    player = gameMap.getPlayer()
+    artist = gui.qtPyrel.artists.ascii.QtAsciiArtist(gameMap)
+    reference = gui.qtPyrel.artists.ascii.QtAsciiArtist(gameMap)
+    width, height = artist.getCharSize()
+    rng = random.Random(0)
+    for numColumns, numRows in SIZES:
+        pixelSize = (numColumns * width, numRows * height)
+        # Resizing means Qt repaints everything.
+        artist.draw(None, pixelSize[0], pixelSize[1], None, False)
+        window = artist.screenBitmap.copy()
+        window.fill()
+        for rect in artist.takeDirtyRects():
+            painter = QtGui.QPainter(window)
+            artist.paint(painter, rect)
+            painter.end()
+        # Walk around.
+        for i in xrange(20):
+            gui.glyphLayer_test.takeRandomStep(gameMap, rng)
+            checkFrame(artist, reference, window, pixelSize, None)
+        # Scroll the view around the map, and back.
+        for offset in [(5, 0), (0, -3), (-7, 4), (0, 0)]:
+            events.publish('center point for display',
+                    (player.pos[0] + offset[0], player.pos[1] + offset[1]))
+            checkFrame(artist, reference, window, pixelSize, None)
+        events.publish('center point for display', None)
+        checkFrame(artist, reference, window, pixelSize, None)
+        # Bring up a prompt, then take it down.
+        prompt = gui.qtPyrel.prompt.TargetPrompt()
+        checkFrame(artist, reference, window, pixelSize, prompt)
+        checkFrame(artist, reference, window, pixelSize, None)
+        # Play an animation over the player.
+        x, y = player.pos
+        for frame in [[((x, y), '*', (255, 0, 0))],
+                [((x + dx, y + dy), '*', (255, 255, 0))
+                    for dx in [-1, 0, 1] for dy in [-1, 0, 1]]]:
+            artist.setOverlay(frame)
+            reference.setOverlay(frame)
+            checkFrame(artist, reference, window, pixelSize, None)
+        artist.setOverlay(None)
+        reference.setOverlay(None)
+        checkFrame(artist, reference, window, pixelSize, None)
+
+
+## The MainPanel shows what its artist drew, both when Qt repaints it of its
+# own accord and after the game changes.
+def test_mainPanel():
+    app = getApp()
+    import PyQt4.QtGui as QtGui
+    import gui.qtPyrel.mainFrame
+    gameMap = gui.glyphLayer_test.makeLevel()
+    panel = gui.qtPyrel.mainFrame.MainPanel(None, gameMap)
+    width, height = panel.artist.getCharSize()
+    rng = random.Random(0)
+    for numColumns, numRows in SIZES:
+        panel.resize(numColumns * width, numRows * height)
+        for i in xrange(5):
+            gui.glyphLayer_test.takeRandomStep(gameMap, rng)
+            panel.doRefresh()
+            app.processEvents()
+            image = QtGui.QPixmap.grabWidget(panel).toImage()
+            assert image == panel.artist.screenBitmap.toImage().copy(
+                    image.rect())
+
+
+
+if __name__ == '__main__':
+    test_drawFrames()
+    test_mainPanel()
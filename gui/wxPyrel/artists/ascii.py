@@ -9,10 +9,6 @@ import util.threads
 
 import wx
 
-## Ordered list of what we want to draw -- the first thing to match gets 
-# displayed.
-DRAW_ORDER = [container.UPDATERS, container.ITEMS, container.TERRAIN]
-
 
 
 class WxAsciiArtist(gui.base.artists.ascii.AsciiArtist):
@@ -1,5 +1,14 @@
 import numpy
 
+## When AccessibilityMaps that are based on GameMap.containerMask have more
+# than this many dirty cells, they update the entire map at once rather than
+# one cell at a time.
+MAX_DIRTY_CELLS = 64
+
+## AccessibilityMaps remember at most this many changed cells for the benefit
+# of getChangesSince(); anyone who falls further behind than that has to
+# start over.
+MAX_CHANGE_LOG = 4096
 
 
 ## An AccessibilityMap is a 2D array of values that indicates how obstructed
@@ -12,9 +21,13 @@ class AccessibilityMap:
     # \param filterFunc Function that accepts a Cell and the GameMap as 
     #        parameters, and returns a float indicating the degree to which
     #        the Cell is obstructed.
-    def __init__(self, gameMap, filterFunc):
+    # \param maskBits If the map is just "does the Cell have anything in
+    #        these special Containers", then the relevant bits in
+    #        GameMap.containerMask. This lets us update many Cells at once.
+    def __init__(self, gameMap, filterFunc, maskBits = None):
         self.gameMap = gameMap
         self.filterFunc = filterFunc
+        self.maskBits = maskBits
         ## These cells have been modified since we were last asked for 
         # our map.
         self.dirtyCells = set()
@@ -24,6 +37,13 @@ class AccessibilityMap:
         # because we may want partial obstruction (e.g. for LOS, fog is not
         # entirely opaque, but also not entirely transparent). 
         self.map = numpy.zeros(gameMap.getDimensions(), dtype = numpy.float32)
+        ## Positions whose values have changed, in the order that we noticed,
+        # for anyone who maintains data derived from our map (e.g. heat maps;
+        # see util.flowField).
+        self.changeLog = []
+        ## Number of changes that have been discarded from the front of
+        # self.changeLog.
+        self.changeLogStart = 0
 
 
     ## A cell's contents have changed, so it is now dirty.
@@ -33,8 +53,49 @@ class AccessibilityMap:
 
     ## Get the current map; at this time, we evaluate all of our dirty cells.
     def getMap(self):
-        for cell in self.dirtyCells:
-            self.map[cell.pos[0], cell.pos[1]] = self.filterFunc(cell, self.gameMap)
+        if self.maskBits is not None and len(self.dirtyCells) > MAX_DIRTY_CELLS:
+            # Cheaper to redo the whole map in one go.
+            mask = self.gameMap.getContainerMask()
+            newMap = ((mask & self.maskBits) != 0).astype(numpy.float32)
+            xVals, yVals = numpy.where(newMap != self.map)
+            self.map[:] = newMap
+            self.logChanges(zip(xVals.tolist(), yVals.tolist()))
+        else:
+            changes = []
+            for cell in self.dirtyCells:
+                pos = cell.pos
+                value = self.filterFunc(cell, self.gameMap)
+                if value != self.map.item(pos):
+                    self.map[pos] = value
+                    changes.append(pos)
+            self.logChanges(changes)
         self.dirtyCells = set()
         return self.map
 
+
+    ## Record that the given positions have changed.
+    def logChanges(self, positions):
+        self.changeLog.extend(positions)
+        if len(self.changeLog) > MAX_CHANGE_LOG:
+            self.changeLogStart += len(self.changeLog)
+            self.changeLog = []
+
+
+    ## Get a value to pass to getChangesSince() later on, to find out what has
+    # changed since now. Our map must be up-to-date (i.e. getMap() must have
+    # been called) for this to be meaningful.
+    def getChangeIndex(self):
+        return self.changeLogStart + len(self.changeLog)
+
+
+    ## Get the list of positions whose values have changed since the given
+    # index (from getChangeIndex()), along with the current index. The list
+    # may contain duplicates. It is None if too much has changed to keep
+    # track of, in which case the caller should assume that everything has
+    # changed. Call getMap() first to bring the log up-to-date.
+    def getChangesSince(self, index):
+        if index < self.changeLogStart:
+            return None, self.getChangeIndex()
+        return (self.changeLog[index - self.changeLogStart:],
+                self.getChangeIndex())
+
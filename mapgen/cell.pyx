@@ -14,7 +14,9 @@ class Cell(container.Container):
         # Cell change. 
         # Each must accept three arguments: ourselves, the item in question (or
         # None to initialize an "empty" cell), and
-        # a boolean indicating if the item is entering or leaving.
+        # a boolean indicating if the item is entering or leaving. Members
+        # that join or leave special Containers are passed in as if they
+        # were entering again; see notifyMemberChanged().
         self.updateCellFuncs = set()
 
 
@@ -45,6 +47,14 @@ class Cell(container.Container):
             func(self, member, False)
 
 
+    ## One of our members has joined or left a special Container, which may
+    # change how it's treated (e.g. whether it gets drawn); tell our update
+    # funcs, as if it had just arrived.
+    def notifyMemberChanged(self, member):
+        for func in self.updateCellFuncs:
+            func(self, member, True)
+
+
     ## Generate a ready-to-be-serialized dict of our data. See the 
     # util.serializer module for more information.
     def getSerializationDict(self):
@@ -60,10 +70,18 @@ class Cell(container.Container):
 
 
 ## Create a "blank" (no data filled in) Cell instance, needed for the 
-# deserialization process. See util.serializer for more information. 
+# deserialization process. See util.serializer for more information. There are
+# a lot of Cells, so we skip the constructor; fillCell() takes care of
+# everything.
 def makeBlankCell(*args, **kwargs):
-    return Cell((-1, -1))
+    return util.serializer.makeBareInstance(Cell)
+
+
+## Fill in a blank Cell's data as part of deserialization.
+def fillCell(cell, data, *args):
+    cell.updateCellFuncs = set()
+    util.serializer.basicDataFill(cell, data, *args)
 
 
 # Register the Cell class as being eligible for [de]serialization.
-util.serializer.registerObjectClass(Cell.__name__, makeBlankCell)
+util.serializer.registerObjectClass(Cell.__name__, makeBlankCell, fillCell)
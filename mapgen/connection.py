@@ -13,8 +13,9 @@
 import generationMap
 import genUtility
 import util.geometry
+import util.pathfinding
 
-import heapq
+import numpy
 import random
         
         
@@ -91,8 +92,8 @@ def connectRooms(curMap, genMap, tunnelStyle = 'AStar', noise = None,
         # get two different indices into colorMap
         startIndex, targetIndex = random.sample(range(len(colorMap)), 2)
         # Find two nearby points to start from
-        startPoint, endPoint = util.geometry.getClosestPoints(
-                colorMap[startIndex], colorMap[targetIndex])
+        startPoint, endPoint = colorMap.getClosestPoints(startIndex,
+                targetIndex)
         
         if tunnelStyle == 'AStar':
             tunnelPath = getAStarTunnel(genMap, colorMap, startPoint, 
@@ -153,7 +154,7 @@ def getAngbandTunnel(genMap, colorMap, start, target, startIndex,
         endPoint = tunnel[-1]
         if genMap.isRoom(endPoint[0], endPoint[1]):
             # new region?
-            if getColorFor(colorMap, endPoint) != startIndex:
+            if colorMap.getColorFor(endPoint) != startIndex:
                 # success!
                 return tunnel
             else:
@@ -371,87 +372,24 @@ def tunnelAroundObstacle(genMap, tunnel, target, priority = 1):
 ## Update the color map by taking the union of two of the sets
 #  and adding in the tunnelPath    
 def updateColorMap(colorMap, tunnelPath):
-    # find the indices for the start and endpoints
-    startIndex = getColorFor(colorMap, tunnelPath[-1])
-    region = colorMap.pop(startIndex)
-    # Now get the other index
-    endIndex = getColorFor(colorMap, tunnelPath[0])
-    # paranoia
-    if startIndex == None or endIndex == None:
-        raise runtimeError("Location not in color map")
-    # Add in the second region
-    region = region.union(colorMap.pop(endIndex))
-    # This is a union between a set and a list, but it seems to work
-    region = region.union(tunnelPath)
-    colorMap.append(region)
+    colorMap.joinRegions(tunnelPath)
         
         
-## Returns a set of points yielding the A* approximation for the
-#  shortest point between the start and the first connected region
-#  we hit.
-#  Note from d_m: tuples are faster, if connection is slow, we can
-#  optimize by using them instead of dicts.
+## Returns a list of points yielding the A* approximation for the
+#  shortest path between the start and the first connected region
+#  we hit, starting from the end of the path.
 def getAStarTunnel(genMap, colorMap, startPoint, endPoint, startColor):
-    
-    # triedLocations is a dictionary where the key is the location
-    # and the value is itself a dict that includes keys 'cost' with the cost from 
-    # start to the current location and 'previous' with the location of 
-    # the previous point in the tunnel.
-    triedLocations = {startPoint: {'cost': 0, 'previous': None}}
-    # activeHeap is a heap of (estimatedcost, dict) tuples.  The estimated cost
-    # is the sum of the actual cost to the point for the shortest path found so
-    # far, and the estimated cost from the point to the target.  The dict has keys
-    # 'current', 'previous' and 'cost' indicating the current point, the previous
-    # point, and the actual cost respectively
-    activeHeap = []
-    curHeapData = (getTunnelDistance(startPoint, endPoint) * genMap.defaultCost, 
-            {'current': startPoint, 'previous': None, 'cost':0})
-    heapq.heappush(activeHeap, curHeapData)
-    curColor = startColor
-    
-    # Stop when we enter a zone with a new color
-    while curColor == None or curColor == startColor:
-        # Get a new point
-        curHeapData = heapq.heappop(activeHeap)
-        curX = curHeapData[1]['current'][0]
-        curY = curHeapData[1]['current'][1]
-        curColor = getColorFor(colorMap, (curX, curY))
-        # Do not check boundary squares
-        if genMap.isBoundary(curX, curY):
-            continue
-        # only check the cardinal directions
-        for direction in util.geometry.cardinalDirections:
-            newLocation = (curX + direction[0], curY + direction[1])
-            newCost = curHeapData[1]['cost'] + genMap.getCost(curX, curY)
-            
-            # Find out if we've been here already and if so, if it was
-            # cheaper down the previous path.
-            if newLocation in triedLocations:
-                if triedLocations[newLocation]['cost'] <= newCost:
-                    continue
-            
-            # Add the new data to the heap
-            heapq.heappush(activeHeap, 
-                    (newCost + getTunnelDistance(newLocation, endPoint) * genMap.defaultCost, 
-                    {'current': newLocation, 'previous': (curX, curY), 
-                    'cost':newCost}))
-                    
-            # Update the triedLocations dict with the new data for this point
-            triedLocations[newLocation] = {'cost': newCost, 'previous': (curX, curY)}
-    
-    return getTunnelPath((curX, curY), triedLocations)
-    
-
-## Get a tunnel path given an end point and a dictionary that uses points as keys
-#  and includes the previous point in the values. (see getAStarTunnel for details)  
-def getTunnelPath(startLocation, triedLocations):
-    location = startLocation
-    tunnelPath = [startLocation]
-    while triedLocations[location]['previous'] is not None:
-        location = triedLocations[location]['previous']
-        tunnelPath.append(location)
+    # Head for the end point, but stop when we enter a zone with a new 
+    # color.  Each step costs the cost of the square we're leaving, and we
+    # do not tunnel out of boundary squares.
+    heuristic = util.pathfinding.getManhattanHeuristic(
+            genMap.costGrid.shape, endPoint, genMap.defaultCost)
+    tunnelPath = util.pathfinding.findPath(genMap.costGrid, startPoint,
+            colorMap.getOtherColorMask(startColor), heuristic = heuristic,
+            canLeave = ~genMap.getBoundaryMask())
+    tunnelPath.reverse()
     return tunnelPath
-
+    
 
 ## Make a tunnel given a tunnel path
 def constructTunnelFromPath(curMap, genMap, tunnelPath, priority = 1):
@@ -496,54 +434,244 @@ def constructTunnelFromPath(curMap, genMap, tunnelPath, priority = 1):
             
         
     
-## Get estimated tunnel distance (maybe put this in geometry)
-#  /todo allow diagonal
-def getTunnelDistance(startPoint, endPoint):
-    xDistance = abs(startPoint[0] - endPoint[0]);
-    yDistance = abs(startPoint[1] - endPoint[1]);
-    return xDistance + yDistance
-
-    
 ## This makes a "colored" map of the dungeon.  Basically it returns
-#  a list of sets, where all items in each set are room/tunnel places
-#  that are connected to each other    
+#  a ColorMap, a list of sets, where all items in each set are room/tunnel
+#  places that are connected to each other    
 def getColorMap(genMap, unconnectedLocations):
-    colorMap = []
+    colorMap = ColorMap(genMap.width, genMap.height)
     preconnectedLocations = set()
+    clearMask = genMap.getClearMask()
     for center in list(unconnectedLocations):
         # Check to see if we've already found this place
-        if getColorFor(colorMap, center) is not None:
+        if colorMap.getColorFor(center) is not None:
             preconnectedLocations.add(center)
             continue
         # Find all points connected to the center
-        connectedPoints = getConnectedRegion(genMap, center)        
+        connectedPoints = floodRegion(clearMask, center, 10000)
         # Append the list off all the connected locations to this center to the map
-        colorMap.append(connectedPoints)
+        colorMap.addRegion(connectedPoints)
     
     return colorMap, preconnectedLocations
 
 
+## A list of sets of connected points, as used by connectRooms, that also
+#  knows which set each point is in, so that looking up a point's color
+#  doesn't mean searching every set.  Each set has a region ID, and every
+#  point in a set has its region's ID in idGrid.  When two sets are joined,
+#  we join their regions in a disjoint-set forest rather than relabelling
+#  their points.
+#
+#  connectRooms picks points at random from these sets, and breaks ties
+#  between equally close points by the order the sets list them in, so we
+#  keep the sets themselves and build them up exactly as we always have,
+#  to keep generating the same levels for the same seeds.
+class ColorMap:
+    def __init__(self, width, height):
+        ## Region ID of each point, or -1 if it isn't in any set
+        self.idGrid = numpy.empty((width, height), dtype = numpy.int32)
+        self.idGrid.fill(-1)
+        ## Maps each region ID to its parent's; the roots of the forest are
+        # the regions that are still separate.
+        self.parents = []
+        ## The sets of points, in order
+        self.regions = []
+        ## Root region ID for each set
+        self.regionIds = []
+        ## Maps root region IDs to the index of their set
+        self.idToIndex = {}
+        ## Maps points that are in more than one set (which tunnels running
+        # through other sets make) to the IDs of every region they were put
+        # in.
+        self.overlaps = {}
+        ## Array of the boundary points of each set (see getBoundary()), or
+        # None if we haven't needed it yet.
+        self.boundaries = []
+
+
+    def __len__(self):
+        return len(self.regions)
+
+
+    def __getitem__(self, index):
+        return self.regions[index]
+
+
+    ## Add a new set of connected points, which must not overlap with any of
+    # our existing sets.
+    def addRegion(self, points):
+        regionId = len(self.parents)
+        self.parents.append(regionId)
+        self.setIds(points, regionId)
+        self.idToIndex[regionId] = len(self.regions)
+        self.regions.append(points)
+        self.regionIds.append(regionId)
+        self.boundaries.append(None)
+
+
+    ## Record that the given points are in the given region.
+    def setIds(self, points, regionId):
+        points = numpy.array(list(points)).reshape(-1, 2)
+        xs, ys = points[:, 0], points[:, 1]
+        oldIds = self.idGrid[xs, ys]
+        isNew = oldIds < 0
+        self.idGrid[xs[isNew], ys[isNew]] = regionId
+        # Points that are already in a different region are now in more
+        # than one.
+        root = self.findRoot(regionId)
+        for oldId in numpy.unique(oldIds[~isNew]).tolist():
+            if self.findRoot(oldId) == root:
+                continue
+            for point in points[oldIds == oldId].tolist():
+                point = tuple(point)
+                if point not in self.overlaps:
+                    self.overlaps[point] = [oldId]
+                self.overlaps[point].append(regionId)
+
+
+    ## Find the root of the given region ID.
+    def findRoot(self, regionId):
+        parents = self.parents
+        while parents[regionId] != regionId:
+            # Point at our grandparent as we go, to keep the trees flat.
+            parents[regionId] = parents[parents[regionId]]
+            regionId = parents[regionId]
+        return regionId
+
+
+    ## Return the index of the set the given location is in, or None if it
+    # isn't in any of them.
+    def getColorFor(self, location):
+        x, y = location
+        if not (0 <= x < self.idGrid.shape[0] and 
+                0 <= y < self.idGrid.shape[1]):
+            return None
+        regionId = self.idGrid.item(x, y)
+        if regionId < 0:
+            return None
+        if location in self.overlaps:
+            # The point is in whichever of its sets comes first.
+            return min(self.idToIndex[self.findRoot(otherId)]
+                    for otherId in self.overlaps[location])
+        return self.idToIndex[self.findRoot(regionId)]
+
+
+    ## Get a boolean array that's True wherever getColorFor() would return a
+    # color other than the given one (or None).
+    def getOtherColorMask(self, color):
+        rootIds = numpy.array([self.findRoot(regionId) 
+                for regionId in xrange(len(self.parents))], dtype = numpy.int32)
+        mask = self.idGrid >= 0
+        mask[mask] = rootIds[self.idGrid[mask]] != self.regionIds[color]
+        for point in self.overlaps:
+            mask[point] = self.getColorFor(point) != color
+        return mask
+
+
+    ## Remove the set at the given index, and return it and its region ID.
+    def popRegion(self, index):
+        region = self.regions.pop(index)
+        regionId = self.regionIds.pop(index)
+        self.boundaries.pop(index)
+        del self.idToIndex[regionId]
+        for i in xrange(index, len(self.regionIds)):
+            self.idToIndex[self.regionIds[i]] = i
+        return region, regionId
+
+
+    ## Take the union of the sets that the ends of the tunnel path are in, and
+    # the path itself, and put it at the end of the list.
+    def joinRegions(self, tunnelPath):
+        # find the indices for the start and endpoints
+        startIndex = self.getColorFor(tunnelPath[-1])
+        # paranoia
+        if startIndex is None:
+            raise RuntimeError("Location not in color map")
+        region, startId = self.popRegion(startIndex)
+        # Now get the other index
+        endIndex = self.getColorFor(tunnelPath[0])
+        if endIndex is None:
+            raise RuntimeError("Location not in color map")
+        otherRegion, endId = self.popRegion(endIndex)
+        # Add in the second region
+        region = region.union(otherRegion)
+        # This is a union between a set and a list, but it seems to work
+        region = region.union(tunnelPath)
+        # Join the regions, and put the tunnel in the result
+        regionId = min(startId, endId)
+        self.parents[max(startId, endId)] = regionId
+        self.setIds(tunnelPath, regionId)
+        self.idToIndex[regionId] = len(self.regions)
+        self.regions.append(region)
+        self.regionIds.append(regionId)
+        self.boundaries.append(None)
+
+
+    ## Get an array of the points in the set at the given index that are
+    # next to (including diagonally) a point that isn't in the set, in the
+    # order the set lists them in.  The point in a set that is closest to a
+    # location outside of the set is always one of these, since otherwise
+    # its neighbor towards that location would be closer.
+    def getBoundary(self, index):
+        if self.boundaries[index] is None:
+            points = numpy.array(list(self.regions[index])).reshape(-1, 2)
+            # Mark the set's points in an array covering their bounding box,
+            # plus a border of empty squares.
+            xMin, yMin = points.min(axis = 0) - 1
+            xMax, yMax = points.max(axis = 0) + 1
+            isMember = numpy.zeros((xMax - xMin + 1, yMax - yMin + 1), 
+                    dtype = numpy.bool_)
+            xs = points[:, 0] - xMin
+            ys = points[:, 1] - yMin
+            isMember[xs, ys] = True
+            # Points whose neighbors are all in the set are interior.
+            isInterior = isMember[1:-1, 1:-1].copy()
+            for dx in xrange(3):
+                for dy in xrange(3):
+                    isInterior &= isMember[dx:dx + isInterior.shape[0],
+                            dy:dy + isInterior.shape[1]]
+            isBoundary = numpy.ones(isMember.shape, dtype = numpy.bool_)
+            isBoundary[1:-1, 1:-1] = ~isInterior
+            self.boundaries[index] = points[isBoundary[xs, ys]]
+        return self.boundaries[index]
+
+
+    ## Return the point in the set at the given index that is closest to the
+    # given location.  As with util.geometry.getNearbyLocation, ties go to
+    # whichever point the set lists first.
+    def getNearbyLocation(self, index, target):
+        if target in self.regions[index]:
+            return target
+        boundary = self.getBoundary(index)
+        distances = ((boundary[:, 0] - target[0]) ** 2 +
+                (boundary[:, 1] - target[1]) ** 2)
+        return tuple(boundary[distances.argmin()].tolist())
+
+
+    ## Pick a pair of points, one in each of the sets at the given indices,
+    # that are reasonably close to each other; the same pair that
+    # util.geometry.getClosestPoints would.
+    def getClosestPoints(self, indexA, indexB):
+        # pick a random location in setA
+        guessA = random.choice(list(self.regions[indexA]))
+        # find the closest point in set B to our guess
+        guessB = self.getNearbyLocation(indexB, guessA)
+        # now find the closest point in A to guessB
+        guessA = self.getNearbyLocation(indexA, guessB)
+        return guessA, guessB
+
+
 ## Make a color map for a selected area.  Returns a colorMap, a list containing sets
 # of connected regions and "centers" for each region.  This option is slower than
 # getColorMap, but does not require seeding the region with center locations.
 # Hence, it knows nothing about regions that you wish to keep unconnected.
 # Used for cavern connection and other regions with complicated geometries.      
 def getColorMapForArea(genMap, xWest, yNorth, width, height):
-    colorMap = []
-    for x in xrange(xWest + width - 1):
-        for y in xrange(yNorth + height - 1):
-            # only care about room spaces
-            if not genMap.isRoom(x, y):
-                continue
-            color = getColorFor(colorMap, (x, y))
-            # not there
-            if color is None:
-                # Find a connected region and add it
-                connectedPoints = getConnectedRegion(genMap, (x, y))
-                colorMap.append(connectedPoints)
-    return colorMap
-    
-                               
+    clearMask = genMap.getClearMask()
+    labels, sizes = labelRegions(clearMask)
+    return [floodRegion(clearMask, start, sizes[label]) for label, start in
+            getRegionStartsForArea(genMap, labels, xWest, yNorth, width, height)]
+
+
 # Check if something is in a list of sets, more general than our current use        
 def getColorFor(colorMap, location):
     # return false if empty
@@ -556,13 +684,106 @@ def getColorFor(colorMap, location):
     
     # not there
     return None
-       
+
+
+## Label the connected regions (including diagonal connections) in a boolean
+#  array.  Returns an integer array of the same shape, where every True
+#  location has the number of its region (starting from 1) and every False
+#  location is 0, and an array of the sizes of the regions, by number (with
+#  the number of False locations first).
+#
+#  We go through the array a column at a time, find the runs of True
+#  locations in each column, and join up the runs that touch runs in the
+#  previous column, using a union-find structure, so the work done in Python
+#  goes with the number of runs rather than the number of locations.
+def labelRegions(mask):
+    labels = numpy.zeros(mask.shape, dtype = numpy.int32)
+    # Maps each run's ID to its parent run's ID; a run that is its own parent
+    # is the root of its region.
+    parents = []
+    # (x, yStart, yEnd) for each run, by ID, where yEnd is exclusive
+    runs = []
+    previousRuns = []
+
+    def findRoot(runId):
+        while parents[runId] != runId:
+            # Point at our grandparent as we go, to keep the trees flat.
+            parents[runId] = parents[parents[runId]]
+            runId = parents[runId]
+        return runId
+
+    for x in xrange(mask.shape[0]):
+        # Find where the column switches between False and True.
+        edges = numpy.flatnonzero(numpy.diff(numpy.concatenate(
+                ([False], mask[x], [False])).astype(numpy.int8)))
+        currentRuns = []
+        # Index of the first previous-column run that could touch this run
+        first = 0
+        for yStart, yEnd in zip(edges[::2].tolist(), edges[1::2].tolist()):
+            runId = len(runs)
+            runs.append((x, yStart, yEnd))
+            parents.append(runId)
+            currentRuns.append(runId)
+            # Runs in the previous column that end before we start (less
+            # diagonal contact) can't touch this run or any later one.
+            while (first < len(previousRuns) and
+                    runs[previousRuns[first]][2] < yStart):
+                first += 1
+            i = first
+            while (i < len(previousRuns) and
+                    runs[previousRuns[i]][1] <= yEnd):
+                root = findRoot(previousRuns[i])
+                ourRoot = findRoot(runId)
+                if root != ourRoot:
+                    parents[max(root, ourRoot)] = min(root, ourRoot)
+                i += 1
+        previousRuns = currentRuns
+
+    # Number the regions in the order we first came across them.
+    rootToLabel = {}
+    for runId, (x, yStart, yEnd) in enumerate(runs):
+        root = findRoot(runId)
+        if root not in rootToLabel:
+            rootToLabel[root] = len(rootToLabel) + 1
+        labels[x, yStart:yEnd] = rootToLabel[root]
+    return labels, numpy.bincount(labels.ravel(),
+            minlength = len(rootToLabel) + 1)
+
+
+## Find the regions that room squares in the given area belong to.  Returns
+#  a list of (region number, location) tuples, one per region, in the order
+#  that scanning the area column by column comes across them, and with the
+#  first location in the area that belongs to the region.
+#  \param labels Region numbers, as from labelRegions.
+#
+#  Note that this scans from the NW corner of the map, not of the area.
+#  /todo fix that without changing what existing seeds generate.
+def getRegionStartsForArea(genMap, labels, xWest, yNorth, width, height):
+    area = (slice(0, xWest + width - 1), slice(0, yNorth + height - 1))
+    areaLabels = numpy.where(genMap.roomGrid[area], labels[area], 0)
+    regionLabels, firstIndices = numpy.unique(areaLabels,
+            return_index = True)
+    result = []
+    for firstIndex, label in sorted(zip(firstIndices.tolist(),
+            regionLabels.tolist())):
+        if label:
+            result.append((label, divmod(firstIndex, areaLabels.shape[1])))
+    return result
+
 
 ## Returns a list of connected points to a starting location
 #  Used by getColorMap and getColorMapForArea.
 #
 #  /todo make option to not include tunnels        
 def getConnectedRegion(genMap, start, maxSteps = 10000):       
+    return floodRegion(genMap.getClearMask(), start, maxSteps)
+
+
+## Returns the set of points connected to a starting location, through
+#  locations that are True in clearMask (see GenerationMap.getClearMask).
+#  Stops after looking at maxSteps locations.
+def floodRegion(clearMask, start, maxSteps):
+    width, height = clearMask.shape
     # this is the set of all points connected to the center location.        
     connectedPoints = set()
     # This is for the iteration loop, it's the set of locations
@@ -580,7 +801,8 @@ def getConnectedRegion(genMap, start, maxSteps = 10000):
                 # Check if we've already been here
                 if (x, y) in connectedPoints:
                     continue
-                if genMap.isClear(x, y) and not genMap.isBoundary(x, y):
+                if (0 <= x < width and 0 <= y < height and
+                        clearMask.item(x, y)):
                     # Add this place to the queue
                     pointsQueue.add((x, y)) 
     
@@ -591,31 +813,27 @@ def getConnectedRegion(genMap, start, maxSteps = 10000):
 #  marbled noise.  Basically whatever d_m cooks up.    
 def addCostNoise(genMap, noiseType = 'random'):
 
-    noiseGrid = [[0 for i in xrange(genMap.height)] for j in xrange(genMap.width)]
+    noiseGrid = numpy.zeros((genMap.width, genMap.height), dtype = numpy.int64)
     
     # add random noise between 0 and the default cost
     # This option is for debug testing only.
     if noiseType == 'random':
         for x in xrange(genMap.width):
             for y in xrange(genMap.height):
-                noiseGrid[x][y] += random.randint(0, genMap.defaultCost)
+                noiseGrid[x, y] += random.randint(0, genMap.defaultCost)
                 
     # Add blocky noise, in an attempt to get angband style tunnels
     if noiseType == 'block':
         noiseGrid = getBlockNoise(noiseGrid, genMap.width, genMap.height)
                        
-    # Derakon: this will be much quicker with numpy allowing for
-    # matrix addition.
-    # add the noise to the background
-    for x in xrange(genMap.width):
-        for y in xrange(genMap.height):
-            # skip open areas
-            if genMap.isClear(x, y):
-                continue
-            genMap.addCost(x, y, noiseGrid[x][y])
+    # add the noise to the background, skipping open areas
+    noiseGrid[genMap.roomGrid | genMap.tunnelGrid] = 0
+    genMap.costGrid += noiseGrid
 
 
 ## This function adds blocks of noise to the function
+#  \param noiseGrid is a width by height numpy array that we add the
+#  noise to, and return.
 #  \param blockNumber is the number of blocks (squares) of noise to 
 #  add to the noise array.
 #  \param blockSizeMin is the minimum block size for each block and
@@ -641,8 +859,7 @@ def getBlockNoise(noiseGrid, width, height, blockNumber = 300,
         xWest = random.randint(0, width - blockWidth - 1)
         yNorth = random.randint(0, height - blockHeight - 1)
         # Add the block to the noiseGrid
-        for x in xrange(xWest, xWest + blockWidth - 1):
-            for y in xrange(yNorth, yNorth + blockHeight - 1):
-                noiseGrid[x][y] += blockCost
+        noiseGrid[xWest:xWest + blockWidth - 1,
+                yNorth:yNorth + blockHeight - 1] += blockCost
 
     return noiseGrid
\ No newline at end of file
@@ -7,9 +7,13 @@ import container
 import events
 import mapgen.generator
 import mapgen.genTown
+import scheduler
+import util.flowField
 import util.id
 import util.serializer
 
+import numpy
+import weakref
 
 
 class GameMap:
@@ -25,11 +29,20 @@ class GameMap:
         ## Maps Container IDs to the Containers. We also map our Cells' 
         # position tuples here even though those aren't their IDs. 
         self.idToContainerMap = dict()
+        ## Maps Container IDs to Containers made by makeContainer() and
+        # makeContainerMap(). We only hold weak references to these, so
+        # they go away once no one else is using them.
+        self.idToWeakContainerMap = weakref.WeakValueDictionary()
         ## These functions want to know when we modify cells.
         self.updateCellFuncs = set()
         ## Maps tuples of Container IDs to AccessibilityMap instances. See
         # getAccessibilityMap().
         self.containerIdsToAccessibilityMap = dict()
+        ## Shares heat maps between everyone who wants one. See
+        # getFlowFieldManager().
+        self.flowFieldManager = None
+        ## Handles writing savefiles; see save().
+        self.saveJournal = None
         ## These containers are associated with functions used in the above.
         # See getFilterFunc().
         self.containerToFuncMap = dict()
@@ -37,64 +50,30 @@ class GameMap:
         self.idToContainerMap[container.PERSISTENT] = container.Container(
                 container.PERSISTENT)
         self.makeCellArray()
+        ## (width, height) array of bitfields, one bit per Container in 
+        # container.SPECIAL_CONTAINERS (see 
+        # container.SPECIAL_CONTAINER_TO_BIT). A bit is set when the Cell has
+        # any members in that Container, so that e.g. "is there a blocker
+        # here?" is a single lookup. Kept up-to-date by the functions that 
+        # change Containers' memberships.
+        self.containerMask = numpy.zeros((width, height), dtype = numpy.uint32)
         ## Maps Things to sets of containers they are in.
         self.thingToMemberships = {}
         ## Maps Thing names to those Things.
         self.nameToThing = {}
+        ## Decides the order in which members of the UPDATERS container get
+        # to act.
+        self.scheduler = scheduler.EnergyScheduler(self)
 
 
     ## Update dynamic elements of the map. We do this in order of the
     # updaters' energy ratings, until we get
     # to the player's turn, at which point we yield control back to the UI
-    # layer (for input handling).
+    # layer (for input handling). See mapgen.scheduler for the details.
     def update(self):
         if container.UPDATERS not in self.idToContainerMap:
             return
-        # We'll perform this loop until we get to the player's turn.
-        while True:
-            # Find the entity that has the least amount of "real" time left to
-            # pass before they get a turn.
-            sortedEntities = []
-            updaters = self.getContainer(container.UPDATERS)
-            minTimestep = None
-            for thing in updaters:
-                timestep = float(1 - thing.energy) / thing.getStat('speed')
-                if minTimestep is None or timestep < minTimestep:
-                    minTimestep = timestep
-            if minTimestep > 0:
-                # Add the requisite amount of energy to all entities.
-                for thing in updaters:
-                    thing.addEnergy(thing.getStat('speed') * minTimestep)
-
-            # Sort entities by most energy, and if that's equal, by name.
-            sortedUpdaters = sorted(list(updaters),
-                    lambda a, b: cmp(b.energy, a.energy) or cmp(a.name, b.name))
-            # Update entities with at least 1 energy, until we reach the player.
-            player = self.getContainer(container.PLAYERS)[0]
-            while sortedUpdaters[0].energy >= 1:
-                curCreature = sortedUpdaters[0]
-                # Ensure the creature is still valid -- other creatures may 
-                # have destroyed it.
-                if curCreature not in self.thingToMemberships:
-                    del sortedUpdaters[0]
-                    continue
-                curCreature.update()
-                if curCreature is player:
-                    # All done updating things for now; return control to the
-                    # UI layer.
-                    return
-                # Entity now has a new energy score, so insert them into their
-                # proper location in the list. Assume their energy is probably
-                # low, so start from the back.
-                # \todo This requires a lot of iterating over the list, which
-                # seems inefficient -- an O(N^2) algorithm, potentially. Still,
-                # don't optimize it if it's not a problem.
-                del sortedUpdaters[0]
-                index = len(sortedUpdaters)
-                while (index > 0 and
-                        curCreature.energy > sortedUpdaters[index - 1].energy):
-                    index -= 1
-                sortedUpdaters.insert(index, curCreature)
+        self.scheduler.update()
 
 
     ## Fill in self.cells with an array of empty Containers.
@@ -103,12 +82,8 @@ class GameMap:
         for x in xrange(self.width):
             self.cells.append([])
             for y in xrange(self.height):
-                newCell = cell.Cell((x, y))
-                self.cells[x].append(newCell)
-                # We keep track of Cells both by their position and by their
-                # unique Container IDs.
-                self.idToContainerMap[(x, y)] = newCell
-                self.idToContainerMap[newCell.id] = newCell
+                self.cells[x].append(cell.Cell((x, y)))
+        self.indexCells()
         # HACK: have a Cell at (-1, -1) for objects that need a position but
         # don't need a *valid* position (e.g. in the process of deserializing
         # saved games.
@@ -117,6 +92,15 @@ class GameMap:
         self.idToContainerMap[newCell.id] = newCell
 
 
+    ## Add our Cells to self.idToContainerMap. We keep track of Cells both by
+    # their position and by their unique Container IDs.
+    def indexCells(self):
+        for x, column in enumerate(self.cells):
+            for y, newCell in enumerate(column):
+                self.idToContainerMap[(x, y)] = newCell
+                self.idToContainerMap[newCell.id] = newCell
+
+
     ## Create a new level at the specified depth. This first requires us to
     # delete the old one. In fact, much of the "map" (more like an object
     # database) is preserved whenever a new level is generated -- anything that
@@ -134,7 +118,9 @@ class GameMap:
         # or should we be manually unsubscribing everyone?
         persisters = self.idToContainerMap[container.PERSISTENT]
         self.idToContainerMap = {container.PERSISTENT: persisters}
+        self.scheduler.reset()
         self.makeCellArray()
+        self.containerMask[:] = 0
         for member in persisters:
             member.resubscribe(self)
 
@@ -146,6 +132,8 @@ class GameMap:
             mapgen.generator.makeAngbandLevel(self, targetLevel, self.width, self.height)
 
         self.resetCellFuncs(self.updateCellFuncs)
+        # Practically everything is new.
+        util.serializer.markAllDirty()
         events.publish('new level generation')
 
 
@@ -167,12 +155,33 @@ class GameMap:
     ## Get the accessibility map associated with the provided Container IDs.
     # If we don't have one, make one.
     def getAccessibilityMap(self, *containerIds):
+        return self.getAccessibilityMapper(*containerIds).getMap()
+
+
+    ## Get the AccessibilityMap instance that maintains the accessibility map
+    # for the provided Container IDs, making it if necessary. Useful for
+    # finding out what has changed in the map; see 
+    # AccessibilityMap.getChangesSince().
+    def getAccessibilityMapper(self, *containerIds):
         containerIds = tuple(sorted(containerIds))
         if containerIds not in self.containerIdsToAccessibilityMap:
-            func = lambda cell, gameMap: bool(gameMap.filterContainer(cell, *containerIds))
-            newMap = accessibilityMap.AccessibilityMap(self, func)
+            func = lambda cell, gameMap: gameMap.getHasIntersection(cell.pos, *containerIds)
+            maskBits = None
+            if len(containerIds) == 1:
+                # Can be calculated straight from self.containerMask.
+                maskBits = container.SPECIAL_CONTAINER_TO_BIT.get(
+                        containerIds[0], None)
+            newMap = accessibilityMap.AccessibilityMap(self, func, maskBits)
             self.containerIdsToAccessibilityMap[containerIds] = newMap
-        return self.containerIdsToAccessibilityMap[containerIds].getMap()
+        return self.containerIdsToAccessibilityMap[containerIds]
+
+
+    ## Get the FlowFieldManager that hands out heat maps for this map,
+    # making it if necessary.
+    def getFlowFieldManager(self):
+        if self.flowFieldManager is None:
+            self.flowFieldManager = util.flowField.FlowFieldManager(self)
+        return self.flowFieldManager
 
 
     ## Try to move the given Thing from the first position to the second.
@@ -180,17 +189,21 @@ class GameMap:
     # update where we store the Thing (and its 'pos' field).
     def moveMe(self, thing, source, target):
         x, y = target
-        blockers = self.getContainer((x, y), container.BLOCKERS)
-        result = self.makeContainer()
-        for blocker in blockers:
+        result = container.Container()
+        for blocker in self.iterIntersection((x, y), container.BLOCKERS):
             if not blocker.canMoveThrough(thing):
                 result.subscribe(blocker)
         if not result:
             # It can move there, so move it.
             self.cells[x][y].subscribe(thing)
             self.cells[source[0]][source[1]].unsubscribe(thing)
-            self.thingToMemberships[thing].remove(source)
-            self.thingToMemberships[thing].add(target)
+            util.serializer.markDirty(thing, self.cells[x][y],
+                    self.cells[source[0]][source[1]])
+            memberships = self.thingToMemberships[thing]
+            memberships.remove(source)
+            memberships.add(target)
+            self.updateContainerMask(source, memberships)
+            self.updateContainerMask(target, memberships)
             thing.pos = target
         return result
 
@@ -199,19 +212,34 @@ class GameMap:
     def moveThing(self, thing, fromPos, toPos):
         self.idToContainerMap[fromPos].unsubscribe(thing)
         self.idToContainerMap[toPos].subscribe(thing)
-        self.thingToMemberships[thing].remove(fromPos)
-        self.thingToMemberships[thing].add(toPos)
+        util.serializer.markDirty(thing, self.idToContainerMap[fromPos],
+                self.idToContainerMap[toPos])
+        memberships = self.thingToMemberships[thing]
+        memberships.remove(fromPos)
+        memberships.add(toPos)
+        self.updateContainerMask(fromPos, memberships)
+        self.updateContainerMask(toPos, memberships)
 
 
     ## Add a Thing to a Container. 
     def addSubscriber(self, subscriber, containerID):
-        if containerID not in self.idToContainerMap:
+        target = self.lookupContainer(containerID)
+        if target is None:
             # Make sure the container exists first.
-            self.makeContainer(containerID, notifyOnEmpty = self.containerIsEmpty)
-        self.idToContainerMap[containerID].subscribe(subscriber)
+            target = container.Container(containerID,
+                    notifyOnEmpty = self.containerIsEmpty)
+            self.idToContainerMap[containerID] = target
+        target.subscribe(subscriber)
+        util.serializer.markDirty(subscriber, target)
         if subscriber not in self.thingToMemberships:
             self.thingToMemberships[subscriber] = set()
-        self.thingToMemberships[subscriber].add(containerID)
+        memberships = self.thingToMemberships[subscriber]
+        memberships.add(containerID)
+        self.updateContainerMaskFor(containerID, memberships)
+        if containerID in container.SPECIAL_CONTAINER_TO_BIT:
+            self.notifyCellsOf(subscriber, memberships)
+        if containerID == container.UPDATERS:
+            self.scheduler.add(subscriber)
 
 
     ## Register a Thing by its name, indicating that we want to keep track of 
@@ -224,15 +252,127 @@ class GameMap:
 
     ## Remove a Thing from a Container.
     def removeSubscriber(self, subscriber, containerID):
-        self.idToContainerMap[containerID].unsubscribe(subscriber)
-        self.thingToMemberships[subscriber].remove(containerID)
+        target = self.lookupContainer(containerID)
+        target.unsubscribe(subscriber)
+        util.serializer.markDirty(subscriber, target)
+        memberships = self.thingToMemberships[subscriber]
+        memberships.remove(containerID)
+        self.updateContainerMaskFor(containerID, memberships)
+        if containerID in container.SPECIAL_CONTAINER_TO_BIT:
+            self.notifyCellsOf(subscriber, memberships)
+        if containerID == container.UPDATERS:
+            self.scheduler.remove(subscriber)
+
+
+    ## Bring self.containerMask up-to-date after a Thing has joined or left
+    # the Container with the given ID.
+    # \param memberships IDs of the Containers the Thing is (still) in.
+    def updateContainerMaskFor(self, containerID, memberships):
+        if containerID in container.SPECIAL_CONTAINER_TO_BIT:
+            # Joined or left a special Container; that Container's bit may
+            # have changed for every Cell the Thing is in.
+            for membership in memberships:
+                pos = self.getCellPos(membership)
+                if pos is not None:
+                    self.updateContainerMask(pos, (containerID,))
+        else:
+            pos = self.getCellPos(containerID)
+            if pos is not None:
+                # Joined or left a Cell; that Cell's bits for every special
+                # Container the Thing is in may have changed. Things like
+                # terrain can be in thousands of Cells, so look for the
+                # special Containers rather than going through them all.
+                self.updateContainerMask(pos, [specialID
+                        for specialID in container.SPECIAL_CONTAINERS
+                        if specialID in memberships])
+
+
+    ## Let every Cell the given Thing is in know that it has joined or left a
+    # special Container, so that e.g. the Cell gets drawn again. Otherwise
+    # anything that looked at the Cell between the Thing joining it and
+    # joining (say) ITEMS would be out of date.
+    # \param memberships IDs of the Containers the Thing is (still) in.
+    def notifyCellsOf(self, thing, memberships):
+        for membership in list(memberships):
+            pos = self.getCellPos(membership)
+            if pos is not None and self.getIsInBounds(pos):
+                target = self.cells[pos[0]][pos[1]]
+                if thing in target:
+                    target.notifyMemberChanged(thing)
+
+
+    ## If the given Container ID refers to a Cell (either by its position,
+    # or by its actual ID), then return that Cell's position. Otherwise 
+    # return None.
+    def getCellPos(self, containerID):
+        if type(containerID) is tuple:
+            return containerID
+        target = self.idToContainerMap.get(containerID, None)
+        if isinstance(target, cell.Cell):
+            return target.pos
+        return None
+
+
+    ## Recalculate the bits in self.containerMask at the given position for
+    # any of the given Container IDs that are special Containers.
+    def updateContainerMask(self, pos, containerIDs):
+        if not self.getIsInBounds(pos):
+            return
+        members = self.cells[pos[0]][pos[1]].members
+        mask = self.containerMask.item(pos)
+        for containerID in containerIDs:
+            bit = container.SPECIAL_CONTAINER_TO_BIT.get(containerID, 0)
+            if bit:
+                special = self.idToContainerMap.get(containerID, None)
+                if special is None or members.isdisjoint(special.members):
+                    mask &= ~bit
+                else:
+                    mask |= bit
+        self.containerMask[pos] = mask
+
+
+    ## Recalculate self.containerMask from scratch (e.g. after loading a 
+    # saved game).
+    def resetContainerMask(self):
+        self.containerMask = numpy.zeros((self.width, self.height),
+                dtype = numpy.uint32)
+        for containerID, bit in container.SPECIAL_CONTAINER_TO_BIT.iteritems():
+            special = self.idToContainerMap.get(containerID, None)
+            if special is None:
+                continue
+            for thing in special:
+                for membership in self.thingToMemberships.get(thing, ()):
+                    pos = self.getCellPos(membership)
+                    # Persistent Things' memberships can still mention
+                    # Cells from previous levels, so double-check.
+                    if (pos is not None and self.getIsInBounds(pos) and
+                            thing in self.cells[pos[0]][pos[1]]):
+                        self.containerMask[pos] |= bit
+
+
+    ## Return our per-Cell bitfields of special Container memberships. See
+    # the containerMask field; callers must not modify it.
+    def getContainerMask(self):
+        return self.containerMask
 
 
     ## Destroy the specified Thing, removing it from all relevant containers
     # as we do.
     def destroy(self, thing):
-        for containerID in self.thingToMemberships[thing]:
-            self.idToContainerMap[containerID].unsubscribe(thing)
+        memberships = self.thingToMemberships[thing]
+        for containerID in memberships:
+            target = self.lookupContainer(containerID)
+            # Weakly-held Containers (e.g. the inventory of something that
+            # was itself destroyed) may have gone away already.
+            if target is not None:
+                target.unsubscribe(thing)
+                util.serializer.markDirty(target)
+        for membership in memberships:
+            pos = self.getCellPos(membership)
+            if pos is not None:
+                self.updateContainerMask(pos, memberships)
+        if container.UPDATERS in self.thingToMemberships[thing]:
+            self.scheduler.remove(thing)
         if thing in self.thingToMemberships:
             del self.thingToMemberships[thing]
         if thing.name in self.nameToThing:
@@ -260,27 +400,52 @@ class GameMap:
     # Container constructor, except that we then note down the Container for
     # later tracking. If you want a new Container for any non-transient 
     # purpose, you should use this function so the GameMap can keep track of 
-    # the Container for you.
+    # the Container for you. We only keep track of it for as long as someone
+    # else holds a reference to it, though, so transient Containers don't
+    # pile up in here.
     def makeContainer(self, *args, **kwargs):
         newContainer = container.Container(*args, **kwargs)
-        self.idToContainerMap[newContainer.id] = newContainer
+        self.idToWeakContainerMap[newContainer.id] = newContainer
         return newContainer
 
 
     ## Create a new ContainerMap. See makeContainer.
     def makeContainerMap(self, *args, **kwargs):
         newContainer = container.ContainerMap(*args, **kwargs)
-        self.idToContainerMap[newContainer.id] = newContainer
+        self.idToWeakContainerMap[newContainer.id] = newContainer
         return newContainer
 
 
+    ## Return the Container with the given ID, or None if there is no such
+    # Container.
+    def lookupContainer(self, containerID):
+        result = self.idToContainerMap.get(containerID, None)
+        if result is None:
+            result = self.idToWeakContainerMap.get(containerID, None)
+        return result
+
+
+    ## Put the Containers that our Things own (their inventories and
+    # equipment) back into self.idToWeakContainerMap, which isn't saved
+    # (e.g. after loading a saved game).
+    def indexOwnedContainers(self):
+        for thing in self.thingToMemberships:
+            for owned in [getattr(thing, 'inventory', None),
+                    getattr(thing, 'equipment', None)]:
+                if isinstance(owned, (container.Container,
+                        container.ContainerMap)):
+                    self.idToWeakContainerMap[owned.id] = owned
+
+
     ## Provided with an arbitrary number of Container IDs, return a Container
     # that is all the Things that are in the intersection of all of those
     # Containers (that is, for each additional provided ID, we prune down the
-    # eligible Things).
+    # eligible Things). If we're asked for a single Container that doesn't
+    # exist, we return container.EMPTY_CONTAINER, which must not be modified.
     def getContainer(self, *containerIDs):
-        result = self.idToContainerMap.get(containerIDs[0], 
-                self.makeContainer())
+        result = self.lookupContainer(containerIDs[0])
+        if result is None:
+            result = container.EMPTY_CONTAINER
         if len(containerIDs) == 1:
             # Already done.
             return result
@@ -290,33 +455,111 @@ class GameMap:
     ## Perform an intersection of the given container with the provided
     # container IDs.
     def filterContainer(self, targetContainer, *containerIDs):
-        for containerID in containerIDs:
-            targetContainer = targetContainer.getIntersection(self.getContainer(containerID))
-        return targetContainer
+        if not containerIDs:
+            return targetContainer
+        sets = self.getMemberSets((targetContainer,) + containerIDs)
+        return container.Container(members = sets[0].intersection(*sets[1:]),
+                sortFunc = targetContainer.sortFunc)
+
+
+    ## Given a list of Containers and/or Container IDs, return a list of the
+    # sets of their members, smallest first.
+    def getMemberSets(self, containers):
+        result = []
+        for item in containers:
+            if not isinstance(item, container.Container):
+                item = self.getContainer(item)
+            result.append(item.members)
+        result.sort(key = len)
+        return result
+
+
+    ## Iterate over the Things that are in all of the provided Containers
+    # (which may be given as Containers or as Container IDs), without
+    # building any new Containers. Starting from the smallest set of members,
+    # set.intersection() walks the smaller of each pair; the result is a
+    # snapshot, so it's safe to modify the Containers while iterating.
+    def iterIntersection(self, *containers):
+        sets = self.getMemberSets(containers)
+        return iter(sets[0].intersection(*sets[1:]))
+
+
+    ## Return True if any Thing is in all of the provided Containers (which
+    # may be given as Containers or as Container IDs). Cheaper than
+    # bool(getContainer(...)) since no new Containers or sets are made; e.g.
+    # getHasIntersection(pos, container.BLOCKERS) asks "is anything in the
+    # way at pos?"
+    def getHasIntersection(self, *containers):
+        if len(containers) == 2:
+            first, second = containers
+            if (type(first) is tuple and 
+                    second in container.SPECIAL_CONTAINER_TO_BIT and
+                    0 <= first[0] < self.width and 
+                    0 <= first[1] < self.height):
+                # "Is there anything of this type here?" is answered by
+                # our mask.
+                return bool(self.containerMask.item(first) & 
+                        container.SPECIAL_CONTAINER_TO_BIT[second])
+            # Otherwise, set.isdisjoint() walks the smaller set for us.
+            if not isinstance(first, container.Container):
+                first = self.getContainer(first)
+            if not isinstance(second, container.Container):
+                second = self.getContainer(second)
+            return not first.members.isdisjoint(second.members)
+        # Walk the smallest set, stopping at the first Thing that's in all
+        # of the others.
+        sets = self.getMemberSets(containers)
+        others = sets[1:]
+        for thing in sets[0]:
+            for members in others:
+                if thing not in members:
+                    break
+            else:
+                return True
+        return False
 
 
     ## Generate a ready-to-be-serialized dict representing our data. See the
     # util.serializer module for more information.
     def getSerializationDict(self):
+        # Make certain everyone's energy is up-to-date before it gets saved.
+        self.scheduler.sync()
         result = dict(self.__dict__)
         # These will have to be recreated on load.
         del result['containerIdsToAccessibilityMap']
+        del result['flowFieldManager']
+        del result['saveJournal']
         del result['updateCellFuncs']
+        del result['scheduler']
+        del result['idToWeakContainerMap']
+        del result['containerMask']
+        # Our Cells can be found via self.cells; see fillGameMap().
+        result['idToContainerMap'] = dict(
+                (key, value) for key, value in self.idToContainerMap.iteritems()
+                if not (isinstance(value, cell.Cell) and
+                    self.getIsInBounds(value.pos)))
+        return result
+
+
+    ## As getSerializationDict(), but leave out our Cells, which only change
+    # when a new level is made (and then the next save is always a full
+    # one). See util.serializer.SaveJournal.
+    def getCheckpointDict(self):
+        result = self.getSerializationDict()
+        del result['cells']
         return result
 
 
-    ## Save the game. 
+    ## Save the game. After the first save, we normally only write out
+    # what has changed since the previous save; see util.serializer.SaveJournal.
     def save(self):
         import time
-        saver = util.serializer.Serializer()
         start = time.time()
-        import cProfile
-        saver.addObject(self)
-        curTime = time.time()
-        print "Adding objects took",(curTime - start)
-#        cProfile.runctx('saver.writeFile("save.txt")', locals(), globals(), 'profiling.pro')
-        saver.writeFile('save.txt')
-        print "Writing took",(time.time() - curTime)
+        if self.saveJournal is None:
+            self.saveJournal = util.serializer.SaveJournal('save.txt')
+        isFullSave = self.saveJournal.save(self)
+        print "%s took %.3fs" % (['Checkpoint', 'Full save'][isFullSave],
+                time.time() - start)
 
 
     ## Load the game. Technically this doesn't require any GameMap instance
@@ -324,13 +567,24 @@ class GameMap:
     # GameMap, but this is a convenient location, right next to save(). 
     # \todo Is this really the best place for load()?
     def load(self):
-        loader = util.serializer.Deserializer()
+        loader = util.serializer.Deserializer(isLazy = True)
         loader.loadFile('save.txt')
         newMap = loader.getGameMap()
+        # Further saves can carry on with the same journal.
+        newMap.saveJournal = util.serializer.SaveJournal('save.txt',
+                loader.getSavedIds(), loader.numCheckpoints)
         # Because the map's cells weren't necessarily around when the entities
         # that create update-cell funcs are created, we need to reset all of
         # them now.
         newMap.resetCellFuncs(newMap.updateCellFuncs)
+        # Likewise, the scheduler needs to learn about the loaded updaters,
+        # our Things' inventories need to be registered again, and our Cells'
+        # memberships need to be recalculated.
+        newMap.scheduler.reset()
+        newMap.indexOwnedContainers()
+        newMap.resetContainerMask()
+        # Recreating everything doesn't count as changing it.
+        util.serializer.takeDirtyObjects()
         # Let other entities know about the new GameMap.
         events.publish('new game map', newMap)
 
@@ -343,7 +597,7 @@ class GameMap:
     ## Return a synthetic container of all Things adjacent to the specified
     # position.
     def getAdjacentThings(self, pos):
-        result = self.makeContainer()
+        result = container.Container()
         for xOffset in [-1, 0, 1]:
             for yOffset in [-1, 0, 1]:
                 result.unionAdd(
@@ -378,6 +632,14 @@ def makeBlankGameMap(width, height):
     return GameMap(width, height)
 
 
-util.serializer.registerObjectClass(GameMap.__name__, makeBlankGameMap)
+## Fill in a blank GameMap's data as part of deserialization, and put our
+# Cells back into our idToContainerMap.
+def fillGameMap(gameMap, data, *args):
+    util.serializer.basicDataFill(gameMap, data, *args)
+    gameMap.indexCells()
+
+
+util.serializer.registerObjectClass(GameMap.__name__, makeBlankGameMap,
+        fillGameMap)
 
 
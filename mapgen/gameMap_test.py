@@ -0,0 +1,246 @@
+import pyximport; pyximport.install()
+import mapgen.gameMap
+
+import container
+import things.mixins.updater
+
+import gc
+import numpy
+import os
+import random
+import shutil
+import tempfile
+import time
+
+
+## Minimal creature that wanders around, carrying an inventory, and looking at
+# its surroundings the way the AI does.
+class Wanderer(things.mixins.updater.Updateable):
+    def __init__(self, gameMap, name, pos, rng):
+        things.mixins.updater.Updateable.__init__(self, gameMap, name,
+                speed = 1)
+        self.gameMap = gameMap
+        self.rng = rng
+        self.pos = pos
+        self.inventory = gameMap.makeContainer()
+        gameMap.addSubscriber(self, pos)
+        gameMap.addSubscriber(self, container.BLOCKERS)
+
+
+    def canMoveThrough(self, alt):
+        return False
+
+
+    def update(self):
+        self.addEnergy(-1)
+        gameMap = self.gameMap
+        player = gameMap.getContainer(container.PLAYERS)[0]
+        gameMap.getAdjacentThings(self.pos)
+        gameMap.getContainer(self.pos, container.BLOCKERS)
+        gameMap.getContainer('nonexistent container')
+        x = min(max(self.pos[0] + self.rng.randint(-1, 1), 0),
+                gameMap.width - 1)
+        y = min(max(self.pos[1] + self.rng.randint(-1, 1), 0),
+                gameMap.height - 1)
+        if (x, y) != self.pos:
+            gameMap.moveMe(self, self.pos, (x, y))
+
+
+
+## Play 50,000 turns, with Wanderers dying and being replaced all the while,
+# and make sure the GameMap isn't hanging onto Containers that no one uses.
+def test_containerSoak():
+    rng = random.Random(0)
+    gameMap = mapgen.gameMap.GameMap(20, 20)
+    player = Wanderer(gameMap, 'player', (0, 0), rng)
+    gameMap.addSubscriber(player, container.PLAYERS)
+    wanderers = [Wanderer(gameMap, 'wanderer %d' % i,
+            (rng.randint(0, 19), rng.randint(0, 19)), rng) for i in xrange(5)]
+    numStrongContainers = len(gameMap.idToContainerMap)
+    for turn in xrange(50000):
+        gameMap.update()
+        player.addEnergy(-1)
+        if turn % 10 == 0:
+            gameMap.destroy(wanderers.pop(rng.randint(0, len(wanderers) - 1)))
+            wanderers.append(Wanderer(gameMap, 'wanderer %d' % turn,
+                    (rng.randint(0, 19), rng.randint(0, 19)), rng))
+        if turn % 1000 == 0:
+            gc.collect()
+            assert len(gameMap.idToContainerMap) <= numStrongContainers
+            assert len(gameMap.idToWeakContainerMap) <= len(wanderers) + 1
+
+
+## Asking for a nonexistent Container doesn't make a new one.
+def test_emptyContainer():
+    gameMap = mapgen.gameMap.GameMap(10, 10)
+    numContainers = len(gameMap.idToContainerMap)
+    assert gameMap.getContainer(container.PLAYERS) is container.EMPTY_CONTAINER
+    assert not gameMap.getContainer(container.PLAYERS, container.CREATURES)
+    assert len(gameMap.idToContainerMap) == numContainers
+    try:
+        container.EMPTY_CONTAINER.subscribe(gameMap)
+        assert False
+    except RuntimeError:
+        pass
+    assert not container.EMPTY_CONTAINER
+
+
+## The intersection queries agree with the old chained-getIntersection
+# approach.
+def test_intersectionQueries():
+    rng = random.Random(0)
+    gameMap = mapgen.gameMap.GameMap(10, 10)
+    ids = [container.BLOCKERS, container.CREATURES, container.ITEMS]
+    for i in xrange(200):
+        thing = Wanderer(gameMap, 'wanderer %d' % i,
+                (rng.randint(0, 9), rng.randint(0, 9)), rng)
+        for containerID in ids:
+            if rng.randint(0, 1):
+                gameMap.addSubscriber(thing, containerID)
+    for x in xrange(10):
+        for y in xrange(10):
+            for numIds in xrange(1, len(ids) + 1):
+                queryIds = ids[:numIds]
+                expected = gameMap.getContainer((x, y))
+                for containerID in queryIds:
+                    expected = expected.getIntersection(
+                            gameMap.getContainer(containerID))
+                expected = set(expected)
+                assert set(gameMap.getContainer((x, y), *queryIds)) == expected
+                assert set(gameMap.iterIntersection((x, y), *queryIds)) == expected
+                assert gameMap.getHasIntersection((x, y), *queryIds) == bool(expected)
+
+
+## Time asking every cell of a freshly-generated 120x120 level whether it
+# contains any blockers, with getContainer() and with getHasIntersection(),
+# and time finding the terrain blockers in every cell.
+def speedTest_intersectionQueries():
+    import procs.procLoader
+    procs.procLoader.loadFiles()
+    import procs.procData
+    procs.procData.loadFiles()
+    import things.items.itemLoader
+    things.items.itemLoader.loadFiles()
+    import things.creatures.creatureLoader
+    things.creatures.creatureLoader.loadFiles()
+    import things.terrain.terrainLoader
+    things.terrain.terrainLoader.loadFiles()
+    import things.creatures.player
+    random.seed(0)
+    gameMap = mapgen.gameMap.GameMap(120, 120)
+    things.creatures.player.debugMakePlayer(gameMap)
+    gameMap.makeLevel(1)
+    cells = [(x, y) for x in xrange(120) for y in xrange(120)]
+    for label, func in [
+            ('getContainer', lambda pos: bool(gameMap.getContainer(pos, container.BLOCKERS))),
+            ('filterContainer', lambda pos: bool(gameMap.filterContainer(gameMap.getContainer(pos), container.BLOCKERS))),
+            ('getHasIntersection', lambda pos: gameMap.getHasIntersection(pos, container.BLOCKERS)),
+            ('getContainer (3 IDs)', lambda pos: list(gameMap.getContainer(pos, container.TERRAIN, container.BLOCKERS))),
+            ('iterIntersection (3 IDs)', lambda pos: list(gameMap.iterIntersection(pos, container.TERRAIN, container.BLOCKERS)))]:
+        start = time.time()
+        for i in xrange(10):
+            for pos in cells:
+                func(pos)
+        print "%s: %.2fus per cell" % (label,
+                (time.time() - start) / (10 * len(cells)) * 1000000)
+
+
+## Calculate what GameMap.containerMask should be, the slow way.
+def getExpectedMask(gameMap):
+    result = numpy.zeros((gameMap.width, gameMap.height), dtype = numpy.uint32)
+    for x in xrange(gameMap.width):
+        for y in xrange(gameMap.height):
+            for containerID in container.SPECIAL_CONTAINERS:
+                if gameMap.getContainer((x, y), containerID):
+                    result[x, y] |= container.getSpecialBits(containerID)
+    return result
+
+
+## The per-Cell membership mask stays correct as Things join and leave Cells
+# and special Containers, move around, and are destroyed.
+def test_containerMask():
+    rng = random.Random(0)
+    gameMap = mapgen.gameMap.GameMap(8, 8)
+    ids = [container.BLOCKERS, container.CREATURES, container.ITEMS,
+            container.OPAQUES]
+    wanderers = []
+    for i in xrange(500):
+        roll = rng.randint(0, 5)
+        if roll == 0 or not wanderers:
+            wanderers.append(Wanderer(gameMap, 'wanderer %d' % i,
+                    (rng.randint(0, 7), rng.randint(0, 7)), rng))
+        elif roll == 1:
+            gameMap.destroy(wanderers.pop(rng.randint(0, len(wanderers) - 1)))
+        elif roll == 2:
+            gameMap.addSubscriber(rng.choice(wanderers), rng.choice(ids))
+        elif roll == 3:
+            wanderer = rng.choice(wanderers)
+            memberships = [m for m in gameMap.getMembershipsFor(wanderer)
+                    if m in ids]
+            if memberships:
+                gameMap.removeSubscriber(wanderer, rng.choice(memberships))
+        elif roll == 4:
+            # Pretend to be an alias in a second Cell.
+            gameMap.addSubscriber(rng.choice(wanderers),
+                    (rng.randint(0, 7), rng.randint(0, 7)))
+        else:
+            wanderer = rng.choice(wanderers)
+            target = (rng.randint(0, 7), rng.randint(0, 7))
+            if target not in gameMap.getMembershipsFor(wanderer):
+                gameMap.moveMe(wanderer, wanderer.pos, target)
+        assert (gameMap.containerMask == getExpectedMask(gameMap)).all()
+        for pos in [(0, 0), (3, 4)]:
+            for containerID in ids:
+                assert (gameMap.getHasIntersection(pos, containerID) ==
+                        bool(gameMap.getContainer(pos, containerID)))
+    expected = gameMap.containerMask.copy()
+    gameMap.resetContainerMask()
+    assert (gameMap.containerMask == expected).all()
+
+
+## Saving and loading keeps monsters' inventories registered with the
+# GameMap, so that destroying an Item they carry still takes it out of their
+# inventory, and adding to their inventory by ID doesn't make a new Container.
+def test_saveLoadInventories():
+    import events
+    import util.serializer_test
+    gameMap = util.serializer_test.makeLevel()
+    carriers = [creature for creature in
+            gameMap.getContainer(container.CREATURES)
+            if getattr(creature, 'inventory', None)]
+    assert carriers
+    newMaps = []
+    subscription = events.subscribe('new game map', newMaps.append)
+    oldCwd = os.getcwd()
+    tempDir = tempfile.mkdtemp()
+    try:
+        os.chdir(tempDir)
+        gameMap.save()
+        gameMap.load()
+    finally:
+        os.chdir(oldCwd)
+        shutil.rmtree(tempDir)
+        subscription.cancel()
+    newMap = newMaps[0]
+    idToCreature = dict((creature.id, creature)
+            for creature in newMap.getContainer(container.CREATURES))
+    for carrier in carriers:
+        newCarrier = idToCreature[carrier.id]
+        inventory = newCarrier.inventory
+        assert newMap.lookupContainer(inventory.id) is inventory
+        item = list(inventory)[0]
+        numStrongContainers = len(newMap.idToContainerMap)
+        newMap.destroy(item)
+        assert item not in inventory
+        newMap.addSubscriber(item, inventory.id)
+        assert item in inventory
+        assert len(newMap.idToContainerMap) == numStrongContainers
+
+
+if __name__ == '__main__':
+    test_containerSoak()
+    test_emptyContainer()
+    test_intersectionQueries()
+    test_containerMask()
+    test_saveLoadInventories()
+    speedTest_intersectionQueries()
@@ -11,6 +11,7 @@ import genUtility
 import connection
 import util.geometry
 
+import numpy
 import random
 
 ## Create a cavern region in the dungeon.  
@@ -45,37 +46,44 @@ def createCavern(curMap, genMap, width = 100, height = 80, priority = 1):
     
     # reset the area, erasing information of whatever was there, this region
     # will be blanked even if the cavern fails!
-    for x in xrange(xWest + width - 1):
-        for y in xrange(yNorth + height - 1):
-            genMap.setGridInfo(x, y)
+    # /todo this resets from the NW corner of the map, not of the cavern.
+    genMap.setRectangleInfo(0, 0, xWest + width - 1, yNorth + height - 1)
     # Inital seeding of room squares        
     initializeCavern(genMap, xWest, yNorth, width, height, density)
     # Mutate the cavern several times
     for i in xrange(mutations):
         mutateCavern(genMap, xWest, yNorth, width, height)
       
-    colorMap = connection.getColorMapForArea(genMap, xWest, 
+    clearMask = genMap.getClearMask()
+    labels, sizes = connection.labelRegions(clearMask)
+    regionStarts = connection.getRegionStartsForArea(genMap, labels, xWest,
             yNorth, width, height)
     if genMap.debug:
-        print "Pre-removal, ", len(colorMap), "regions"
+        print "Pre-removal, ", len(regionStarts), "regions"
     # remove all the small regions
-    colorMap = removeSmallRegions(genMap, colorMap)
+    regionStarts = removeSmallRegions(genMap, labels, sizes, regionStarts)
                 
     # make sure we got something
-    if not colorMap:
+    if not regionStarts:
         if genMap.debug:
             print "Cavern failure due to no points"
         return
     
     if genMap.debug:
-        print len(colorMap), "regions detected"
+        print len(regionStarts), "regions detected"
     # make a set of all points in the cavern
+    # Which cavern points become centers depends on the order we go through
+    # them in, so we build up this set the same way we always have.
     cavernPoints = set()
-    for region in colorMap:
-        cavernPoints.update(region)
+    for label, start in regionStarts:
+        cavernPoints.update(connection.floodRegion(clearMask, start,
+                sizes[label]))
     # set information for all the cavern locations
+    isCavern = numpy.in1d(labels, [label for label, start in regionStarts])
+    isCavern = isCavern.reshape(labels.shape)
+    genMap.priorityGrid[isCavern] = numpy.maximum(
+            genMap.priorityGrid[isCavern], priority)
     for location in cavernPoints:
-        genMap.setPriority(location[0], location[1], priority)
         genUtility.clearCell(curMap, location[0], location[1])
     
     # Make a mesh of points
@@ -99,10 +107,12 @@ def initializeCavern(genMap, xWest, yNorth, width, height, density):
     # number of squares to initially set as rooms
     clearSquares = area * density / 100
     
+    xs = []
+    ys = []
     for i in xrange(clearSquares):
-        x = random.randint(xWest, xWest + width - 1)
-        y = random.randint(yNorth, yNorth + height - 1)
-        genMap.setRoom(x, y, True)
+        xs.append(random.randint(xWest, xWest + width - 1))
+        ys.append(random.randint(yNorth, yNorth + height - 1))
+    genMap.roomGrid[xs, ys] = True
         
         
 ## Run the game of life rules (3, 4)  If 0, 1, or 2 surrounding
@@ -110,51 +120,63 @@ def initializeCavern(genMap, xWest, yNorth, width, height, density):
 #  If 5, 6, 7, or 8 squares are floors, the next iteration will
 #  have a floor.  If 3 or 4 squares are floors, the next iteration
 #  will retain whatever state it had.
+#
+#  We update every square in the area (bar the eastmost column and the
+#  southmost row) at once.  Squares outside the area count as neighbors, and
+#  squares outside the map count as walls.
 def mutateCavern(genMap, xWest, yNorth, width, height):
-    # make a new grid for the next evolution
-    tempGrid = [[False for j in xrange(height)] for i in xrange(width)]
-    
-    for x in xrange(xWest, xWest + width - 1):
-        for y in xrange(yNorth, yNorth + height - 1):
-            adjacentRooms = genMap.getNumAdjacentRooms(x, y)
-            if adjacentRooms < 3:
-                tempGrid[x - xWest][y - yNorth] = False
-            elif adjacentRooms > 4:
-                tempGrid[x - xWest][y - yNorth] = True
-            else:
-                tempGrid[x - xWest][y - yNorth] = genMap.isRoom(x, y)
-                
-    # Update genMap            
-    for x in xrange(xWest, xWest + width - 1):
-        for y in xrange(yNorth, yNorth + height - 1):
-            genMap.setRoom(x, y, tempGrid[x - xWest][y - yNorth])
+    # The area, plus a one-square border, with the border outside the map
+    # filled in with walls.
+    rooms = numpy.zeros((width + 1, height + 1), dtype = numpy.int8)
+    xMin = max(0, xWest - 1)
+    yMin = max(0, yNorth - 1)
+    xMax = min(genMap.width, xWest + width)
+    yMax = min(genMap.height, yNorth + height)
+    rooms[xMin - xWest + 1:xMax - xWest + 1, yMin - yNorth + 1:yMax - yNorth + 1] = (
+            genMap.roomGrid[xMin:xMax, yMin:yMax])
+    # Sum each square's neighbors by adding up shifted copies of the area
+    adjacentRooms = numpy.zeros((width - 1, height - 1), dtype = numpy.int8)
+    for dx in xrange(3):
+        for dy in xrange(3):
+            if dx != 1 or dy != 1:
+                adjacentRooms += rooms[dx:dx + width - 1, dy:dy + height - 1]
+
+    area = genMap.roomGrid[xWest:xWest + width - 1, yNorth:yNorth + height - 1]
+    area[adjacentRooms < 3] = False
+    area[adjacentRooms > 4] = True
 
 
 ## Remove all the small regions that aren't large enough
 #  to consider as part of the cavern
-def removeSmallRegions(genMap, colorMap, minimumSize = 8):
-    regionNumber = 0
-    
-    while regionNumber < len(colorMap):
-        if len(colorMap[regionNumber]) >= minimumSize:
-            regionNumber += 1
-            continue
-        # pull out the region
-        region = colorMap.pop(regionNumber)
-        # remove the room settings
-        for location in list(region):
-            genMap.setRoom(location[0], location[1], False)
-    return colorMap
+#  \param labels, sizes Region numbers and sizes, as from
+#  connection.labelRegions.
+#  \param regionStarts List of (region number, location) tuples, as from
+#  connection.getRegionStartsForArea.  Returns the ones for the regions we
+#  keep.
+def removeSmallRegions(genMap, labels, sizes, regionStarts, minimumSize = 8):
+    smallLabels = [label for label, start in regionStarts
+            if sizes[label] < minimumSize]
+    # remove the room settings
+    isSmall = numpy.in1d(labels, smallLabels).reshape(labels.shape)
+    genMap.roomGrid[isSmall] = False
+    return [(label, start) for label, start in regionStarts
+            if sizes[label] >= minimumSize]
     
             
 ## Find center points for the cavern.  This function scans through a 
 #  list of points and returns the cavern square nearest to each point.
+#  As with util.geometry.getNearbyLocation, ties go to whichever square
+#  comes first in cavernPoints.
 def getCavernCenters(genMap, xWest, yNorth, width, height, cavernPoints, centerMesh):
 
     cavernCenters = set()
+    pointList = list(cavernPoints)
+    points = numpy.array(pointList)
     # Start scanning through the mesh
     for location in centerMesh:
         # add the closest point to the set of centers
-        cavernCenters.add(util.geometry.getNearbyLocation(cavernPoints, location))
+        distances = ((points[:, 0] - location[0]) ** 2 +
+                (points[:, 1] - location[1]) ** 2)
+        cavernCenters.add(pointList[distances.argmin()])
 
-    return cavernCenters
\ No newline at end of file
+    return cavernCenters
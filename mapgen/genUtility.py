@@ -75,12 +75,8 @@ def findPlaceableRectangle(genMap, width, height, priority, xWest = None, yNorth
     
 ## See if a rectangle is placeable in the grid
 def isRectanglePlaceable(genMap, xWest, yNorth, width, height, priority):
-    # If this is slow we can speed it up by not checking every cell
-    for x in xrange(xWest, xWest + width):
-        for y in xrange(yNorth, yNorth + height):
-            if genMap.grid[x][y].priority >= priority: 
-                return False
-    return True
+    region = genMap.priorityGrid[xWest:xWest + width, yNorth:yNorth + height]
+    return not (region >= priority).any()
     
 
 ## Create a rectangle of the designated terrain type.
@@ -122,12 +118,6 @@ def makeRectangleHollow(curMap, genMap, xWest, yNorth,
                 clearCell(curMap, x, ySouth)
             curMap.addSubscriber(terrain, (x, yNorth))
             curMap.addSubscriber(terrain, (x, ySouth))
-        
-        genMap.setGridInfo(x, yNorth, priority = priority, 
-                isPierceable = isPierceable, isRoom = isRoom, cost = cost)
-        genMap.setGridInfo(x, ySouth, priority = priority,  
-                isPierceable = isPierceable, isRoom = isRoom, cost = cost) 
-
     
     # Make the West and East columns
     for y in xrange(yNorth + 1, ySouth):
@@ -141,10 +131,14 @@ def makeRectangleHollow(curMap, genMap, xWest, yNorth,
             curMap.addSubscriber(terrain, (xWest, y))
             curMap.addSubscriber(terrain, (xEast, y))            
 
-        genMap.setGridInfo(xWest, y, priority = priority, 
-                isPierceable = isPierceable, isRoom = isRoom, cost = cost)
-        genMap.setGridInfo(xEast, y, priority = priority, 
-                isPierceable = isPierceable, isRoom = isRoom, cost = cost)
+    # Update the generation map one side at a time: top and bottom rows, then
+    # West and East columns
+    for x, y, sideWidth, sideHeight in [(xWest, yNorth, width, 1),
+            (xWest, ySouth, width, 1), (xWest, yNorth + 1, 1, height - 2),
+            (xEast, yNorth + 1, 1, height - 2)]:
+        genMap.setRectangleInfo(x, y, sideWidth, sideHeight,
+                priority = priority, isPierceable = isPierceable,
+                isRoom = isRoom, cost = cost)
         
         
 ## Create a filled rectangle of the designated terrain type.
@@ -173,8 +167,9 @@ def makeRectangleFilled(curMap, genMap, xWest, yNorth,
                 if doErasePrevious:
                     clearCell(curMap, x, y)
                 curMap.addSubscriber(terrain, (x, y))
-            
-            genMap.setGridInfo(x, y, priority = priority, isRoom = isRoom, cost = cost)
+
+    genMap.setRectangleInfo(xWest, yNorth, width, height, priority = priority,
+            isRoom = isRoom, cost = cost)
         
         
 ## Return a random cell in the range ([1, width - 2], [1, height - 2])
@@ -1,5 +1,6 @@
 import util.geometry
 
+import numpy
 import random
 
 ## This class is used to store and manipulate all the temporary
@@ -17,8 +18,20 @@ class GenerationMap:
         ## Information needed for all grids
         # Value of background cost
         self.defaultCost = 20
-        self.grid = ([[GenCell(self.defaultCost) for i in xrange(height)] 
-                for j in xrange(width)])
+        ## Per-cell information is stored in parallel arrays, indexed by
+        # [x, y], so that it can be read and written a region at a time. See
+        # GenCell for what each one means.
+        # Cost for tunneling through each cell. Permanent walls cost 10**10,
+        # so we need 64 bits here.
+        self.costGrid = numpy.empty((width, height), dtype = numpy.int64)
+        self.costGrid.fill(self.defaultCost)
+        self.priorityGrid = numpy.zeros((width, height), dtype = numpy.int)
+        self.roomGrid = numpy.zeros((width, height), dtype = numpy.bool_)
+        self.pierceableGrid = numpy.zeros((width, height), dtype = numpy.bool_)
+        self.tunnelGrid = numpy.zeros((width, height), dtype = numpy.bool_)
+        self.junctionGrid = numpy.zeros((width, height), dtype = numpy.bool_)
+        ## Per-cell view of the arrays above, so that grid[x][y] is a GenCell.
+        self.grid = GenGrid(self)
         ## List of (x,y) tuples specifying all the room centers that need to 
         #  be connected.  
         self.centers = set()
@@ -43,9 +56,9 @@ class GenerationMap:
             print "x, y", x, y
             raise RuntimeError("Out of bounds")
         if not equalIsOK:
-            return priorityValue > self.grid[x][y].priority
+            return priorityValue > self.priorityGrid.item(x, y)
         else:
-            return priorityValue >= self.grid[x][y].priority
+            return priorityValue >= self.priorityGrid.item(x, y)
     
     
     ## Check if we can overwrite priority, then do it
@@ -55,7 +68,7 @@ class GenerationMap:
             print "x, y", x, y
             raise RuntimeError("Out of bounds")     
         if self.isHigherPriority(x, y, priorityValue):
-            self.grid[x][y].priority = priorityValue
+            self.priorityGrid.itemset(x, y, priorityValue)
             
 
     ## Overwrite priority regardless of whether we should
@@ -64,7 +77,7 @@ class GenerationMap:
         if not self.isInBounds(x, y):
             print "x, y", x, y
             raise RuntimeError("Out of bounds")    
-        self.grid[x][y].priority = priorityValue
+        self.priorityGrid.itemset(x, y, priorityValue)
 
         
     ## The set of functions below are used to check and manipulate the
@@ -128,12 +141,14 @@ class GenerationMap:
             raise RuntimeError("Out of bounds")            
         # Add it
         self.junctions.add((x, y))
+        self.junctionGrid.itemset(x, y, True)
         
         
     ## Remove a room junction from the list
     def removeJunction(self, x, y):
         if self.isJunction(x, y):
             self.junctions.remove((x, y))
+            self.junctionGrid.itemset(x, y, False)
                 
             
     ## Get a random junction location
@@ -153,7 +168,7 @@ class GenerationMap:
         if not self.isInBounds(x, y):
             print "x, y", x, y
             raise RuntimeError("Out of bounds")        
-        return self.grid[x][y].isPierceable
+        return self.pierceableGrid.item(x, y)
         
     
     ## Set location as pierceable
@@ -163,7 +178,7 @@ class GenerationMap:
             print "x, y", x, y
             raise RuntimeError("Out of bounds")
         if (not priority) or self.isHigherPriority(x, y, priority):
-            self.grid[x][y].isPierceable = value
+            self.pierceableGrid.itemset(x, y, value)
                    
             
     ## Check whether any squares in the nearby "marchingSquare" are higher priority
@@ -196,7 +211,7 @@ class GenerationMap:
             print "out of bounds", x, y
             print "width, height", self.width, self.height
             raise RuntimeError("out of bounds")
-        return self.grid[x][y].isTunnel
+        return self.tunnelGrid.item(x, y)
         
         
     def setTunnel(self, x, y, value):
@@ -204,7 +219,7 @@ class GenerationMap:
         if not self.isInBounds(x, y):
             print "x, y", x, y
             raise RuntimeError("Out of bounds")            
-        self.grid[x][y].isTunnel = value
+        self.tunnelGrid.itemset(x, y, value)
     
     
     ## The set of functions below are used to check and manipulate
@@ -214,7 +229,7 @@ class GenerationMap:
             print "out of bounds", x, y
             print "width, height", self.width, self.height
             raise RuntimeError("out of bounds")
-        return self.grid[x][y].isRoom
+        return self.roomGrid.item(x, y)
         
         
     def setRoom(self, x, y, value):
@@ -222,7 +237,7 @@ class GenerationMap:
         if not self.isInBounds(x, y):
             print "x, y", x, y
             raise RuntimeError("Out of bounds")            
-        self.grid[x][y].isRoom = value
+        self.roomGrid.itemset(x, y, value)
         
     
     ## Get the number of rooms adjacent (including diagonals)
@@ -246,7 +261,7 @@ class GenerationMap:
         if not self.isInBounds(x, y):
             print "x, y", x, y
             raise RuntimeError("Out of bounds")
-        self.grid[x][y].cost = value
+        self.costGrid.itemset(x, y, value)
         
         
     ## Return the cost for a grid square
@@ -254,7 +269,7 @@ class GenerationMap:
         if not self.isInBounds(x, y):
             print "x, y", x, y
             raise RuntimeError("Out of bounds")
-        return self.grid[x][y].cost
+        return self.costGrid.item(x, y)
         
     
     ## add the cost to the already existing cost
@@ -262,7 +277,7 @@ class GenerationMap:
         if not self.isInBounds(x, y):
             print "x, y", x, y
             raise RuntimeError("Out of bounds")
-        self.grid[x][y].cost += value
+        self.costGrid[x, y] += value
     
     ## General purpose functions
     
@@ -276,6 +291,31 @@ class GenerationMap:
         self.setRoom(x, y, isRoom)
         self.setTunnel(x, y, isTunnel)
         self.setCost(x, y, cost)
+
+
+    ## As setGridInfo, but for every square in a rectangle at once.
+    def setRectangleInfo(self, xWest, yNorth, width, height, priority = 0,
+            isRoom = False, isPierceable = False, isTunnel = False,
+            cost = None):
+        if width <= 0 or height <= 0:
+            return
+        xEast = xWest + width - 1
+        ySouth = yNorth + height - 1
+        # Paranoia, check bounds
+        if not (self.isInBounds(xWest, yNorth) and
+                self.isInBounds(xEast, ySouth)):
+            print "x, y", xWest, yNorth, xEast, ySouth
+            raise RuntimeError("Out of bounds")
+        if cost is None:
+            cost = self.defaultCost
+        region = (slice(xWest, xEast + 1), slice(yNorth, ySouth + 1))
+        # Only raise priorities, as setPriority does.
+        numpy.maximum(self.priorityGrid[region], priority,
+                out = self.priorityGrid[region])
+        self.pierceableGrid[region] = isPierceable
+        self.roomGrid[region] = isRoom
+        self.tunnelGrid[region] = isTunnel
+        self.costGrid[region] = cost
         
     
     ## Check if the location is in bounds
@@ -288,9 +328,25 @@ class GenerationMap:
         return x == 0 or x == self.width - 1 or y == 0 or y == self.width
         
      
+    ## Get an array that's True for every location isBoundary() is true for.
+    def getBoundaryMask(self):
+        mask = numpy.zeros((self.width, self.height), dtype = numpy.bool_)
+        mask[[0, -1], :] = True
+        mask[:, 0] = True
+        if self.width < self.height:
+            mask[:, self.width] = True
+        return mask
+
+
     ## check if the location is clear (either a room or tunnel)
     def isClear(self, x, y):
         return self.isRoom(x, y) or self.isTunnel(x, y)
+
+
+    ## Get an array that's True for every location that is clear and not on
+    # the boundary; i.e. that connected regions can extend into.
+    def getClearMask(self):
+        return (self.roomGrid | self.tunnelGrid) & ~self.getBoundaryMask()
         
         
     ## Get a random cell that fits user given restrictions
@@ -300,9 +356,9 @@ class GenerationMap:
         for i in xrange(tries):
             x = random.randint(0, self.width - 1)
             y = random.randint(0, self.height - 1)
-            if isRoom and not self.grid[x][y].isRoom: 
+            if isRoom and not self.roomGrid.item(x, y): 
                 continue
-            if isPierceable and not self.grid[x][y].isPierceable: 
+            if isPierceable and not self.pierceableGrid.item(x, y): 
                 continue
             return x, y
         # Return something indicating failure
@@ -364,25 +420,76 @@ class GenerationMap:
         return [[northWest, southWest], [northEast, southEast]]
         
         
+## Lets a GenerationMap's grid be used as a list of columns of GenCells, so
+#  that grid[x][y] is the GenCell at (x, y).
+class GenGrid:
+    def __init__(self, genMap):
+        self.genMap = genMap
+
+
+    def __getitem__(self, x):
+        return GenColumn(self.genMap, x)
+
+
+    def __len__(self):
+        return self.genMap.width
+
+
+
+## One column of a GenGrid.
+class GenColumn:
+    def __init__(self, genMap, x):
+        self.genMap = genMap
+        self.x = x
+
+
+    def __getitem__(self, y):
+        return GenCell(self.genMap, self.x, y)
+
+
+    def __len__(self):
+        return self.genMap.height
+
+
+
 ## This class is for information that is stored in a grid map
 #  and is used for dungeon generation.  Information stored here
 #  will disappear after dungeon generation.  Stuff that needs
 #  to stay around until later, needs to go elsewhere.
-class GenCell:
-    def __init__(self, cost):
-        # cost is the background cost for tunneling through something
-        self.cost = cost
-        # Room cells include obstacles that should be treated as connected
-        # e.g. vault cells that should be tunneled through.  It does *not*
-        # include vault cells that are permanent walls
-        self.isRoom = False
-        # These cells surround rooms and are the angband style tunnel's way
-        # of knowing that it hit a new area to connect to.
-        self.isPierceable = False
-        # Tunnel cells may contain doors and rubble.
-        self.isTunnel = False
-        # An area should be allowed to overwrite another area if it's higher priority.
-        # Exception: tunnel cells clearing pierceable cells.
-        self.priority = 0
-
-        
\ No newline at end of file
+#
+#  The information itself lives in the GenerationMap's arrays; GenCells are
+#  just a view onto one square of them.
+class GenCell(object):
+    def __init__(self, genMap, x, y):
+        self.genMap = genMap
+        self.pos = (x, y)
+
+
+    ## Make a property for the given GenerationMap array.
+    def makeProperty(gridName):
+        def getValue(self):
+            return getattr(self.genMap, gridName).item(self.pos)
+        def setValue(self, value):
+            getattr(self.genMap, gridName)[self.pos] = value
+        return property(getValue, setValue)
+
+
+    # cost is the background cost for tunneling through something
+    cost = makeProperty('costGrid')
+    # Room cells include obstacles that should be treated as connected
+    # e.g. vault cells that should be tunneled through.  It does *not*
+    # include vault cells that are permanent walls
+    isRoom = makeProperty('roomGrid')
+    # These cells surround rooms and are the angband style tunnel's way
+    # of knowing that it hit a new area to connect to.
+    isPierceable = makeProperty('pierceableGrid')
+    # Tunnel cells may contain doors and rubble.
+    isTunnel = makeProperty('tunnelGrid')
+    # Tunnels meet or enter rooms at junctions. Use GenerationMap.addJunction
+    # and removeJunction to change this.
+    isJunction = property(
+            lambda self: self.genMap.junctionGrid.item(self.pos))
+    # An area should be allowed to overwrite another area if it's higher priority.
+    # Exception: tunnel cells clearing pierceable cells.
+    priority = makeProperty('priorityGrid')
+    del makeProperty
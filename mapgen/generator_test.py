@@ -0,0 +1,419 @@
+import pyximport; pyximport.install()
+import mapgen.gameMap
+
+import gui
+import mapgen.connection
+import mapgen.genCavern
+import mapgen.generationMap
+import mapgen.genUtility
+import things.creatures.player
+import util.geometry
+import util.serializer_test
+
+import numpy
+import random
+import time
+
+
+## Names of the GenerationMap arrays.
+GRID_NAMES = ['costGrid', 'priorityGrid', 'roomGrid', 'pierceableGrid',
+        'tunnelGrid', 'junctionGrid']
+
+
+## Get a random rectangle, as (xWest, yNorth, width, height), that fits in
+# the given GenerationMap.
+def getRandomRectangle(genMap, rng):
+    xWest = rng.randint(0, genMap.width - 1)
+    yNorth = rng.randint(0, genMap.height - 1)
+    return (xWest, yNorth, rng.randint(0, genMap.width - xWest),
+            rng.randint(0, genMap.height - yNorth))
+
+
+## Setting a rectangle's worth of grid info at once does the same thing as
+# setting it one square at a time.
+def test_setRectangleInfo():
+    rng = random.Random(0)
+    fastMap = mapgen.generationMap.GenerationMap(30, 20)
+    slowMap = mapgen.generationMap.GenerationMap(30, 20)
+    for i in xrange(200):
+        xWest, yNorth, width, height = getRandomRectangle(fastMap, rng)
+        info = {'priority': rng.randint(0, 5),
+                'isRoom': rng.choice([True, False]),
+                'isPierceable': rng.choice([True, False]),
+                'isTunnel': rng.choice([True, False]),
+                'cost': rng.choice([None, 0, 10, 10 ** 10])}
+        fastMap.setRectangleInfo(xWest, yNorth, width, height, **info)
+        for x in xrange(xWest, xWest + width):
+            for y in xrange(yNorth, yNorth + height):
+                slowMap.setGridInfo(x, y, **info)
+        for name in GRID_NAMES:
+            assert (getattr(fastMap, name) == getattr(slowMap, name)).all()
+
+
+## Checking whether a rectangle is placeable checks every square in it.
+def test_isRectanglePlaceable():
+    rng = random.Random(0)
+    genMap = mapgen.generationMap.GenerationMap(30, 20)
+    for i in xrange(20):
+        genMap.setPriority(rng.randint(0, 29), rng.randint(0, 19),
+                rng.randint(1, 5))
+    for i in xrange(500):
+        xWest, yNorth, width, height = getRandomRectangle(genMap, rng)
+        priority = rng.randint(1, 6)
+        isPlaceable = all(genMap.grid[x][y].priority < priority
+                for x in xrange(xWest, xWest + width)
+                for y in xrange(yNorth, yNorth + height))
+        assert (mapgen.genUtility.isRectanglePlaceable(genMap, xWest, yNorth,
+                width, height, priority) == isPlaceable)
+
+
+## The per-square API and the grid of GenCells see the same values as the
+# arrays do.
+def test_genCells():
+    genMap = mapgen.generationMap.GenerationMap(10, 10)
+    assert len(genMap.grid) == len(genMap.grid[0]) == 10
+    cell = genMap.grid[3][4]
+    assert cell.cost == genMap.defaultCost
+    genMap.setRoom(3, 4, True)
+    genMap.setTunnel(3, 4, True)
+    genMap.setPierceable(3, 4, True)
+    genMap.addJunction(3, 4)
+    genMap.setCost(3, 4, 10 ** 10)
+    genMap.addCost(3, 4, 5)
+    genMap.setPriority(3, 4, 2)
+    assert cell.isRoom and cell.isTunnel and cell.isPierceable
+    assert cell.isJunction
+    assert cell.cost == genMap.getCost(3, 4) == 10 ** 10 + 5
+    assert cell.priority == 2
+    cell.isRoom = False
+    cell.priority = 1
+    assert not genMap.isRoom(3, 4)
+    assert not genMap.isHigherPriority(3, 4, 1)
+    genMap.removeJunction(3, 4)
+    assert not cell.isJunction
+    assert genMap.roomGrid.sum() == 0
+    assert genMap.tunnelGrid.sum() == genMap.pierceableGrid.sum() == 1
+
+
+## Cost noise goes everywhere except rooms and tunnels, and block noise
+# covers (width - 1) x (height - 1) squares per block.
+def test_addCostNoise():
+    random.seed(0)
+    genMap = mapgen.generationMap.GenerationMap(50, 40)
+    genMap.setRectangleInfo(5, 5, 10, 10, isRoom = True, cost = 0)
+    genMap.setRectangleInfo(20, 5, 1, 20, isTunnel = True, cost = 0)
+    clear = genMap.roomGrid | genMap.tunnelGrid
+    mapgen.connection.addCostNoise(genMap, noiseType = 'block')
+    assert (genMap.costGrid[clear] == 0).all()
+    assert (genMap.costGrid[~clear] > genMap.defaultCost).any()
+
+    random.seed(0)
+    noise = mapgen.connection.getBlockNoise(numpy.zeros((50, 40)), 50, 40,
+            blockNumber = 1, blockCostMin = 7, blockCostMax = 7)
+    random.seed(0)
+    width = random.randint(1, 15)
+    height = random.randint(1, 15)
+    assert noise.sum() == 7 * (width - 1) * (height - 1)
+
+
+## Make a GenerationMap with random room squares in it.
+def makeRandomRooms(width, height, density, rng):
+    genMap = mapgen.generationMap.GenerationMap(width, height)
+    for x in xrange(width):
+        for y in xrange(height):
+            genMap.setRoom(x, y, rng.randint(1, 100) <= density)
+    return genMap
+
+
+## Run a cavern mutation one square at a time, as genCavern used to.
+def mutateCavernSlowly(genMap, xWest, yNorth, width, height):
+    tempGrid = [[False for j in xrange(height)] for i in xrange(width)]
+    for x in xrange(xWest, xWest + width - 1):
+        for y in xrange(yNorth, yNorth + height - 1):
+            adjacentRooms = genMap.getNumAdjacentRooms(x, y)
+            if adjacentRooms < 3:
+                tempGrid[x - xWest][y - yNorth] = False
+            elif adjacentRooms > 4:
+                tempGrid[x - xWest][y - yNorth] = True
+            else:
+                tempGrid[x - xWest][y - yNorth] = genMap.isRoom(x, y)
+    for x in xrange(xWest, xWest + width - 1):
+        for y in xrange(yNorth, yNorth + height - 1):
+            genMap.setRoom(x, y, tempGrid[x - xWest][y - yNorth])
+
+
+## Find the connected regions in an area one square at a time, as
+# connection.getColorMapForArea used to.
+def getColorMapForAreaSlowly(genMap, xWest, yNorth, width, height):
+    colorMap = []
+    for x in xrange(xWest + width - 1):
+        for y in xrange(yNorth + height - 1):
+            if not genMap.isRoom(x, y):
+                continue
+            if mapgen.connection.getColorFor(colorMap, (x, y)) is None:
+                connectedPoints = set()
+                pointsQueue = set()
+                pointsQueue.add((x, y))
+                while pointsQueue:
+                    curPoint = pointsQueue.pop()
+                    connectedPoints.add(curPoint)
+                    for x2 in xrange(curPoint[0] - 1, curPoint[0] + 2):
+                        for y2 in xrange(curPoint[1] - 1, curPoint[1] + 2):
+                            if (x2, y2) in connectedPoints:
+                                continue
+                            if (genMap.isClear(x2, y2) and
+                                    not genMap.isBoundary(x2, y2)):
+                                pointsQueue.add((x2, y2))
+                colorMap.append(connectedPoints)
+    return colorMap
+
+
+## Mutating a cavern all at once does the same as doing it one square at a
+# time, including for caverns that touch the edges of the map.
+def test_mutateCavern():
+    rng = random.Random(0)
+    for xWest, yNorth, width, height in [(0, 0, 30, 20), (5, 3, 20, 12),
+            (10, 8, 20, 12), (1, 1, 1, 1)]:
+        fastMap = makeRandomRooms(30, 20, 45, rng)
+        slowMap = makeRandomRooms(30, 20, 0, rng)
+        slowMap.roomGrid[:] = fastMap.roomGrid
+        for i in xrange(4):
+            mapgen.genCavern.mutateCavern(fastMap, xWest, yNorth, width, height)
+            mutateCavernSlowly(slowMap, xWest, yNorth, width, height)
+            assert (fastMap.roomGrid == slowMap.roomGrid).all()
+
+
+## Labelling finds the same regions, in the same order, as flood-filling
+# does; and the sets of points in them come out in the same order too.
+def test_getColorMapForArea():
+    rng = random.Random(0)
+    for density in [30, 45, 60]:
+        genMap = makeRandomRooms(60, 40, density, rng)
+        for i in xrange(10):
+            genMap.setTunnel(rng.randint(1, 58), rng.randint(1, 38), True)
+        mapgen.genCavern.mutateCavern(genMap, 5, 5, 50, 30)
+        # Like a real level, nothing at the edges of the map is clear (the
+        # old way raises an exception if it is).
+        edges = numpy.ones((60, 40), dtype = numpy.bool_)
+        edges[1:-1, 1:-1] = False
+        genMap.roomGrid[edges] = genMap.tunnelGrid[edges] = False
+        for area in [(0, 0, 60, 40), (5, 5, 50, 30), (20, 10, 10, 10)]:
+            colorMap = mapgen.connection.getColorMapForArea(genMap, *area)
+            slowColorMap = getColorMapForAreaSlowly(genMap, *area)
+            assert colorMap
+            assert map(list, colorMap) == map(list, slowColorMap)
+
+
+## Every True square gets the label of its region, with regions numbered in
+# the order that they first appear.
+def test_labelRegions():
+    rng = random.Random(0)
+    for density in [20, 50, 80]:
+        genMap = makeRandomRooms(40, 30, density, rng)
+        mask = genMap.roomGrid
+        labels, sizes = mapgen.connection.labelRegions(mask)
+        assert ((labels > 0) == mask).all()
+        assert sizes.sum() == mask.size
+        firstSeen = []
+        for x in xrange(40):
+            for y in xrange(30):
+                if labels[x, y] and labels[x, y] not in firstSeen:
+                    firstSeen.append(labels[x, y])
+                    region = mapgen.connection.floodRegion(mask, (x, y),
+                            mask.size)
+                    assert len(region) == sizes[labels[x, y]]
+                    assert all(labels[point] == labels[x, y]
+                            for point in region)
+        assert firstSeen == range(1, len(sizes))
+
+
+## Time making the shape of a 300x300 cavern, and of a default-sized (100x80)
+# cavern the way we used to, a square at a time.
+def speedTest_cavernShape():
+    for width, height, isSlow in [(100, 80, True), (100, 80, False),
+            (300, 300, False)]:
+        random.seed(0)
+        genMap = mapgen.generationMap.GenerationMap(width + 2, height + 2)
+        start = time.time()
+        mapgen.genCavern.initializeCavern(genMap, 1, 1, width, height, 45)
+        for i in xrange(4):
+            if isSlow:
+                mutateCavernSlowly(genMap, 1, 1, width, height)
+            else:
+                mapgen.genCavern.mutateCavern(genMap, 1, 1, width, height)
+        if isSlow:
+            colorMap = getColorMapForAreaSlowly(genMap, 1, 1, width, height)
+        else:
+            colorMap = mapgen.connection.getColorMapForArea(genMap, 1, 1,
+                    width, height)
+        print "%dx%d cavern%s: %.3fs, %d regions" % (width, height, [" (the old way)", ""][not isSlow], time.time() - start, len(colorMap))
+
+
+## Time making a whole 300x300 cavern, centers and connections included.
+def speedTest_largeCavern():
+    util.serializer_test.loadDataFiles()
+    random.seed(0)
+    gameMap = mapgen.gameMap.GameMap(320, 320)
+    genMap = mapgen.generationMap.GenerationMap(320, 320)
+    gameMap.mapLevel = 1
+    start = time.time()
+    mapgen.genCavern.createCavern(gameMap, genMap, width = 300, height = 300)
+    print "300x300 cavern with %d centers: %.3fs" % (len(genMap.centers), time.time() - start)
+
+
+## Make a map with the given number of randomly-placed rectangular rooms,
+# some of which will overlap.
+def makeRectangleRooms(width, height, numRooms, rng):
+    genMap = mapgen.generationMap.GenerationMap(width, height)
+    for i in xrange(numRooms):
+        roomWidth = rng.randint(3, 12)
+        roomHeight = rng.randint(3, 8)
+        # Leave room around the edges for tunnels to wander in.
+        x = rng.randint(5, width - roomWidth - 6)
+        y = rng.randint(5, height - roomHeight - 6)
+        genMap.setRectangleInfo(x, y, roomWidth, roomHeight, isRoom = True)
+        genMap.addCenter(x + roomWidth / 2, y + roomHeight / 2)
+    return genMap
+
+
+## Join the sets at the ends of the tunnel path in a list-of-sets color map,
+# as connection.updateColorMap used to.
+def updateColorMapSlowly(colorMap, tunnelPath):
+    startIndex = mapgen.connection.getColorFor(colorMap, tunnelPath[-1])
+    region = colorMap.pop(startIndex)
+    endIndex = mapgen.connection.getColorFor(colorMap, tunnelPath[0])
+    region = region.union(colorMap.pop(endIndex))
+    region = region.union(tunnelPath)
+    colorMap.append(region)
+
+
+## ColorMaps hold the same sets in the same order as list-of-sets color maps
+# do, and find the same colors for each location, as their sets get joined
+# together by tunnels (which may run through other sets).
+def test_colorMap():
+    rng = random.Random(0)
+    for trial in xrange(5):
+        genMap = makeRectangleRooms(60, 40, 20, rng)
+        colorMap = mapgen.connection.getColorMap(genMap, genMap.centers)[0]
+        regions = []
+        for center in genMap.centers:
+            if mapgen.connection.getColorFor(regions, center) is None:
+                regions.append(mapgen.connection.getConnectedRegion(genMap,
+                        center))
+        while True:
+            assert len(colorMap) == len(regions)
+            for i in xrange(len(regions)):
+                assert colorMap[i] == regions[i]
+                assert list(colorMap[i]) == list(regions[i])
+            for x in xrange(-1, genMap.width + 1):
+                for y in xrange(-1, genMap.height + 1):
+                    assert (colorMap.getColorFor((x, y)) ==
+                            mapgen.connection.getColorFor(regions, (x, y)))
+            if len(regions) < 2:
+                break
+            # Join two sets with a straight tunnel between random points.
+            startIndex, targetIndex = rng.sample(range(len(regions)), 2)
+            start = rng.choice(list(regions[startIndex]))
+            end = rng.choice(list(regions[targetIndex]))
+            tunnelPath = [end]
+            x, y = end
+            while (x, y) != start:
+                x += cmp(start[0], x)
+                y += cmp(start[1], y)
+                tunnelPath.append((x, y))
+            mapgen.connection.updateColorMap(colorMap, tunnelPath)
+            updateColorMapSlowly(regions, tunnelPath)
+
+
+## ColorMaps pick the same pairs of nearby points as
+# util.geometry.getClosestPoints does, given the same random seed.
+def test_getClosestPoints():
+    rng = random.Random(1)
+    genMap = makeRectangleRooms(80, 60, 30, rng)
+    colorMap = mapgen.connection.getColorMap(genMap, genMap.centers)[0]
+    for i in xrange(200):
+        indexA, indexB = rng.sample(range(len(colorMap)), 2)
+        random.seed(i)
+        expected = util.geometry.getClosestPoints(colorMap[indexA],
+                colorMap[indexB])
+        random.seed(i)
+        assert colorMap.getClosestPoints(indexA, indexB) == expected
+        # Points in both sets are their own closest point.
+        point = rng.choice(list(colorMap[indexA]))
+        assert colorMap.getNearbyLocation(indexA, point) == point
+
+
+## Time connecting up 150 rooms on a 300x300 map, and time looking up colors
+# and nearby points with a ColorMap vs. with a list of sets.
+def speedTest_connectRooms():
+    rng = random.Random(0)
+    random.seed(0)
+    gameMap = mapgen.gameMap.GameMap(300, 300)
+    genMap = makeRectangleRooms(300, 300, 150, rng)
+    # Surround the map with a wall, as generator.makeAngbandLevel does.
+    mapgen.genUtility.makeRectangleHollow(gameMap, genMap, 0, 0, 299, 299,
+            None, priority = 10, cost = 10 ** 10)
+    start = time.time()
+    colorMap = mapgen.connection.getColorMap(genMap, genMap.centers)[0]
+    numRegions = len(colorMap)
+    mapgen.connection.connectRooms(gameMap, genMap, tunnelStyle = 'AStar',
+            noise = 'block')
+    print "Connecting %d regions on a 300x300 map: %.3fs" % (numRegions, time.time() - start)
+
+    genMap = makeRectangleRooms(300, 300, 150, rng)
+    colorMap = mapgen.connection.getColorMap(genMap, genMap.centers)[0]
+    regions = list(colorMap)
+    locations = [(rng.randint(0, 299), rng.randint(0, 299))
+            for i in xrange(10000)]
+    pairs = [rng.sample(range(len(regions)), 2) for i in xrange(1000)]
+    start = time.time()
+    for location in locations:
+        mapgen.connection.getColorFor(regions, location)
+    for indexA, indexB in pairs:
+        util.geometry.getClosestPoints(regions[indexA], regions[indexB])
+    listTime = time.time() - start
+    start = time.time()
+    for location in locations:
+        colorMap.getColorFor(location)
+    for indexA, indexB in pairs:
+        colorMap.getClosestPoints(indexA, indexB)
+    colorMapTime = time.time() - start
+    print "%d color lookups and %d closest-point searches over %d regions: %.3fs with a list of sets, %.3fs with a ColorMap" % (len(locations), len(pairs), len(regions), listTime, colorMapTime)
+
+
+## Time generating 100 seeded 120x120 levels.
+def speedTest_generateLevels():
+    util.serializer_test.loadDataFiles()
+    # Item generation sometimes has things to say; normally the UI would
+    # listen.
+    gui.messenger.message = lambda message: None
+    gameMap = mapgen.gameMap.GameMap(120, 120)
+    things.creatures.player.debugMakePlayer(gameMap)
+    # Go through the first 40 levels, which the creature and item data
+    # handle well, except that the debug vault on every 12th level doesn't
+    # fit in a 120x120 map.
+    levels = [level for level in xrange(1, 41) if level % 12]
+    times = []
+    for seed in xrange(100):
+        random.seed(seed)
+        level = levels[seed % len(levels)]
+        start = time.time()
+        gameMap.makeLevel(level)
+        times.append(time.time() - start)
+    print "Generated %d levels in %.2fs (%.3fs per level, slowest %.3fs)" % (len(times), sum(times), sum(times) / len(times), max(times))
+
+
+if __name__ == '__main__':
+    test_setRectangleInfo()
+    test_isRectanglePlaceable()
+    test_genCells()
+    test_addCostNoise()
+    test_mutateCavern()
+    test_getColorMapForArea()
+    test_labelRegions()
+    test_colorMap()
+    test_getClosestPoints()
+    speedTest_cavernShape()
+    speedTest_largeCavern()
+    speedTest_connectRooms()
+    speedTest_generateLevels()
@@ -0,0 +1,334 @@
+## Schedulers decide which of the Things in the UPDATERS Container get to act,
+# and in what order. Every updater accumulates energy at a rate given by its
+# "speed" stat; once it has at least 1 energy it gets a turn. When several
+# updaters are ready at once, the one with the most energy goes first, with
+# ties broken by name.
+#
+# The GameMap owns a scheduler and forwards UPDATERS membership changes to it
+# (see GameMap.addSubscriber(), removeSubscriber() and destroy()).
+
+import container
+import things.stats
+
+import heapq
+import math
+
+
+
+## Reference scheduler: every step we rescan all updaters to find out how much
+# time needs to pass before someone gets a turn, give everyone that much
+# energy, and re-sort the lot. This is O(N log N) per step and O(N^2) in the
+# worst case, but it's simple, so we keep it around to check the
+# EnergyScheduler against (see mapgen/scheduler_test.py).
+class SortingScheduler:
+    ## \param gameMap The GameMap whose UPDATERS we will be handling.
+    def __init__(self, gameMap):
+        self.gameMap = gameMap
+
+
+    ## We rescan the UPDATERS Container on every step, so we don't need to
+    # track membership changes.
+    def add(self, thing):
+        pass
+
+
+    ## As add().
+    def remove(self, thing):
+        pass
+
+
+    ## As add().
+    def reset(self):
+        pass
+
+
+    ## Everyone's energy is always up-to-date, so there's nothing to do here.
+    def sync(self):
+        pass
+
+
+    ## Update dynamic elements of the map. We do this in order of the
+    # updaters' energy ratings, until we get to the player's turn, at which
+    # point we yield control back to the UI layer (for input handling).
+    def update(self):
+        gameMap = self.gameMap
+        # We'll perform this loop until we get to the player's turn.
+        while True:
+            # Find the entity that has the least amount of "real" time left to
+            # pass before they get a turn.
+            updaters = gameMap.getContainer(container.UPDATERS)
+            minTimestep = None
+            for thing in updaters:
+                timestep = float(1 - thing.energy) / thing.getStat('speed')
+                if minTimestep is None or timestep < minTimestep:
+                    minTimestep = timestep
+            if minTimestep > 0:
+                # Add the requisite amount of energy to all entities.
+                for thing in updaters:
+                    thing.addEnergy(thing.getStat('speed') * minTimestep)
+
+            # Sort entities by most energy, and if that's equal, by name.
+            sortedUpdaters = sorted(list(updaters),
+                    lambda a, b: cmp(b.energy, a.energy) or cmp(a.name, b.name))
+            # Update entities with at least 1 energy, until we reach the player.
+            player = gameMap.getContainer(container.PLAYERS)[0]
+            while sortedUpdaters[0].energy >= 1:
+                curCreature = sortedUpdaters[0]
+                # Ensure the creature is still valid -- other creatures may
+                # have destroyed it.
+                if curCreature not in gameMap.thingToMemberships:
+                    del sortedUpdaters[0]
+                    continue
+                curCreature.update()
+                if curCreature is player:
+                    # All done updating things for now; return control to the
+                    # UI layer.
+                    return
+                # Entity now has a new energy score, so insert them into their
+                # proper location in the list. Assume their energy is probably
+                # low, so start from the back.
+                del sortedUpdaters[0]
+                index = len(sortedUpdaters)
+                while (index > 0 and
+                        curCreature.energy > sortedUpdaters[index - 1].energy):
+                    index -= 1
+                sortedUpdaters.insert(index, curCreature)
+
+
+
+## Indices into the entries in EnergyScheduler.queue. The first five fields
+# determine turn order; heapq compares entries as lists, and the sequence
+# number is unique, so comparison never gets past it.
+(READY_TIME, PRIORITY, ORDER, TIE_BREAK, SEQUENCE,
+        THING, SYNC_TIME, ENERGY, SPEED, IS_VALID) = range(10)
+
+## Values for the ORDER field. Updaters that become ready by the passage of
+# time are ordered by name; updaters that still have a full turn's worth of
+# energy left after acting go behind them, in the order they acted (this
+# matches how SortingScheduler re-inserts them).
+(BY_NAME, BY_SEQUENCE) = range(2)
+
+## Ready times are rounded to the nearest multiple of 1 / TIME_RESOLUTION turns.
+# Using a power of two means that times which are already exact in floating
+# point are unaffected.
+TIME_RESOLUTION = 2 ** 30
+
+
+## Event-driven scheduler: rather than handing out energy to everyone on every
+# step, we keep a heap keyed on the time at which each updater will next
+# reach 1 energy. Each entry remembers the energy and speed the updater had
+# as of a given time, so energy is only actually calculated for an updater
+# when it takes its turn (or when sync() is called).
+#
+# Entries are invalidated lazily: when an updater is removed or its speed
+# changes, its old entry is flagged and skipped when it reaches the top of the
+# heap. Speeds are only rechecked when things.stats.changeCounter tells us
+# that some Stats instance has been modified.
+#
+# This gives the same turn order as the SortingScheduler, with two caveats:
+# - updaters with both the same energy and the same name go in the order they
+#   were scheduled instead of in arbitrary set order.
+# - the SortingScheduler accumulates floating-point rounding error in
+#   everyone's energy, so when two updaters' turns coincide it sometimes
+#   orders them by that error instead of by name. We round ready times off,
+#   so coincident turns are always ordered by name.
+class EnergyScheduler:
+    ## \param gameMap The GameMap whose UPDATERS we will be handling.
+    def __init__(self, gameMap):
+        self.gameMap = gameMap
+        self.reset()
+
+
+    ## Forget everything we know, and start over with the current contents of
+    # the GameMap's UPDATERS Container (if any).
+    def reset(self):
+        ## Current game time, measured in turns at normal speed.
+        self.time = 0.0
+        ## Heap of entries (lists whose fields are indexed by READY_TIME, etc.)
+        self.queue = []
+        ## Number of entries in self.queue that have been invalidated.
+        self.numStaleEntries = 0
+        ## Maps Things to their current entries in self.queue, or to None if
+        # they don't have one (because they're waiting in self.pendingThings,
+        # or are currently taking their turn).
+        self.thingToEntry = {}
+        ## Things that have been added since the last step, and which still
+        # need entries. We can't schedule them immediately because their
+        # speed may not be set yet (e.g. a Creature's stats are filled in
+        # after it has subscribed to the UPDATERS Container).
+        self.pendingThings = []
+        ## The Thing whose turn is currently in progress. For the player,
+        # this persists after update() returns until update() is called
+        # again, since their turn isn't over until the UI says so.
+        self.activeThing = None
+        ## Value of things.stats.changeCounter the last time we checked
+        # everyone's speed.
+        self.statsChangeCounter = things.stats.changeCounter
+        ## Incrementing counter used to keep heap entries unique.
+        self.sequence = 0
+        if container.UPDATERS in self.gameMap.idToContainerMap:
+            for thing in self.gameMap.getContainer(container.UPDATERS):
+                self.add(thing)
+
+
+    ## Start tracking a new updater.
+    def add(self, thing):
+        if thing in self.thingToEntry:
+            # Already tracking them.
+            return
+        self.thingToEntry[thing] = None
+        self.pendingThings.append(thing)
+
+
+    ## Stop tracking an updater. We bring their energy up to date so that
+    # it's correct if they are ever added back in.
+    def remove(self, thing):
+        entry = self.thingToEntry.pop(thing, None)
+        if entry is not None:
+            thing.energy = self.getEnergy(entry)
+            self.invalidate(entry)
+        if thing is self.activeThing:
+            self.activeThing = None
+
+
+    ## Bring the "energy" field of every updater up to date. Only needed when
+    # something other than the updater itself wants to look at its energy
+    # (e.g. when saving the game).
+    def sync(self):
+        for thing, entry in self.thingToEntry.iteritems():
+            if entry is not None:
+                thing.energy = self.getEnergy(entry)
+
+
+    ## Calculate how much energy the updater for the given entry has at the
+    # current time.
+    def getEnergy(self, entry):
+        if self.time >= entry[READY_TIME]:
+            # They've accumulated (at least) a full turn's worth.
+            return max(entry[ENERGY], 1.0)
+        return entry[ENERGY] + entry[SPEED] * (self.time - entry[SYNC_TIME])
+
+
+    ## Create a heap entry for the given updater, which has the given amount
+    # of energy at the current time.
+    # \param hasActed True if the updater has just finished taking a turn at
+    #        the current time, in which case they go behind anyone else who
+    #        is ready now.
+    def schedule(self, thing, energy, hasActed = False):
+        speed = thing.getStat('speed')
+        self.sequence += 1
+        if energy >= 1:
+            # Can act immediately.
+            readyTime = self.time
+            priority = -energy
+        else:
+            readyTime = self.time + float(1 - energy) / speed
+            # Round off so that turns which coincide in exact arithmetic
+            # (e.g. speed 3 and speed 1 updaters, every turn) really do
+            # coincide, and get ordered by name.
+            readyTime = (math.floor(readyTime * TIME_RESOLUTION + .5) /
+                    TIME_RESOLUTION)
+            priority = -1.0
+        if hasActed and readyTime == self.time:
+            order = BY_SEQUENCE
+            tieBreak = self.sequence
+        else:
+            order = BY_NAME
+            tieBreak = thing.name
+        entry = [readyTime, priority, order, tieBreak, self.sequence,
+                thing, self.time, energy, speed, True]
+        self.thingToEntry[thing] = entry
+        heapq.heappush(self.queue, entry)
+
+
+    ## Flag an entry as no longer valid. If too much of the heap is taken up
+    # by such entries, rebuild it.
+    def invalidate(self, entry):
+        entry[IS_VALID] = False
+        # Don't keep dead Things alive until the entry reaches the top.
+        entry[THING] = None
+        self.numStaleEntries += 1
+        if self.numStaleEntries > 32 and self.numStaleEntries * 2 > len(self.queue):
+            self.queue = [e for e in self.queue if e[IS_VALID]]
+            heapq.heapify(self.queue)
+            self.numStaleEntries = 0
+
+
+    ## Remove the entry at the top of the heap.
+    def popEntry(self):
+        entry = heapq.heappop(self.queue)
+        if not entry[IS_VALID]:
+            self.numStaleEntries -= 1
+        return entry
+
+
+    ## Start a new step: schedule any pending updaters, and reschedule anyone
+    # whose speed has changed since the last step.
+    def prepareStep(self):
+        if self.pendingThings:
+            pendingThings = self.pendingThings
+            self.pendingThings = []
+            for thing in pendingThings:
+                if (self.thingToEntry.get(thing, False) is None and
+                        thing is not self.activeThing):
+                    self.schedule(thing, thing.energy)
+        if things.stats.changeCounter != self.statsChangeCounter:
+            self.statsChangeCounter = things.stats.changeCounter
+            for thing, entry in self.thingToEntry.items():
+                if entry is not None and thing.getStat('speed') != entry[SPEED]:
+                    self.invalidate(entry)
+                    self.schedule(thing, self.getEnergy(entry))
+
+
+    ## Updaters that are waiting to act at the current time, but which were
+    # left behind when we last returned to the UI layer, go back to being
+    # ordered by name, just as if we had re-sorted everyone.
+    def resortCurrentStep(self):
+        entries = []
+        while self.queue and self.queue[0][READY_TIME] <= self.time:
+            entries.append(self.popEntry())
+        for entry in entries:
+            if entry[IS_VALID]:
+                entry[ORDER] = BY_NAME
+                entry[TIE_BREAK] = entry[THING].name
+                heapq.heappush(self.queue, entry)
+
+
+    ## Let updaters take their turns, in order, until we get to the player's
+    # turn, at which point we yield control back to the UI layer (for input
+    # handling).
+    def update(self):
+        player = self.gameMap.getContainer(container.PLAYERS)[0]
+        if self.activeThing is not None:
+            # The UI layer has finished the player's turn.
+            thing = self.activeThing
+            self.activeThing = None
+            self.schedule(thing, thing.energy)
+        self.resortCurrentStep()
+        while True:
+            self.prepareStep()
+            while self.queue and not self.queue[0][IS_VALID]:
+                self.popEntry()
+            if not self.queue:
+                # Nobody to update.
+                return
+            # Advance time until someone has a full turn's worth of energy.
+            self.time = max(self.time, self.queue[0][READY_TIME])
+            while self.queue and self.queue[0][READY_TIME] <= self.time:
+                entry = self.popEntry()
+                if not entry[IS_VALID]:
+                    continue
+                thing = entry[THING]
+                thing.energy = self.getEnergy(entry)
+                self.thingToEntry[thing] = None
+                self.activeThing = thing
+                thing.update()
+                if thing is player:
+                    # All done updating things for now; return control to
+                    # the UI layer.
+                    return
+                if self.activeThing is thing:
+                    # They weren't removed during their turn, so they need a
+                    # new entry based on their new energy score.
+                    self.activeThing = None
+                    self.schedule(thing, thing.energy, hasActed = True)
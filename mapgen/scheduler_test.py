@@ -0,0 +1,161 @@
+import pyximport; pyximport.install()
+import mapgen.gameMap
+
+import container
+import mapgen.scheduler
+import things.mixins.updater
+import things.stats
+import things.synthetics.timer
+
+import random
+import time
+
+## Speeds to pick from, weighted roughly as they are in data/creature.txt.
+SPEEDS = [1] * 27 + [2] * 18 + [3] * 6 + [1.5] * 4 + [2.5] * 3 + [0.5] * 2 + [0.75, 4, 0.333]
+## Speeds whose energy and time calculations are exact in floating point. The
+# SortingScheduler lets rounding error decide the order of turns that
+# coincide, so we can only expect the two schedulers to agree when there is
+# no rounding error.
+EXACT_SPEEDS = [0.25, 0.5, 1, 2, 4]
+
+
+## Minimal updater that records when it gets a turn. Occasionally it does
+# something that the scheduler has to notice: changes its own or someone
+# else's speed, kills someone, or starts a Timer.
+class DummyUpdater(things.mixins.updater.Updateable):
+    def __init__(self, gameMap, name, speed, log, rng, isChaotic):
+        things.mixins.updater.Updateable.__init__(self, gameMap, name,
+                speed = speed)
+        self.gameMap = gameMap
+        self.log = log
+        self.rng = rng
+        self.isChaotic = isChaotic
+
+
+    def update(self):
+        self.log.append(self.name)
+        if self.isPlayer():
+            # Energy will be spent by the "command".
+            return
+        self.addEnergy(-1)
+        if not self.isChaotic:
+            return
+        roll = self.rng.randint(0, 99)
+        if roll < 10:
+            # Slow or haste a random updater for a while.
+            target = self.getRandomUpdater()
+            if isinstance(target, DummyUpdater):
+                # Each mod gets its own tier so that they compound instead
+                # of adding up (which could bring speed down to 0).
+                mod = things.stats.StatMod(100 + len(self.log),
+                        multiplier = self.rng.choice([-0.5, 1]))
+                target.stats.addMod('speed', mod)
+                things.synthetics.timer.Timer(self.gameMap,
+                        self.rng.randint(1, 5), target.stats.removeMod,
+                        ('speed', mod), name = 'timer %d' % len(self.log))
+        elif roll < 12:
+            # Kill a random non-player updater.
+            target = self.getRandomUpdater()
+            if isinstance(target, DummyUpdater) and not target.isPlayer():
+                self.gameMap.destroy(target)
+        elif roll < 13:
+            # Take an extra turn right away.
+            self.addEnergy(1)
+
+
+    def getRandomUpdater(self):
+        updaters = self.gameMap.getContainer(container.UPDATERS)
+        return self.rng.choice(sorted(updaters, key = lambda u: u.name))
+
+
+    def isPlayer(self):
+        return self in self.gameMap.getContainer(container.PLAYERS)
+
+
+
+## Make a GameMap using the given scheduler class, with the given number of
+# updaters, and run it for the given number of player turns. Return the
+# sequence of names of updaters that took turns.
+def runScheduler(schedulerClass, numUpdaters, numTurns, isChaotic, 
+        speeds = SPEEDS, seed = 0):
+    rng = random.Random(seed)
+    gameMap = mapgen.gameMap.GameMap(10, 10)
+    gameMap.scheduler = schedulerClass(gameMap)
+    log = []
+    player = DummyUpdater(gameMap, 'player', 1, log, rng, False)
+    gameMap.addSubscriber(player, container.PLAYERS)
+    player.energy = 1
+    for i in xrange(numUpdaters - 1):
+        updater = DummyUpdater(gameMap, 'updater %04d' % i,
+                rng.choice(speeds), log, rng, isChaotic)
+        updater.energy = rng.randint(0, 15) / 16.0
+    for i in xrange(numTurns):
+        gameMap.update()
+        # Pretend the player performed a command.
+        player.addEnergy(-1)
+    return log
+
+
+## Both schedulers should hand out turns in exactly the same order.
+def test_turnOrder():
+    for isChaotic in [False, True]:
+        for seed in xrange(3):
+            expected = runScheduler(mapgen.scheduler.SortingScheduler,
+                    30, 100, isChaotic, EXACT_SPEEDS, seed)
+            actual = runScheduler(mapgen.scheduler.EnergyScheduler,
+                    30, 100, isChaotic, EXACT_SPEEDS, seed)
+            assert expected == actual
+
+
+## Ties in energy are broken by name.
+def test_nameTieBreak():
+    for schedulerClass in [mapgen.scheduler.SortingScheduler,
+            mapgen.scheduler.EnergyScheduler]:
+        gameMap = mapgen.gameMap.GameMap(10, 10)
+        gameMap.scheduler = schedulerClass(gameMap)
+        log = []
+        rng = random.Random(0)
+        player = DummyUpdater(gameMap, 'a player', 1, log, rng, False)
+        gameMap.addSubscriber(player, container.PLAYERS)
+        for name in ['d', 'b', 'c']:
+            DummyUpdater(gameMap, name, 1, log, rng, False)
+        gameMap.update()
+        assert log == ['a player']
+        player.addEnergy(-1)
+        gameMap.update()
+        assert log == ['a player', 'b', 'c', 'd', 'a player']
+
+
+## Saving brings everyone's energy up to date.
+def test_sync():
+    gameMap = mapgen.gameMap.GameMap(10, 10)
+    log = []
+    rng = random.Random(0)
+    player = DummyUpdater(gameMap, 'player', 1, log, rng, False)
+    gameMap.addSubscriber(player, container.PLAYERS)
+    slowpoke = DummyUpdater(gameMap, 'slowpoke', .25, log, rng, False)
+    gameMap.update()
+    player.addEnergy(-1)
+    gameMap.update()
+    gameMap.getSerializationDict()
+    assert slowpoke.energy == .5
+
+
+## Compare the two schedulers with 1,000 updaters over 10,000 player turns.
+def speedTest_schedulers():
+    logs = []
+    for schedulerClass in [mapgen.scheduler.EnergyScheduler,
+            mapgen.scheduler.SortingScheduler]:
+        start = time.time()
+        logs.append(runScheduler(schedulerClass, 1000, 10000, False,
+                EXACT_SPEEDS))
+        print "%s: %d turns in %.2fs" % (schedulerClass.__name__, 
+                len(logs[-1]), time.time() - start)
+    print "Turn orders match:", logs[0] == logs[1]
+
+
+if __name__ == '__main__':
+    test_turnOrder()
+    test_nameTieBreak()
+    test_sync()
+    speedTest_schedulers()
@@ -35,7 +35,9 @@ class BasicAIProc(proc.Proc):
                 creature.meleeAttack(player)
             else:
                 # Find an adjacent cell that takes us closer to the player.
-                heatMap = player.getHeatMap()
+                # Everyone who moves like us shares the same heat map.
+                heatMap = gameMap.getFlowFieldManager().getHeatMap(
+                        container.PLAYERS)
                 bestDistance = heatMap[creature.pos]
                 bestNeighbor = None
                 for x, y in util.geometry.getAdjacent(*creature.pos, 
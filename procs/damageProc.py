@@ -114,6 +114,7 @@ class DamageEquipmentProc(proc.Proc):
                     mod = things.stats.StatMod(0, id = id)
                     itemStats.addMod(self.params['damagedStat'], mod)
                 mod.addend += self.params.get('damageAmount', -1)
+                itemStats.invalidateCache()
                 # Damaging the item reduces the damage the target receives.
                 damage *= self.params.get('HPDamageMultiplier', 1)
                 gui.messenger.message("%s %s" % (targetItem.getShortDescription(), self.params['message']))
@@ -23,6 +23,12 @@ import random
 # monster is hit), the relevant entities are consulted to see if they have
 # any Procs associated with the condition. If they do, those Procs are invoked.
 class Proc:
+    ## True if our trigger() function, when used to calculate a StatMod's
+    # value, can return different results without the relevant Stats
+    # instance changing (e.g. because it looks at the state of the map). Such
+    # StatMods' values can't be cached; see things.stats.Stats.
+    isVolatile = False
+
     ## Create the Proc. In addition to setting basic member fields, we also
     # prepare the Proc to be serializable with a couple of default functions.
     # If these functions don't work for you then you can replace them by 
@@ -107,6 +113,7 @@ class SmartMessageProc(Proc):
 class ReduceQuantityProc(Proc):
     def trigger(self, item, gameMap, *args, **kwargs):
         item.quantity -= 1
+        util.serializer.markDirty(item)
         if item.quantity == 0:
             # No more of the item.
             # \todo For now assuming this always only applies to the player.
@@ -58,6 +58,16 @@ def generateProcFromRecord(record, level = None, trigger = None):
             params = record, procLevel = level)
 
 
+## Get the trigger condition that generateProcFromRecord() would give the proc
+# for the given record, without actually making the proc.
+def getTriggerConditionForRecord(record):
+    if type(record) in [str, unicode]:
+        record = {'name': record}
+    if 'triggerCondition' in record:
+        return record['triggerCondition']
+    return TEMPLATE_NAME_MAP.get(record.get('name'), {}).get('triggerCondition')
+
+
 ## Directly request a proc with the given tuple or name
 def getProc(key, triggerCondition, params, procLevel):
     if key not in proc.PROC_NAME_MAP:
@@ -2,6 +2,7 @@ import container
 import gui
 import things.mixins.carrier
 import util
+import util.serializer
 
 import collections
 import random
@@ -80,6 +81,7 @@ def damageItems(target, gameMap, damage, element):
             verb = ['were', 'was'][numDestroyed == 1]
             gui.messenger.message(getDestructionString(item, numDestroyed))
             item.quantity -= numDestroyed
+            util.serializer.markDirty(item)
             if item.quantity == 0:
                 # Item has been completely destroyed.
                 # \todo Should we provide a different message in this case?
@@ -176,3 +178,19 @@ def showCreatureMessage(text, gameMap, target):
     message = util.grammar.getConjugatedPhrase(
         "{creature} %s" % text[0], gameMap, target, text[1])
     gui.messenger.message(message)
+
+
+## Walk along the given path (as from util.geometry.getLineBetween()), and
+# return the first tile that has something in the BLOCKERS Container, or the
+# end of the path if nothing blocks it. The first tile holds the caster, so it
+# is skipped.
+def getProjectileEnd(gameMap, path):
+    if len(path) < 2:
+        return path[-1]
+    xVals, yVals = zip(*path[1:])
+    mask = gameMap.getContainerMask()[xVals, yVals]
+    isBlocked = (mask & 
+            container.SPECIAL_CONTAINER_TO_BIT[container.BLOCKERS]) != 0
+    if isBlocked.any():
+        return path[1 + isBlocked.argmax()]
+    return path[-1]
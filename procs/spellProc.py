@@ -56,20 +56,13 @@ class ExplosiveProjectileProc(proc.Proc):
         path = util.geometry.getLineBetween(source.pos, target.pos)
         # The path may be interrupted by an obstruction, so walk along it and
         # see what we hit.
-        finalTile = path[-1]
-        # Skip the first tile, which contains us and is thus always valid.
-        for i, tile in enumerate(path[1:]):
-            blockers = gameMap.filterContainer(
-                    gameMap.getContainer(tile), container.BLOCKERS)
-            if blockers:
-                # Found the true end of the path.
-                finalTile = tile
-                break
+        finalTile = procUtil.getProjectileEnd(gameMap, path)
         # Figure out what tiles are hit by the explosion.
-        affectedTiles = []
         blockedMap = gameMap.getAccessibilityMap(container.BLOCKERS)
-        util.fieldOfView.setFieldOfView(blockedMap, finalTile, radius,
-                lambda x, y: affectedTiles.append((x, y)))
+        xMin, yMin, visible = util.fieldOfView.getFieldOfView(blockedMap,
+                finalTile, radius)
+        xVals, yVals = numpy.where(visible)
+        affectedTiles = zip((xVals + xMin).tolist(), (yVals + yMin).tolist())
         gui.animation.drawExplosiveProjectile(source.pos, finalTile, 
                 affectedTiles, element.display)
         # Deal damage to any creatures in the affected tiles; potentially
@@ -90,21 +83,18 @@ class ExplosiveProjectileProc(proc.Proc):
 ## Teleport the target a short distance away.
 class PhaseDoorProc(proc.Proc):
     def trigger(self, target, gameMap, **kwargs):
-        # Get all locations that are between 4 and 10 spaces away.
-        validSpaces = []
-        for cellPos in util.geometry.generateSpiral(*target.pos):
-            distance = util.geometry.gridDistance(target.pos, cellPos)
-            if distance > 10:
-                # All points from here out are too far away.
-                break
-            if distance < 4 or not gameMap.getIsInBounds(cellPos):
-                # Not a valid cell.
-                continue
-
-            contents = gameMap.getContainer(cellPos)
-            if not (gameMap.filterContainer(contents, container.BLOCKERS) or
-                    gameMap.filterContainer(contents, container.CREATURES)):
-                validSpaces.append(cellPos)
+        # Get all in-bounds locations that are between 4 and 10 spaces away,
+        # and which have no blockers or creatures in them.
+        x, y = target.pos
+        width, height = gameMap.getDimensions()
+        minX, maxX = max(x - 10, 0), min(x + 11, width)
+        minY, maxY = max(y - 10, 0), min(y + 11, height)
+        xVals, yVals = numpy.mgrid[minX:maxX, minY:maxY]
+        distance = numpy.maximum(abs(xVals - x), abs(yVals - y))
+        mask = gameMap.getContainerMask()[minX:maxX, minY:maxY]
+        isValid = (distance >= 4) & ((mask & container.getSpecialBits(
+                container.BLOCKERS, container.CREATURES)) == 0)
+        validSpaces = zip(xVals[isValid].tolist(), yVals[isValid].tolist())
         gameMap.moveMe(target, target.pos, random.choice(validSpaces))
 
 
@@ -117,15 +107,7 @@ class ProjectileProc(proc.Proc):
         path = util.geometry.getLineBetween(source.pos, target.pos)
         # The path may be interrupted by an obstruction, so walk along it and
         # see what we hit.
-        finalTile = path[-1]
-        # Skip the first tile, which contains us and is thus always valid.
-        for i, tile in enumerate(path[1:]):
-            blockers = gameMap.filterContainer(
-                    gameMap.getContainer(tile), container.BLOCKERS)
-            if blockers:
-                # Found the true end of the path.
-                finalTile = tile
-                break
+        finalTile = procUtil.getProjectileEnd(gameMap, path)
         gui.animation.drawProjectile(source.pos, finalTile, element.display)
         # Deal damage to any creatures in that tile.
         for target in gameMap.filterContainer(
@@ -148,6 +130,7 @@ class SwapStatsProc(proc.Proc):
         firstMod.addend -= 3
         secondMod = targetStats.getModWithName('fundamental %s' % second)
         secondMod.addend += 3
+        targetStats.invalidateCache()
 
 
 
@@ -172,9 +155,8 @@ class TeleportAwayProc(proc.Proc):
             yVals = random.choice([(2, 22), (height - 22, height - 2)])
             x = random.randint(*xVals)
             y = random.randint(*yVals)
-            contents = gameMap.getContainer((x, y))
-            if (gameMap.filterContainer(contents, container.BLOCKERS) or 
-                    gameMap.filterContainer(contents, container.CREATURES)):
+            if (gameMap.getHasIntersection((x, y), container.BLOCKERS) or 
+                    gameMap.getHasIntersection((x, y), container.CREATURES)):
                 # Invalid teleportation target
                 continue
             isValid = True
@@ -206,9 +188,8 @@ class TeleportToProc(proc.Proc):
             if (sourceDistance > 5) or (validSpaces and 
                     sourceDistance > util.geometry.gridDistance(source.pos, validSpaces[0])):
                 break
-            contents = gameMap.getContainer(space)
-            if (gameMap.filterContainer(contents, container.BLOCKERS) or 
-                    gameMap.filterContainer(contents, container.CREATURES)):
+            if (gameMap.getHasIntersection(space, container.BLOCKERS) or 
+                    gameMap.getHasIntersection(space, container.CREATURES)):
                 # Space is blocked; cannot use.
                 continue
             # Space is free.
@@ -12,9 +12,27 @@ def printFlush(text):
     print text,
     sys.stdout.flush()
 
+## (label, seconds) tuples for each stage of startup so far, for the
+# breakdown we print once we're done.
+stageTimes = []
+## When the current stage of startup began.
+stageStart = time.time()
+# Note that the current stage of startup, with the given label, is done.
+def endStage(label):
+    global stageStart
+    stageTimes.append((label, time.time() - stageStart))
+    stageStart = time.time()
+
 parser = argparse.ArgumentParser()
 parser.add_argument('--seed', dest = 'seed', default = int(time.time()))
-parser.add_argument('--ui', dest='uimode', default = 'WX', choices = ['WX', 'CURSES', 'QT'])
+parser.add_argument('--ui', dest='uimode', default = 'WX', choices = ['WX', 'CURSES', 'QT', 'HEADLESS'])
+parser.add_argument('--script', dest = 'script', default = None,
+        help = "File of inputs for the HEADLESS UI to feed the game; see gui.headlessPyrel.mainApp.")
+parser.add_argument('--turns', dest = 'numTurns', type = int, default = 100,
+        help = "Number of random steps for the HEADLESS UI to take, if there's no script.")
+parser.add_argument('--no-data-cache', dest = 'useDataCache',
+        action = 'store_false',
+        help = "Always load data files directly; see util.dataCache.")
 args = parser.parse_args()
 
 start = time.time()
@@ -33,24 +51,32 @@ import mapgen.gameMap
 printFlush("mapgen.cell...")
 import mapgen.cell
 print "done."
+endStage("compiling")
 
 # Load data files.
+import util.dataCache
+util.dataCache.isEnabled = args.useDataCache
 print "Loading data:",
 printFlush("procs...")
 import procs.procLoader
 procs.procLoader.loadFiles()
+endStage("procs")
 printFlush("proc data...")
 import procs.procData
 procs.procData.loadFiles()
+endStage("proc data")
 printFlush("items...")
 import things.items.itemLoader
 things.items.itemLoader.loadFiles()
+endStage("items")
 printFlush("creatures...")
 import things.creatures.creatureLoader
 things.creatures.creatureLoader.loadFiles()
+endStage("creatures")
 printFlush("terrain...")
 import things.terrain.terrainLoader
 things.terrain.terrainLoader.loadFiles()
+endStage("terrain")
 print "done."
 
 # For now, create the player and game map here. This is clearly the wrong place,
@@ -62,8 +88,12 @@ newMap = mapgen.gameMap.GameMap(120, 120)
 import things.creatures.player
 things.creatures.player.debugMakePlayer(newMap)
 newMap.makeLevel(0)
+endStage("map")
 
 gui.setUIMode(gui.__dict__[args.uimode])
-print "Setup took %.2fs" % (time.time() - start)
+if args.uimode == 'HEADLESS':
+    gui.guiPackage.configure(args.script, args.numTurns)
+print "Setup took %.2fs (%s)" % (time.time() - start,
+        ', '.join(["%s %.2fs" % stage for stage in stageTimes]))
 print "Initializing GUI."
 gui.init(newMap)
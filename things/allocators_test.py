@@ -0,0 +1,144 @@
+import pyximport; pyximport.install()
+import mapgen.gameMap
+
+import things.creatures.creatureAllocator
+import things.creatures.creatureLoader
+import things.creatures.player
+import things.items.itemAllocator
+import things.loaders_test
+import util.weightedTable_test
+
+import random
+import time
+
+
+## Make a small map with a player on it.
+def makeMap():
+    gameMap = mapgen.gameMap.GameMap(20, 20)
+    gameMap.mapLevel = 0
+    things.creatures.player.debugMakePlayer(gameMap)
+    return gameMap
+
+
+## ItemAllocators for the same item level share a table, until an artifact
+# that table could allocate gets made.
+def test_itemTables():
+    things.loaders_test.loadFiles()
+    gameMap = makeMap()
+    owner = gameMap.getContainer((0, 0))
+    allocator = things.items.itemAllocator.ItemAllocator(10)
+    allocator.allocate(gameMap, owner)
+    key = allocator.getTableKey()
+    table = things.items.itemAllocator.ITEM_TABLES.get(key)
+    assert table is not None
+    things.items.itemAllocator.ItemAllocator(10).allocate(gameMap, owner)
+    assert things.items.itemAllocator.ITEM_TABLES.get(key) is table
+
+    artifacts = [entry for entry in table.options
+            if entry.categories.has('artifact')]
+    assert artifacts
+    artifacts[0].makeItem(10, gameMap)
+    assert things.items.itemAllocator.ITEM_TABLES.get(key) is None
+    things.items.itemAllocator.ItemAllocator(10).allocate(gameMap, owner)
+    newTable = things.items.itemAllocator.ITEM_TABLES.get(key)
+    assert artifacts[0] not in newTable.options
+    assert len(newTable) == len(table) - 1
+
+
+## CreatureAllocators for the same creature level share a table, until
+# a creature whose "allocation table creation" procs go into making it
+# changes its mind about whether it may be allocated.
+def test_creatureTables():
+    things.loaders_test.loadFiles()
+    gameMap = makeMap()
+    maggot = things.creatures.creatureLoader.CREATURE_MAP['Farmer Maggot']
+    allocator = things.creatures.creatureAllocator.CreatureAllocator(0)
+    table = allocator.getTable(gameMap)
+    assert maggot in table.options
+    assert (things.creatures.creatureAllocator.CreatureAllocator(0).getTable(
+            gameMap) is table)
+
+    # Maggot is unique, so once he's on the map he can't be allocated.
+    maggot.makeCreature(gameMap, (1, 1))
+    assert allocator.getTable(gameMap) is table
+    newTable = things.creatures.creatureAllocator.CreatureAllocator(0).getTable(
+            gameMap)
+    assert newTable is not table
+    assert maggot not in newTable.options
+    assert (things.creatures.creatureAllocator.CreatureAllocator(0).getTable(
+            gameMap) is newTable)
+
+
+## Rolls against real allocation tables pick the same things as walking down
+# the table does, as the allocators used to.
+def test_tableRolls():
+    things.loaders_test.loadFiles()
+    gameMap = makeMap()
+    rng = random.Random(0)
+    for level in xrange(0, 100, 10):
+        itemTable = things.items.itemAllocator.ItemAllocator(level).makeTable()
+        creatureTable = things.creatures.creatureAllocator.CreatureAllocator(
+                level).makeTable(gameMap)[0]
+        for table in [itemTable, creatureTable]:
+            weightedOptions = getWeightedOptions(table)
+            for i in xrange(200):
+                roll = rng.random() * table.getTotalWeight()
+                assert (table.getOptionForRoll(roll) ==
+                        util.weightedTable_test.getOptionByWalking(
+                            weightedOptions, roll))
+
+
+## Get the list of (weight, option) tuples that the given WeightedTable was
+# made from.
+def getWeightedOptions(table):
+    weights = [b - a for a, b in
+            zip([0] + table.cumulativeWeights, table.cumulativeWeights)]
+    return zip(weights, table.options)
+
+
+## Time 100,000 draws from real item and creature allocation tables, walking
+# down the table vs. using the WeightedTable. Also time getting allocation
+# tables for new allocators, with and without the table caches.
+def speedTest_draws():
+    things.loaders_test.loadFiles()
+    gameMap = makeMap()
+    numDraws = 100000
+    for level in [5, 30, 60]:
+        tables = [
+            ('items', things.items.itemAllocator.ItemAllocator(level).makeTable()),
+            ('creatures', things.creatures.creatureAllocator.CreatureAllocator(
+                level).makeTable(gameMap)[0])]
+        for name, table in tables:
+            weightedOptions = getWeightedOptions(table)
+            total = table.getTotalWeight()
+            rolls = [random.random() * total for i in xrange(numDraws)]
+            start = time.time()
+            for roll in rolls:
+                util.weightedTable_test.getOptionByWalking(weightedOptions, roll)
+            walkTime = time.time() - start
+            start = time.time()
+            for roll in rolls:
+                table.getOptionForRoll(roll)
+            tableTime = time.time() - start
+            print "Level %d %s (%d options): %d draws took %.3fs walking, %.3fs with WeightedTable" % (level, name, len(table), numDraws, walkTime, tableTime)
+
+    numTables = 200
+    itemAllocator = things.items.itemAllocator
+    start = time.time()
+    for i in xrange(numTables):
+        itemAllocator.ItemAllocator(30).makeTable()
+    makeTime = time.time() - start
+    start = time.time()
+    for i in xrange(numTables):
+        allocator = itemAllocator.ItemAllocator(30)
+        itemAllocator.ITEM_TABLES.getTable(allocator.getTableKey(),
+                allocator.makeTable)
+    cacheTime = time.time() - start
+    print "%d item allocation tables took %.3fs to make, %.3fs with the cache" % (numTables, makeTime, cacheTime)
+
+
+if __name__ == '__main__':
+    test_itemTables()
+    test_creatureTables()
+    test_tableRolls()
+    speedTest_draws()
@@ -1,7 +1,14 @@
 import creatureLoader
+import util.weightedTable
 
 import random
 
+
+## Cache of the allocation tables made by CreatureAllocators without filter
+# functions, keyed on creature level. See CreatureAllocator.getTable().
+CREATURE_TABLES = util.weightedTable.TableCache()
+
+
 ## CreatureAllocators are used to select creatures to place into the game map,
 # as appropriate to the given level. They behave similarly to ItemAllocators
 # but are simpler.
@@ -9,88 +16,124 @@ class CreatureAllocator:
     def __init__(self, creatureLevel, filterFuncs = []):
         ## Level at which we generate creatures.
         self.creatureLevel = creatureLevel
-        # filterFuncs A list of functions that accept a CreatureFactory and
-        # returns True if it is desirable, False otherwise. If not supplied, we
-        # assume all creatures are valid.
+        # filterFuncs A list of functions that accept a
+        # creatureFactory.CreatureFactoryEntry and returns True if it is
+        # desirable, False otherwise. If not supplied, we assume all creatures
+        # are valid.
         self.filterFuncs = filterFuncs
 
-        ## List of (commonness, CreatureFactory) tuples, where "commonness" is a
-        # number indicating how common the creature is (larger = more common).
-        self.allocationTable = []
-        ## This is the sum of all commonness values for all valid creatures.
-        self.maxRoll = 0
+        ## Our allocation table, once we've fetched it (see getTable()).
+        self.table = None
 
-        
-    ## \param pos Location at which the creature is placed.
-    def allocate(self, gameMap, pos):
-        if not self.allocationTable:
-            # Generate the allocation table now. Iterate over all possible
-            # creatures, decide if they're valid using the filter func(s), and
-            # insert them into the list.
-            for factory in creatureLoader.CREATURE_MAP.values():
-                if (not factory.rarity or 
-                        sum([not f(factory) for f in self.filterFuncs])):
-                    # Creature is not valid; skip it.
+
+    ## Return True if the "allocation table creation" procs of the given
+    # creatureFactory.CreatureFactoryEntry's factory will let it be
+    # allocated.
+    def getIsAllowed(self, entry, gameMap):
+        # Check if the factory will allow the creature to be allocated.
+        factory = entry.getFactory()
+        for effect in factory.staticProcs["allocation table creation"]:
+            if not effect.trigger(factory = factory, gameMap = gameMap):
+                return False
+        return True
+
+
+    ## Make our allocation table. Returns a WeightedTable of
+    # CreatureFactoryEntries, weighted by how common the creature is (larger
+    # = more common), and a list of (entry, allowed) tuples of the
+    # getIsAllowed() answers we based it on. We only make CreatureFactories
+    # for the creatures we actually allocate, or have to ask about.
+    def makeTable(self, gameMap):
+        allocationTable = []
+        procAnswers = []
+        # Iterate over all possible creatures, decide if they're valid using
+        # the filter func(s), and insert them into the list.
+        for entry in creatureLoader.CREATURE_MAP.values():
+            if (not entry.rarity or 
+                    sum([not f(entry) for f in self.filterFuncs])):
+                # Creature is not valid; skip it.
+                continue
+            elif "allocation table creation" in entry.staticTriggers:
+                isAllowed = self.getIsAllowed(entry, gameMap)
+                procAnswers.append((entry, isAllowed))
+                if not isAllowed:
                     continue
-                elif "allocation table creation" in factory.staticProcs:
-                    # Check if the factory will allow the creature to be 
-                    # allocated.
-                    canAllocate = True
-                    for effect in factory.staticProcs["allocation table creation"]:
-                        if not effect.trigger(factory = factory, 
-                                gameMap = gameMap):
-                            canAllocate = False
-                            break
-                    if not canAllocate:
-                        continue
-
-                try:
-                    # The number of entries a creature gets depends on its
-                    # native depth relative to the desired depth. Entries fall
-                    # off exponentially if the monster is too deep, and linearly
-                    # if it is too shallow.
-                    numEntries = factory.rarity
-                    if factory.nativeDepth > self.creatureLevel:
-                        numEntries /= float(2 ** (factory.nativeDepth - self.creatureLevel))
-                    else:
-                        numEntries -= (self.creatureLevel - factory.nativeDepth)
-                    if numEntries > 0:
-                        numEntries = int(numEntries)
-                        self.maxRoll += numEntries
-                        self.allocationTable.append((numEntries, factory))
-                except Exception, e:
-                    print "Factory for creature %s could not be allocated: %s." % (factory.name, e)
-
-            # Sort the table so the most common creatures are first, to make
-            # repeated allocations faster.
-            # \todo This may be wasted effort if we're only going to do a few
-            # allocations.
-            self.allocationTable.sort(lambda a, b: cmp(a[0], b[0]))
 
+            try:
+                # The number of entries a creature gets depends on its
+                # native depth relative to the desired depth. Entries fall
+                # off exponentially if the monster is too deep, and linearly
+                # if it is too shallow.
+                numEntries = entry.rarity
+                if entry.nativeDepth > self.creatureLevel:
+                    numEntries /= float(2 ** (entry.nativeDepth - self.creatureLevel))
+                else:
+                    numEntries -= (self.creatureLevel - entry.nativeDepth)
+                if numEntries > 0:
+                    numEntries = int(numEntries)
+                    allocationTable.append((numEntries, entry))
+            except Exception, e:
+                print "Factory for creature %s could not be allocated: %s." % (entry.name, e)
+
+        # Keep the table in order from least to most common, so that a given
+        # roll always picks the same creature. With a WeightedTable the order
+        # makes no difference to how quickly we find it.
+        allocationTable.sort(lambda a, b: cmp(a[0], b[0]))
+        return util.weightedTable.WeightedTable(allocationTable), procAnswers
+
+
+    ## Get our allocation table, making it if necessary. Tables for
+    # allocators without filter functions are shared via CREATURE_TABLES,
+    # and remade whenever one of the getIsAllowed() answers they were based
+    # on has changed since (e.g. because a unique creature has been made). We
+    # can't tell whether two sets of filter functions are the same, so
+    # allocators with them make their own tables. Either way, we hang on to
+    # the table for as long as we're around; the "allocation table
+    # selection" procs take care of any changes in the meantime.
+    def getTable(self, gameMap):
+        if self.table is not None:
+            return self.table
+        if self.filterFuncs:
+            self.table = self.makeTable(gameMap)[0]
+            return self.table
+        cached = CREATURE_TABLES.get(self.creatureLevel)
+        if cached is not None:
+            table, procAnswers = cached
+            if all(self.getIsAllowed(entry, gameMap) == isAllowed
+                    for entry, isAllowed in procAnswers):
+                self.table = table
+                return table
+        table, procAnswers = self.makeTable(gameMap)
+        CREATURE_TABLES.set(self.creatureLevel, (table, procAnswers))
+        self.table = table
+        return table
+
+
+    ## \param pos Location at which the creature is placed.
+    def allocate(self, gameMap, pos):
+        table = self.getTable(gameMap)
         numTries = 0
         # \todo Make this a constant somewhere. We should only need retries
         # if the factory rejects allocation of the creature knowing the current
         # game state, which ideally shouldn't happen often.
         while numTries < 1000:
             numTries += 1
-            roll = random.randint(0, self.maxRoll)
-            for commonness, factory in self.allocationTable:
-                roll -= commonness
-                if roll <= 0:
-                    if "allocation table selection" in factory.staticProcs:
-                        canAllocate = True
-                        for effect in factory.staticProcs["allocation table selection"]:
-                            if not effect.trigger(factory = factory,
-                                    gameMap = gameMap):
-                                canAllocate = False
-                                break
-                        if not canAllocate:
-                            break
-
-                    result = factory.makeCreature(gameMap, pos)
-                    return result
+            roll = random.randint(0, table.getTotalWeight())
+            entry = table.getOptionForRoll(roll)
+            if entry is None:
+                continue
+            factory = entry.getFactory()
+            if "allocation table selection" in factory.staticProcs:
+                canAllocate = True
+                for effect in factory.staticProcs["allocation table selection"]:
+                    if not effect.trigger(factory = factory,
+                            gameMap = gameMap):
+                        canAllocate = False
+                        break
+                if not canAllocate:
+                    continue
+
+            result = factory.makeCreature(gameMap, pos)
+            return result
             
         raise RuntimeError("Couldn't manage to pass our allocation filters after %d attempts." % numTries)
-
-
-
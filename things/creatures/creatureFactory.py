@@ -37,6 +37,16 @@ EXTEND_FIELDS = ['blows', 'flags']
 
 
 
+## Build the complete record for a CreatureFactory with the given record, by
+# applying its templates to a copy of it.
+def resolveRecord(record):
+    completeRecord = copy.deepcopy(record)
+    for template in map(creatureLoader.getTemplate, record.get('templates', [])):
+        util.record.applyValues(template.completeRecord, completeRecord)
+    return completeRecord
+
+
+
 ## This class is used to instantiate Creatures *or* to modify existing 
 # Creatures (by applying a template to them). We do this because the records
 # that describe creatures are almost identical to the ones that describe
@@ -45,13 +55,17 @@ EXTEND_FIELDS = ['blows', 'flags']
 class CreatureFactory:
     ## \param record A dictionary of data (deserialized JSON dictionary)
     #         containing all the information we have for this record.
-    def __init__(self, record):
+    # \param completeRecord Our record with our templates applied (see
+    #        resolveRecord()), if we already have it (see util.dataCache).
+    def __init__(self, record, completeRecord = None):
         ## Copy of the dict directly (i.e. without templates being applied) 
         # representing us. We may need this for later reserialization.
         self.record = record
         ## This dict represents all of our attributes, including those inherited
         # from our templates. 
-        self.completeRecord = copy.deepcopy(record)
+        self.completeRecord = completeRecord
+        if self.completeRecord is None:
+            self.completeRecord = resolveRecord(record)
 
         # Start out with a bunch of default values; some of these (possibly
         # even all of them) will get filled in from record in a bit, but we
@@ -107,10 +121,8 @@ class CreatureFactory:
         # a list of the Procs to call.
         self.staticProcs = {}
 
-        # Apply our templates to our complete record, and copy over
-        # Effect instances.
+        # Copy over our templates' Effect instances.
         for template in map(creatureLoader.getTemplate, record.get('templates', [])):
-            util.record.applyValues(template.completeRecord, self.completeRecord)
             util.record.applyValues(template.staticProcs, self.staticProcs)
 
 
@@ -262,3 +274,66 @@ class CreatureFactory:
     def __cmp__(self, alt):
         return cmp(self.nativeDepth, alt.nativeDepth) or cmp(self.name, alt.name)
 
+
+
+
+## Lightweight stand-in for a CreatureFactory, which is what creatureLoader
+# keeps for each creature. Most creatures never show up in a given game, and
+# making a CreatureFactory (with its Stats, Procs, and LootTemplates) is
+# comparatively expensive, so we only hold on to what allocators and their
+# filters need to know about the creature, and make the CreatureFactory the
+# first time it's needed.
+class CreatureFactoryEntry:
+    ## \param record As for CreatureFactory.
+    # \param completeRecord As for CreatureFactory.
+    def __init__(self, record, completeRecord = None):
+        if completeRecord is None:
+            completeRecord = resolveRecord(record)
+        self.record = record
+        ## We hold onto this until our CreatureFactory is made.
+        self.completeRecord = completeRecord
+        ## Our CreatureFactory, once it's been made.
+        self.factory = None
+        self.name = record['name']
+        self.nativeDepth = completeRecord.get('nativeDepth')
+        self.rarity = completeRecord.get('rarity')
+        self.categories = util.extend.Categories()
+        self.categories.update(completeRecord.get('templates', []))
+        ## Trigger conditions of the CreatureFactory's static procs.
+        self.staticTriggers = set()
+        for template in map(creatureLoader.getTemplate, record.get('templates', [])):
+            self.staticTriggers.update(template.staticProcs)
+        for procRecord in completeRecord.get('procs', []):
+            trigger = procs.procLoader.getTriggerConditionForRecord(procRecord)
+            if trigger in procs.proc.STATIC_TRIGGERS:
+                self.staticTriggers.add(trigger)
+
+
+    ## Get our CreatureFactory, making it if necessary.
+    def getFactory(self):
+        if self.factory is None:
+            self.factory = CreatureFactory(self.record, self.completeRecord)
+            self.completeRecord = None
+        return self.factory
+
+
+    ## Create our creature at the specified position.
+    def makeCreature(self, gameMap, pos):
+        return self.getFactory().makeCreature(gameMap, pos)
+
+
+    ## Get the name of the creature.
+    def getName(self):
+        return self.name
+
+
+    ## Anything we don't know about, our CreatureFactory will.
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.getFactory(), name)
+
+
+    ## Sort in the same order as CreatureFactories.
+    def __cmp__(self, alt):
+        return cmp(self.nativeDepth, alt.nativeDepth) or cmp(self.name, alt.name)
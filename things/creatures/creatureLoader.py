@@ -1,6 +1,8 @@
 ## Load the creature_template.txt and creature.txt files.
 
+import creatureAllocator
 import creatureFactory
+import util.dataCache
 import util.record
 
 import json
@@ -8,7 +10,8 @@ import os
 import re
 
 
-## Maps creature name to a factory for that creature.
+## Maps creature name to a creatureFactory.CreatureFactoryEntry for that
+# creature, which makes the creature's CreatureFactory when it's first needed.
 CREATURE_MAP = dict()
 ## Generate a creature of the given name at the specified position.
 def makeCreature(name, gameMap, pos):
@@ -20,12 +23,14 @@ def makeCreature(name, gameMap, pos):
 ## Directly access the factory with the given name.
 def getFactory(name, isCaseSensitive = True):
     if isCaseSensitive:
-        return CREATURE_MAP.get(name, None)
+        if name not in CREATURE_MAP:
+            return None
+        return CREATURE_MAP[name].getFactory()
     # Must scan through the entries manually to do case-insensitive matches.
     name = name.lower()
     for key, val in CREATURE_MAP.iteritems():
         if name == key.lower():
-            return val
+            return val.getFactory()
     # No match
     return None
 
@@ -37,9 +42,15 @@ def getRecordForCreature(creature):
     return CREATURE_MAP[creature.name].record
 
 
-## Retrieve all available CreatureFactories.
+## Retrieve the names of all available creatures.
+def getNames():
+    return CREATURE_MAP.keys()
+
+
+## Retrieve all available CreatureFactories. This makes every one of them, so
+# prefer getNames() or CREATURE_MAP where possible.
 def getAllFactories():
-    return CREATURE_MAP.values()
+    return [entry.getFactory() for entry in CREATURE_MAP.values()]
 
 
 ## Maps template names to CreatureFactory instances.
@@ -51,20 +62,32 @@ def getTemplate(label):
     return TEMPLATE_NAME_MAP[label]
 
 
-## Load our data files.
+## Data files that loadFiles() loads.
+DATA_FILES = [os.path.join('data', 'creature_template.txt'),
+        os.path.join('data', 'creature.txt')]
+
+
+## Load our data files, via a util.dataCache.DataCache.
 def loadFiles():
+    cache = util.dataCache.DataCache('creatures',
+            DATA_FILES + [__file__, util.record.__file__,
+                creatureFactory.__file__])
     # First load the creature templates, because they'll be needed when we 
     # load the actual creatures.
-    templates = util.record.loadRecords(
+    templates = cache.loadRecords(
             os.path.join('data', 'creature_template.txt'), 
-            creatureFactory.CreatureFactory)
+            creatureFactory.CreatureFactory, creatureFactory.resolveRecord)
     for template in templates:
         TEMPLATE_NAME_MAP[template.name] = template
 
-    # Now load the creatures themselves.
-    creatures = util.record.loadRecords(
+    # Now load the creatures themselves; their factories are made on demand.
+    creatures = cache.loadRecords(
             os.path.join('data', 'creature.txt'), 
-            creatureFactory.CreatureFactory)
+            creatureFactory.CreatureFactoryEntry, creatureFactory.resolveRecord)
     for creature in creatures:
         CREATURE_MAP[creature.name] = creature
 
+    cache.save()
+    # Any existing allocation tables refer to the old factories.
+    creatureAllocator.CREATURE_TABLES.clear()
+
@@ -2,8 +2,9 @@ import mapgen.cell
 import container
 import creature
 import gui
+import gui.glyphLayer
 import util.fieldOfView
-import util.cmap
+import util.serializer
 
 import numpy
 import sys
@@ -24,11 +25,11 @@ class Player(creature.Creature):
         
         ## 2D Numpy array of which cells we can currently see.
         self.fovMap = numpy.zeros(gameMap.getDimensions(), dtype = numpy.bool)
+        ## Remembers our recent fields of view, so we can skip recalculating
+        # them when nothing has changed.
+        self.fovCache = util.fieldOfView.FieldOfViewCache()
         ## Boolean to track if we need to recreate the FOV.
         self.haveMadeFOV = False
-        
-        ## 2D Numpy array describing the paths to the player.
-        self.heatMap = None
 
         ## The player's memory of the state of the game map, implemented as a
         # 2D array (list of lists) of Cells. Doesn't include
@@ -46,6 +47,9 @@ class Player(creature.Creature):
                 newCell = mapgen.cell.Cell((x, y))
                 self.mapMemory[x].append(newCell)
                 self.coordsToCell[(x, y)] = newCell
+        ## What the artists should draw for our memory of each cell.
+        self.glyphLayer = gui.glyphLayer.GlyphLayer(self, gameMap.width,
+                gameMap.height)
         gameMap.addUpdateCellFunc(self.onCellChange)
 
 
@@ -68,15 +72,20 @@ class Player(creature.Creature):
     ## A Cell has been modified. We only find out about it if the Cell is
     # visible.
     def onCellChange(self, cell, newThing, wasAdded):
+        memory = self.coordsToCell[cell.pos]
         if newThing is None:
             # Cell is empty.
-            self.coordsToCell[cell.pos].setEmpty()
+            memory.setEmpty()
+            util.serializer.markDirty(memory)
+            self.glyphLayer.markStale(*cell.pos)
             return
         if self.fovMap[cell.pos]:
             if wasAdded:
-                self.coordsToCell[cell.pos].subscribe(newThing)
+                memory.subscribe(newThing)
             else:
-                self.coordsToCell[cell.pos].unsubscribe(newThing)
+                memory.unsubscribe(newThing)
+            util.serializer.markDirty(memory)
+            self.glyphLayer.markStale(*cell.pos)
 
 
     ## Update the player's knowledge of the game world.
@@ -99,11 +108,10 @@ class Player(creature.Creature):
         self.fovMap[:] = 0
         # Get a simplified map of the game that marks the cells that obstruct
         # view.
-        blockedMap = self.gameMap.getAccessibilityMap(container.OPAQUES)
+        mapper = self.gameMap.getAccessibilityMapper(container.OPAQUES)
         # Generate the map of cells that are visible from our position.
         # \todo Make the view radius more configurable.
-        util.fieldOfView.setFieldOfView(blockedMap, self.pos, 20,
-                self.markCellInFOV)
+        self.fovCache.fillFieldOfView(mapper, self.pos, 20, self.fovMap)
         # Find cells whose visibility status has changed
         changedCellLocs = oldMap != self.fovMap
         # Find cells that are newly visible.
@@ -116,6 +124,8 @@ class Player(creature.Creature):
             myCell = self.coordsToCell[(x, y)]
             myCell.setEmpty()
             myCell.unionAdd(self.gameMap.getContainer((x, y)))
+            util.serializer.markDirty(myCell)
+        self.glyphLayer.markStale(xVals, yVals)
         # Find cells that are newly no-longer-visible, and remove all
         # transient entries from our memory of their contents.
         xVals, yVals = numpy.where(numpy.invert(self.fovMap) & changedCellLocs)
@@ -127,11 +137,8 @@ class Player(creature.Creature):
             for oldThing in list(myCell.members):
                 if oldThing in updaters:
                     myCell.unsubscribe(oldThing)
-
-
-    ## Update our field-of-view map.
-    def markCellInFOV(self, x, y):
-        self.fovMap[x, y] = 1
+                    util.serializer.markDirty(myCell)
+                    self.glyphLayer.markStale(x, y)
 
 
     ## Return True iff we can see the specified position.
@@ -143,27 +150,37 @@ class Player(creature.Creature):
         return bool(self.fovMap[pos[0], pos[1]])
 
 
-    ## Generate a heat map describing the valid paths to reach the player.
+    ## Bring the heat map describing the valid paths to reach the player up
+    # to date, so that creatures don't have to wait for it on their turns.
     def generateHeatMap(self):
-        blockedMap = self.gameMap.getAccessibilityMap(container.BLOCKERS)
-        self.heatMap = util.cmap.getHeatMap(blockedMap, [self.pos])
+        self.getHeatMap()
 
 
-    ## Get the heat map. If it hasn't been generated yet, then generate it.
+    ## Get the heat map describing the valid paths to reach the player. This
+    # is shared with everyone else who wants it; see
+    # GameMap.getFlowFieldManager().
     def getHeatMap(self):
-        if self.heatMap is None:
-            # Initialize our heat map for the current map.
-            self.generateHeatMap()
-        return self.heatMap
+        return self.gameMap.getFlowFieldManager().getHeatMap(container.PLAYERS)
 
 
     ## Generate a ready-to-be-serialized dict of our data. See the 
     # util.serializer module for more information.
     def getSerializationDict(self):
         result = dict(self.__dict__)
-        # Remove the Numpy arrays, which util.serializer can't handle.
+        # Remove the Numpy array, which util.serializer can't handle.
         del result['fovMap']
-        del result['heatMap']
+        del result['fovCache']
+        del result['glyphLayer']
+        # This can be recreated from our mapMemory; see fillPlayer().
+        del result['coordsToCell']
+        return result
+
+
+    ## As getSerializationDict(), but leave out our mapMemory, which never
+    # changes (though its Cells do). See util.serializer.SaveJournal.
+    def getCheckpointDict(self):
+        result = self.getSerializationDict()
+        del result['mapMemory']
         return result
 
 
@@ -173,7 +190,19 @@ def makeBlankPlayer(gameMap):
     return Player(gameMap, (-1, -1), 'Blank player')
 
 
-util.serializer.registerObjectClass(Player.__name__, makeBlankPlayer)
+## Fill in a blank Player's data as part of deserialization, and recreate
+# our coordsToCell lookup table.
+def fillPlayer(player, data, *args):
+    util.serializer.basicDataFill(player, data, *args)
+    player.coordsToCell = dict()
+    for x, column in enumerate(player.mapMemory):
+        for y, memory in enumerate(column):
+            player.coordsToCell[(x, y)] = memory
+    player.glyphLayer.markAllStale()
+
+
+util.serializer.registerObjectClass(Player.__name__, makeBlankPlayer,
+        fillPlayer)
 
 
 ## Generate a test player.
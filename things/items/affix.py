@@ -87,7 +87,7 @@ class Affix:
 
         # Build a full record based on the current object and all ancestor templates.
         # NOTE: There are no affix templates, so don't pass any template loader.
-        completeRecord = util.record.buildRecord(self, None)
+        completeRecord = util.record.buildRecord(self.record, None)
         # Apply that record to ourselves, setting appropriate attributes in place.
         util.record.applyRecord(self, completeRecord)
 
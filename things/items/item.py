@@ -140,6 +140,7 @@ class Item(things.thing.Thing, things.mixins.carrier.Carrier):
     ## Toggle display of the container's contents.
     def setIsOpen(self, value):
         self.isContainerOpen = value
+        util.serializer.markDirty(self)
 
 
     ## Return True if the item is a container that is currently "open" (i.e.
@@ -1,9 +1,26 @@
 import allocatorRules
 import itemLoader
+import util.weightedTable
 
 import collections
 import random
 
+
+## Caches of the util.weightedTable.WeightedTables made by ItemAllocators,
+# AffixAllocators, and ThemeAllocators respectively, keyed on everything
+# that goes into making them (see their getTableKey() methods).
+ITEM_TABLES = util.weightedTable.TableCache()
+AFFIX_TABLES = util.weightedTable.TableCache()
+THEME_TABLES = util.weightedTable.TableCache()
+
+## Forget all cached allocation tables; for when the data files are
+# (re)loaded.
+def clearTables():
+    for cache in [ITEM_TABLES, AFFIX_TABLES, THEME_TABLES]:
+        cache.clear()
+
+
+
 ## ItemAllocators are used to generate items of a desired level, with potential
 # filters applied as well.
 class ItemAllocator:
@@ -23,68 +40,75 @@ class ItemAllocator:
             # Now set the final item level
             self.itemLevel = self.lootRules.itemLevel
 
-        ## List of (commonness, ItemFactory) tuples, where "commonness" is a
-        # number indicating how common the item is (larger = more common).
-        self.allocationTable = []
-        ## This is the sum of all commonness values for all valid items.
-        self.maxRoll = 0
 
-        
-    ## \param owner A Container that holds the newly-created Item.
-    def allocate(self, gameMap, owner):
-        # Check for artifact creation specified in lootRules
+    ## Get the key for our allocation table in ITEM_TABLES.
+    def getTableKey(self):
+        if self.lootRules is None:
+            return (self.itemLevel, None, None)
+        return (self.itemLevel, self.lootRules.getFilterSignature(),
+                self.lootRules.artifactChance)
+
+
+    ## Make our allocation table: a WeightedTable of
+    # itemFactory.ItemFactoryEntry instances, weighted by how common the
+    # item is (larger = more common). We only make ItemFactories for the
+    # items we actually allocate.
+    def makeTable(self):
         artifactChance = 1
         if self.lootRules:
-            if self.lootRules.artifactName:
-                artifact = itemLoader.getFactory(self.lootRules.artifactName)
-                result = artifact.makeItem(self.itemLevel, gameMap)
-                gameMap.addSubscriber(result, owner.id)
-                return result
             artifactChance = self.lootRules.artifactChance
+        allocationTable = []
+        # Iterate over all possible items, including artifacts, decide if
+        # they're valid using the filters, and insert them into the list.
+        for entry in itemLoader.ITEM_FACTORY_MAP.values():
+            if self.lootRules and not self.lootRules.isValidItem(entry.categories):
+                # Item is not valid; skip it.
+                continue
+            # Check whether this factory is for creating an artifact
+            isArtifact = False
+            if entry.categories.has('artifact'):
+                if entry.getIsArtifactCreated():
+                    # We've already created this artifact, so skip it
+                    continue
+                isArtifact = True
+            # Find the most applicable allocatorRule entry.
+            bestRule = None
+            for rule in entry.allocatorRules:
+                if rule.isValidAtItemLevel(self.itemLevel):
+                    if bestRule is None or bestRule.commonness < rule.commonness:
+                        bestRule = rule
+            if bestRule is not None:
+                finalCommonness = bestRule.commonness
+                if isArtifact:
+                    # Multiply commonness by artifactChance
+                    finalCommonness = bestRule.commonness * artifactChance
+                allocationTable.append((finalCommonness, entry))
+        # Keep the table in order from least to most common, so that a given
+        # roll always picks the same item. With a WeightedTable the order
+        # makes no difference to how quickly we find it.
+        allocationTable.sort(lambda a, b: cmp(a[0], b[0]))
+        return util.weightedTable.WeightedTable(allocationTable)
+
+
+    ## \param owner A Container that holds the newly-created Item.
+    def allocate(self, gameMap, owner):
+        # Check for artifact creation specified in lootRules
+        if self.lootRules and self.lootRules.artifactName:
+            artifact = itemLoader.getFactory(self.lootRules.artifactName)
+            result = artifact.makeItem(self.itemLevel, gameMap)
+            gameMap.addSubscriber(result, owner.id)
+            return result
 
         # So we're not generating a specific artifact - now we choose an item
-        if not self.allocationTable:
-            # Generate the allocation table now. Iterate over all possible
-            # items, including artifacts, decide if they're valid using the
-            # filters, and insert them into the list.
-            for factory in itemLoader.ITEM_FACTORY_MAP.values():
-                if self.lootRules and not self.lootRules.isValidItem(factory.categories):
-                    # Item is not valid; skip it.
-                    continue
-                # Check whether this factory is for creating an artifact
-                isArtifact = False
-                if factory.categories.has('artifact'):
-                    if factory.artifactCreated:
-                        # We've already created this artifact, so skip it
-                        continue
-                    isArtifact = True
-                # Find the most applicable allocatorRule entry.
-                bestRule = None
-                for rule in factory.allocatorRules:
-                    if rule.isValidAtItemLevel(self.itemLevel):
-                        if bestRule is None or bestRule.commonness < rule.commonness:
-                            bestRule = rule
-                if bestRule is not None:
-                    finalCommonness = bestRule.commonness
-                    if isArtifact:
-                        # Multiply commonness by artifactChance
-                        finalCommonness = bestRule.commonness * artifactChance
-                    self.allocationTable.append((finalCommonness, factory))
-                    self.maxRoll += finalCommonness
-            # Sort the table so the most common items are first, to make
-            # repeated allocations faster.
-            self.allocationTable.sort(lambda a, b: cmp(a[0], b[0]))
-        
-        roll = random.random() * self.maxRoll
-        for commonness, factory in self.allocationTable:
-            roll -= commonness
-            if roll <= 0:
-                result = factory.makeItem(self.itemLevel, gameMap,
-                        lootRules = self.lootRules)
-                gameMap.addSubscriber(result, owner.id)
-                return result
-            
-        raise RuntimeError("Got an invalid roll %d for our item allocation table (nominal max %d)." % (roll, self.maxRoll))
+        table = ITEM_TABLES.getTable(self.getTableKey(), self.makeTable)
+        roll = random.random() * table.getTotalWeight()
+        entry = table.getOptionForRoll(roll)
+        if entry is None:
+            raise RuntimeError("Got an invalid roll %d for our item allocation table (nominal max %d)." % (roll, table.getTotalWeight()))
+        result = entry.makeItem(self.itemLevel, gameMap,
+                lootRules = self.lootRules)
+        gameMap.addSubscriber(result, owner.id)
+        return result
 
 
 
@@ -106,94 +130,108 @@ class AffixAllocator:
             self.limits = limits
         # Affixes already on the item, if any
         self.itemAffixes = itemAffixes
-        # List of (commonness, affix) tuples
-        self.allocationTable = []
-        ## This is the sum of all commonness values for all valid affixes.
-        self.maxRoll = 0
 
 
-    ## Create the allocation table (if necessary) and choose the affix
-    def allocate(self):
-        if not self.allocationTable:
-            # Count the types and levels of affixes already on the item, so
-            # we can use these counts in the coming loops
-            existingTypes = collections.Counter()
-            existingLevels = collections.Counter()
+    ## Get the key for our allocation table in AFFIX_TABLES.
+    def getTableKey(self):
+        limits = self.limits
+        return (self.itemLevel, frozenset(self.itemCategories),
+                frozenset(limits.typesMin or {}),
+                frozenset((limits.typesMax or {}).items()),
+                frozenset(limits.levelsMin or {}),
+                frozenset((limits.levelsMax or {}).items()),
+                limits.minAffixLevel, limits.maxAffixLevel,
+                tuple(sorted((a['name'], a['affixType'], a['affixLevel'])
+                    for a in self.itemAffixes)),
+                self.lootRules.getFilterSignature())
+
+
+    ## Make our allocation table: a WeightedTable of (affix, affix level)
+    # tuples, weighted by how common the affix is at that level.
+    def makeTable(self):
+        allocationTable = []
+        # Count the types and levels of affixes already on the item, so
+        # we can use these counts in the coming loops
+        existingTypes = collections.Counter()
+        existingLevels = collections.Counter()
+        for existingAffix in self.itemAffixes:
+            existingTypes[existingAffix['affixType']] += 1
+            existingLevels[existingAffix['affixLevel']] += 1
+        # Iterate over all possible affixes, decide if they're valid, and
+        # insert valid ones into the list.
+        for affix in itemLoader.AFFIX_NAME_MAP.values():
+            # Find the most applicable allocatorRule entry.
+            bestRule = None
+            # Check for minimum required affix types - discard affixes
+            # that aren't part of any min requirements
+            if (self.limits.typesMin and
+                    affix.affixType not in self.limits.typesMin):
+                continue
+            # Check for maximum allowed affix types - discard affixes that
+            # violate them
+            if (self.limits.typesMax and
+                    affix.affixType in self.limits.typesMax and
+                    existingTypes[affix.affixType] >=
+                    self.limits.typesMax[affix.affixType]):
+                continue
+            # Check for conflicts with affixes already on the item
+            hasAffixConflict = False
             for existingAffix in self.itemAffixes:
-                existingTypes[existingAffix['affixType']] += 1
-                existingLevels[existingAffix['affixLevel']] += 1
-            # Generate the allocation table now. Iterate over all possible
-            # affixes, decide if they're valid, and insert valid ones
-            # into the list.
-            for affix in itemLoader.AFFIX_NAME_MAP.values():
-                # Find the most applicable allocatorRule entry.
-                bestRule = None
-                # Check for minimum required affix types - discard affixes
-                # that aren't part of any min requirements
-                if (self.limits.typesMin and
-                        affix.affixType not in self.limits.typesMin):
-                    continue
-                # Check for maximum allowed affix types - discard affixes that
-                # violate them
-                if (self.limits.typesMax and
-                        affix.affixType in self.limits.typesMax and
-                        existingTypes[affix.affixType] >=
-                        self.limits.typesMax[affix.affixType]):
-                    continue
-                # Check for conflicts with affixes already on the item
-                hasAffixConflict = False
-                for existingAffix in self.itemAffixes:
-                    if existingAffix['name'] in affix.conflicts:
-                        hasAffixConflict = True
-                        break
-                if hasAffixConflict:
+                if existingAffix['name'] in affix.conflicts:
+                    hasAffixConflict = True
+                    break
+            if hasAffixConflict:
+                continue
+            # Check against affixes specified in lootRules
+            if not self.lootRules.isValidAffix(affix.affixType, affix.name):
+                continue
+
+            # The affix itself is valid so we check its allocation rules
+            for rule in affix.allocatorRules:
+                # Meet minimum requirements first - discard all rules that
+                # aren't part of any min requirements
+                if (self.limits.levelsMin and
+                        rule.affixLevel not in self.limits.levelsMin):
                     continue
-                # Check against affixes specified in lootRules
-                if not self.lootRules.isValidAffix(affix.affixType, affix.name):
+                # Check against maxima - discard rules that violate them
+                if (self.limits.levelsMax and
+                        rule.affixLevel in self.limits.levelsMax and
+                        existingLevels[rule.affixLevel] >=
+                        self.limits.levelsMax[rule.affixLevel]):
                     continue
 
-                # The affix itself is valid so we check its allocation rules
-                for rule in affix.allocatorRules:
-                    # Meet minimum requirements first - discard all rules that
-                    # aren't part of any min requirements
-                    if (self.limits.levelsMin and
-                            rule.affixLevel not in self.limits.levelsMin):
-                        continue
-                    # Check against maxima - discard rules that violate them
-                    if (self.limits.levelsMax and
-                            rule.affixLevel in self.limits.levelsMax and
-                            existingLevels[rule.affixLevel] >=
-                            self.limits.levelsMax[rule.affixLevel]):
-                        continue
-
-                    # Check other constraints
-                    if (rule.isValidAtItemLevel(self.itemLevel) and
-                            rule.isValidAffixLevel(self.limits.minAffixLevel,
-                            self.limits.maxAffixLevel) and
-                            rule.isValidItem(self.itemCategories)):
-                        # Finally, a valid rule! We use the best commonness
-                        if bestRule is None or bestRule.commonness < rule.commonness:
-                            bestRule = rule
-                if bestRule is not None:
-                    affix.affixLevel = bestRule.affixLevel
-                    self.allocationTable.append((bestRule.commonness, affix))
-                    self.maxRoll += bestRule.commonness
-            # Sort the table so the most common affixes are first, to make
-            # repeated allocations faster.
-            self.allocationTable.sort(lambda a, b: cmp(a[0], b[0]))
+                # Check other constraints
+                if (rule.isValidAtItemLevel(self.itemLevel) and
+                        rule.isValidAffixLevel(self.limits.minAffixLevel,
+                        self.limits.maxAffixLevel) and
+                        rule.isValidItem(self.itemCategories)):
+                    # Finally, a valid rule! We use the best commonness
+                    if bestRule is None or bestRule.commonness < rule.commonness:
+                        bestRule = rule
+            if bestRule is not None:
+                allocationTable.append((bestRule.commonness,
+                        (affix, bestRule.affixLevel)))
+        # Keep the table in order from least to most common, so that a given
+        # roll always picks the same affix.
+        allocationTable.sort(lambda a, b: cmp(a[0], b[0]))
+        return util.weightedTable.WeightedTable(allocationTable)
+
+
+    ## Get the allocation table (making it if necessary) and choose the affix
+    def allocate(self):
+        table = AFFIX_TABLES.getTable(self.getTableKey(), self.makeTable)
 
         # Drop out if we have no available affixes
-        if self.maxRoll == 0:
+        if table.getTotalWeight() == 0:
             return None
 
         # Select the affix from the allocation table and return it
-        roll = random.random() * self.maxRoll
-        for commonness, affix in self.allocationTable:
-            roll -= commonness
-            if roll <= 0:
-                return affix
-            
-        raise RuntimeError("Got an invalid roll %d for our affix allocation table (nominal max %d)." % (roll, self.maxRoll))
+        roll = random.random() * table.getTotalWeight()
+        choice = table.getOptionForRoll(roll)
+        if choice is None:
+            raise RuntimeError("Got an invalid roll %d for our affix allocation table (nominal max %d)." % (roll, table.getTotalWeight()))
+        affix, affix.affixLevel = choice
+        return affix
 
 
 
@@ -209,80 +247,84 @@ class ThemeAllocator:
         self.itemCategories = itemCategories
         # Affixes already on the item, if any
         self.itemAffixes = itemAffixes
-        # List of (commonness, theme) tuples
-        self.allocationTable = []
-        ## This is the sum of all commonness values for all valid themes.
-        self.maxRoll = 0
 
 
-    ## Create the allocation table (if necessary) and choose the theme
-    def allocate(self):
-        if not self.allocationTable:
-            # Generate the allocation table now. Iterate over all possible
-            # themes, decide if they're valid, and insert valid ones
-            # into the list.
-            for theme in itemLoader.THEME_NAME_MAP.values():
-                # Check against themes specified in lootRules
-                if not self.lootRules.isValidTheme(theme.name):
-                    continue
+    ## Get the key for our allocation table in THEME_TABLES.
+    def getTableKey(self):
+        return (self.itemLevel, frozenset(self.itemCategories),
+                tuple(sorted(a['name'] for a in self.itemAffixes)),
+                self.lootRules.getFilterSignature())
 
-                isValid = False
-                # The theme itself is valid so we check its allocation rules
-                for rule in theme.allocatorRules:
-                    if (rule.isValidAtItemLevel(self.itemLevel) and
-                            rule.isValidItem(self.itemCategories)):
-                        isValid = True
-                        
-                if not isValid:
-                    continue
-                        
-                # Now we check for relevant affixes
-                totalCount = 0
-                totalWeight = 0
-                themeWeight = 0
-                # Iterate over all affixes listed in the theme 
-                for themeAffix in theme.affixes:
-                    count = 0
-                    # Weighting is a list of likelihoods of selecting
-                    # this affix, because affixes can be relevant to a
-                    # theme more than once.
-                    weighting = themeAffix['weighting']
-                    if type(weighting) is not list:
-                        weighting = [weighting]
-                    themeWeight += sum(weighting)
-                    # If it's on the item, add the correct weighting
-                    for itemAffix in self.itemAffixes:
-                        if itemAffix['name'] == themeAffix['name']:
-                            count += 1
-                            if count and count <= len(weighting):
-                                totalWeight += weighting[count - 1]
-                    if count:
-                        totalCount += 1
-
-                # If we have two or more relevant affixes, add us to the table                                
-                if totalCount > 1:
-                    # This is the formula used to determine chance of a theme
-                    commonness = float(8 * totalWeight ** 2) / themeWeight
-                    self.allocationTable.append((commonness, theme))
-                    self.maxRoll += commonness
-            # Sort the table so the most common themes are first, to make
-            # repeated allocations faster.
-            self.allocationTable.sort()
+
+    ## Make our allocation table: a WeightedTable of themes, weighted by how
+    # well the item's affixes fit them.
+    def makeTable(self):
+        allocationTable = []
+        # Iterate over all possible themes, decide if they're valid, and
+        # insert valid ones into the list.
+        for theme in itemLoader.THEME_NAME_MAP.values():
+            # Check against themes specified in lootRules
+            if not self.lootRules.isValidTheme(theme.name):
+                continue
+
+            isValid = False
+            # The theme itself is valid so we check its allocation rules
+            for rule in theme.allocatorRules:
+                if (rule.isValidAtItemLevel(self.itemLevel) and
+                        rule.isValidItem(self.itemCategories)):
+                    isValid = True
+                    
+            if not isValid:
+                continue
+                    
+            # Now we check for relevant affixes
+            totalCount = 0
+            totalWeight = 0
+            themeWeight = 0
+            # Iterate over all affixes listed in the theme 
+            for themeAffix in theme.affixes:
+                count = 0
+                # Weighting is a list of likelihoods of selecting
+                # this affix, because affixes can be relevant to a
+                # theme more than once.
+                weighting = themeAffix['weighting']
+                if type(weighting) is not list:
+                    weighting = [weighting]
+                themeWeight += sum(weighting)
+                # If it's on the item, add the correct weighting
+                for itemAffix in self.itemAffixes:
+                    if itemAffix['name'] == themeAffix['name']:
+                        count += 1
+                        if count and count <= len(weighting):
+                            totalWeight += weighting[count - 1]
+                if count:
+                    totalCount += 1
+
+            # If we have two or more relevant affixes, add us to the table                                
+            if totalCount > 1:
+                # This is the formula used to determine chance of a theme
+                commonness = float(8 * totalWeight ** 2) / themeWeight
+                allocationTable.append((commonness, theme))
+        # Keep the table in order from least to most common, so that a given
+        # roll always picks the same theme.
+        allocationTable.sort()
+        return util.weightedTable.WeightedTable(allocationTable)
+
+
+    ## Get the allocation table (making it if necessary) and choose the theme
+    def allocate(self):
+        table = THEME_TABLES.getTable(self.getTableKey(), self.makeTable)
 
         # Drop out if we have no available themes:
-        if self.maxRoll == 0:
+        if table.getTotalWeight() == 0:
             return None
 
         # Select the theme from the allocation table and return it
         # But use a standard maxRoll of 200 so if the table is small
         # we may still get no theme. The 200 is modifiable by lootRules,
         # whose themeChance defaults to 100.
-        roll = random.random() * max(self.maxRoll, 20000 /
+        # If we rolled too high, then there were themes available, but we
+        # didn't get one.
+        roll = random.random() * max(table.getTotalWeight(), 20000 /
                                      self.lootRules.themeChance)
-        for commonness, theme in self.allocationTable:
-            roll -= commonness
-            if roll <= 0:
-                return theme
-        # So there were themes available, but we rolled too high and didn't
-        # get one
-        return None
+        return table.getOptionForRoll(roll)
@@ -9,6 +9,7 @@ import itemLoader
 import procs.procLoader
 from .. import stats
 import util.boostedDie
+import util.extend
 import util.record
 
 
@@ -41,9 +42,66 @@ COPIED_FIELDS = ['index',
                 ]
 
 
+## Build the complete record for an ItemFactory with the given record, by
+# applying all of its ancestor templates to it.
+def resolveRecord(record):
+    return util.record.buildRecord(record, itemLoader.getItemTemplate)
+
+
+## Choose a flavor for the ItemFactory with the given complete record, if it's
+# marked as FLAVORED; otherwise return None.
+def chooseFlavor(completeRecord):
+    # Don't generate flavors for templates.
+    if ("FLAVORED" not in completeRecord.get('flags', []) or
+            'templateName' in completeRecord):
+        return None
+    # The object has to specify flavorTypes values in order to
+    # properly select a flavor to apply.
+    nameInfo = completeRecord.get('nameInfo', {})
+    if 'flavorTypes' not in nameInfo:
+        return None
+    return gui.flavors.chooseFlavorFromCategory(nameInfo['flavorTypes'])
+
+
+## Generate the name of an ItemFactory from its template name (None if it
+# isn't a template), templates, subtype, and nameInfo. See
+# ItemFactory.getFactoryName().
+def makeFactoryName(templateName, templates, subtype, nameInfo):
+    # A factory for a template is defined solely by the template name.
+    if templateName is not None:
+        return templateName
+
+    # A factory for a named item can be uniquely defined by that name.
+    if 'properName' in nameInfo:
+        return nameInfo['properName']
+
+    # Otherwise we construct a tuple of: templates this object
+    # was derived from, subtype (the category added by this type),
+    # and nameInfo['variantName'].
+
+    tupleList = []
+    if isinstance(templates, list):
+        tupleList.extend(templates)
+    else:
+        tupleList.append(templates)
+    # Make sure we don't duplicate values
+    if subtype and subtype not in tupleList:
+        tupleList.append(subtype)
+    # Make sure we don't duplicate values
+    if 'variantName' in nameInfo and nameInfo['variantName'] not in tupleList:
+        tupleList.append(nameInfo['variantName'])
+
+    return tuple(tupleList)
+
+
+
 class ItemFactory:
     ## \param record A dictionary containing our instantiation data.
-    def __init__(self, record):
+    # \param completeRecord Our record with our templates applied (see
+    #        resolveRecord()), if we already have it (see util.dataCache).
+    # \param flavor Our flavor, if it's already been chosen (see
+    #        chooseFlavor()).
+    def __init__(self, record, completeRecord = None, flavor = None):
         ## We need to hold onto this in case we're being used as a template, 
         # and for later serialization.
         self.record = record
@@ -97,8 +155,8 @@ class ItemFactory:
 
         # Build a full record based on the current object and all ancestor 
         # templates.
-        completeRecord = util.record.buildRecord(self, 
-                itemLoader.getItemTemplate)
+        if completeRecord is None:
+            completeRecord = resolveRecord(record)
         # Apply that record to ourselves, setting appropriate attributes in 
         # place.
         util.record.applyRecord(self, completeRecord)
@@ -146,13 +204,10 @@ class ItemFactory:
                 self.maxCarriedSlots = completeRecord['maxCapacity']['slots']
 
         # Chose a flavor if the object is marked as FLAVORED.
-        if "FLAVORED" in self.flags:
-            # Don't generate flavors for templates.
-            if not self.isTemplate:
-                # The object has to specify flavorTypes values in order to
-                # properly select a flavor to apply.
-                if 'flavorTypes' in self.nameInfo:
-                    self.flavor = gui.flavors.chooseFlavorFromCategory(self.nameInfo['flavorTypes'])
+        if flavor is None:
+            flavor = chooseFlavor(completeRecord)
+        if flavor is not None:
+            self.flavor = flavor
 
 
     ## Apply random properties to items
@@ -287,6 +342,9 @@ class ItemFactory:
         # If we're an artifact, mark us as created.
         if self.categories.has("artifact"):
             self.artifactCreated = True
+            # Item allocation tables may include us, so they're now out of
+            # date.
+            itemAllocator.ITEM_TABLES.clear()
             # Ensure that we have a valid display field
             # \todo Allow colour tuples to overwrite those in templates - issue #7
             if 'color' not in newItem.display['ascii'].keys():
@@ -329,31 +387,8 @@ class ItemFactory:
     #  be unique, and immutable (thus suitable for hashing).
     #  Simple strings get converted to 1-item tuples
     def getFactoryName(self):
-        # A factory for a template is defined solely by the template name.
-        if self.isTemplate:
-            return self.templateName
-
-        # A factory for a named item can be uniquely defined by that name.
-        if 'properName' in self.nameInfo:
-            return self.nameInfo['properName']
-
-        # Otherwise we construct a tuple of: templates this object
-        # was derived from, subtype (the category added by this type),
-        # and nameInfo['variantName'].
-
-        tupleList = []
-        if isinstance(self.templates, list):
-            tupleList.extend(self.templates)
-        else:
-            tupleList.append(self.templates)
-        # Make sure we don't duplicate values
-        if self.subtype and self.subtype not in tupleList:
-            tupleList.append(self.subtype)
-        # Make sure we don't duplicate values
-        if 'variantName' in self.nameInfo and self.nameInfo['variantName'] not in tupleList:
-            tupleList.append(self.nameInfo['variantName'])
-
-        return tuple(tupleList)
+        return makeFactoryName(getattr(self, 'templateName', None),
+                self.templates, self.subtype, self.nameInfo)
 
 
     ## Serialize us. We use the JSON format, but we output keys in a specific
@@ -372,3 +407,71 @@ class ItemFactory:
     def __unicode__(self):
         return "<ItemFactory for subtype %s, template %s>" % (self.subtype, self.templateName)
 
+
+
+## Lightweight stand-in for an ItemFactory, which is what itemLoader keeps
+# for each item type and artifact. Most of them never get made in a given
+# game, so we only hold on to what ItemAllocators need to know about the
+# item, and make the ItemFactory the first time it's needed.
+class ItemFactoryEntry:
+    ## \param record As for ItemFactory.
+    # \param completeRecord As for ItemFactory.
+    def __init__(self, record, completeRecord = None):
+        if completeRecord is None:
+            completeRecord = resolveRecord(record)
+        self.record = record
+        ## We hold onto this until our ItemFactory is made.
+        self.completeRecord = completeRecord
+        ## Our ItemFactory, once it's been made.
+        self.factory = None
+        self.isTemplate = 'templateName' in completeRecord
+        self.categories = util.extend.Categories()
+        self.categories.update(completeRecord.get('categories', []))
+        self.allocatorRules = [allocatorRules.ItemAllocatorRule(a)
+                for a in completeRecord.get('allocatorRules', [])]
+        # Choose our flavor now rather than when our ItemFactory is made, so
+        # that we use the random number generator exactly as we would if
+        # we'd made the ItemFactory.
+        self.flavor = chooseFlavor(completeRecord)
+        subtype = completeRecord.get('subtype')
+        if 'subtype' not in record and record.get('categories'):
+            subtype = record['categories'][0]
+        self.name = makeFactoryName(completeRecord.get('templateName'),
+                completeRecord.get('templates', []), subtype,
+                completeRecord.get('nameInfo', {}))
+
+
+    ## Get our ItemFactory, making it if necessary.
+    def getFactory(self):
+        if self.factory is None:
+            self.factory = ItemFactory(self.record, self.completeRecord,
+                    self.flavor)
+            self.completeRecord = None
+        return self.factory
+
+
+    ## Return True if we're for an artifact that has already been created.
+    def getIsArtifactCreated(self):
+        return self.factory is not None and self.factory.artifactCreated
+
+
+    ## Instantiate an Item; see ItemFactory.makeItem().
+    def makeItem(self, itemLevel, gameMap, pos = None, lootRules = None):
+        return self.getFactory().makeItem(itemLevel, gameMap, pos, lootRules)
+
+
+    ## Get the name of our ItemFactory; see ItemFactory.getFactoryName().
+    def getFactoryName(self):
+        return self.name
+
+
+    ## Anything we don't know about, our ItemFactory will.
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.getFactory(), name)
+
+
+    ## Sort in the same order as ItemFactories.
+    def __cmp__(self, alt):
+        return cmp(self.getFactoryName(), alt.getFactoryName())
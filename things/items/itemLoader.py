@@ -2,9 +2,11 @@
 # ItemFactories for them.
 
 import allocatorRules
+import itemAllocator
 import itemFactory
 import affix
 import loot
+import util.dataCache
 import util.record
 import util.extend
 import theme
@@ -22,8 +24,9 @@ ITEM_SUBTYPE_MAP = dict()
 ## A list of all the artifacts
 ARTIFACTS = []
 
-## Maps (type, subtype) tuples, or artifact names, to the factories
-# needed to instantiate them.
+## Maps (type, subtype) tuples, or artifact names, to the
+# itemFactory.ItemFactoryEntry instances that make the factories needed to
+# instantiate them.
 ITEM_FACTORY_MAP = dict()
 
 
@@ -34,7 +37,7 @@ def getFactory(key):
         key = tuple(key)
     if key not in ITEM_FACTORY_MAP:
         raise RuntimeError("Invalid item tuple or artifact name: %s" % unicode(key))
-    return ITEM_FACTORY_MAP[key]
+    return ITEM_FACTORY_MAP[key].getFactory()
 
 
 ## Instantiate an Item, rolling all necessary dice to randomize it.
@@ -159,51 +162,66 @@ def getAffixLimits(itemLevel):
     return allocatorRules.AffixLimits(AFFIX_LIMITS[itemLevel])
 
 
-## Load the data files we need.
+## Data files that loadFiles() loads.
+DATA_FILES = [os.path.join('data', 'object', name) for name in [
+        'object_template.txt', 'object.txt', 'object_flags.txt',
+        'affix_meta.txt', 'affix.txt', 'theme.txt', 'artifact.txt',
+        'loot_template.txt']]
+
+
+## Load the data files we need, via a util.dataCache.DataCache.
 def loadFiles():
+    cache = util.dataCache.DataCache('items',
+            DATA_FILES + [__file__, util.record.__file__,
+                itemFactory.__file__, loot.__file__])
     ## First load templates, so they're available when we load objects.
     #  loadRecords yields an iterable list so that templates can
     #  refer to previously completed templates.
-    for templateFactory in util.record.loadRecords(
+    for templateFactory in cache.loadRecords(
             os.path.join('data', 'object', 'object_template.txt'),
-            itemFactory.ItemFactory):
+            itemFactory.ItemFactory, itemFactory.resolveRecord):
         TEMPLATE_NAME_MAP[templateFactory.getFactoryName()] = templateFactory
 
-    # Now load the object records.
-    for objectFactory in util.record.loadRecords(
+    # Now load the object records; their factories are made on demand.
+    for objectFactory in cache.loadRecords(
             os.path.join('data', 'object', 'object.txt'),
-            itemFactory.ItemFactory):
+            itemFactory.ItemFactoryEntry, itemFactory.resolveRecord):
         ITEM_FACTORY_MAP[objectFactory.getFactoryName()] = objectFactory
 
     # Load the object flag metadata.
-    OBJECT_FLAGS = json.load(open(os.path.join('data', 'object',
-            'object_flags.txt')))
+    global OBJECT_FLAGS
+    OBJECT_FLAGS = cache.loadJson(os.path.join('data', 'object',
+            'object_flags.txt'))
 
     # Load the affix metadata.
     global AFFIX_LEVELS
     global AFFIX_TYPES
-    AFFIX_LEVELS, AFFIX_TYPES = json.load(open(os.path.join('data', 'object',
-            'affix_meta.txt')))
+    AFFIX_LEVELS, AFFIX_TYPES = cache.loadJson(os.path.join('data', 'object',
+            'affix_meta.txt'))
 
     # Now load the affixes.
-    for newAffix in util.record.loadRecords(
+    for newAffix in cache.loadRecords(
             os.path.join('data', 'object', 'affix.txt'), affix.Affix):
         AFFIX_NAME_MAP[newAffix.name] = newAffix
 
     # Now load the themes.
-    for newTheme in util.record.loadRecords(
+    for newTheme in cache.loadRecords(
             os.path.join('data', 'object', 'theme.txt'), theme.Theme):
         THEME_NAME_MAP[newTheme.name] = newTheme
 
     # Now load the artifacts, adding them to the base item map by name
-    for artifactFactory in util.record.loadRecords(
+    for artifactFactory in cache.loadRecords(
             os.path.join('data', 'object', 'artifact.txt'), 
-            itemFactory.ItemFactory):
+            itemFactory.ItemFactoryEntry, itemFactory.resolveRecord):
         ITEM_FACTORY_MAP[artifactFactory.getFactoryName()] = artifactFactory
 
     # Load the loot templates.
-    for lootTemplate in util.record.loadRecords(
+    for lootTemplate in cache.loadRecords(
             os.path.join('data', 'object', 'loot_template.txt'), 
-            loot.LootTemplate):
+            loot.LootTemplate, loot.resolveRecord):
         LOOT_TEMPLATE_MAP[lootTemplate.templateName] = lootTemplate
 
+    cache.save()
+    # Any existing allocation tables refer to the old factories.
+    itemAllocator.clearTables()
+
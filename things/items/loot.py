@@ -8,16 +8,34 @@ import things.mixins.filter
 import util.boostedDie
 import util.evaluator
 
+import json
 import random
 
 
 
+## Build the complete record for a LootTemplate with the given record, by
+# applying all of its ancestor templates to it. We only need the templates'
+# records, so unlike itemLoader.getLootTemplate(), we don't copy them.
+def resolveRecord(record):
+    return util.record.buildRecord(record, getTemplateForRecord)
+
+
+## Look up a loot template for resolveRecord().
+def getTemplateForRecord(name):
+    if name not in itemLoader.LOOT_TEMPLATE_MAP:
+        raise RuntimeError("Invalid loot template: [%s]" % str(name))
+    return itemLoader.LOOT_TEMPLATE_MAP[name]
+
+
+
 ## Class that sets rules and filters for item generation
 class LootTemplate(things.mixins.filter.ItemFilter,
                    things.mixins.filter.AffixFilter,
                    things.mixins.filter.ThemeFilter):
     ## \param record A dictionary containing our instantiation data
-    def __init__(self, record):
+    # \param completeRecord Our record with our templates applied (see
+    #        resolveRecord()), if we already have it (see util.dataCache).
+    def __init__(self, record, completeRecord = None):
         # Construct the filter mixins
         things.mixins.filter.ItemFilter.__init__(self)
         things.mixins.filter.AffixFilter.__init__(self)
@@ -53,11 +71,22 @@ class LootTemplate(things.mixins.filter.ItemFilter,
         self.artifactName = None
 
         # Build a full record based on the current object and all ancestor templates.
-        completeRecord = util.record.buildRecord(self, itemLoader.getLootTemplate)
+        if completeRecord is None:
+            completeRecord = resolveRecord(record)
         # Apply that record to ourselves, setting appropriate attributes in place.
         util.record.applyRecord(self, completeRecord)
 
 
+    ## Get a string summarizing our item, affix, and theme filters, such that
+    # LootTemplates with the same filters have the same signature. Allocators
+    # use this to share allocation tables among LootTemplates.
+    def getFilterSignature(self):
+        return json.dumps([self.allowCategories, self.denyCategories,
+                self.affixType, self.allowAffixes, self.denyAffixes,
+                self.allowThemes, self.denyThemes],
+                sort_keys = True, default = sorted)
+
+
     ## Resolve boostedDie values in the template, so they can be used.
     def resolveValues(self, itemLevel):
         # \todo Construct a tester for boostedDie that returns whether a
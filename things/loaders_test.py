@@ -0,0 +1,150 @@
+import pyximport; pyximport.install()
+import mapgen.gameMap
+
+import procs.procLoader
+import things.creatures.creatureAllocator
+import things.creatures.creatureLoader
+import things.creatures.player
+import things.items.itemAllocator
+import things.items.itemLoader
+
+import os
+import random
+import subprocess
+import sys
+
+
+## Load the data files the item and creature loaders need, seeding the random
+# number generator first so that item flavors come out the same every time.
+def loadFiles():
+    random.seed(0)
+    procs.procLoader.loadFiles()
+    things.items.itemLoader.loadFiles()
+    things.creatures.creatureLoader.loadFiles()
+
+
+## Get every item and creature factory entry.
+def getEntries():
+    return (things.items.itemLoader.ITEM_FACTORY_MAP.values() +
+            things.creatures.creatureLoader.CREATURE_MAP.values())
+
+
+## Get the comparable parts of an ItemAllocatorRule.
+def getRuleFields(rule):
+    return (rule.commonness, rule.minDepth, rule.maxDepth, rule.pileChance)
+
+
+## The loaders don't make any factories until they're asked for, then make
+# each one once; and what the factory entries know about their factories
+# agrees with the factories themselves.
+def test_factoryEntries():
+    loadFiles()
+    assert all(entry.factory is None for entry in getEntries())
+    for key, entry in things.items.itemLoader.ITEM_FACTORY_MAP.iteritems():
+        factory = things.items.itemLoader.getFactory(key)
+        assert factory is entry.factory
+        assert things.items.itemLoader.getFactory(key) is factory
+        assert entry.getFactoryName() == factory.getFactoryName() == key
+        assert entry.isTemplate == factory.isTemplate
+        assert entry.categories == factory.categories
+        assert entry.flavor == factory.flavor
+        assert (map(getRuleFields, entry.allocatorRules) ==
+                map(getRuleFields, factory.allocatorRules))
+    for name, entry in things.creatures.creatureLoader.CREATURE_MAP.iteritems():
+        factory = things.creatures.creatureLoader.getFactory(name)
+        assert factory is entry.factory
+        assert things.creatures.creatureLoader.getFactory(name) is factory
+        assert entry.getName() == factory.getName() == name
+        assert entry.nativeDepth == factory.nativeDepth
+        assert entry.rarity == factory.rarity
+        assert entry.categories == factory.categories
+        assert entry.staticTriggers == set(factory.staticProcs)
+
+
+## Get a summary of an Item.
+def describeItem(item):
+    return (item.type, item.subtype, item.quantity, item.flavor,
+            [affix['name'] for affix in item.affixes])
+
+
+## Allocate a bunch of items and creatures at various levels, and return
+# summaries of them.
+def allocate():
+    random.seed(0)
+    gameMap = mapgen.gameMap.GameMap(20, 20)
+    things.creatures.player.debugMakePlayer(gameMap)
+    result = []
+    for level in xrange(0, 40, 2):
+        gameMap.mapLevel = level
+        itemAllocator = things.items.itemAllocator.ItemAllocator(level)
+        creatureAllocator = things.creatures.creatureAllocator.CreatureAllocator(level)
+        for i in xrange(20):
+            pos = (random.randint(0, 19), random.randint(0, 19))
+            item = itemAllocator.allocate(gameMap, gameMap.getContainer(pos))
+            creature = creatureAllocator.allocate(gameMap, pos)
+            result.append((describeItem(item), creature.name,
+                    sorted(map(describeItem, creature.inventory))))
+    return result
+
+
+## Allocators only make the factories they allocate from, and allocate the
+# same things as they would if every factory had already been made.
+def test_allocation():
+    loadFiles()
+    lazyResult = allocate()
+    numFactories = sum(entry.factory is not None for entry in getEntries())
+    assert 0 < numFactories < len(getEntries()) / 2
+    loadFiles()
+    for entry in getEntries():
+        entry.getFactory()
+    assert allocate() == lazyResult
+
+
+## Loads the item and creature data files, then makes every factory if the
+# first argument is "eager", and prints how long that took, and how much
+# memory (in kilobytes) we were using before and at most while doing so.
+LOAD_SCRIPT = """
+import pyximport; pyximport.install()
+import mapgen.gameMap
+
+import resource
+import sys
+import time
+import procs.procLoader
+import things.creatures.creatureLoader
+import things.items.itemLoader
+procs.procLoader.loadFiles()
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.time()
+things.items.itemLoader.loadFiles()
+things.creatures.creatureLoader.loadFiles()
+if sys.argv[1] == 'eager':
+    for entry in (things.items.itemLoader.ITEM_FACTORY_MAP.values() +
+            things.creatures.creatureLoader.CREATURE_MAP.values()):
+        entry.getFactory()
+print time.time() - start, baseline, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+"""
+
+
+## Time loading the item and creature data files, with every factory made up
+# front and with factories made on demand, and measure peak memory use while
+# doing so. Each load happens in a fresh process, so that they don't affect
+# each other's peak memory use; since the processes start out with our own
+# peak memory use, this should run before anything else does.
+def speedTest_loadFiles():
+    rootDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    # Make sure the data cache is up to date first.
+    subprocess.check_output([sys.executable, '-c', LOAD_SCRIPT, 'lazy'],
+            cwd = rootDir)
+    for mode in ['eager', 'lazy']:
+        output = subprocess.check_output(
+                [sys.executable, '-c', LOAD_SCRIPT, mode], cwd = rootDir)
+        loadTime, baseline, peak = output.splitlines()[-1].split()
+        print "%s: loading took %.3fs, peak memory use %.1fMB" % (mode,
+                float(loadTime), (int(peak) - int(baseline)) / 1000.0)
+
+
+if __name__ == '__main__':
+    speedTest_loadFiles()
+    test_factoryEntries()
+    test_allocation()
@@ -138,7 +138,7 @@ class Carrier:
 
     ## Return True if any item in ourselves matches the specified container key.
     def containsMatch(self, key):
-        if self.gameMap.filterContainer(self.inventory, key):
+        if self.gameMap.getHasIntersection(self.inventory, key):
             return True
         for item in self.inventory:
             if item.isContainer() and item.containsMatch(key):
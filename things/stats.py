@@ -7,10 +7,58 @@ import util.serializer
 
 
 
+## Incremented whenever any Stats instance gains or loses StatMods (or child
+# Stats). Code that holds onto values derived from stats (e.g. the turn
+# scheduler in mapgen.scheduler) can compare against this to find out if it
+# needs to recalculate.
+changeCounter = 0
+
+
+## Note that some Stats instance somewhere has been modified.
+def noteChange():
+    global changeCounter
+    changeCounter += 1
+
+
+## Number of Stats.getStatValue() calls that were answered from, or that
+# missed, a Stats instance's value cache. Calls that can't use the cache at
+# all (because they have a condition, or are nested inside another
+# calculation) count towards neither.
+cacheHits = 0
+cacheMisses = 0
+
+
+## Return a (hits, misses, hit rate) tuple describing how well the Stats value
+# caches have been doing since the last call to resetCacheCounters().
+def getCacheCounters():
+    total = cacheHits + cacheMisses
+    hitRate = 0
+    if total:
+        hitRate = float(cacheHits) / total
+    return (cacheHits, cacheMisses, hitRate)
+
+
+## Reset the counters reported by getCacheCounters().
+def resetCacheCounters():
+    global cacheHits, cacheMisses
+    cacheHits = 0
+    cacheMisses = 0
+
+
+
 ## This class handles statistics for a given Thing. "Statistics" are basically
 # any numerical property of a Thing, from how many hitpoints it has to 
 # how hard it is to find. Each statistic is composed of a series of tiers of
 # StatMods which are applied in order. 
+#
+# For each stat we keep an index: a tier-sorted list of all the StatMods for
+# that stat, from ourselves and from our children. Indices are built on
+# demand and kept up to date as mods and children come and go.
+#
+# Stat values are cached, keyed on the stat name and maximum tier. Any change
+# made through our methods clears our cache, and the caches of every Stats
+# instance that we are a child of. Code that modifies a StatMod in-place
+# instead must call invalidateCache() itself.
 class Stats:
     ## Create the Stats. This function accepts arbitrary arguments as the 
     # deserialization process (in util.serializer) may supply extra arguments.
@@ -23,6 +71,23 @@ class Stats:
         ## Set of other Stats instances that we should take into account when
         # calculating values.
         self.children = set()
+        ## Set of Stats instances that have us in their children. Not
+        # serialized; rebuilt from the children sets when loading.
+        self.parents = set()
+        ## Maps stat names to tier-sorted lists of all StatMods for that stat,
+        # including from our children. See getAllStatModsFor().
+        self.modIndex = {}
+        ## Maps (stat name, max tier) tuples to the values of those stats.
+        self.valueCache = {}
+        ## Set to True while calculating a stat value if we encounter a
+        # StatMod that doesn't allow its value to be cached.
+        self.sawVolatileMod = False
+        ## List of StatMods whose values are currently being calculated, to
+        # prevent infinite recursion when there's a dependency loop. StatMod
+        # procs calculate other stats by calling back into us, so this
+        # persists across those nested getStatValue() calls. (It's only ever
+        # a few entries long, so a list is faster than a set here.)
+        self.busyMods = []
         ## Global unique ID.
         self.id = util.id.getId()
 
@@ -35,7 +100,8 @@ class Stats:
             newStats.stats[statName] = [m.copy() for m in mods]
             for mod in mods:
                 newStats.modNameToMod[mod.name] = mod
-        newStats.children = set(self.children)
+        for child in self.children:
+            newStats.addStats(child)
         return newStats
 
 
@@ -43,9 +109,10 @@ class Stats:
     def addMod(self, statName, modifier):
         if statName not in self.stats:
             self.stats[statName] = []
-        self.stats[statName].append(modifier)
-        self.stats[statName].sort(key = lambda a: a.tier)
+        insertByTier(self.stats[statName], modifier)
         self.modNameToMod[modifier.name] = modifier
+        self.addIndexedMod(statName, modifier)
+        self.invalidateCache()
 
 
     ## Remove the specific StatMod instance for the named stat.
@@ -53,15 +120,25 @@ class Stats:
         if statName not in self.stats:
             raise RuntimeError("Tried to remove nonexistent stat [%s]" % statName)
         self.stats[statName].remove(modifier)
+        self.removeIndexedMod(statName, modifier)
         # modifier.name won't be in self.modNameToMod if we had two StatMods
         # with the same ID added to the Stats instance.
         if modifier.name in self.modNameToMod:
             del self.modNameToMod[modifier.name]
+        self.invalidateCache()
 
 
     ## Add a Stats instance to self.children.
     def addStats(self, childStats):
+        if childStats in self.children:
+            # Don't index its StatMods a second time.
+            return
         self.children.add(childStats)
+        childStats.parents.add(self)
+        for statName in childStats.getStatNames():
+            self.addIndexedMods(statName, 
+                    childStats.getAllStatModsFor(statName))
+        self.invalidateCache()
 
 
     ## Remove a Stats instance from self.children.
@@ -69,6 +146,60 @@ class Stats:
         if childStats not in self.children:
             raise RuntimeError("Tried to remove nonexistent child stat")
         self.children.remove(childStats)
+        childStats.parents.discard(self)
+        for statName in childStats.getStatNames():
+            self.dropIndex(statName)
+        self.invalidateCache()
+
+
+    ## Add a StatMod to our index for the named stat, and to our parents'
+    # indices, for any of those indices that have been built.
+    def addIndexedMod(self, statName, modifier):
+        if statName in self.modIndex:
+            insertByTier(self.modIndex[statName], modifier)
+        for parent in self.parents:
+            parent.addIndexedMod(statName, modifier)
+
+
+    ## Merge a tier-sorted list of StatMods into our index for the named
+    # stat, and into our parents' indices, for any of those indices that have
+    # been built.
+    def addIndexedMods(self, statName, mods):
+        if statName in self.modIndex:
+            index = self.modIndex[statName]
+            index.extend(mods)
+            # Both halves are already sorted, so this is a linear-time merge.
+            index.sort(key = getTier)
+        for parent in self.parents:
+            parent.addIndexedMods(statName, mods)
+
+
+    ## Remove a StatMod from our index for the named stat, and from our
+    # parents' indices, for any of those indices that have been built.
+    def removeIndexedMod(self, statName, modifier):
+        if statName in self.modIndex:
+            self.modIndex[statName].remove(modifier)
+        for parent in self.parents:
+            parent.removeIndexedMod(statName, modifier)
+
+
+    ## Throw away our index for the named stat, and our parents' indices;
+    # they'll be rebuilt as needed.
+    def dropIndex(self, statName):
+        if statName in self.modIndex:
+            del self.modIndex[statName]
+        for parent in self.parents:
+            parent.dropIndex(statName)
+
+
+    ## Throw away our cached stat values, and those of everyone we are a
+    # child of, as they may depend on our values.
+    def invalidateCache(self):
+        self.valueCache.clear()
+        util.serializer.markDirty(self)
+        for parent in self.parents:
+            parent.invalidateCache()
+        noteChange()
 
 
     ## Return true if we have mods for this stat.
@@ -88,12 +219,30 @@ class Stats:
     #           get the total of racial mod values.
     #         - a dungeon area that enhances or nullifies all temporary effects
     #           etc.
-    # \param busyMods - List of StatMods whose values are currently being 
-    #                  calculated, to prevent infinite recursion when there's a
-    #                  dependency loop.  Value is maintained across function
-    #                  calls.
-    def getStatValue(self, statName, maxTier = None, condition = None, 
-            busyMods = []):
+    # We use our value cache only for top-level, unconditional requests; a
+    # request made while another StatMod is being calculated may have some
+    # StatMods blocked off by self.busyMods, so its result isn't the "real"
+    # value of the stat.
+    def getStatValue(self, statName, maxTier = None, condition = None):
+        if condition is not None or self.busyMods:
+            return self.calculateStatValue(statName, maxTier, condition)
+        global cacheHits, cacheMisses
+        key = (statName, maxTier)
+        if key in self.valueCache:
+            cacheHits += 1
+            return self.valueCache[key]
+        cacheMisses += 1
+        self.sawVolatileMod = False
+        result = self.calculateStatValue(statName, maxTier, condition)
+        if not self.sawVolatileMod:
+            self.valueCache[key] = result
+        return result
+
+
+    ## Calculate the value for the named stat from scratch, without using
+    # our value cache. Parameters are as per getStatValue().
+    def calculateStatValue(self, statName, maxTier, condition):
+        busyMods = self.busyMods
         result = 0
         accumulator = 0
         curTier = None
@@ -119,25 +268,32 @@ class Stats:
             # of getting its value, we can't call on it again til it's done.
             if mod not in busyMods:
                 busyMods.append(mod)
-                # allow for conditional filters to specify what type of
-                # mods to process.
-                if condition is None or condition(mod):
-                    accumulator += mod.getModifier(self, result)
-                del busyMods[-1]
+                try:
+                    # allow for conditional filters to specify what type of
+                    # mods to process.
+                    if condition is None or condition(mod):
+                        accumulator += mod.getModifier(self, result)
+                        if mod.getIsVolatile():
+                            self.sawVolatileMod = True
+                finally:
+                    del busyMods[-1]
         result += accumulator
         return result
 
 
     ## Get a sorted list of the StatMods for the named stat, including from
-    # all of our children.
+    # all of our children. This is our index for the stat, so callers must
+    # not modify it.
     def getAllStatModsFor(self, statName):
-        result = []
-        if statName in self.stats:
-            result.extend(self.stats[statName])
-        for child in self.children:
-            result.extend(child.getAllStatModsFor(statName))
-        result.sort(key = lambda a: a.tier)
-        return result
+        if statName not in self.modIndex:
+            result = []
+            if statName in self.stats:
+                result.extend(self.stats[statName])
+            for child in self.children:
+                result.extend(child.getAllStatModsFor(statName))
+            result.sort(key = getTier)
+            self.modIndex[statName] = result
+        return self.modIndex[statName]
 
 
     ## Generate a dict that maps stat names to stat values for all of our
@@ -210,12 +366,18 @@ class Stats:
         for statName, mods in self.stats.iteritems():
             for mod in mods:
                 mod.roll(level)
+        self.invalidateCache()
 
 
     ## Generate a ready-for-serialization dict. See the util.serializer
-    # module for more information.
+    # module for more information. Our parents and caches are left out;
+    # see fillStats().
     def getSerializationDict(self):
-        return self.__dict__
+        result = dict(self.__dict__)
+        for key in ['parents', 'modIndex', 'valueCache', 'sawVolatileMod',
+                'busyMods']:
+            del result[key]
+        return result
 
 
     ## Generate a string representation of the stats.
@@ -228,8 +390,31 @@ class Stats:
 
 
 
+## Return the tier of the given StatMod; used as a sort key.
+def getTier(mod):
+    return mod.tier
+
+
+## Insert a StatMod into a tier-sorted list of StatMods, after any other
+# StatMods with the same tier.
+def insertByTier(mods, modifier):
+    index = len(mods)
+    while index > 0 and mods[index - 1].tier > modifier.tier:
+        index -= 1
+    mods.insert(index, modifier)
+
+
+## Fill in a deserialized Stats instance, and tell our children that we are
+# one of their parents (all objects are created before any are filled in, so
+# our children exist even if they haven't been filled in yet).
+def fillStats(stats, data, gameMap):
+    util.serializer.basicDataFill(stats, data, gameMap)
+    for child in stats.children:
+        child.parents.add(stats)
+
+
 # Make Stats be [de]serializable.
-util.serializer.registerObjectClass(Stats.__name__, Stats)
+util.serializer.registerObjectClass(Stats.__name__, Stats, fillStats)
 
 
 ## Given a record (from a data file, not from a savefile), generate a Stats
@@ -242,7 +427,8 @@ def deserializeStats(record):
             result.stats[statName] = [deserializeStatMod(mods)]
         else:
             # Multiple entries.
-            result.stats[statName] = [deserializeStatMod(m) for m in mods]
+            result.stats[statName] = sorted(
+                    [deserializeStatMod(m) for m in mods], key = getTier)
     return result
 
 
@@ -268,13 +454,19 @@ class StatMod:
     # \param name Unique name for the StatMod. If none is provided then an
     #        auto-incrementing ID will be used (same as the 'id' field).
     #        This can be used to find a specific StatMod later.
+    # \param isVolatile True if our value can change without the Stats
+    #        instance we belong to being told about it (e.g. because one of
+    #        our procs looks at the game state), and therefore should not be
+    #        cached. Procs can also declare themselves volatile; see
+    #        procs.proc.Proc.isVolatile.
     def __init__(self, tier, addend = 0, multiplier = 0, procs = [], 
-            name = '', category = None):
+            name = '', category = None, isVolatile = False):
         self.tier = tier
         self.category = category
         self.addend = addend
         self.multiplier = multiplier
         self.procs = procs
+        self.isVolatile = isVolatile
         self.id = util.id.getId()
         self.name = self.id
         if name:
@@ -293,6 +485,17 @@ class StatMod:
         return result
 
 
+    ## Return true if our modifier must be recalculated every time it is
+    # needed.
+    def getIsVolatile(self):
+        if self.isVolatile:
+            return True
+        for proc in self.procs:
+            if proc.isVolatile:
+                return True
+        return False
+
+
     ## Calculate our addend and multiplier per the provided level. This is 
     # only relevant if the values are BoostedDie formats -- if they're 
     # numbers then we just leave them be.
@@ -305,7 +508,8 @@ class StatMod:
 
     ## Generate a copy of ourselves.
     def copy(self):
-        return StatMod(self.tier, self.addend, self.multiplier, self.procs)
+        return StatMod(self.tier, self.addend, self.multiplier, self.procs,
+                isVolatile = self.isVolatile)
 
 
     ## Generate a ready-for-serialization dict. See the util.serializer
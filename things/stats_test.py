@@ -0,0 +1,173 @@
+import pyximport; pyximport.install()
+import mapgen.gameMap
+
+import procs.calculatorProc
+import procs.proc
+import things.stats
+
+import random
+import time
+
+
+## Proc whose value changes every time it's asked for, so StatMods using it
+# must not be cached.
+class CountingProc(procs.proc.Proc):
+    isVolatile = True
+
+    def __init__(self):
+        procs.proc.Proc.__init__(self, None)
+        self.count = 0
+
+
+    def trigger(self, *args, **kwargs):
+        self.count += 1
+        return self.count
+
+
+
+## Make a Stats instance with a few tiers of mods for 'speed', including a
+# calculator that depends on 'STR'.
+def makeStats(rng):
+    stats = things.stats.Stats()
+    stats.addMod('STR', things.stats.StatMod(0, rng.randint(5, 20)))
+    stats.addMod('speed', things.stats.StatMod(0, rng.randint(1, 3)))
+    stats.addMod('speed', things.stats.StatMod(1, multiplier = .5))
+    calculator = procs.calculatorProc.PercentageStatModCalculator(None,
+            {'sourceStat': 'STR', 'multiplier': .1})
+    stats.addMod('speed', things.stats.StatMod(2, procs = [calculator]))
+    return stats
+
+
+## Calculate a stat value from scratch. Only the top-level Stats instance's
+# cache matters, since it's the one StatMods' procs are given.
+def getUncachedValue(stats, statName, maxTier = None):
+    stats.valueCache.clear()
+    return stats.getStatValue(statName, maxTier)
+
+
+## Build a list of all the StatMods for a stat from scratch.
+def getAllModsFor(stats, statName):
+    result = list(stats.stats.get(statName, []))
+    for child in stats.children:
+        result.extend(getAllModsFor(child, statName))
+    return result
+
+
+## Cached and uncached values agree, and the StatMod index stays correct, as
+# mods and child Stats come and go, including changes made to grandchildren.
+def test_cacheInvalidation():
+    rng = random.Random(0)
+    root = makeStats(rng)
+    middle = makeStats(rng)
+    root.addStats(middle)
+    leaves = []
+    for i in xrange(100):
+        roll = rng.randint(0, 3)
+        if roll == 0:
+            leaf = makeStats(rng)
+            middle.addStats(leaf)
+            leaves.append(leaf)
+        elif roll == 1 and leaves:
+            leaf = leaves.pop(rng.randint(0, len(leaves) - 1))
+            middle.removeStats(leaf)
+        elif roll == 2:
+            target = rng.choice([root, middle] + leaves)
+            target.addMod(rng.choice(['STR', 'speed']),
+                    things.stats.StatMod(rng.randint(0, 3), rng.randint(-2, 2)))
+        elif leaves:
+            target = rng.choice(leaves)
+            statName = rng.choice(['STR', 'speed'])
+            if target.stats[statName]:
+                target.removeMod(statName, target.stats[statName][0])
+        for statName in ['STR', 'speed']:
+            index = root.getAllStatModsFor(statName)
+            expected = getAllModsFor(root, statName)
+            assert [m.tier for m in index] == sorted(m.tier for m in index)
+            assert sorted(index) == sorted(expected)
+            for maxTier in [None, 0, 1]:
+                actual = root.getStatValue(statName, maxTier)
+                assert actual == getUncachedValue(root, statName, maxTier)
+
+
+## Volatile StatMods are recalculated every time, and so is anything that
+# depends on them.
+def test_volatileMods():
+    stats = things.stats.Stats()
+    stats.addMod('luck', things.stats.StatMod(0, procs = [CountingProc()]))
+    calculator = procs.calculatorProc.PercentageStatModCalculator(None,
+            {'sourceStat': 'luck', 'multiplier': 1})
+    stats.addMod('charm', things.stats.StatMod(1, procs = [calculator]))
+    assert stats.getStatValue('luck') == 1
+    assert stats.getStatValue('luck') == 2
+    assert stats.getStatValue('charm') == 3
+    assert stats.getStatValue('charm') == 4
+    stats.addMod('vigor', things.stats.StatMod(0, 5, isVolatile = True))
+    things.stats.resetCacheCounters()
+    stats.getStatValue('vigor')
+    stats.getStatValue('vigor')
+    assert things.stats.getCacheCounters() == (0, 2, 0)
+
+
+## Repeated lookups are served from the cache.
+def test_cacheCounters():
+    stats = makeStats(random.Random(0))
+    things.stats.resetCacheCounters()
+    for i in xrange(4):
+        stats.getStatValue('speed')
+    assert things.stats.getCacheCounters() == (3, 1, .75)
+    stats.addMod('speed', things.stats.StatMod(0, 1))
+    stats.getStatValue('speed')
+    assert things.stats.getCacheCounters() == (3, 2, .6)
+
+
+## Time a "turn" worth of stat lookups for a player with 20 equipped items,
+# with and without the value cache, and time swapping an item out and back
+# in again.
+def speedTest_getStatValue():
+    rng = random.Random(0)
+    player = makeStats(rng)
+    items = [makeStats(rng) for i in xrange(20)]
+    for item in items:
+        player.addStats(item)
+    numTurns = 10000
+    for label, getter in [
+            ('uncached', lambda s: getUncachedValue(player, s)),
+            ('cached', player.getStatValue)]:
+        things.stats.resetCacheCounters()
+        start = time.time()
+        for i in xrange(numTurns):
+            for statName in ['speed', 'STR', 'speed', 'speed']:
+                getter(statName)
+        elapsed = time.time() - start
+        print "%s: %.1fus per turn; cache (hits, misses, rate) = %s" % (
+                label, elapsed / numTurns * 1000000,
+                things.stats.getCacheCounters())
+    start = time.time()
+    for i in xrange(numTurns):
+        item = items[i % len(items)]
+        player.removeStats(item)
+        player.addStats(item)
+        player.getStatValue('speed')
+    elapsed = time.time() - start
+    print "swap item: %.1fus per swap" % (elapsed / numTurns * 1000000)
+
+
+## Adding the same child Stats twice doesn't count its StatMods twice.
+def test_addStatsTwice():
+    parent = things.stats.Stats()
+    child = things.stats.Stats()
+    child.addMod('speed', things.stats.StatMod(0, 2))
+    parent.addStats(child)
+    assert parent.getStatValue('speed') == 2
+    parent.addStats(child)
+    assert parent.getStatValue('speed') == 2
+    assert getUncachedValue(parent, 'speed') == 2
+    assert len(parent.getAllStatModsFor('speed')) == 1
+
+
+if __name__ == '__main__':
+    test_cacheInvalidation()
+    test_volatileMods()
+    test_cacheCounters()
+    test_addStatsTwice()
+    speedTest_getStatValue()
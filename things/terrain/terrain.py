@@ -180,9 +180,11 @@ class Terrain(things.thing.Thing):
 
 
 
-## Make a "blank" Terrain instance for deserialization. 
+## Make a "blank" Terrain instance for deserialization. There's a lot of
+# Terrain, and our serialization has all of our fields in it, so we skip the
+# constructor (which would also subscribe us to the GameMap).
 def makeBlankTerrain(gameMap):
-    return Terrain(gameMap, (-1, -1))
+    return util.serializer.makeBareInstance(Terrain)
 
 
 util.serializer.registerObjectClass(Terrain.__name__, makeBlankTerrain)
@@ -206,3 +206,347 @@ int burnHeatMap(int32_t xMax, int32_t yMax,
       return failLine;
 }
 
+
+
+/* A cell, and the value it should be given, waiting to be processed by
+ * lowerCells(). */
+typedef struct {
+    int32_t x;
+    int32_t y;
+    int32_t cost;
+} candidate;
+
+
+/* Growable array of pairs, for when we need to remember everything we've
+ * added (unlike the circular queue above). */
+typedef struct {
+    pair *pairs;
+    size_t size; // Allocated space, in pairs
+    size_t length; // Number of pairs actually in use
+} pairList;
+
+
+static int addToList(pairList *l, pair p) {
+    if (l->length == l->size) {
+        l->size = l->size ? l->size * 2 : 64;
+        l->pairs = (pair*) realloc(l->pairs, l->size * sizeof(pair));
+        if (l->pairs == NULL) {
+            return -1;
+        }
+    }
+    l->pairs[l->length++] = p;
+    return 0;
+}
+
+
+static int compareCandidates(const void *a, const void *b) {
+    return ((const candidate*) a)->cost - ((const candidate*) b)->cost;
+}
+
+
+/* Everything repairHeatMap()'s helper functions need to know. */
+typedef struct {
+    int32_t xMax;
+    int32_t yMax;
+    int32_t *heatMap;
+    int32_t *blockedMap;
+    uint8_t *goalCells; // Bitmap of goal cells
+    int32_t work; // Number of cells examined so far
+    int32_t maxWork;
+} repairState;
+
+
+/* Convenience macros for the repair functions. */
+#define UNPACK_STATE(s) \
+    int32_t xMax = (s)->xMax, yMax = (s)->yMax; \
+    int32_t *heatMap = (s)->heatMap; \
+    (void) yMax;
+#define ISGOAL(x, y) getbit(s->goalCells, (x), (y), xMax)
+#define ISBLOCKED(x, y) (s->blockedMap[(y)*xMax + (x)] != 0 && !ISGOAL(x, y))
+#define ISPENDING(x, y) (IX(x, y) <= -2)
+#define FOREACH_NEIGHBOR(x, y, xi, yi) \
+    for (int32_t yi = MAX(0, (y) - 1); yi < MIN(yMax, (y) + 2); yi++) \
+        for (int32_t xi = MAX(0, (x) - 1); xi < MIN(xMax, (x) + 2); xi++) \
+            if (xi != (x) || yi != (y))
+#define SPEND_WORK() if (++s->work > s->maxWork) { result = -1; goto cleanup; }
+
+
+/* Return true if the given cell (which must not be a goal) has a neighbor
+ * that it could have gotten its cost from. */
+static int isSupported(repairState *s, int32_t x, int32_t y, int32_t cost) {
+    UNPACK_STATE(s);
+    if (cost <= 0) {
+        return 0;
+    }
+    FOREACH_NEIGHBOR(x, y, xi, yi) {
+        if (IX(xi, yi) == cost - 1) {
+            return 1;
+        }
+    }
+    return 0;
+}
+
+
+/* Mark the given cell as pending, by storing (-2 - oldCost) in it, where it
+ * can be recovered later. */
+static int markPending(repairState *s, pairList *pending, int32_t x, int32_t y) {
+    UNPACK_STATE(s);
+    IX(x, y) = -2 - IX(x, y);
+    pair xy = {x, y};
+    return addToList(pending, xy);
+}
+
+
+/* Flood out from the given candidates in increasing order of cost, lowering
+ * the cost of every cell we can find a shorter route to. If onlyReachable is
+ * set, then cells with negative costs are left alone.
+ * Returns 0 on success, -1 if we ran out of work, and -2 if we failed to
+ * allocate memory. */
+static int floodCandidates(repairState *s, candidate *candidates,
+        size_t numCandidates, int onlyReachable) {
+    UNPACK_STATE(s);
+    int result = 0;
+    queue cellQueue;
+    if (initQueue(&cellQueue) != 0) {
+        return -2;
+    }
+    qsort(candidates, numCandidates, sizeof(candidate), compareCandidates);
+
+    // Cells in the queue were given their cost as they were added, and are
+    // always in increasing order of cost, so we just merge the two
+    // sequences.
+    size_t nextCandidate = 0;
+    while (nextCandidate < numCandidates || getNumElements(&cellQueue) > 0) {
+        int32_t x, y, cost;
+        if (nextCandidate < numCandidates &&
+                (getNumElements(&cellQueue) == 0 ||
+                 candidates[nextCandidate].cost <=
+                 IX(cellQueue.pairs[cellQueue.head].x,
+                    cellQueue.pairs[cellQueue.head].y))) {
+            candidate c = candidates[nextCandidate++];
+            x = c.x;
+            y = c.y;
+            cost = c.cost;
+            if (IX(x, y) >= 0 && IX(x, y) < cost) {
+                // Already found a better route.
+                continue;
+            }
+            if (IX(x, y) == cost && !ISGOAL(x, y) && !onlyReachable) {
+                // Already found a route this good, and flooded from it.
+                continue;
+            }
+            IX(x, y) = cost;
+        }
+        else {
+            pair xy = queuePopLeft(&cellQueue);
+            x = xy.x;
+            y = xy.y;
+            cost = IX(x, y);
+        }
+        SPEND_WORK();
+        FOREACH_NEIGHBOR(x, y, xi, yi) {
+            if (ISBLOCKED(xi, yi)) {
+                continue;
+            }
+            int32_t oldCost = IX(xi, yi);
+            if ((oldCost < 0 && !onlyReachable) || oldCost > cost + 1) {
+                IX(xi, yi) = cost + 1;
+                pair xiyi = {xi, yi};
+                if (addToQueue(&cellQueue, xiyi) != 0) {
+                    result = -2;
+                    goto cleanup;
+                }
+            }
+        }
+    }
+
+   cleanup:
+      freeQueue(&cellQueue);
+      return result;
+}
+
+
+/* Work out the best cost each of the given cells can get from its neighbors,
+ * and flood out from there. Pending cells become -1 unless and until we find
+ * a route to them. Return values are as floodCandidates(). */
+static int lowerCells(repairState *s, pairList *cells) {
+    UNPACK_STATE(s);
+    size_t numCandidates = 0;
+    candidate *candidates = (candidate*) malloc(
+            (cells->length + 1) * sizeof(candidate));
+    if (candidates == NULL) {
+        return -2;
+    }
+    for (size_t i = 0; i < cells->length; i++) {
+        int32_t x = cells->pairs[i].x, y = cells->pairs[i].y;
+        if (ISGOAL(x, y)) {
+            candidate c = {x, y, 0};
+            candidates[numCandidates++] = c;
+            continue;
+        }
+        if (ISPENDING(x, y)) {
+            IX(x, y) = -1;
+        }
+        if (ISBLOCKED(x, y)) {
+            continue;
+        }
+        int32_t best = -1;
+        FOREACH_NEIGHBOR(x, y, xi, yi) {
+            int32_t cost = IX(xi, yi);
+            if (cost >= 0 && (best < 0 || cost < best)) {
+                best = cost;
+            }
+        }
+        if (best >= 0) {
+            candidate c = {x, y, best + 1};
+            candidates[numCandidates++] = c;
+        }
+    }
+    int result = floodCandidates(s, candidates, numCandidates, 0);
+    free(candidates);
+    return result;
+}
+
+
+/* Mark as pending everyone whose cost came from a pending cell, and who has
+ * no other neighbor to get it from. Note pending grows as we iterate over
+ * it. Return values are as lowerCells(). */
+static int raisePending(repairState *s, pairList *pending) {
+    UNPACK_STATE(s);
+    int result = 0;
+    for (size_t i = 0; i < pending->length; i++) {
+        int32_t x = pending->pairs[i].x, y = pending->pairs[i].y;
+        int32_t childCost = -2 - IX(x, y) + 1;
+        SPEND_WORK();
+        FOREACH_NEIGHBOR(x, y, xi, yi) {
+            if (IX(xi, yi) == childCost && !ISGOAL(xi, yi) &&
+                    !isSupported(s, xi, yi, childCost)) {
+                if (markPending(s, pending, xi, yi) != 0) {
+                    return -2;
+                }
+            }
+        }
+    }
+   cleanup:
+      return result;
+}
+
+
+/* Update a heat map generated by burnHeatMap() to account for a small number
+ * of changes, touching as few cells as possible.
+ *
+ * heatMap holds the old heat map, and is modified in place. blockedMap is the
+ * current obstruction map (nonzero means blocked), and goalXs/goalYs are the
+ * current goals. changedXs/changedYs are every cell whose obstruction or
+ * goal status has changed since heatMap was accurate.
+ *
+ * This is done in three passes:
+ * - Flood out from new goals and newly-opened cells, lowering the cost of
+ *   anyone they give a shorter route to. When the goal moves, this takes
+ *   care of everyone that it moved towards.
+ * - Find every cell whose cost can no longer be justified, because the
+ *   neighbor it got its cost from is gone or has itself become unjustified,
+ *   and mark it as pending.
+ * - Work out new costs for the pending cells and flood out from them again.
+ *
+ * Returns the number of cells examined, or -1 if that would have exceeded
+ * maxWork (in which case heatMap is left in an inconsistent state and must
+ * be regenerated from scratch), or -2 if we failed to allocate memory. */
+int32_t repairHeatMap(int32_t xMax, int32_t yMax,
+        int32_t *heatMap, int32_t *blockedMap,
+        size_t goals_length, int32_t *goalXs, int32_t *goalYs,
+        size_t changed_length, int32_t *changedXs, int32_t *changedYs,
+        int32_t maxWork)
+{
+    repairState state = {xMax, yMax, heatMap, blockedMap, NULL, 0, maxWork};
+    repairState *s = &state;
+    int result = 0;
+    pairList pending = {NULL, 0, 0};
+    pairList opened = {NULL, 0, 0};
+    s->goalCells = (uint8_t*) calloc(((size_t) xMax * yMax >> 3) + 1, 1);
+    if (s->goalCells == NULL) {
+        return -2;
+    }
+    for (size_t i = 0; i < goals_length; i++) {
+        setbit(s->goalCells, goalXs[i], goalYs[i], xMax);
+    }
+
+    // Sort out which changed cells are now open, and which are now closed
+    // (and thus no longer usable as routes).
+    for (size_t i = 0; i < changed_length; i++) {
+        int32_t x = changedXs[i], y = changedYs[i];
+        pair xy = {x, y};
+        if (ISBLOCKED(x, y)) {
+            if (IX(x, y) >= 0) {
+                result = markPending(s, &pending, x, y);
+            }
+        }
+        else {
+            result = addToList(&opened, xy);
+        }
+        if (result != 0) {
+            goto cleanup;
+        }
+    }
+
+    if ((result = lowerCells(s, &opened)) != 0) {
+        goto cleanup;
+    }
+
+    for (size_t i = 0; i < opened.length; i++) {
+        int32_t x = opened.pairs[i].x, y = opened.pairs[i].y;
+        if (!ISGOAL(x, y) && IX(x, y) >= 0 &&
+                !isSupported(s, x, y, IX(x, y))) {
+            if ((result = markPending(s, &pending, x, y)) != 0) {
+                goto cleanup;
+            }
+        }
+    }
+    if ((result = raisePending(s, &pending)) != 0) {
+        goto cleanup;
+    }
+
+    result = lowerCells(s, &pending);
+
+   cleanup:
+      free(s->goalCells);
+      free(pending.pairs);
+      free(opened.pairs);
+      if (result == 0) {
+          return s->work;
+      }
+      return result;
+}
+
+
+/* Given a heat map whose non-negative values are arbitrary starting costs,
+ * lower each open cell's cost to one more than its cheapest neighbor's, and
+ * so on, until every open cell with a non-negative cost is no more than one
+ * more than any of its neighbors. Cells with negative costs, and blocked
+ * cells (per blockedMap), are never changed.
+ * Returns 0 on success, or -2 if we failed to allocate memory. */
+int32_t relaxHeatMap(int32_t xMax, int32_t yMax,
+        int32_t *heatMap, int32_t *blockedMap)
+{
+    uint8_t *goalCells = (uint8_t*) calloc(((size_t) xMax * yMax >> 3) + 1, 1);
+    repairState state = {xMax, yMax, heatMap, blockedMap, goalCells, 0,
+            INT32_MAX};
+    candidate *candidates = (candidate*) malloc(
+            ((size_t) xMax * yMax + 1) * sizeof(candidate));
+    size_t numCandidates = 0;
+    int32_t result = -2;
+    if (goalCells != NULL && candidates != NULL) {
+        for (int32_t y = 0; y < yMax; y++) {
+            for (int32_t x = 0; x < xMax; x++) {
+                if (IX(x, y) >= 0) {
+                    candidate c = {x, y, IX(x, y)};
+                    candidates[numCandidates++] = c;
+                }
+            }
+        }
+        result = floodCandidates(&state, candidates, numCandidates, 1);
+    }
+    free(goalCells);
+    free(candidates);
+    return result;
+}
@@ -15,14 +15,37 @@ heatMapArray = numpy.ctypeslib.ndpointer(
     flags=('C_CONTIGUOUS', 'ALIGNED', 'WRITEABLE'),
 )
 
-# Assume that the compiled cmap code is in the same directory as this module.
-mapLib = ctypes.CDLL(os.path.join(os.path.dirname(__file__), "_cmap.so"))
-mapLib.burnHeatMap.argtypes = (
-    ctypes.c_int32, ctypes.c_int32, heatMapArray,
-    ctypes.c_size_t, ctypes.POINTER(ctypes.c_int32), 
-    ctypes.POINTER(ctypes.c_int32))
-mapLib.burnHeatMap.restype = ctypes.c_int
+## Load the compiled cmap library at the given path and declare the
+# signatures of its functions. Raises OSError if the library can't be
+# loaded, and ImportError if it was built from an older _cmap.c that lacks
+# some of the functions we need.
+def loadLibrary(path):
+    lib = ctypes.CDLL(path)
+    for name in ('burnHeatMap', 'repairHeatMap', 'relaxHeatMap'):
+        if not hasattr(lib, name):
+            raise ImportError(("%s has no %s function; it is out of date. " +
+                    "Rebuild it from _cmap.c (run \"make\").") % (path, name))
+    lib.burnHeatMap.argtypes = (
+        ctypes.c_int32, ctypes.c_int32, heatMapArray,
+        ctypes.c_size_t, ctypes.POINTER(ctypes.c_int32), 
+        ctypes.POINTER(ctypes.c_int32))
+    lib.burnHeatMap.restype = ctypes.c_int
+    lib.repairHeatMap.argtypes = (
+        ctypes.c_int32, ctypes.c_int32, heatMapArray, heatMapArray,
+        ctypes.c_size_t, ctypes.POINTER(ctypes.c_int32),
+        ctypes.POINTER(ctypes.c_int32),
+        ctypes.c_size_t, ctypes.POINTER(ctypes.c_int32),
+        ctypes.POINTER(ctypes.c_int32),
+        ctypes.c_int32)
+    lib.repairHeatMap.restype = ctypes.c_int32
+    lib.relaxHeatMap.argtypes = (
+        ctypes.c_int32, ctypes.c_int32, heatMapArray, heatMapArray)
+    lib.relaxHeatMap.restype = ctypes.c_int32
+    return lib
+
 
+# Assume that the compiled cmap code is in the same directory as this module.
+mapLib = loadLibrary(os.path.join(os.path.dirname(__file__), "_cmap.so"))
 
 ## Generate a heat map. We marshall our inputs into a format that the C code
 # can understand, and then hand the actual work off to it.
@@ -31,13 +54,7 @@ def getHeatMap(gridMap, goals):
     heatMap = numpy.ndarray(gridMap.shape, dtype=numpy.int32, order='C')
     heatMap[:,:] = gridMap[:,:]
 
-    # Copy the goals list into a format that's convenient for ctypes passing.
-    goalsType = ctypes.c_int32 * len(goals)
-    goalXs = goalsType()
-    goalYs = goalsType()
-    for i, (y, x) in enumerate(goals):
-        goalXs[i] = x
-        goalYs[i] = y
+    goalXs, goalYs = getCoordinateArrays(goals)
 
     xMax = heatMap.shape[1]
     yMax = heatMap.shape[0]
@@ -49,3 +66,50 @@ def getHeatMap(gridMap, goals):
     return heatMap
 
 
+
+
+## Copy a list of (x, y) tuples into a format that's convenient for ctypes
+# passing. Note that the C code's X and Y are our Y and X.
+def getCoordinateArrays(positions):
+    coordsType = ctypes.c_int32 * len(positions)
+    xs = coordsType()
+    ys = coordsType()
+    for i, (y, x) in enumerate(positions):
+        xs[i] = x
+        ys[i] = y
+    return xs, ys
+
+
+## Update a heat map made by getHeatMap() in place, to account for changes
+# to the map or the goals, without redoing the whole thing.
+# \param heatMap The heat map to update.
+# \param blockedMap A C-contiguous int32 copy of the current gridMap.
+# \param goals The current goals.
+# \param changedCells Every cell whose obstruction or goal status has
+#        changed since heatMap was accurate.
+# \param maxWork How many cells we may examine before giving up.
+# \return The number of cells examined, or None if we gave up, in which case
+#         heatMap is garbage and must be regenerated with getHeatMap().
+def repairHeatMap(heatMap, blockedMap, goals, changedCells, maxWork):
+    goalXs, goalYs = getCoordinateArrays(goals)
+    changedXs, changedYs = getCoordinateArrays(changedCells)
+    result = mapLib.repairHeatMap(heatMap.shape[1], heatMap.shape[0],
+            heatMap, blockedMap, len(goals), goalXs, goalYs,
+            len(changedCells), changedXs, changedYs, maxWork)
+    if result == -2:
+        raise MemoryError("allocation error in _cmap.repairHeatMap.")
+    if result == -1:
+        return None
+    return result
+
+
+## Lower the values in a heat map, in place, until no open cell with a
+# non-negative value is more than one more than any of its neighbors. Cells
+# with negative values, and blocked cells, are left alone.
+# \param heatMap The heat map to relax.
+# \param blockedMap A C-contiguous int32 array where nonzero values are
+#        blocked.
+def relaxHeatMap(heatMap, blockedMap):
+    if mapLib.relaxHeatMap(heatMap.shape[1], heatMap.shape[0],
+            heatMap, blockedMap) != 0:
+        raise MemoryError("allocation error in _cmap.relaxHeatMap.")
@@ -0,0 +1,181 @@
+## Precompiled cache of the contents of our data files. Parsing the JSON in
+# data/ and applying templates to the records in it takes a noticeable chunk
+# of startup time, and the results are the same every time unless the data
+# files change. So loaders can use a DataCache to store the parsed and
+# template-resolved records in a binary (marshal) file under CACHE_DIR, keyed
+# on a hash of the data files they come from and of the code that resolves
+# them; when nothing has changed, launches load that instead.
+#
+# The cache only ever holds plain data (dicts, lists, strings and numbers),
+# never code, and is rebuilt automatically whenever it's missing, out of
+# date, or unreadable. To build it ahead of time, run "python -m
+# util.dataCache" from the top-level directory.
+
+import hashlib
+import json
+import marshal
+import os
+import sys
+
+import util.record
+
+
+## Directory the cache files live in.
+CACHE_DIR = os.path.join('data', 'cache')
+
+## Bump this whenever the cache format, or the way loaders use it, changes.
+CACHE_VERSION = 1
+
+## If False, we never use (or write) cache files.
+isEnabled = True
+
+
+
+## Get a hash of the contents of the given files (Python modules are
+# hashed by their source), along with everything else that affects whether
+# a cache file is usable.
+def getSourceHash(sourcePaths):
+    hasher = hashlib.sha1()
+    hasher.update('%d:%d:%s' % (CACHE_VERSION, marshal.version, sys.version))
+    for path in sourcePaths:
+        if path.endswith('.pyc') or path.endswith('.pyo'):
+            path = path[:-1]
+        hasher.update(path + '\0')
+        with open(path, 'rb') as handle:
+            hasher.update(handle.read())
+    return hasher.hexdigest()
+
+
+
+## A DataCache stands in for a loader's data files. The loader asks it for
+# the contents of each file, and it either provides them from the cache file
+# (if it's up to date) or reads the data file and remembers what it found,
+# so that save() can write out a new cache file afterwards.
+class DataCache:
+    ## \param name Name of the cache file (without directory or extension).
+    # \param sourcePaths Paths to every file that affects what we cache:
+    #        the data files, and the modules whose code resolves templates.
+    def __init__(self, name, sourcePaths):
+        self.name = name
+        self.cachePath = os.path.join(CACHE_DIR, name + '.cache')
+        self.sourceHash = getSourceHash(sourcePaths)
+        ## Maps data file paths to marshalled contents of those files (or to
+        # lists of marshalled records), if our cache file is up to date, or
+        # None if it isn't.
+        self.pathToContents = self.readCache()
+        ## Maps data file paths to marshalled contents of those files (or to
+        # lists of marshalled records) that we've read while the cache file
+        # was out of date.
+        self.newPathToContents = {}
+
+
+    ## Read the cache file, if it's there and up to date, and return its
+    # contents.
+    def readCache(self):
+        if not isEnabled or not os.path.exists(self.cachePath):
+            return None
+        try:
+            with open(self.cachePath, 'rb') as handle:
+                if marshal.load(handle) != self.sourceHash:
+                    return None
+                return marshal.load(handle)
+        except (EOFError, ValueError, TypeError), e:
+            print "Ignoring unreadable data cache %s: %s" % (self.cachePath, e)
+            return None
+
+
+    ## Return True if we're using the cache file instead of data files.
+    def getIsUpToDate(self):
+        return self.pathToContents is not None
+
+
+    ## Get the parsed contents of the given JSON file.
+    def loadJson(self, filePath):
+        if self.pathToContents is not None:
+            return marshal.loads(self.pathToContents[filePath])
+        with open(filePath, 'r') as handle:
+            result = json.load(handle)
+        self.newPathToContents[filePath] = marshal.dumps(result)
+        # Hand out what the cache would, so that dicts iterate in the same
+        # order either way.
+        return marshal.loads(self.newPathToContents[filePath])
+
+
+    ## As util.record.loadRecords(), generate an instance of the given class
+    # for each record in the given data file.
+    # \param resolveFunc Function that accepts a record and returns the
+    #        complete record, with templates applied. If provided, we cache
+    #        the complete records too, and pass them to the class's
+    #        constructor along with the records. The records are resolved
+    #        one at a time, as the instances are created, so they can refer
+    #        to earlier ones.
+    def loadRecords(self, filePath, classType, resolveFunc = None):
+        if self.pathToContents is not None:
+            for entry in self.pathToContents[filePath]:
+                entry = marshal.loads(entry)
+                if resolveFunc is None:
+                    yield classType(entry)
+                else:
+                    yield classType(*entry)
+            return
+        entries = self.newPathToContents[filePath] = []
+        # Instances get copies of the records, as they would from the cache,
+        # so that dicts iterate in the same order either way.
+        def makeInstance(record):
+            if resolveFunc is None:
+                entries.append(marshal.dumps(record))
+                return classType(marshal.loads(entries[-1]))
+            completeRecord = resolveFunc(record)
+            # Take a copy now, before anything can modify the records.
+            entries.append(marshal.dumps((record, completeRecord)))
+            return classType(*marshal.loads(entries[-1]))
+        for instance in util.record.loadRecords(filePath, makeInstance):
+            yield instance
+
+
+    ## Write out a new cache file, if the old one was out of date. Failing to
+    # do so (e.g. because we can't write to CACHE_DIR) isn't fatal; we'll
+    # just have to read the data files again next time.
+    def save(self):
+        if not isEnabled or self.pathToContents is not None:
+            return
+        contents = dict(self.newPathToContents)
+        tempPath = self.cachePath + '.tmp'
+        try:
+            if not os.path.isdir(CACHE_DIR):
+                os.makedirs(CACHE_DIR)
+            with open(tempPath, 'wb') as handle:
+                marshal.dump(self.sourceHash, handle)
+                marshal.dump(contents, handle)
+            if os.path.exists(self.cachePath):
+                os.remove(self.cachePath)
+            os.rename(tempPath, self.cachePath)
+        except (IOError, OSError), e:
+            print "Couldn't write data cache %s: %s" % (self.cachePath, e)
+            return
+        self.pathToContents = contents
+
+
+
+## Rebuild every cache file, by loading all of the data files.
+def buildCaches():
+    import procs.procLoader
+    import procs.procData
+    import things.items.itemLoader
+    import things.creatures.creatureLoader
+    import things.terrain.terrainLoader
+    for name in os.listdir(CACHE_DIR) if os.path.isdir(CACHE_DIR) else []:
+        if name.endswith('.cache'):
+            os.remove(os.path.join(CACHE_DIR, name))
+    procs.procLoader.loadFiles()
+    procs.procData.loadFiles()
+    things.items.itemLoader.loadFiles()
+    things.creatures.creatureLoader.loadFiles()
+    things.terrain.terrainLoader.loadFiles()
+
+
+if __name__ == '__main__':
+    import pyximport
+    pyximport.install()
+    import mapgen.gameMap
+    buildCaches()
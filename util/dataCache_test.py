@@ -0,0 +1,150 @@
+import pyximport; pyximport.install()
+import mapgen.gameMap
+
+import util.dataCache
+
+import json
+import marshal
+import os
+import shutil
+import tempfile
+
+
+## Minimal record-driven class, like the various factories.
+class Widget:
+    def __init__(self, record, completeRecord = None):
+        self.record = record
+        self.completeRecord = completeRecord
+
+
+## Cache files go into a temporary directory while the given function runs.
+def withTempCacheDir(func):
+    def wrapper():
+        oldDir = util.dataCache.CACHE_DIR
+        util.dataCache.CACHE_DIR = tempfile.mkdtemp()
+        try:
+            func()
+        finally:
+            shutil.rmtree(util.dataCache.CACHE_DIR)
+            util.dataCache.CACHE_DIR = oldDir
+    wrapper.__name__ = func.__name__
+    return wrapper
+
+
+## A DataCache gives the same records as the data files (down to the order
+# their dicts iterate in), only resolves them when it has to, and notices
+# when the data files change or the cache file is damaged.
+@withTempCacheDir
+def test_dataCache():
+    handle, dataPath = tempfile.mkstemp()
+    os.close(handle)
+    numResolves = [0]
+    def resolve(record):
+        numResolves[0] += 1
+        return dict(record, resolved = True)
+    def load():
+        cache = util.dataCache.DataCache('test', [dataPath])
+        isUpToDate = cache.getIsUpToDate()
+        widgets = list(cache.loadRecords(dataPath, Widget, resolve))
+        cache.save()
+        return isUpToDate, widgets
+    try:
+        records = [{'name': 'a', 'list': [1, 2.5, u'three']}, {'name': 'b'},
+                dict(('key%d' % (i * 7919 % 1000), i) for i in xrange(40))]
+        with open(dataPath, 'w') as handle:
+            json.dump(records, handle)
+        keyOrders = None
+        for expectUpToDate in [False, True, True]:
+            isUpToDate, widgets = load()
+            assert isUpToDate == expectUpToDate
+            assert [w.record for w in widgets] == records
+            assert [w.completeRecord for w in widgets] == [
+                    dict(record, resolved = True) for record in records]
+            newKeyOrders = [(w.record.keys(), w.completeRecord.keys())
+                    for w in widgets]
+            assert keyOrders is None or newKeyOrders == keyOrders
+            keyOrders = newKeyOrders
+        assert numResolves[0] == 3
+        # Changing the data file invalidates the cache.
+        records.append({'name': 'c'})
+        with open(dataPath, 'w') as handle:
+            json.dump(records, handle)
+        isUpToDate, widgets = load()
+        assert not isUpToDate and len(widgets) == 4
+        assert load()[0]
+        # So does damaging the cache file.
+        cachePath = os.path.join(util.dataCache.CACHE_DIR, 'test.cache')
+        with open(cachePath, 'r+b') as handle:
+            handle.truncate(os.path.getsize(cachePath) / 2)
+        isUpToDate, widgets = load()
+        assert not isUpToDate and len(widgets) == 4
+        # And we can turn the cache off entirely.
+        util.dataCache.isEnabled = False
+        try:
+            assert not load()[0]
+        finally:
+            util.dataCache.isEnabled = True
+    finally:
+        os.remove(dataPath)
+
+
+## Get the fields of the given object that can be marshalled, so that they
+# can be compared. Flavors are chosen at random, so we skip them.
+def getComparableFields(obj):
+    result = {}
+    for key, value in obj.__dict__.iteritems():
+        if key == 'flavor':
+            continue
+        try:
+            result[key] = marshal.loads(marshal.dumps(value))
+        except ValueError:
+            pass
+    return result
+
+
+## Load the item and creature data files, and return comparable versions of
+# all the factories made from them.
+def loadFactories():
+    import things.items.itemLoader
+    import things.creatures.creatureLoader
+    things.items.itemLoader.loadFiles()
+    things.creatures.creatureLoader.loadFiles()
+    # Make every item and creature factory.
+    items = dict((key, things.items.itemLoader.getFactory(key))
+            for key in things.items.itemLoader.ITEM_FACTORY_MAP)
+    creatures = dict((name, things.creatures.creatureLoader.getFactory(name))
+            for name in things.creatures.creatureLoader.CREATURE_MAP)
+    result = {}
+    for prefix, nameToFactory in [
+            ('item', items),
+            ('item template', things.items.itemLoader.TEMPLATE_NAME_MAP),
+            ('affix', things.items.itemLoader.AFFIX_NAME_MAP),
+            ('theme', things.items.itemLoader.THEME_NAME_MAP),
+            ('loot', things.items.itemLoader.LOOT_TEMPLATE_MAP),
+            ('creature', creatures),
+            ('creature template',
+                things.creatures.creatureLoader.TEMPLATE_NAME_MAP)]:
+        for name, factory in nameToFactory.iteritems():
+            result[(prefix, name)] = getComparableFields(factory)
+    for name, factory in creatures.iteritems():
+        result[('static procs', name)] = sorted(
+                (trigger, len(procs)) for trigger, procs in factory.staticProcs.iteritems())
+        result[('drops', name)] = [getComparableFields(drop)
+                for drop in factory.drops]
+    return result
+
+
+## The item and creature loaders make the same factories whether they're
+# reading the data files or the cache.
+@withTempCacheDir
+def test_loaders():
+    import procs.procLoader
+    procs.procLoader.loadFiles()
+    expected = loadFactories()
+    assert os.listdir(util.dataCache.CACHE_DIR)
+    assert loadFactories() == expected
+
+
+if __name__ == '__main__':
+    test_dataCache()
+    test_loaders()
@@ -13,7 +13,9 @@
 #
 # As adapted by d_m, and then further modified for Pyrel. 
 
+import collections
 import copy
+import numpy
 
 
 
@@ -269,6 +271,245 @@ def checkView(active, viewIndex):
     else:
         return True
 
+
+## Fast field-of-view engine. This implements exactly the same algorithm as
+# setFieldOfView() and its helpers above (and gives exactly the same results),
+# but views are plain lists of integers instead of View and Line objects, bumps
+# are (x, y, parent) tuples, and we read from and write to nested lists
+# covering just the part of the map within the radius, instead of calling a
+# function per visible tile. Each view is laid out as follows:
+(SHALLOW_START_X, SHALLOW_START_Y, SHALLOW_END_X, SHALLOW_END_Y,
+        STEEP_START_X, STEEP_START_Y, STEEP_END_X, STEEP_END_Y,
+        SHALLOW_BUMP, STEEP_BUMP) = range(10)
+
+## Maximum number of fields of view that a FieldOfViewCache remembers.
+MAX_CACHED_VIEWS = 64
+
+
+## Determine which coordinates on a 2D grid are visible from a particular
+# coordinate, as setFieldOfView(), but return the result as a boolean array.
+# \param mapGrid Numpy array representing map visibility: 0 is clear,
+#        anything else is obstructed.
+# \param start (x, y) tuple representing the center of view.
+# \param radius How far the field of view may extend along the X or Y axes.
+# \return (xMin, yMin, visible) tuple, where visible is a Numpy boolean
+#         array covering the part of the map within the radius of the start,
+#         and (xMin, yMin) is the map position of its first element.
+def getFieldOfView(mapGrid, start, radius):
+    startX, startY = start
+    minExtentX = min(startX, radius)
+    maxExtentX = min(mapGrid.shape[0] - startX - 1, radius)
+    minExtentY = min(startY, radius)
+    maxExtentY = min(mapGrid.shape[1] - startY - 1, radius)
+    xMin = startX - minExtentX
+    yMin = startY - minExtentY
+    blocked = (mapGrid[xMin:startX + maxExtentX + 1,
+            yMin:startY + maxExtentY + 1] != 0).tolist()
+    height = minExtentY + maxExtentY + 1
+    visible = [[False] * height for i in xrange(minExtentX + maxExtentX + 1)]
+    # The center is always visible.
+    visible[minExtentX][minExtentY] = True
+    for dx, dy, extentX, extentY in [
+            (1, 1, maxExtentX, maxExtentY), (1, -1, maxExtentX, minExtentY),
+            (-1, -1, minExtentX, minExtentY), (-1, 1, minExtentX, maxExtentY)]:
+        scanQuadrant(blocked, visible, minExtentX, minExtentY, dx, dy,
+                extentX, extentY)
+    return xMin, yMin, numpy.array(visible, dtype = numpy.bool_)
+
+
+## As getFieldOfView(), but mark the visible cells in the given
+# map-sized boolean array. Cells that aren't visible are left alone.
+def fillFieldOfView(mapGrid, start, radius, out):
+    xMin, yMin, visible = getFieldOfView(mapGrid, start, radius)
+    out[xMin:xMin + visible.shape[0], yMin:yMin + visible.shape[1]] |= visible
+
+
+## Fast version of checkQuadrant() and visitCoord(). As in Line, the
+# relative slope of a point to a line is
+# (endY - startY) * (endX - x) - (endX - startX) * (endY - y), which is
+# negative when the point is above the line and positive when it's below.
+def scanQuadrant(blocked, visible, startX, startY, dx, dy, extentX, extentY):
+    # The initial shallow line runs from (0, 1) to (extentX, 0), and the
+    # initial steep line from (1, 0) to (0, extentY).
+    active = [[0, 1, extentX, 0, 1, 0, 0, extentY, None, None]]
+    maxI = extentX + extentY
+    i = 1
+    while i != maxI + 1 and active:
+        j = max(0, i - extentX)
+        maxJ = min(i, extentY)
+        while j != maxJ + 1 and active:
+            x = i - j
+            y = j
+            j += 1
+            # Skip views that the current coordinate is above, by comparing
+            # their steep lines against its bottom right corner.
+            viewIndex = 0
+            numViews = len(active)
+            while viewIndex < numViews:
+                view = active[viewIndex]
+                steepEndX = view[STEEP_END_X]
+                steepEndY = view[STEEP_END_Y]
+                steepDX = steepEndX - view[STEEP_START_X]
+                steepDY = steepEndY - view[STEEP_START_Y]
+                if (steepDY * (steepEndX - x - 1) -
+                        steepDX * (steepEndY - y)) < 0:
+                    break
+                viewIndex += 1
+            if viewIndex == numViews:
+                continue
+            # Give up if we're below this view, by comparing its shallow line
+            # against our top left corner.
+            shallowEndX = view[SHALLOW_END_X]
+            shallowEndY = view[SHALLOW_END_Y]
+            shallowDX = shallowEndX - view[SHALLOW_START_X]
+            shallowDY = shallowEndY - view[SHALLOW_START_Y]
+            if (shallowDY * (shallowEndX - x) -
+                    shallowDX * (shallowEndY - y - 1)) <= 0:
+                continue
+            realX = startX + x * dx
+            realY = startY + y * dy
+            visible[realX][realY] = True
+            if not blocked[realX][realY]:
+                continue
+            # Is the shallow line above our bottom right corner, and is the
+            # steep line below our top left corner?
+            isShallowAbove = (shallowDY * (shallowEndX - x - 1) -
+                    shallowDX * (shallowEndY - y)) < 0
+            isSteepBelow = (steepDY * (steepEndX - x) -
+                    steepDX * (steepEndY - y - 1)) > 0
+            if isShallowAbove and isSteepBelow:
+                # The view is completely blocked.
+                del active[viewIndex]
+            elif isShallowAbove:
+                addFastShallowBump(x, y + 1, view)
+                checkFastView(active, viewIndex)
+            elif isSteepBelow:
+                addFastSteepBump(x + 1, y, view)
+                checkFastView(active, viewIndex)
+            else:
+                # Split the view in two around the current coordinate.
+                steepViewIndex = viewIndex + 1
+                shallowView = list(view)
+                active.insert(viewIndex, shallowView)
+                addFastSteepBump(x + 1, y, shallowView)
+                if not checkFastView(active, viewIndex):
+                    steepViewIndex -= 1
+                addFastShallowBump(x, y + 1, active[steepViewIndex])
+                checkFastView(active, steepViewIndex)
+        i += 1
+
+
+## Fast version of addShallowBump(). Bumps are (x, y, parent) tuples.
+def addFastShallowBump(x, y, view):
+    view[SHALLOW_END_X] = x
+    view[SHALLOW_END_Y] = y
+    view[SHALLOW_BUMP] = (x, y, view[SHALLOW_BUMP])
+    # Move the start of the shallow line to the steep bumps above it.
+    bump = view[STEEP_BUMP]
+    while bump is not None:
+        bumpX, bumpY, parent = bump
+        if ((y - view[SHALLOW_START_Y]) * (x - bumpX) -
+                (x - view[SHALLOW_START_X]) * (y - bumpY)) < 0:
+            view[SHALLOW_START_X] = bumpX
+            view[SHALLOW_START_Y] = bumpY
+        bump = parent
+
+
+## Fast version of addSteepBump().
+def addFastSteepBump(x, y, view):
+    view[STEEP_END_X] = x
+    view[STEEP_END_Y] = y
+    view[STEEP_BUMP] = (x, y, view[STEEP_BUMP])
+    # Move the start of the steep line to the shallow bumps below it.
+    bump = view[SHALLOW_BUMP]
+    while bump is not None:
+        bumpX, bumpY, parent = bump
+        if ((y - view[STEEP_START_Y]) * (x - bumpX) -
+                (x - view[STEEP_START_X]) * (y - bumpY)) > 0:
+            view[STEEP_START_X] = bumpX
+            view[STEEP_START_Y] = bumpY
+        bump = parent
+
+
+## Fast version of checkView(). Remove the view, and return False, if its
+# shallow and steep lines are collinear and pass through the origin or the
+# extremity of the origin cell.
+def checkFastView(active, viewIndex):
+    view = active[viewIndex]
+    endX = view[SHALLOW_END_X]
+    endY = view[SHALLOW_END_Y]
+    dx = endX - view[SHALLOW_START_X]
+    dy = endY - view[SHALLOW_START_Y]
+    if (dy * (endX - view[STEEP_START_X]) -
+                dx * (endY - view[STEEP_START_Y]) == 0 and
+            dy * (endX - view[STEEP_END_X]) -
+                dx * (endY - view[STEEP_END_Y]) == 0 and
+            (dy * endX - dx * (endY - 1) == 0 or
+             dy * (endX - 1) - dx * endY == 0)):
+        del active[viewIndex]
+        return False
+    return True
+
+
+
+## Remembers fields of view for an AccessibilityMap, keyed on the center and
+# radius of the view, so that e.g. a player standing still doesn't have to
+# recalculate theirs. We use the AccessibilityMap's change log (see
+# AccessibilityMap.getChangesSince()) to forget about views that are affected
+# by changes to the map.
+class FieldOfViewCache:
+    def __init__(self):
+        ## The AccessibilityMap our views are for.
+        self.mapper = None
+        ## Index into self.mapper's change log as of when our views were
+        # last checked.
+        self.changeIndex = None
+        ## Maps (start, radius) tuples to results of getFieldOfView(), least
+        # recently used first.
+        self.keyToView = collections.OrderedDict()
+
+
+    ## As getFieldOfView(), but for the given AccessibilityMap.
+    def getFieldOfView(self, mapper, start, radius):
+        gridMap = mapper.getMap()
+        if mapper is not self.mapper:
+            self.mapper = mapper
+            self.keyToView.clear()
+            self.changeIndex = mapper.getChangeIndex()
+        else:
+            changes, self.changeIndex = mapper.getChangesSince(self.changeIndex)
+            if changes is None:
+                self.keyToView.clear()
+            elif changes:
+                self.forgetChanges(changes)
+        key = (tuple(start), radius)
+        view = self.keyToView.pop(key, None)
+        if view is None:
+            view = getFieldOfView(gridMap, start, radius)
+            while len(self.keyToView) >= MAX_CACHED_VIEWS:
+                self.keyToView.popitem(last = False)
+        # Mark the view as most recently used.
+        self.keyToView[key] = view
+        return view
+
+
+    ## As fillFieldOfView(), but for the given AccessibilityMap.
+    def fillFieldOfView(self, mapper, start, radius, out):
+        xMin, yMin, visible = self.getFieldOfView(mapper, start, radius)
+        out[xMin:xMin + visible.shape[0], yMin:yMin + visible.shape[1]] |= visible
+
+
+    ## Forget any views that include any of the given positions.
+    def forgetChanges(self, positions):
+        for key, (xMin, yMin, visible) in self.keyToView.items():
+            xMax = xMin + visible.shape[0]
+            yMax = yMin + visible.shape[1]
+            for x, y in positions:
+                if xMin <= x < xMax and yMin <= y < yMax:
+                    del self.keyToView[key]
+                    break
+
+
 if __name__ == "__main__":
     import numpy
     width = 40
@@ -0,0 +1,99 @@
+import pyximport; pyximport.install()
+import mapgen.gameMap
+
+import container
+import util.fieldOfView
+
+import numpy
+import random
+import time
+
+
+## Get the field of view the slow way, as a map-sized boolean array.
+def getExpectedView(mapGrid, start, radius):
+    result = numpy.zeros(mapGrid.shape, dtype = numpy.bool_)
+    def markVisible(x, y):
+        result[x, y] = True
+    util.fieldOfView.setFieldOfView(mapGrid, start, radius, markVisible)
+    return result
+
+
+## Get the field of view with fillFieldOfView().
+def getFastView(mapGrid, start, radius):
+    result = numpy.zeros(mapGrid.shape, dtype = numpy.bool_)
+    util.fieldOfView.fillFieldOfView(mapGrid, start, radius, result)
+    return result
+
+
+## The fast field of view engine agrees exactly with setFieldOfView(), for
+# random maps, starting points and radii.
+def test_fieldOfView():
+    rng = random.Random(0)
+    for trial in xrange(500):
+        width, height = rng.randint(1, 30), rng.randint(1, 30)
+        density = rng.choice([0, .1, .3, .5])
+        mapGrid = numpy.array([[rng.random() < density
+                for y in xrange(height)] for x in xrange(width)],
+                dtype = numpy.int32)
+        start = (rng.randint(0, width - 1), rng.randint(0, height - 1))
+        radius = rng.randint(0, 20)
+        assert (getFastView(mapGrid, start, radius) ==
+                getExpectedView(mapGrid, start, radius)).all()
+
+
+## Minimal Thing that sits in a Cell and blocks sight.
+class Wall:
+    def __init__(self, gameMap, pos):
+        self.name = 'wall'
+        self.pos = pos
+        gameMap.addSubscriber(self, pos)
+        gameMap.addSubscriber(self, container.OPAQUES)
+
+
+## The FieldOfViewCache reuses views while nothing nearby changes, and forgets
+# them when something does.
+def test_fieldOfViewCache():
+    rng = random.Random(0)
+    gameMap = mapgen.gameMap.GameMap(40, 30)
+    walls = [Wall(gameMap, (rng.randint(0, 39), rng.randint(0, 29)))
+            for i in xrange(200)]
+    mapper = gameMap.getAccessibilityMapper(container.OPAQUES)
+    cache = util.fieldOfView.FieldOfViewCache()
+    for i in xrange(300):
+        start = (rng.randint(0, 39), rng.randint(0, 29))
+        radius = rng.choice([3, 8])
+        view = cache.getFieldOfView(mapper, start, radius)
+        assert cache.getFieldOfView(mapper, start, radius) is view
+        result = numpy.zeros((40, 30), dtype = numpy.bool_)
+        cache.fillFieldOfView(mapper, start, radius, result)
+        assert (result ==
+                getExpectedView(mapper.getMap(), start, radius)).all()
+        # Move a wall.
+        wall = rng.choice(walls)
+        target = (rng.randint(0, 39), rng.randint(0, 29))
+        if target not in gameMap.getMembershipsFor(wall):
+            gameMap.moveMe(wall, wall.pos, target)
+            wall.pos = target
+    assert len(cache.keyToView) <= util.fieldOfView.MAX_CACHED_VIEWS
+
+
+## Time calculating a radius-20 field of view from every open cell of a
+# 120x120 map, with setFieldOfView() and with fillFieldOfView().
+def speedTest_fieldOfView():
+    rng = random.Random(0)
+    mapGrid = numpy.array([[rng.random() < .3 for y in xrange(120)]
+            for x in xrange(120)], dtype = numpy.int32)
+    starts = zip(*numpy.where(mapGrid == 0))[::10]
+    for label, func in [('setFieldOfView', getExpectedView),
+            ('fillFieldOfView', getFastView)]:
+        start = time.time()
+        for pos in starts:
+            func(mapGrid, pos, 20)
+        print "%s: %.3fms per view" % (label,
+                (time.time() - start) / len(starts) * 1000)
+
+
+if __name__ == '__main__':
+    test_fieldOfView()
+    test_fieldOfViewCache()
+    speedTest_fieldOfView()
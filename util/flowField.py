@@ -0,0 +1,200 @@
+import container
+import heatMap
+
+import collections
+import numpy
+
+
+## If repairing a FlowField would mean examining more than this many cells
+# per reachable cell in the heat map, we just regenerate it from scratch
+# instead, which is cheaper per cell.
+MAX_REPAIR_FRACTION = .5
+## Always allow repairs to examine at least this many cells.
+MIN_REPAIR_WORK = 64
+## Maximum number of FlowFields that a FlowFieldManager keeps around.
+MAX_CACHED_FIELDS = 32
+
+
+
+## A FlowField maintains a heat map (as per util.heatMap.getHeatMap()) for an
+# AccessibilityMap and a set of goals. Rather than regenerating the entire heat
+# map every time we're asked for it, we find out which cells the
+# AccessibilityMap has changed since last time, and repair just the parts
+# of the heat map that those changes (and any changes to the goals) affect.
+# If too much has changed, we fall back to regenerating the whole thing.
+# That includes when every goal moves: even a single step changes the cost
+# of about half the cells in the map, and util.cmap.repairHeatMap() is no
+# faster than util.cmap.getHeatMap() at that point.
+#
+# Repairs need the compiled util.cmap code; without it (or if a non-C heat map
+# backend has been chosen), we always regenerate from scratch. Likewise for
+# depth-limited heat maps.
+class FlowField:
+    ## \param maxDepth As per util.heatMap.getHeatMap().
+    def __init__(self, maxDepth = None):
+        self.maxDepth = maxDepth
+        ## The current heat map. Repairs are done in place, so anyone holding
+        # onto this will see them.
+        self.heatMap = None
+        ## C-contiguous int32 array of which cells were blocked in the
+        # AccessibilityMap's map as of when self.heatMap was last accurate.
+        self.blockedMap = None
+        ## Goals as of when self.heatMap was last accurate.
+        self.goals = []
+        ## The AccessibilityMap we're following.
+        self.mapper = None
+        ## Index from self.mapper.getChangeIndex() as of when self.heatMap
+        # was last accurate.
+        self.changeIndex = None
+        ## Number of cells in self.heatMap with routes to the goals, as of
+        # the last time it was regenerated.
+        self.numReachable = 0
+        ## Number of times we've repaired the heat map.
+        self.numRepairs = 0
+        ## Number of times we've regenerated the heat map from scratch.
+        self.numRebuilds = 0
+
+
+    ## Bring the heat map up to date and return it.
+    # \param mapper The AccessibilityMap instance for the obstructions we
+    #        care about (see GameMap.getAccessibilityMapper()).
+    # \param goals List of (x, y) tuples for the goal cells.
+    def update(self, mapper, goals):
+        gridMap = mapper.getMap()
+        changes = None
+        if (mapper is self.mapper and self.heatMap is not None and
+                self.heatMap.shape == gridMap.shape and
+                self.maxDepth is None and heatMap.getBackend() == 'c'):
+            changes, self.changeIndex = mapper.getChangesSince(self.changeIndex)
+        if changes is None:
+            self.rebuild(mapper, gridMap, goals)
+            return self.heatMap
+        newGoals = set(goals).difference(self.goals)
+        if newGoals and len(newGoals) >= len(goals):
+            # Every goal has moved, which changes about half of the heat
+            # map even if they only moved one step; we're better off
+            # starting over.
+            self.rebuild(mapper, gridMap, goals)
+            return self.heatMap
+        changedCells = set(changes)
+        changedCells.update(set(goals).symmetric_difference(self.goals))
+        if changedCells:
+            for pos in changes:
+                self.blockedMap[pos] = gridMap[pos] != 0
+            self.goals = list(goals)
+            maxWork = max(MIN_REPAIR_WORK,
+                    int(self.numReachable * MAX_REPAIR_FRACTION))
+            if heatMap.cmap.repairHeatMap(self.heatMap, self.blockedMap, goals,
+                    list(changedCells), maxWork) is None:
+                self.rebuild(mapper, gridMap, goals)
+            else:
+                self.numRepairs += 1
+        return self.heatMap
+
+
+    ## Regenerate the heat map from scratch.
+    def rebuild(self, mapper, gridMap, goals):
+        self.mapper = mapper
+        self.changeIndex = mapper.getChangeIndex()
+        self.blockedMap = numpy.ascontiguousarray(gridMap != 0,
+                dtype = numpy.int32)
+        self.goals = list(goals)
+        self.heatMap = heatMap.getHeatMap(gridMap, goals, self.maxDepth)
+        self.numReachable = numpy.count_nonzero(self.heatMap >= 0)
+        self.numRebuilds += 1
+
+
+    ## Forget everything, so that the next update() regenerates from scratch.
+    def reset(self):
+        self.heatMap = None
+        self.mapper = None
+
+
+
+## The FlowFieldManager hands out heat maps for everyone on a GameMap who
+# wants to move towards (or away from) something, so that creatures that move
+# the same way, towards the same goals, all share the same heat map instead
+# of each needing their own. Heat maps are identified by their goals, the
+# Containers that obstruct movement, and how far out from the goals they go.
+#
+# Goals can either be a fixed list of positions, or a Container ID, in which
+# case the goals are wherever that Container's members are, and the heat map
+# follows them as they move.
+#
+# Anyone asking for a heat map gets the FlowField's array, which is updated in
+# place, so it should be treated as read-only. We find out that the map has
+# changed via GameMap.addUpdateCellFunc(); until it does, asking for the same
+# heat map again just returns it.
+class FlowFieldManager:
+    ## \param gameMap The GameMap whose creatures we'll be guiding.
+    def __init__(self, gameMap):
+        self.gameMap = gameMap
+        ## Maps (goals, obstructing Container IDs, max depth) tuples to
+        # FlowFields, least recently used first.
+        self.keyToField = collections.OrderedDict()
+        ## Maps the same keys to the value of self.version as of when the
+        # FlowField was last updated.
+        self.keyToVersion = {}
+        ## Maps the same keys to (version, flee map) tuples.
+        self.keyToFleeMap = {}
+        ## Incremented every time a Cell's contents change.
+        self.version = 0
+        gameMap.addUpdateCellFunc(self.onCellChange)
+
+
+    ## A Cell's contents have changed, so all of our heat maps may be out of
+    # date.
+    def onCellChange(self, cell, thing, wasAdded):
+        self.version += 1
+
+
+    ## Get a heat map leading to the given goals.
+    # \param goals Either a Container ID, or a list of (x, y) positions.
+    # \param obstructionIds Container IDs whose members obstruct movement.
+    # \param maxDepth As per util.heatMap.getHeatMap().
+    def getHeatMap(self, goals, obstructionIds = (container.BLOCKERS,),
+            maxDepth = None):
+        return self.getFlowField(goals, obstructionIds, maxDepth).heatMap
+
+
+    ## Get a heat map leading away from the given goals (see
+    # util.heatMap.getFleeMap()). Parameters are as getHeatMap().
+    def getFleeMap(self, goals, obstructionIds = (container.BLOCKERS,),
+            maxDepth = None):
+        key = self.getKey(goals, obstructionIds, maxDepth)
+        field = self.getFlowField(goals, obstructionIds, maxDepth)
+        version, fleeMap = self.keyToFleeMap.get(key, (None, None))
+        if version != self.version:
+            mapper = self.gameMap.getAccessibilityMapper(*obstructionIds)
+            fleeMap = heatMap.getFleeMap(field.heatMap, mapper.getMap())
+            self.keyToFleeMap[key] = (self.version, fleeMap)
+        return fleeMap
+
+
+    ## Get the FlowField for the given parameters (as per getHeatMap()),
+    # making it if necessary, and make certain it's up to date.
+    def getFlowField(self, goals, obstructionIds, maxDepth):
+        key = self.getKey(goals, obstructionIds, maxDepth)
+        field = self.keyToField.pop(key, None)
+        if field is None:
+            field = FlowField(maxDepth)
+            while len(self.keyToField) >= MAX_CACHED_FIELDS:
+                oldKey, oldField = self.keyToField.popitem(last = False)
+                del self.keyToVersion[oldKey]
+                self.keyToFleeMap.pop(oldKey, None)
+        # Mark the field as most recently used.
+        self.keyToField[key] = field
+        if self.keyToVersion.get(key) != self.version:
+            if isinstance(goals, (int, long)):
+                goals = [thing.pos for thing in self.gameMap.getContainer(goals)]
+            mapper = self.gameMap.getAccessibilityMapper(*obstructionIds)
+            field.update(mapper, goals)
+            self.keyToVersion[key] = self.version
+        return field
+
+
+    ## Get the key we use to identify the FlowField for the given parameters.
+    def getKey(self, goals, obstructionIds, maxDepth):
+        if not isinstance(goals, (int, long)):
+            goals = frozenset(goals)
+        return (goals, tuple(sorted(obstructionIds)), maxDepth)
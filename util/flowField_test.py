@@ -0,0 +1,237 @@
+import pyximport; pyximport.install()
+import mapgen.gameMap
+
+import container
+import util.cmap
+import util.flowField
+import util.heatMap
+
+import numpy
+import random
+import time
+
+
+## Minimal Thing that sits in a Cell and blocks movement.
+class Blocker:
+    def __init__(self, gameMap, pos):
+        self.name = 'blocker'
+        self.pos = pos
+        gameMap.addSubscriber(self, pos)
+        gameMap.addSubscriber(self, container.BLOCKERS)
+
+
+
+## Make a blocked/open grid of the given size that looks like a cavern, using
+# the same game-of-life rules as mapgen.genCavern, with a solid border.
+def makeCavernGrid(width, height, rng):
+    grid = numpy.array([[rng.randint(0, 99) >= 45 for y in xrange(height)]
+            for x in xrange(width)])
+    for i in xrange(4):
+        padded = numpy.pad(grid, 1, 'constant', constant_values = True)
+        numWalls = sum(padded[1 + dx:1 + dx + width, 1 + dy:1 + dy + height]
+                for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                if dx or dy).astype(numpy.int32)
+        grid = numpy.where(numWalls > 5, True,
+                numpy.where(numWalls < 4, False, grid))
+    grid[0, :] = grid[-1, :] = grid[:, 0] = grid[:, -1] = True
+    return grid
+
+
+## Make a GameMap with Blockers wherever the grid says.
+def makeCavernMap(width, height, rng):
+    grid = makeCavernGrid(width, height, rng)
+    gameMap = mapgen.gameMap.GameMap(width, height)
+    for x, y in zip(*numpy.where(grid)):
+        Blocker(gameMap, (int(x), int(y)))
+    return gameMap, grid
+
+
+## Pick a random open neighbor of the given position, or return the position
+# itself if there isn't one.
+def getStep(gameMap, pos, rng):
+    steps = [(pos[0] + dx, pos[1] + dy) for dx in (-1, 0, 1)
+            for dy in (-1, 0, 1)
+            if (dx or dy) and
+            not gameMap.getHasIntersection((pos[0] + dx, pos[1] + dy),
+                container.BLOCKERS)]
+    if not steps:
+        return pos
+    return rng.choice(steps)
+
+
+## Walk a "player" and some "monsters" (all Blockers) around a cavern, and
+# yield after every turn with the player and the AccessibilityMap for
+# blockers. Monsters move every turn; the player moves with the given
+# probability.
+def walkCavern(width, height, numTurns, numMonsters, rng, moveChance):
+    gameMap, grid = makeCavernMap(width, height, rng)
+    openCells = zip(*numpy.where(~grid))
+    rng.shuffle(openCells)
+    player = Blocker(gameMap, tuple(map(int, openCells[0])))
+    gameMap.addSubscriber(player, container.PLAYERS)
+    monsters = [Blocker(gameMap, tuple(map(int, pos)))
+            for pos in openCells[1:1 + numMonsters]]
+    mapper = gameMap.getAccessibilityMapper(container.BLOCKERS)
+    for i in xrange(numTurns):
+        for monster in monsters:
+            target = getStep(gameMap, monster.pos, rng)
+            if target != monster.pos:
+                gameMap.moveMe(monster, monster.pos, target)
+        target = getStep(gameMap, player.pos, rng)
+        if rng.random() < moveChance and target != player.pos:
+            gameMap.moveMe(player, player.pos, target)
+        if i % 100 == 99:
+            # Occasionally dig out or fill in a bit of wall.
+            x, y = (rng.randint(1, width - 2), rng.randint(1, height - 2))
+            blockers = gameMap.getContainer((x, y), container.BLOCKERS)
+            if not blockers:
+                Blocker(gameMap, (x, y))
+            elif blockers[0] is not player and blockers[0] not in monsters:
+                gameMap.destroy(blockers[0])
+        yield player, mapper
+
+
+## Repaired heat maps match ones made from scratch, for random changes to the
+# grid and goals.
+def test_repairHeatMap():
+    rng = random.Random(0)
+    for trial in xrange(200):
+        width, height = rng.randint(1, 12), rng.randint(1, 12)
+        grid = numpy.array([[rng.randint(0, 2) == 0 for y in xrange(height)]
+                for x in xrange(width)], dtype = numpy.int32)
+        goals = [(rng.randint(0, width - 1), rng.randint(0, height - 1))
+                for i in xrange(rng.randint(1, 3))]
+        heatMap = util.cmap.getHeatMap(grid, goals)
+        for step in xrange(5):
+            changed = set()
+            for i in xrange(rng.randint(0, 4)):
+                pos = (rng.randint(0, width - 1), rng.randint(0, height - 1))
+                grid[pos] = not grid[pos]
+                changed.add(pos)
+            if rng.randint(0, 1):
+                index = rng.randint(0, len(goals) - 1)
+                oldGoal = goals[index]
+                goals[index] = (
+                        min(max(oldGoal[0] + rng.randint(-1, 1), 0), width - 1),
+                        min(max(oldGoal[1] + rng.randint(-1, 1), 0), height - 1))
+                changed.update([oldGoal, goals[index]])
+            result = util.cmap.repairHeatMap(heatMap, grid, goals,
+                    list(changed), 10 ** 6)
+            assert result is not None
+            assert (heatMap == util.cmap.getHeatMap(grid, goals)).all()
+
+
+## A FlowField following a player around a cavern full of moving monsters
+# always agrees with a heat map made from scratch.
+def test_flowField():
+    rng = random.Random(0)
+    flowField = util.flowField.FlowField()
+    for player, mapper in walkCavern(40, 30, 300, 10, rng, .5):
+        heatMap = flowField.update(mapper, [player.pos])
+        assert (heatMap == util.cmap.getHeatMap(mapper.getMap(),
+                [player.pos])).all()
+    assert flowField.numRepairs > 0
+
+
+## Time keeping the player's heat map up to date in a 200x200 cavern with 20
+# monsters, over 1,000 turns where the player moves every turn and 1,000
+# where they only move occasionally, by regenerating it every time and by
+# using a FlowField.
+def speedTest_flowField():
+    numTurns = 1000
+    for moveChance in [1, .1]:
+        for label in ['getHeatMap', 'FlowField']:
+            flowField = util.flowField.FlowField()
+            elapsed = 0
+            for player, mapper in walkCavern(200, 200, numTurns, 20,
+                    random.Random(0), moveChance):
+                start = time.time()
+                if label == 'getHeatMap':
+                    util.cmap.getHeatMap(mapper.getMap(), [player.pos])
+                else:
+                    flowField.update(mapper, [player.pos])
+                elapsed += time.time() - start
+            print "%s, player move chance %s: %.3fms per turn (%d repairs, %d rebuilds)" % (
+                    label, moveChance, elapsed / numTurns * 1000,
+                    flowField.numRepairs, flowField.numRebuilds)
+
+
+## Flee maps are the same regardless of backend, and nowhere is any cell more
+# than one step worse than its best neighbor.
+def test_fleeMap():
+    rng = random.Random(0)
+    for trial in xrange(100):
+        width, height = rng.randint(1, 15), rng.randint(1, 15)
+        grid = numpy.array([[rng.randint(0, 3) == 0 for y in xrange(height)]
+                for x in xrange(width)])
+        goals = [(rng.randint(0, width - 1), rng.randint(0, height - 1))]
+        heatMap = util.heatMap.getHeatMap(grid, goals)
+        fleeMaps = [util.heatMap.getFleeMap(heatMap, grid, backend)
+                for backend in util.heatMap.getAvailableBackends()]
+        for fleeMap in fleeMaps:
+            assert (fleeMap == fleeMaps[0]).all()
+        fleeMap = fleeMaps[0]
+        assert ((fleeMap >= 0) == (heatMap >= 0)).all()
+        for x in xrange(width):
+            for y in xrange(height):
+                if fleeMap[x, y] < 0 or grid[x, y]:
+                    continue
+                for xi in xrange(max(0, x - 1), min(width, x + 2)):
+                    for yi in xrange(max(0, y - 1), min(height, y + 2)):
+                        if fleeMap[xi, yi] >= 0:
+                            assert fleeMap[x, y] <= fleeMap[xi, yi] + 1
+
+
+## The FlowFieldManager hands out the same heat map to everyone who asks for
+# the same thing, and keeps its heat maps accurate as things move around.
+def test_flowFieldManager():
+    rng = random.Random(0)
+    for player, mapper in walkCavern(30, 20, 100, 10, rng, .5):
+        gameMap = mapper.gameMap
+        manager = gameMap.getFlowFieldManager()
+        gridMap = mapper.getMap()
+        heatMap = manager.getHeatMap(container.PLAYERS)
+        assert heatMap is manager.getHeatMap(container.PLAYERS)
+        expected = util.heatMap.getHeatMap(gridMap, [player.pos])
+        assert (heatMap == expected).all()
+        assert (manager.getHeatMap([player.pos]) == expected).all()
+        assert (manager.getFleeMap(container.PLAYERS) ==
+                util.heatMap.getFleeMap(expected, gridMap)).all()
+        assert (manager.getHeatMap(container.PLAYERS, maxDepth = 5) ==
+                util.heatMap.getHeatMap(gridMap, [player.pos], 5)).all()
+        goals = [(1, 1), (28, 18)]
+        assert (manager.getHeatMap(goals) ==
+                util.heatMap.getHeatMap(gridMap, goals)).all()
+    # Old heat maps get thrown away.
+    for i in xrange(util.flowField.MAX_CACHED_FIELDS * 2):
+        manager.getHeatMap([(i % 30, i / 30)])
+    assert len(manager.keyToField) == util.flowField.MAX_CACHED_FIELDS
+
+
+## Time 100 turns of 50 creatures in a 200x200 cavern each finding their way
+# to the player, with a heat map per creature and with shared heat maps.
+def speedTest_flowFieldManager():
+    numTurns = 100
+    numCreatures = 50
+    for label in ['per creature', 'shared']:
+        elapsed = 0
+        for player, mapper in walkCavern(200, 200, numTurns, 20,
+                random.Random(0), 1):
+            manager = mapper.gameMap.getFlowFieldManager()
+            start = time.time()
+            for i in xrange(numCreatures):
+                if label == 'per creature':
+                    util.heatMap.getHeatMap(mapper.getMap(), [player.pos])
+                else:
+                    manager.getHeatMap(container.PLAYERS)
+            elapsed += time.time() - start
+        print "%s: %.2fms per turn" % (label, elapsed / numTurns * 1000)
+
+
+if __name__ == '__main__':
+    test_repairHeatMap()
+    test_flowField()
+    test_fleeMap()
+    test_flowFieldManager()
+    speedTest_flowField()
+    speedTest_flowFieldManager()
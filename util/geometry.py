@@ -1,5 +1,7 @@
 ## This module handles various geometry tasks, like finding lines or circles.
 
+import pathfinding
+
 import copy
 import math
 import numpy
@@ -346,74 +348,16 @@ def generateCone(start, direction):
 # "closed", as well as starting and ending positions (represented as 
 # (x, y) tuples), return a list of (x, y) tuples representing the path from
 # the starting position to the ending position, as generated by the A*
-# search algorithm.
-# Code based on the pseudocode at
-# http://en.wikipedia.org/wiki/A*_search_algorithm
+# search algorithm (see util.pathfinding), or an empty list if there is no
+# such path.
 # By default, we use gridDistance as our heuristic cost function; however, 
-# any heuristic can be supplied.
+# any heuristic can be supplied, as a function that takes a node and the end
+# position. It must never overestimate for the path to be the shortest one.
 def aStarSearch(mapGrid, start, end, heuristic = gridDistance):
-    closedNodes = set() # Nodes we have evaluated
-    # Set of nodes we are currently considering navigating through.
-    openNodes = set([start])
-    # Maps nodes to the node we used to reach them, allowing us to retrace
-    # our steps when we finish. 
-    nodeToPredecessor = dict()
-    
-    # Maps node to cost to get from start to that node.
-    nodeToKnownCost = dict()
-    nodeToKnownCost[start] = 0
-    # Maps node to the result of calling the heuristic. 
-    nodeToHeuristicCache = dict()
-    nodeToHeuristicCache[start] = heuristic(start, end)
-    # This helper function will check the cache for the value of calling
-    # heuristic(node, end), saving us on function calls (though the performance
-    # gains when using the default heuristic are extremely minor, they could
-    # be more significant for more costly heuristics).
-    def heuristicWrap(node):
-        if node in nodeToHeuristicCache:
-            return nodeToHeuristicCache[node]
-        val = heuristic(node, end)
-        nodeToHeuristicCache[node] = val
-        return val
-    # Maps node to estimated cost (i.e. known cost + heuristic cost) to get 
-    # from start to end by way of that node.
-    nodeToEstimatedCost = dict()
-    nodeToEstimatedCost[start] = nodeToKnownCost[start] + heuristicWrap(start)
-
-    while openNodes:
-        # Find the next node with the lowest cost.
-        temp = sorted(openNodes, key = lambda n: heuristicWrap(n))
-        curNode = temp[0]
-        openNodes.remove(curNode)
-        closedNodes.add(curNode)
-        if curNode == end:
-            # All done! Generate the path back from curNode to start.
-            result = [curNode]
-            while curNode is not start:
-                curNode = nodeToPredecessor[curNode]
-                result.append(curNode)
-            # Currently result is from end-to-start, so reverse it. 
-            result.reverse()
-            return result
-        for neighbor in getAdjacent(*curNode, grid = mapGrid):
-            # Ensure that neighbor is a valid (i.e. open) cell.
-            if mapGrid[neighbor[0]][neighbor[1]] != 0:
-                continue
-            # Add 1 for the distance between curNode and neighbor.
-            neighborCost = nodeToKnownCost[curNode] + 1
-            if (neighbor in closedNodes and 
-                    neighborCost >= nodeToKnownCost[neighbor]):
-                # There's a shorter way to get to neighbar than by going
-                # through curNode.
-                continue
-            if (neighbor not in openNodes or 
-                    neighborCost < nodeToKnownCost[neighbor]):
-                # Found a shorter route to neighbor than what we had before.
-                nodeToPredecessor[neighbor] = curNode
-                nodeToKnownCost[neighbor] = neighborCost
-                nodeToEstimatedCost[neighbor] = neighborCost + heuristicWrap(neighbor)
-                openNodes.add(neighbor)
-    # Failed to find a path; return an empty path.
-    return []
+    # Every step, diagonal or not, costs 1, and we may only step into open
+    # cells.
+    return pathfinding.findPath(numpy.ones(mapGrid.shape, dtype = numpy.int),
+            start, end, heuristic = lambda node: heuristic(node, end),
+            directions = pathfinding.ALL_DIRECTIONS, canEnter = (mapGrid == 0))
 
 
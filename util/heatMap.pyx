@@ -1,59 +1,219 @@
+## Generate "heat maps" that represent how far away each cell in a map is from
+# any of a set of goal cells. The heat map can be used to allow entities
+# to move towards those goal cells by simply examining their neighbors and
+# moving to the one with the shortest remaining distance.
+#
+# There are several interchangeable backends, which all give identical
+# results. We use the fastest one available (the C code in util.cmap, if
+# its library has been compiled), unless told otherwise by setBackend().
+
+import collections
+import heapq
 import numpy
 
+try:
+    import cmap
+except OSError:
+    # The compiled _cmap library isn't available.
+    cmap = None
+except ImportError, e:
+    # The library is there but can't be used, most likely because it was
+    # built from an older _cmap.c.
+    print "Not using the compiled heat map code: %s" % e
+    cmap = None
 
-## Generate a "heat map" that represents how far away each cell in the provided
-# map is from any of the goal cells. The heat map can be used to allow entities
-# to move towards those goal cells by simply examining their neighbors and 
-# moving to the one with the shortest remaining distance.
-# \param gridMap A Numpy array where 0 represents "open" and any 
+
+## 8-connected breadth-first search, run in C. See util/_cmap.c.
+def getHeatMapC(blockedMap, goals, maxDepth):
+    heatMap = cmap.getHeatMap(blockedMap, goals)
+    if maxDepth is not None:
+        heatMap[heatMap > maxDepth] = -1
+    return heatMap
+
+
+## Expand a wavefront out from the goals one step at a time, using Numpy to
+# handle every cell in the wavefront at once. We only look at the bounding
+# box of the wavefront (plus a 1-cell margin) on each step.
+def getHeatMapNumpy(blockedMap, goals, maxDepth):
+    width, height = blockedMap.shape
+    heatMap = numpy.empty(blockedMap.shape, dtype = numpy.int32)
+    heatMap.fill(-1)
+    unvisited = ~blockedMap
+    frontier = numpy.zeros(blockedMap.shape, dtype = numpy.bool_)
+    for goal in goals:
+        heatMap[goal] = 0
+        unvisited[goal] = False
+        frontier[goal] = True
+    if not goals:
+        return heatMap
+    xMin = min(x for x, y in goals)
+    xMax = max(x for x, y in goals) + 1
+    yMin = min(y for x, y in goals)
+    yMax = max(y for x, y in goals) + 1
+    depth = 0
+    while maxDepth is None or depth < maxDepth:
+        xMin, xMax = max(xMin - 1, 0), min(xMax + 1, width)
+        yMin, yMax = max(yMin - 1, 0), min(yMax + 1, height)
+        front = frontier[xMin:xMax, yMin:yMax]
+        # Spread the wavefront to all 8 neighbors, by spreading it
+        # horizontally and then vertically.
+        spread = front.copy()
+        spread[1:] |= front[:-1]
+        spread[:-1] |= front[1:]
+        grown = spread.copy()
+        grown[:, 1:] |= spread[:, :-1]
+        grown[:, :-1] |= spread[:, 1:]
+        grown &= unvisited[xMin:xMax, yMin:yMax]
+        xVals = numpy.flatnonzero(grown.any(axis = 1))
+        if not len(xVals):
+            break
+        depth += 1
+        heatMap[xMin:xMax, yMin:yMax][grown] = depth
+        unvisited[xMin:xMax, yMin:yMax] &= ~grown
+        front[:] = grown
+        yVals = numpy.flatnonzero(grown.any(axis = 0))
+        xMin, xMax = xMin + xVals[0], xMin + xVals[-1] + 1
+        yMin, yMax = yMin + yVals[0], yMin + yVals[-1] + 1
+    return heatMap
+
+
+## Plain breadth-first search, with a deque for the queue. We pad the map
+# with a border of blocked cells and flatten it into a list, so that
+# neighbors are just fixed offsets and we never need to do bounds checks.
+def getHeatMapDeque(blockedMap, goals, maxDepth):
+    width, height = blockedMap.shape
+    stride = height + 2
+    padded = numpy.ones((width + 2, height + 2), dtype = numpy.bool_)
+    padded[1:-1, 1:-1] = blockedMap
+    # -1 for blocked cells, -2 for open cells we haven't reached yet.
+    costs = (padded.ravel().astype(numpy.int32) - 2).tolist()
+    offsets = [-stride - 1, -stride, -stride + 1, -1, 1,
+            stride - 1, stride, stride + 1]
+    cellQueue = collections.deque()
+    for x, y in goals:
+        index = (x + 1) * stride + y + 1
+        costs[index] = 0
+        cellQueue.append(index)
+    if maxDepth is None:
+        maxDepth = len(costs)
+    while cellQueue:
+        index = cellQueue.popleft()
+        cost = costs[index] + 1
+        if cost > maxDepth:
+            continue
+        for offset in offsets:
+            neighbor = index + offset
+            if costs[neighbor] == -2:
+                costs[neighbor] = cost
+                cellQueue.append(neighbor)
+    heatMap = numpy.array(costs, dtype = numpy.int32).reshape(
+            (width + 2, height + 2))[1:-1, 1:-1]
+    heatMap[heatMap == -2] = -1
+    return numpy.ascontiguousarray(heatMap)
+
+
+## Python version of util.cmap.relaxHeatMap(): Dijkstra's algorithm, starting
+# from every cell at once.
+def relaxHeatMapPython(heatMap, blockedMap):
+    width, height = heatMap.shape
+    stride = height + 2
+    costs = numpy.pad(heatMap, 1, 'constant', constant_values = -1)
+    costs = costs.ravel().tolist()
+    isBlocked = numpy.pad(blockedMap, 1, 'constant', constant_values = True)
+    isBlocked = isBlocked.ravel().tolist()
+    offsets = [-stride - 1, -stride, -stride + 1, -1, 1,
+            stride - 1, stride, stride + 1]
+    cellQueue = [(cost, index) for index, cost in enumerate(costs)
+            if cost >= 0]
+    heapq.heapify(cellQueue)
+    while cellQueue:
+        cost, index = heapq.heappop(cellQueue)
+        if cost > costs[index]:
+            # Already found a better route here.
+            continue
+        cost += 1
+        for offset in offsets:
+            neighbor = index + offset
+            if not isBlocked[neighbor] and costs[neighbor] > cost:
+                costs[neighbor] = cost
+                heapq.heappush(cellQueue, (cost, neighbor))
+    heatMap[:] = numpy.array(costs, dtype = numpy.int32).reshape(
+            (width + 2, height + 2))[1:-1, 1:-1]
+
+
+## Maps backend names to functions, in order of preference. Each function
+# accepts a boolean "is this cell blocked" array, a list of goals, and a
+# maximum depth (or None), and returns the heat map.
+BACKENDS = collections.OrderedDict()
+if cmap is not None:
+    BACKENDS['c'] = getHeatMapC
+BACKENDS['numpy'] = getHeatMapNumpy
+BACKENDS['deque'] = getHeatMapDeque
+
+## Name of the backend that getHeatMap() uses by default.
+backendName = BACKENDS.keys()[0]
+
+
+## Choose which backend getHeatMap() uses by default.
+def setBackend(name):
+    global backendName
+    if name not in BACKENDS:
+        raise ValueError("Unknown or unavailable heat map backend: %s" % name)
+    backendName = name
+
+
+## Get the name of the backend that getHeatMap() uses by default.
+def getBackend():
+    return backendName
+
+
+## Get the names of all backends we can use, in order of preference.
+def getAvailableBackends():
+    return BACKENDS.keys()
+
+
+## Generate a heat map. Goal cells have a value of 0, and other cells have
+# the number of steps (in any of the 8 directions) needed to reach the
+# nearest goal without passing through closed cells, or -1 if that can't be
+# done (including for closed cells that aren't goals).
+# \param gridMap A Numpy array where 0 represents "open" and any
 #         other value represents "closed"
 # \param goals A list (set, etc.) of (x, y) tuples representing the goal
-#        tiles. 
+#        tiles.
 # \param maxDepth How far out from the goals to search; any locations further
 #        out will have a value of -1 in the result.
-def getHeatMap(gridMap, goals, maxDepth = 10**10):
-    # A Numpy array of integers where each value is 
-    # the distance the corresponding cell in gridMap is from any goal tile.
-    # Start with all non-goal tiles at -1 and all goal tiles at 0.
-    heatMap = numpy.ones(gridMap.shape, dtype = numpy.int32) * -1
-    for x, y in goals:
-        heatMap[(x, y)] = 0
-
-    xVals, yVals = numpy.where(gridMap != 0)
-    # Maps cells we've seen to their costs. Add unreachable cells here so we
-    # never try to reach them.
-    cellToCost = dict([((xVals[i], yVals[i]), -1) for i in xrange(len(xVals))])
-    # Queue of cells waiting to be scanned.
-    cellQueue = []
-    # Max values to feed into xrange when getting neighbors.
-    maxX = gridMap.shape[0]
-    maxY = gridMap.shape[1]
-    for x, y in goals:
-        cellToCost[(x, y)] = 0
-        for xi in xrange(max(0, x - 1), min(maxX, x + 2)):
-            for yi in xrange(max(0, y - 1), min(maxY, y + 2)):
-                if (xi, yi) not in cellToCost and gridMap[xi, yi] == 0: 
-                    cellToCost[(xi, yi)] = 1
-                    heatMap[(xi, yi)] = 1
-                    cellQueue.append((xi, yi))
-
-    # Pop a cell, examine its neighbors, and add any not-yet-processed
-    # neighbors to the queue. This is a simple breadth-first search.
-    while cellQueue:
-        x, y = cellQueue.pop(0)
-        cost = cellToCost[(x, y)]
-        # Find all neighbors for whom we have a new route.
-        # We could use a nested loop here but it's about 10% slower.
-        for dx, dy in [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), 
-                (1, 0), (1, 1)]:
-            neighbor = (x + dx, y + dy)
-            if (neighbor[0] >= 0 and neighbor[0] < maxX and 
-                    neighbor[1] >= 0 and neighbor[1] < maxY):
-                if neighbor not in cellToCost:
-                    cellToCost[neighbor] = cost + 1
-                    heatMap[neighbor] = cost + 1
-                    if cost + 1 < maxDepth:
-                        cellQueue.append(neighbor)
-    return heatMap
+# \param backend Name of the backend to use, or None to use the default.
+def getHeatMap(gridMap, goals, maxDepth = None, backend = None):
+    func = BACKENDS[backend or backendName]
+    return func(numpy.asarray(gridMap) != 0, list(goals), maxDepth)
+
+
+## Distances in flee maps are scaled by this much before relaxing them; see
+# getFleeMap().
+FLEE_SCALE_NUMERATOR = 6
+FLEE_SCALE_DENOMINATOR = 5
 
 
+## Derive a "flee map" from a heat map: moving downhill in it takes you away
+# from the heat map's goals. Simply inverting the heat map would lead fleeing
+# entities into the nearest dead end, so we scale the inverted distances up
+# a bit and then relax the map: each cell costs at most one more than its
+# neighbors. That way, cells that are far from the goals but only reachable
+# by heading back towards them become less attractive than open areas. The
+# result has the same form as a heat map: -1 for unreachable cells,
+# non-negative values elsewhere, with lower values being better.
+# \param heatMap A heat map from getHeatMap().
+# \param gridMap The map that the heat map was generated from.
+# \param backend Name of the backend to use, or None to use the default.
+def getFleeMap(heatMap, gridMap, backend = None):
+    scaled = ((heatMap.astype(numpy.int64) * FLEE_SCALE_NUMERATOR) //
+            FLEE_SCALE_DENOMINATOR)
+    fleeMap = numpy.where(heatMap >= 0, scaled.max() - scaled, -1)
+    fleeMap = numpy.ascontiguousarray(fleeMap, dtype = numpy.int32)
+    blockedMap = numpy.asarray(gridMap) != 0
+    if (backend or backendName) == 'c':
+        cmap.relaxHeatMap(fleeMap,
+                numpy.ascontiguousarray(blockedMap, dtype = numpy.int32))
+    else:
+        relaxHeatMapPython(fleeMap, blockedMap)
+    return fleeMap
@@ -1,7 +1,15 @@
 import pyximport; pyximport.install()
-import cmap
+import heatMap
 
+import distutils.spawn
+import imp
 import numpy
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
 
 def test_getHeatMap():
     mapStrs = ["""000
@@ -54,19 +62,88 @@ def test_getHeatMap():
         mapGrid = numpy.zeros((len(lines[0]), len(lines)))
         for j, line in enumerate(lines):
             mapGrid[:, j] = map(int, line)
-        result = cmap.getHeatMap(mapGrid, goals[i])
-        if numpy.any(result != expected[i]):
-            print "Test %d failed" % i
-            print "Expected:\n", expected[i]
-            print "Got:\n", result
-        assert numpy.all(result == expected[i])
+        for backend in heatMap.getAvailableBackends():
+            result = heatMap.getHeatMap(mapGrid, goals[i], backend = backend)
+            if numpy.any(result != expected[i]):
+                print "Test %d failed for backend %s" % (i, backend)
+                print "Expected:\n", expected[i]
+                print "Got:\n", result
+            assert numpy.all(result == expected[i])
 
+## All backends give identical results for random maps, goals and depths.
+def test_backendsAgree():
+    rng = random.Random(0)
+    backends = heatMap.getAvailableBackends()
+    for trial in xrange(300):
+        width, height = rng.randint(1, 20), rng.randint(1, 20)
+        density = rng.random()
+        grid = numpy.array([[rng.random() < density for y in xrange(height)]
+                for x in xrange(width)], dtype = numpy.float32)
+        goals = [(rng.randint(0, width - 1), rng.randint(0, height - 1))
+                for i in xrange(rng.randint(0, 3))]
+        maxDepth = rng.choice([None, 0, 1, 2, 5])
+        results = [heatMap.getHeatMap(grid, goals, maxDepth, backend)
+                for backend in backends]
+        for backend, result in zip(backends, results):
+            assert result.dtype == numpy.int32
+            assert numpy.all(result == results[0]), backend
+
+
+## A _cmap.so built from an older _cmap.c, which only has burnHeatMap, makes
+# util.cmap raise ImportError (which heatMap handles by falling back to
+# another backend) rather than AttributeError.
+def test_staleLibrary():
+    if distutils.spawn.find_executable('gcc') is None:
+        print "No gcc; skipping test_staleLibrary"
+        return
+    tempDir = tempfile.mkdtemp()
+    try:
+        sourcePath = os.path.join(tempDir, '_cmap.c')
+        with open(sourcePath, 'w') as sourceFile:
+            sourceFile.write("int burnHeatMap(void) { return 0; }\n")
+        subprocess.check_call(['gcc', sourcePath, '-o',
+                os.path.join(tempDir, '_cmap.so'), '-fPIC', '-shared'])
+        modulePath = os.path.join(tempDir, 'cmap.py')
+        shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                'cmap.py'),
+                modulePath)
+        try:
+            imp.load_source('staleCmap', modulePath)
+        except ImportError, e:
+            assert 'Rebuild' in str(e)
+        else:
+            assert False, "Loaded an out-of-date _cmap.so"
+    finally:
+        shutil.rmtree(tempDir)
+
+
+## Make a map that's open except for scattered blocks of wall.
+def makeBlockyGrid(width, height, rng):
+    grid = numpy.zeros((width, height))
+    for i in xrange(width * height / 50):
+        x, y = rng.randint(0, width - 1), rng.randint(0, height - 1)
+        grid[x:x + rng.randint(1, 8), y:y + rng.randint(1, 8)] = 1
+    return grid
+
+
+## Time each backend on an empty 360x240 map and a 200x200 map with walls
+# in it.
 def speedTest_getHeatMap():
-    for i in xrange(10):
-        grid = numpy.zeros((360, 240))
-        cmap.getHeatMap(grid, [(0, 0)])
+    rng = random.Random(0)
+    maps = [('empty 360x240', numpy.zeros((360, 240))),
+            ('blocky 200x200', makeBlockyGrid(200, 200, rng))]
+    for label, grid in maps:
+        grid[0, 0] = 0
+        for backend in heatMap.getAvailableBackends():
+            numTrials = 10
+            start = time.time()
+            for i in xrange(numTrials):
+                heatMap.getHeatMap(grid, [(0, 0)], backend = backend)
+            print "%s, %s: %.2fms per heat map" % (label, backend,
+                    (time.time() - start) / numTrials * 1000)
 
 if __name__ == '__main__':
     test_getHeatMap()
-    import cProfile
-    cProfile.runctx('speedTest_getHeatMap()', locals(), globals(), 'profiling.txt')
+    test_backendsAgree()
+    test_staleLibrary()
+    speedTest_getHeatMap()
@@ -24,8 +24,15 @@ def getId(input = None):
 # (e.g. from a previous session of the program) and need to ensure there will
 # be no ID conflicts.
 def setId(obj, newId):
+    obj.id = newId
+    reserveId(newId)
+
+
+## Ensure that any IDs generated by getId() from this point onwards will be
+# higher than the given value, without giving that ID to anything yet (e.g.
+# because an object with that ID may be created later).
+def reserveId(newId):
     with idLock:
-        obj.id = newId
         global globalId
         globalId = max(globalId, newId + 1)
 
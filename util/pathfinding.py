@@ -0,0 +1,134 @@
+## A* search over grids of costs, shared by everything that wants the
+# cheapest route from one place on a grid to another: util.geometry's
+# aStarSearch() and the A* tunneller in mapgen.connection.
+#
+# Grids are NumPy arrays indexed by [x, y]; internally we deal in flat
+# indices into them (x * height + y), so a search step is some integer
+# arithmetic and a few array reads rather than juggling tuples. The open set
+# is a binary heap of (estimated total cost, cost so far, flat index)
+# entries. Rather than finding and updating a location's entry when we find a
+# cheaper way to reach it, we just push a new entry, and skip the old one
+# when it comes up (it will be the more expensive of the two). Ties between
+# entries go to the one that is cheaper so far, then to the one with the
+# lower x, and then the lower y, so searches are repeatable.
+#
+# The search only records the locations it reaches, in dicts, so searches
+# that find their goal quickly don't pay for the size of the map.
+
+import heapq
+import numpy
+
+
+## Steps to take for 4-way movement, in the same order as
+# util.geometry.cardinalDirections.
+CARDINAL_DIRECTIONS = ((0, 1), (1, 0), (0, -1), (-1, 0))
+## Steps to take for 8-way movement.
+ALL_DIRECTIONS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1),
+        (1, 0), (1, 1))
+
+
+
+## Find the cheapest path from start to a goal.
+# \param costs Array of how much it costs to step out of each location,
+#        to any of its neighbors (diagonal or not).
+# \param start (x, y) location to start from.
+# \param goal Either the (x, y) location to get to, or a boolean array that
+#        is True for every location that will do.
+# \param heuristic Estimated cost from each location to the nearest goal,
+#        either as an array or as a function that takes an (x, y) location.
+#        It should never overestimate if you want the cheapest path; the
+#        default of None estimates 0 everywhere, i.e. Dijkstra's algorithm.
+# \param directions The steps we may take from each location; use
+#        CARDINAL_DIRECTIONS or ALL_DIRECTIONS for 4- or 8-way movement.
+# \param canEnter Boolean array of which locations we may step into, or
+#        None for all of them.
+# \param canLeave Boolean array of which locations we may step out of, or
+#        None for all of them. We may end at a location we can't leave.
+# \return A list of (x, y) tuples from start to the goal, inclusive, or an
+#         empty list if no goal can be reached.
+def findPath(costs, start, goal, heuristic = None,
+        directions = CARDINAL_DIRECTIONS, canEnter = None, canLeave = None):
+    width, height = costs.shape
+    costs = costs.ravel()
+    if canEnter is not None:
+        canEnter = canEnter.ravel()
+    if canLeave is not None:
+        canLeave = canLeave.ravel()
+    if isinstance(goal, numpy.ndarray):
+        goalIndex = None
+        isGoal = goal.ravel()
+    else:
+        goalIndex = goal[0] * height + goal[1]
+        isGoal = None
+    if heuristic is None:
+        getEstimate = lambda index: 0
+    elif isinstance(heuristic, numpy.ndarray):
+        getEstimate = heuristic.ravel().item
+    else:
+        getEstimate = lambda index: heuristic(divmod(index, height))
+    # Flat index offset, x offset, and y offset for each step we may take.
+    steps = [(dx * height + dy, dx, dy) for dx, dy in directions]
+
+    startIndex = start[0] * height + start[1]
+    # Maps flat indices to the cheapest cost we've found to get there.
+    indexToCost = {startIndex: 0}
+    # Maps flat indices to the flat index we got there from.
+    indexToPrevious = {startIndex: None}
+    openHeap = [(getEstimate(startIndex), 0, startIndex)]
+    while openHeap:
+        estimate, cost, index = heapq.heappop(openHeap)
+        if cost > indexToCost[index]:
+            # We've since found a cheaper way here.
+            continue
+        if index == goalIndex or (isGoal is not None and isGoal.item(index)):
+            return getPath(indexToPrevious, index, height)
+        if canLeave is not None and not canLeave.item(index):
+            continue
+        x, y = divmod(index, height)
+        newCost = cost + costs.item(index)
+        for offset, dx, dy in steps:
+            if not (0 <= x + dx < width and 0 <= y + dy < height):
+                continue
+            newIndex = index + offset
+            if canEnter is not None and not canEnter.item(newIndex):
+                continue
+            if newIndex in indexToCost and indexToCost[newIndex] <= newCost:
+                continue
+            indexToCost[newIndex] = newCost
+            indexToPrevious[newIndex] = index
+            heapq.heappush(openHeap,
+                    (newCost + getEstimate(newIndex), newCost, newIndex))
+    return []
+
+
+## Follow the trail of flat indices back from the given one to the start of
+# the search, and return the (x, y) locations along it, starting with the
+# start.
+def getPath(indexToPrevious, index, height):
+    path = []
+    while index is not None:
+        path.append(divmod(index, height))
+        index = indexToPrevious[index]
+    path.reverse()
+    return path
+
+
+## Return the total cost of following the given path through the given grid
+# of costs, as findPath() reckons it.
+def getPathCost(costs, path):
+    return sum(costs.item(x, y) for x, y in path[:-1])
+
+
+## Make a heuristic array of the number of 4-way steps from each location in
+# a grid of the given shape to the target, times the given cost per step.
+def getManhattanHeuristic(shape, target, stepCost = 1):
+    xs, ys = numpy.indices(shape)
+    return (numpy.abs(xs - target[0]) + numpy.abs(ys - target[1])) * stepCost
+
+
+## Make a heuristic array of the number of 8-way steps from each location in
+# a grid of the given shape to the target, times the given cost per step.
+def getGridDistanceHeuristic(shape, target, stepCost = 1):
+    xs, ys = numpy.indices(shape)
+    return (numpy.maximum(numpy.abs(xs - target[0]),
+            numpy.abs(ys - target[1])) * stepCost)
@@ -0,0 +1,182 @@
+import geometry
+import pathfinding
+
+import numpy
+import random
+import time
+
+
+## Make a random grid of step costs, and a random mask of which cells may be
+# entered.
+def makeRandomGrid(width, height, rng, blockedFraction = .25):
+    costs = numpy.array([[rng.randint(1, 9) for y in xrange(height)]
+            for x in xrange(width)])
+    canEnter = numpy.array([[rng.random() >= blockedFraction
+            for y in xrange(height)] for x in xrange(width)])
+    return costs, canEnter
+
+
+## Find the cost of the cheapest path from start to every cell, the slow
+# and simple way: keep relaxing every step until nothing changes.
+def getAllCostsSlowly(costs, start, directions, canEnter):
+    width, height = costs.shape
+    infinity = float('inf')
+    bestCosts = numpy.empty(costs.shape)
+    bestCosts.fill(infinity)
+    bestCosts[start] = 0
+    isChanged = True
+    while isChanged:
+        isChanged = False
+        for x in xrange(width):
+            for y in xrange(height):
+                if bestCosts[x, y] == infinity:
+                    continue
+                for dx, dy in directions:
+                    newX, newY = x + dx, y + dy
+                    if (not (0 <= newX < width and 0 <= newY < height) or
+                            not canEnter[newX, newY]):
+                        continue
+                    newCost = bestCosts[x, y] + costs[x, y]
+                    if newCost < bestCosts[newX, newY]:
+                        bestCosts[newX, newY] = newCost
+                        isChanged = True
+    return bestCosts
+
+
+## Check that the path starts and ends in the right places, and only takes
+# allowed steps.
+def checkPath(path, start, end, directions, canEnter):
+    assert path[0] == start
+    assert path[-1] == end
+    for (x, y), (newX, newY) in zip(path, path[1:]):
+        assert (newX - x, newY - y) in directions
+        assert canEnter[newX, newY]
+
+
+## Paths cost as little as possible, for 4- and 8-way movement, with and
+# without heuristics, and we get no path at all when there isn't one.
+def test_findPath():
+    rng = random.Random(0)
+    for trial in xrange(20):
+        width, height = rng.randint(2, 15), rng.randint(2, 15)
+        costs, canEnter = makeRandomGrid(width, height, rng)
+        start = (rng.randint(0, width - 1), rng.randint(0, height - 1))
+        for directions, getHeuristic in [
+                (pathfinding.CARDINAL_DIRECTIONS,
+                    pathfinding.getManhattanHeuristic),
+                (pathfinding.ALL_DIRECTIONS,
+                    pathfinding.getGridDistanceHeuristic)]:
+            bestCosts = getAllCostsSlowly(costs, start, directions, canEnter)
+            for i in xrange(5):
+                end = (rng.randint(0, width - 1), rng.randint(0, height - 1))
+                # No step costs less than 1, so these never overestimate.
+                heuristicGrid = getHeuristic(costs.shape, end)
+                heuristics = [None, heuristicGrid,
+                        lambda location: heuristicGrid[location]]
+                for heuristic in heuristics:
+                    path = pathfinding.findPath(costs, start, end,
+                            heuristic = heuristic, directions = directions,
+                            canEnter = canEnter)
+                    if bestCosts[end] == float('inf'):
+                        assert path == []
+                        continue
+                    checkPath(path, start, end, directions, canEnter)
+                    assert (pathfinding.getPathCost(costs, path) ==
+                            bestCosts[end])
+
+
+## Given a mask of goals, we go to the cheapest one to get to, and we may
+# end in, but not pass through, cells we can't leave.
+def test_findPathGoalMask():
+    rng = random.Random(1)
+    for trial in xrange(20):
+        costs, canEnter = makeRandomGrid(12, 10, rng, blockedFraction = 0)
+        canLeave = numpy.array([[rng.random() >= .2 for y in xrange(10)]
+                for x in xrange(12)])
+        start = (rng.randint(0, 11), rng.randint(0, 9))
+        canLeave[start] = True
+        isGoal = numpy.array([[rng.random() < .05 for y in xrange(10)]
+                for x in xrange(12)])
+        bestCosts = getAllCostsSlowly(costs * numpy.where(canLeave, 1, 10 ** 6),
+                start, pathfinding.CARDINAL_DIRECTIONS, canEnter)
+        bestCosts[bestCosts >= 10 ** 6] = float('inf')
+        path = pathfinding.findPath(costs, start, isGoal, canLeave = canLeave)
+        if isGoal[start]:
+            assert path == [start]
+            continue
+        if not path:
+            assert numpy.all(bestCosts[isGoal] == float('inf'))
+            continue
+        assert isGoal[path[-1]]
+        assert all(canLeave[location] for location in path[:-1])
+        assert pathfinding.getPathCost(costs, path) == bestCosts[isGoal].min()
+
+
+## Search for a path the way util.geometry.aStarSearch used to: taking
+# whichever open node looks closest to the end each time, by sorting them.
+def aStarSearchSlowly(mapGrid, start, end):
+    closedNodes = set()
+    openNodes = set([start])
+    nodeToPredecessor = dict()
+    nodeToKnownCost = {start: 0}
+    while openNodes:
+        curNode = sorted(openNodes,
+                key = lambda n: geometry.gridDistance(n, end))[0]
+        openNodes.remove(curNode)
+        closedNodes.add(curNode)
+        if curNode == end:
+            result = [curNode]
+            while curNode is not start:
+                curNode = nodeToPredecessor[curNode]
+                result.append(curNode)
+            result.reverse()
+            return result
+        for neighbor in geometry.getAdjacent(*curNode, grid = mapGrid):
+            if mapGrid[neighbor[0]][neighbor[1]] != 0:
+                continue
+            neighborCost = nodeToKnownCost[curNode] + 1
+            if (neighbor in closedNodes and
+                    neighborCost >= nodeToKnownCost[neighbor]):
+                continue
+            if (neighbor not in openNodes or
+                    neighborCost < nodeToKnownCost[neighbor]):
+                nodeToPredecessor[neighbor] = curNode
+                nodeToKnownCost[neighbor] = neighborCost
+                openNodes.add(neighbor)
+    return []
+
+
+## Time searches across random grids with geometry.aStarSearch, against the
+# old way it used to search, and time searches across grids of random costs,
+# with and without a heuristic. The random grids have a wall most of the way
+# across the middle, so the searches have to explore most of the grid.
+def speedTest_findPath():
+    rng = random.Random(0)
+    for size in [40, 80]:
+        mapGrid = numpy.array([[int(rng.random() < .3) for y in xrange(size)]
+                for x in xrange(size)])
+        mapGrid[size / 2, :-2] = 1
+        mapGrid[size / 2, -2:] = 0
+        mapGrid[0, 0] = mapGrid[-1, 0] = 0
+        start = time.time()
+        oldPath = aStarSearchSlowly(mapGrid, (0, 0), (size - 1, 0))
+        oldTime = time.time() - start
+        start = time.time()
+        newPath = geometry.aStarSearch(mapGrid, (0, 0), (size - 1, 0))
+        newTime = time.time() - start
+        print "%dx%d grid: old search took %.3fs for a %d-step path, A* took %.3fs for a %d-step path" % (size, size, oldTime, len(oldPath), newTime, len(newPath))
+
+    costs = numpy.array([[rng.randint(1, 9) for y in xrange(300)]
+            for x in xrange(300)])
+    end = (299, 299)
+    for name, heuristic in [('no heuristic', None), ('Manhattan heuristic',
+            pathfinding.getManhattanHeuristic(costs.shape, end))]:
+        start = time.time()
+        path = pathfinding.findPath(costs, (0, 0), end, heuristic = heuristic)
+        print "300x300 grid of costs, %s: %.3fs" % (name, time.time() - start)
+
+
+if __name__ == '__main__':
+    test_findPath()
+    test_findPathGoalMask()
+    speedTest_findPath()
@@ -94,19 +94,19 @@ def applyValues(sourceDict, targetDict, shouldOverwrite = False,
 
 
 ## Build a complete record, inheriting from ancestor templates.
-# \param myRecord - The record of the base object being built.
+# \param record - The record of the base object being built.
 # \param templateLoader - Function used to request a new template.
-def buildRecord(baseObject, templateLoader):
+def buildRecord(record, templateLoader):
     # Inherit values from our templates first, so they can be overridden
     # by our own attributes as needed.
     # Always overwrite color because it has no meaning when lists are combined.
     # Always ignore template names for any except our own record.
     completeRecord = {}
-    if 'templates' in baseObject.record and callable(templateLoader):
-        templates = getRecordTemplates(baseObject, templateLoader)
+    if 'templates' in record and callable(templateLoader):
+        templates = getRecordTemplates(record, templateLoader)
         for template in map(templateLoader, templates):
             applyValues(template.record, completeRecord, overwriteKeys = ['color'], ignoreKeys = ['templateName'])
-    applyValues(baseObject.record, completeRecord, overwriteKeys = ['color'])
+    applyValues(record, completeRecord, overwriteKeys = ['color'])
     return completeRecord
 
 
@@ -131,25 +131,20 @@ def applyRecord(target, record):
 
 ## Recursively get all templates for a given item record.
 #  Allows templates to be based on other templates.
-def getRecordTemplates(objWithRecord, templateLoader):
+def getRecordTemplates(record, templateLoader):
     allTemplates = []
 
-    # If no top object passed in, we're at the end of the recursion
-    if not objWithRecord:
-        return allTemplates
-
-    # If the object doesn't have a record field, we can't work
-    # with it, so consider it the end of the recursion
-    if not hasattr(objWithRecord, 'record'):
+    # If no record passed in, we're at the end of the recursion
+    if not record:
         return allTemplates
 
-    # If the object doesn't have any 'templates' in its record,
+    # If the record doesn't have any 'templates' in it,
     # that means we're as far into the template ancestry as we
     # can go; return all the templates we've accumulated.
-    if 'templates' not in objWithRecord.record:
+    if 'templates' not in record:
         return allTemplates
 
-    curTemplates = objWithRecord.record['templates']
+    curTemplates = record['templates']
     # Make sure we're using a list
     if not isinstance(curTemplates, list):
         curTemplates = [curTemplates]
@@ -161,7 +156,8 @@ def getRecordTemplates(objWithRecord, templateLoader):
     # overwritten by a repeat of an earlier one.
     for template in map(templateLoader, curTemplates):
         if template.templateName not in allTemplates:
-            ancestors = getRecordTemplates(template, templateLoader)
+            ancestors = getRecordTemplates(getattr(template, 'record', None),
+                    templateLoader)
             for ancestor in ancestors:
                 if ancestor not in allTemplates:
                     allTemplates.append(ancestor)
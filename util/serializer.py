@@ -1,4 +1,10 @@
+import collections
+import gzip
 import json
+import mmap
+import os
+import re
+import zlib
 import time
 import traceback
 import types
@@ -24,7 +30,30 @@ import util.id
 #   an appropriate dict. 
 #
 # To use the Serializer, create it, add whatever containers and other objects
-# you want to it, and then call its writeFile() function. 
+# you want to it, and then call its writeFile() or writeStreamFile() function.
+#
+# There are two savefile formats. writeFile() produces a single indented JSON
+# dict, with tuples stored in a separate table. writeStreamFile() produces
+# STREAM_HEADER followed by one compact JSON record per line, each generated
+# and written out as we go (so we never hold every serialization in memory at
+# once), with tuples written inline; the whole thing may optionally be gzipped.
+# The Deserializer tells the formats apart on its own.
+#
+# Rather than writing out everything every time, a SaveJournal can write a
+# base savefile (in the stream format) and then append just the objects that
+# have changed since the last save (a "checkpoint") to a journal file next to
+# it. Objects that are already in the savefile, and that have a
+# getCheckpointDict() function, use it instead of getSerializationDict() for
+# checkpoints; it may leave out fields that rarely change. Changes are
+# tracked via markDirty(), which the GameMap calls whenever Things join or
+# leave Containers; anything else that modifies a serialized object in-place
+# (without going through the GameMap) needs to call it too, or that change
+# may not make it into the journal.
+#
+# A lazy Deserializer (see its isLazy parameter) doesn't parse stream savefiles
+# up front; it just notes where each record is, and only creates objects when
+# something refers to them. Bulk object types can make that cheaper still by
+# skipping their constructors; see makeBareInstance().
 # 
 # Note: one of the primary goals of this system is to avoid having any actual
 # code in the savefile. Thus why we don't use pickle or other existing 
@@ -37,6 +66,77 @@ import util.id
 
 
 
+## First line of savefiles written by Serializer.writeStreamFile().
+STREAM_HEADER = 'pyrelStream:1\n'
+
+## Compression level used for compressed stream savefiles. Low levels are
+# much faster to write, and the savefile is highly repetitive anyway.
+COMPRESSION_LEVEL = 1
+
+## First two bytes of gzipped files.
+GZIP_MAGIC = '\x1f\x8b'
+
+## Encoder for stream savefile records: no indentation, no key sorting, and
+# no spaces.
+STREAM_ENCODER = json.JSONEncoder(separators = (',', ':'))
+
+## Matches the start of a record written by encodeRecord(), capturing its ID
+# and type, so that we can index records without parsing them.
+RECORD_PREFIX = re.compile(r'\{"id":(-?\d+|"[^"\\]*"),"type":"(\w+)","data":\{')
+
+## First line of journals written by SaveJournal.
+JOURNAL_HEADER = 'pyrelJournal:1\n'
+
+## Suffix added to a savefile's name to get the name of its journal.
+JOURNAL_SUFFIX = '.journal'
+
+## A SaveJournal writes a new base savefile (discarding the journal) instead
+# of a checkpoint, once the journal has this many checkpoints in it...
+MAX_JOURNAL_CHECKPOINTS = 50
+## ...or is this large, relative to the base savefile.
+MAX_JOURNAL_FRACTION = 1
+
+## If more than this many objects are modified between checkpoints (e.g.
+# because a new level was generated), we stop keeping track, and the next
+# save writes out everything.
+MAX_DIRTY_OBJECTS = 5000
+
+## Maps IDs of objects that have been modified since the last checkpoint to
+# those objects, or None if we have lost track and everything must be saved.
+dirtyObjects = {}
+
+
+## Note that the given objects have been modified, so they need to be
+# included in the next checkpoint. Objects of types that haven't been
+# registered with registerObjectClass() are ignored.
+def markDirty(*objects):
+    global dirtyObjects
+    if dirtyObjects is None:
+        return
+    for obj in objects:
+        if obj.__class__.__name__ in NAME_TO_DESERIALIZATION_FUNCS:
+            dirtyObjects[obj.id] = obj
+    if len(dirtyObjects) > MAX_DIRTY_OBJECTS:
+        dirtyObjects = None
+
+
+## Note that so much has changed that the next save needs to write out
+# everything.
+def markAllDirty():
+    global dirtyObjects
+    dirtyObjects = None
+
+
+## Return the objects modified since the last checkpoint (as per
+# dirtyObjects), and start a new checkpoint.
+def takeDirtyObjects():
+    global dirtyObjects
+    result = dirtyObjects
+    dirtyObjects = {}
+    return result
+
+
+
 ## Fill in data in the provided object by just blindly copying it through with
 # setattr. This can serve as a useful default option for objects that don't
 # need complicated deserialization.
@@ -45,6 +145,27 @@ def basicDataFill(obj, data, gameMap):
         setattr(obj, key, value)
 
 
+## Create an instance of the given class without calling its constructor.
+# This makes a useful constructorFunc (see registerObjectClass()) for common
+# object types whose constructors do a lot of work that filling in their data
+# would undo anyway, as long as the fill function sets every field the object
+# needs.
+def makeBareInstance(cls):
+    if isinstance(cls, types.ClassType):
+        return types.InstanceType(cls)
+    return cls.__new__(cls)
+
+
+## Convert a record (as generated by Serializer.iterRecords()) to a line of
+# JSON for a stream savefile or journal. The fields always come in the same
+# order, so that RECORD_PREFIX can find the ID and type.
+def encodeRecord(record):
+    return '{"id":%s,"type":%s,"data":%s}\n' % (
+            STREAM_ENCODER.encode(record['id']),
+            STREAM_ENCODER.encode(record['type']),
+            STREAM_ENCODER.encode(record['data']))
+
+
 ## Maps strings (representing object class names) to 
 # (constructorFunc, fillFunc) tuples. See the registerObjectClass() function.
 NAME_TO_DESERIALIZATION_FUNCS = {}
@@ -66,11 +187,25 @@ def registerObjectClass(name, constructorFunc, fillFunc = basicDataFill):
 # serializer = Serializer()
 # serializer.addContainer(...) # recursively adds containers and contents
 # serializer.addObject(...) # adds object and anything it's carrying
-# serializer.writeFile(filename)
+# serializer.writeFile(filename) # or writeStreamFile(filename)
+#
+# Objects aren't actually serialized until the savefile is written; see
+# iterRecords().
 class Serializer:
-    def __init__(self):
-        ## Maps object IDs to serializations of those objects.
-        self.idToObjectSerialization = {}
+    ## \param skipIds IDs of objects that don't need to be serialized
+    #        (because they're already in the savefile), even if other objects
+    #        refer to them.
+    # \param checkpointIds IDs of objects that should be serialized with
+    #        their getCheckpointDict() functions, if they have them. See
+    #        SaveJournal.
+    def __init__(self, skipIds = (), checkpointIds = ()):
+        ## See the skipIds parameter.
+        self.skipIds = skipIds
+        ## See the checkpointIds parameter.
+        self.checkpointIds = checkpointIds
+        ## Objects that have been added but not yet serialized, in the order
+        # they will be serialized (GameMap first).
+        self.pendingObjects = collections.deque()
         ## Maps objects to their Pyrel-generated IDs.
         self.objectToId = {}
         ## Maps object IDs to those objects; mostly useful for debugging.
@@ -81,10 +216,13 @@ class Serializer:
         self.tupleId = 0
         ## Maps tuple IDs (above) to the contents of those tuples.
         self.tupleIdToContents = {}
+        ## If True, tuples are serialized inline (as lists whose first element
+        # is "__pyrelTuple"), instead of via self.tupleIdToContents.
+        self.shouldInlineTuples = False
 
 
-    ## Add the specified object to our serialization, as well as any containers
-    # it contains.
+    ## Add the specified object to our serialization. Any objects it refers
+    # to will be added when it is serialized.
     def addObject(self, obj):
         if obj.__class__.__name__ not in NAME_TO_DESERIALIZATION_FUNCS:
             # This object hasn't registered itself as valid for 
@@ -96,61 +234,59 @@ class Serializer:
             if obj is not self.idToObject[obj.id]:
                 raise RuntimeError(u"Tried to serialize multiple objects with the same ID %s: %s vs. %s" % (obj.id, self.idToObject[obj.id], obj))
             return
+        if obj.id in self.skipIds:
+            return
         self.idToObject[obj.id] = obj
-        try:
-            # HACK: check for the GameMap, which we need to keep track of.
-            if obj.__class__.__name__ == mapgen.gameMap.GameMap.__name__:
-                if self.gameMapId is not None:
-                    raise RuntimeError("Tried to serialize multiple GameMap instances.")
-                self.gameMapId = obj.id
-            objectData = obj.getSerializationDict()
-            # Add the object's class name to its serialization so we can 
-            # extract it later.
-            self.idToObjectSerialization[obj.id] = {
-                    'type': obj.__class__.__name__, 
-                    'data': self.cleanDict(objectData, obj)}
-            self.objectToId[obj] = obj.id
-            # Check for object references in the provided dict.
-            self.addObjectData(objectData)
-        except Exception, e:
-            # Add the object we failed on, to make debugging easier.
-            raise RuntimeError("Failed to add object %s: %s\n%s" % (unicode(obj), e, traceback.format_exc()))
-
-
-    ## Recursively examine the provided dictionary of object data for
-    # references to other objects, which also need to be added to the 
-    # serialization.
-    def addObjectData(self, data):
-        for key, value in data.iteritems():
-            if self.getIsObjectReference(key):
-                self.addObject(key)
-            if self.getIsObjectReference(value):
-                self.addObject(value)
-            elif isinstance(value, list):
-                # Check each element of the list
-                for entry in value:
-                    if self.getIsObjectReference(entry):
-                        self.addObject(entry)
-            elif isinstance(value, dict):
-                # Recurse
-                self.addObjectData(value)
-            # Otherwise: don't care about the type.
-
-
-    ## Write out our serialization to the given filename.
+        self.objectToId[obj] = obj.id
+        # HACK: check for the GameMap, which we need to keep track of, and
+        # which needs to be loaded before any other objects.
+        if obj.__class__.__name__ == mapgen.gameMap.GameMap.__name__:
+            if self.gameMapId is not None:
+                raise RuntimeError("Tried to serialize multiple GameMap instances.")
+            self.gameMapId = obj.id
+            self.pendingObjects.appendleft(obj)
+        else:
+            self.pendingObjects.append(obj)
+
+
+    ## Generate serializations of our objects, one at a time, as dicts with
+    # 'id', 'type' (class name), and 'data' (cleaned serialization dict)
+    # fields. Serializing an object adds any objects it refers to, so they
+    # will be generated later on. The GameMap comes first.
+    def iterRecords(self):
+        if self.gameMapId is None:
+            raise RuntimeError("No GameMap provided for serialization.")
+        while self.pendingObjects:
+            obj = self.pendingObjects.popleft()
+            try:
+                if (obj.id in self.checkpointIds and
+                        hasattr(obj, 'getCheckpointDict')):
+                    objectData = obj.getCheckpointDict()
+                else:
+                    objectData = obj.getSerializationDict()
+                yield {'id': obj.id, 'type': obj.__class__.__name__,
+                        'data': self.cleanDict(objectData, obj)}
+            except Exception, e:
+                # Add the object we failed on, to make debugging easier.
+                raise RuntimeError("Failed to add object %s: %s\n%s" % (unicode(obj), e, traceback.format_exc()))
+
+
+    ## Write out our serialization to the given filename, as a single JSON
+    # dict.
     def writeFile(self, filename):
+        self.shouldInlineTuples = False
+        idToObjectDump = {}
+        for record in self.iterRecords():
+            idToObjectDump[record['id']] = {'type': record['type'],
+                    'data': record['data']}
+
         handle = open(filename, 'w')
         handle.write('{\n')
         
         # Do a special dump of the GameMap object, since it needs to be 
         # loaded before any other objects and thus needs to be easily-found
         # when deserializing.
-        if self.gameMapId is None:
-            raise RuntimeError("No GameMap provided for serialization.")
-        try:
-            serialization = self.idToObjectSerialization[self.gameMapId]
-        except Exception, e:
-            raise RuntimeError("Failed to sanitize serialization for GameMap: %s\n%s" % (e, traceback.format_exc()))
+        serialization = idToObjectDump.pop(self.gameMapId)
         output = json.dumps(serialization, sort_keys = True, indent = 2)
         handle.write('"gameMap": %s,\n\n' % output)
 
@@ -161,8 +297,6 @@ class Serializer:
         handle.write('"tuples": %s,\n\n' % output)
 
         # Now the objects themselves. 
-        idToObjectDump = dict(self.idToObjectSerialization)
-        del idToObjectDump[self.gameMapId]
         output = json.dumps(idToObjectDump, sort_keys = True, indent = 2)
         handle.write('"objects": %s' % output)
 
@@ -170,6 +304,21 @@ class Serializer:
         handle.close()
 
 
+    ## Write out our serialization to the given filename, in the stream
+    # format: STREAM_HEADER, then one record (see iterRecords()) per line.
+    # \param shouldCompress If True, gzip the file.
+    def writeStreamFile(self, filename, shouldCompress = False):
+        self.shouldInlineTuples = True
+        if shouldCompress:
+            handle = gzip.open(filename, 'wb', COMPRESSION_LEVEL)
+        else:
+            handle = open(filename, 'wb')
+        with handle:
+            handle.write(STREAM_HEADER)
+            for record in self.iterRecords():
+                handle.write(encodeRecord(record))
+
+
     ## Given a dict, ensure that it's ready for serialization. We do some
     # replacements (see cleanValue() below) and 
     # ensure that everything is of a valid type. We also recurse through
@@ -180,6 +329,10 @@ class Serializer:
         result = {}
         for key, value in inputDict.iteritems():
             newKey = self.cleanValue(key, key, *parents)
+            if isinstance(newKey, list):
+                # An inlined tuple. JSON dict keys must be strings, so
+                # encode the tuple as one.
+                newKey = '__pyrelTupleKey:' + STREAM_ENCODER.encode(newKey)
             # HACK: because JSON cannot have dict keys that are anything 
             # besides strings, we will be auto-converting strings of numbers
             # into numbers when we deserialize. Thus we cannot have an actual
@@ -207,6 +360,9 @@ class Serializer:
         elif isinstance(value, set):
             # Convert the set into a list with a special first field.
             return ['__pyrelSet'] + [self.cleanValue(v, value, *parents) for v in value]
+        elif isinstance(value, tuple) and self.shouldInlineTuples:
+            # Convert the tuple into a list with a special first field.
+            return ['__pyrelTuple'] + [self.cleanValue(v, value, *parents) for v in value]
         elif isinstance(value, tuple):
             # Convert the tuple into a string with a reference to the tuple's
             # contents, which are store elsewhere. We do this because tuples
@@ -280,89 +436,423 @@ class Serializer:
 
 
 
+## This class handles saving the game to the same savefile over and over.
+# The first save writes a base savefile (with Serializer.writeStreamFile());
+# subsequent saves append checkpoints to the journal, each of which holds the
+# objects that have changed since the previous save (see markDirty()), any
+# objects that are new since then, the GameMap, and everything in the
+# UPDATERS Container (which change themselves every turn). Once the journal
+# gets too big, we write a new base savefile and start a new journal.
+#
+# The journal consists of JOURNAL_HEADER, followed by one block per
+# checkpoint: a line with the block's length, then that many bytes of
+# zlib-compressed records, one per line (as in Serializer.writeStreamFile()).
+# The Deserializer ignores any incomplete block at the end. Records for objects
+# that are already in the savefile update that object's data, so records made
+# with getCheckpointDict() can leave fields out.
+class SaveJournal:
+    ## \param filename Name of the base savefile.
+    # \param savedIds IDs of all objects in the base savefile and journal, if
+    #        they already exist (e.g. because we just loaded them), or None to
+    #        start over with a new base savefile.
+    # \param numCheckpoints Number of checkpoints already in the journal.
+    def __init__(self, filename, savedIds = None, numCheckpoints = 0):
+        self.filename = filename
+        self.journalFilename = filename + JOURNAL_SUFFIX
+        ## See the savedIds parameter.
+        self.savedIds = savedIds
+        ## See the numCheckpoints parameter.
+        self.numCheckpoints = numCheckpoints
+
+
+    ## Save the given GameMap, with a checkpoint if possible, or a new base
+    # savefile if necessary. Returns True if we wrote a new base savefile.
+    def save(self, gameMap):
+        dirty = takeDirtyObjects()
+        if (dirty is None or self.savedIds is None or
+                not os.path.exists(self.filename) or
+                self.numCheckpoints >= MAX_JOURNAL_CHECKPOINTS or
+                (os.path.exists(self.journalFilename) and
+                    os.path.getsize(self.journalFilename) >
+                    os.path.getsize(self.filename) * MAX_JOURNAL_FRACTION)):
+            self.writeBase(gameMap)
+            return True
+        self.writeCheckpoint(gameMap, dirty.values())
+        return False
+
+
+    ## Write out everything to a new base savefile, and discard the journal.
+    # We write to a temporary file first, so that if something goes wrong
+    # partway, the old savefile and journal are still usable.
+    def writeBase(self, gameMap):
+        serializer = Serializer()
+        serializer.addObject(gameMap)
+        tempFilename = self.filename + '.tmp'
+        serializer.writeStreamFile(tempFilename, shouldCompress = True)
+        if os.path.exists(self.journalFilename):
+            os.remove(self.journalFilename)
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        os.rename(tempFilename, self.filename)
+        self.savedIds = set(serializer.idToObject)
+        self.numCheckpoints = 0
+
+
+    ## Append a checkpoint to the journal, holding the given modified
+    # objects, along with the GameMap, the UPDATERS, and any new objects
+    # that they refer to.
+    def writeCheckpoint(self, gameMap, dirtyObjects):
+        objects = [gameMap] + list(gameMap.getContainer(container.UPDATERS))
+        objects.extend(dirtyObjects)
+        skipIds = self.savedIds.difference(obj.id for obj in objects)
+        serializer = Serializer(skipIds, self.savedIds)
+        for obj in objects:
+            serializer.addObject(obj)
+        serializer.shouldInlineTuples = True
+        block = zlib.compress(''.join(encodeRecord(record)
+                for record in serializer.iterRecords()), COMPRESSION_LEVEL)
+        isNewJournal = not os.path.exists(self.journalFilename)
+        with open(self.journalFilename, 'ab') as handle:
+            if isNewJournal:
+                handle.write(JOURNAL_HEADER)
+            handle.write('%d\n' % len(block))
+            handle.write(block)
+        self.savedIds.update(serializer.idToObject)
+        self.numCheckpoints += 1
+
+
+
 ## This class handles loading savefiles. Usage:
 # deserializer = Deserializer()
 # deserializer.loadFile(filename)
-# creatures = deserializer.getContainer(container.CREATURES) etc...
+# gameMap = deserializer.getGameMap()
+#
+# A lazy Deserializer only indexes stream savefiles in loadFile(), keeping
+# the (decompressed) savefile around and noting where each record is in it.
+# Objects are created the first time something refers to them, or someone
+# asks for them via getGameMap() or getObject(), and filled in right away, so
+# at no point do we hold parsed data for the entire savefile, and records
+# that nothing refers to any more are never parsed at all. Savefiles in the
+# old single-dict format are always loaded in full.
 class Deserializer:
-    def __init__(self):
+    ## \param isLazy If True, load stream savefiles lazily, as above.
+    def __init__(self, isLazy = False):
+        ## See the isLazy parameter.
+        self.isLazy = isLazy
         ## Maps object IDs to those objects.
         self.idToObject = {}
-        ## Maps object IDs to dicts holding the data for those objects.
+        ## Maps object IDs to dicts holding the data for those objects. When
+        # loading lazily, only for objects whose records have been parsed but
+        # that haven't been filled in yet.
         self.idToObjectData = {}
         ## Maps tuple IDs to actual tuples.
         self.tupleIdToContents = {}
+        ## Maps tuple IDs to the unfixed contents of those tuples, from
+        # savefiles generated by Serializer.writeFile().
+        self.tupleIdToData = {}
         ## The newly-created GameMap.
         self.newMap = None
-
-
-    ## Load the specified file, which was generated by Serializer.writeFile(),
-    # and recreate the objects specified by the file. 
+        ## Number of checkpoints we loaded from the savefile's journal (see
+        # SaveJournal).
+        self.numCheckpoints = 0
+        ## When loading lazily, the savefile contents, after the header.
+        self.buffer = None
+        ## When loading lazily, maps the IDs of every object in the savefile
+        # to (type, start, end) tuples, where start and end are the location
+        # of the object's record in self.buffer, or None if it has already
+        # been parsed into self.idToObjectData.
+        self.idToRecord = {}
+        ## When loading lazily, IDs of objects that have been created but not
+        # filled in yet.
+        self.unfilledIds = collections.deque()
+        ## Whether the GameMap has been (or is about to be) filled in.
+        self.isGameMapFilled = False
+
+
+    ## Load the specified file, which was generated by Serializer.writeFile()
+    # or Serializer.writeStreamFile(), along with its journal if it has one
+    # (see SaveJournal), and recreate the objects specified by the file (or,
+    # if we're lazy, get ready to).
     def loadFile(self, filename):
-        import time
         startTime = time.time()
-        with open(filename, 'r') as filehandle:
-            saveData = json.load(filehandle)
+        with open(filename, 'rb') as filehandle:
+            isCompressed = filehandle.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+        if isCompressed:
+            filehandle = gzip.open(filename, 'rb')
+        else:
+            filehandle = open(filename, 'rb')
+        with filehandle:
+            firstLine = filehandle.readline()
+            if firstLine != STREAM_HEADER:
+                self.loadDict(json.loads(firstLine + filehandle.read()),
+                        startTime)
+            elif self.isLazy:
+                self.indexStream(filehandle, isCompressed, startTime)
+            else:
+                self.loadStream(filehandle, startTime)
+        if os.path.exists(filename + JOURNAL_SUFFIX):
+            self.loadJournal(filename + JOURNAL_SUFFIX)
+            print "Loaded %d checkpoints at %.2f" % (self.numCheckpoints,
+                    time.time() - startTime)
+        if self.buffer is not None:
+            # Make certain that new objects won't reuse any of the IDs in
+            # the savefile, whether we end up loading them or not.
+            util.id.reserveId(max(objectId for objectId in self.idToRecord
+                    if isinstance(objectId, (int, long))))
+            return
+
+        # Now that all objects have been created, fix any special references
+        # in their data and fill in the details in the actual objects. 
+        for objectId, obj in self.idToObject.iteritems():
+            self.fillObject(obj, self.idToObjectData[objectId])
+        self.isGameMapFilled = True
+        print "Loading took %.2fs" % (time.time() - startTime)
+
 
+    ## Create the objects in a savefile generated by Serializer.writeFile(),
+    # which has been parsed into the given dict.
+    def loadDict(self, saveData, startTime):
         # Load the GameMap, which we need to be able to hand to the 
         # other object types.
-        # \todo This is pretty hackish, the way we know which parameters to
-        # pull out and pass to the GameMap constructor.
-        gameMapData = saveData['gameMap']
-        self.newMap = self.loadObject(gameMapData['data']['id'], 
-                gameMapData,
-                width = gameMapData['data']['width'], 
-                height = gameMapData['data']['height'])
+        self.loadGameMap(saveData['gameMap']['data']['id'], saveData['gameMap'])
         print "Recreated gameMap at %.2f" % (time.time() - startTime)
 
         for objectId, objectData in saveData['objects'].iteritems():
-            if objectData['type'] not in NAME_TO_DESERIALIZATION_FUNCS:
-                raise KeyError('Attempted to deserialize unregistered object type %s' % objectData['type'])
+            self.checkObjectType(objectData)
             self.loadObject(objectId, objectData, gameMap = self.newMap)
 
         print "Loaded objects at %.2f" % (time.time() - startTime)
 
         # Load our tuples, needed to reconstruct objects.
-        for tupleId, contents in saveData['tuples'].iteritems():
-            contents = tuple([self.fixValue(v) for v in contents])
-            self.tupleIdToContents[tupleId] = contents
+        self.tupleIdToData = saveData['tuples']
+        for tupleId in self.tupleIdToData:
+            self.getTuple(tupleId)
         print "Loaded tuples at %.2f" % (time.time() - startTime)
 
-        # Now that all objects have been created, fix any special references
-        # in their data and fill in the details in the actual objects. 
-        for objectId, obj in self.idToObject.iteritems():
-            objectData = self.fixData(self.idToObjectData[objectId])
-            fillFunc = NAME_TO_DESERIALIZATION_FUNCS[obj.__class__.__name__][1]
-            fillFunc(obj, objectData, self.newMap)
-        print "Loading took %.2fs" % (time.time() - startTime)
+
+    ## Create the objects in a savefile generated by
+    # Serializer.writeStreamFile(), reading records from the given file handle
+    # (just past the STREAM_HEADER line).
+    def loadStream(self, filehandle, startTime):
+        for line in filehandle:
+            record = json.loads(line)
+            self.checkRecord(record, line)
+            if self.newMap is None:
+                # The GameMap always comes first.
+                self.loadGameMap(record['id'], record)
+                print "Recreated gameMap at %.2f" % (time.time() - startTime)
+            else:
+                self.loadObject(record['id'], record, gameMap = self.newMap)
+        if self.newMap is None:
+            raise ValueError("Savefile contains no GameMap")
+        print "Loaded objects at %.2f" % (time.time() - startTime)
+
+
+    ## Index the records in a savefile generated by
+    # Serializer.writeStreamFile(), from the given file handle (just past the
+    # STREAM_HEADER line), without parsing them, except for the GameMap, which
+    # we create (but don't fill in) straight away. Uncompressed savefiles are
+    # memory-mapped rather than read in.
+    def indexStream(self, filehandle, isCompressed, startTime):
+        if isCompressed:
+            self.buffer = filehandle.read()
+            start = 0
+        else:
+            self.buffer = mmap.mmap(filehandle.fileno(), 0,
+                    access = mmap.ACCESS_READ)
+            start = len(STREAM_HEADER)
+        bufferEnd = len(self.buffer)
+        while start < bufferEnd:
+            end = self.buffer.find('\n', start)
+            if end == -1:
+                end = bufferEnd
+            match = RECORD_PREFIX.match(self.buffer, start, end)
+            if match and self.buffer[end - 2:end] == '}}':
+                objectId = self.convertToNumeric(match.group(1).strip('"'))
+                objectType = match.group(2)
+                self.checkObjectType({'type': objectType})
+                self.idToRecord[objectId] = (objectType, start, end)
+            else:
+                # Not written by encodeRecord(); parse it now instead.
+                line = self.buffer[start:end]
+                record = json.loads(line)
+                self.checkRecord(record, line)
+                objectId = self.convertToNumeric(record['id'])
+                self.idToRecord[objectId] = (record['type'], None, None)
+                self.idToObjectData[objectId] = record['data']
+            if self.newMap is None:
+                # The GameMap always comes first.
+                self.loadGameMap(objectId, {'type': self.idToRecord[objectId][0],
+                        'data': self.getRecordData(objectId)})
+            start = end + 1
+        if self.newMap is None:
+            raise ValueError("Savefile contains no GameMap")
+        print "Indexed %d objects at %.2f" % (len(self.idToRecord),
+                time.time() - startTime)
+
+
+    ## Apply the complete checkpoints in the given journal file (see
+    # SaveJournal): later records update the data for existing objects, or
+    # create new ones.
+    def loadJournal(self, filename):
+        with open(filename, 'rb') as filehandle:
+            if filehandle.readline() != JOURNAL_HEADER:
+                raise ValueError("%s is not a savefile journal" % filename)
+            while True:
+                header = filehandle.readline()
+                if not header.endswith('\n') or not header[:-1].isdigit():
+                    # End of the journal, or a partially-written checkpoint.
+                    break
+                block = filehandle.read(int(header))
+                if len(block) < int(header):
+                    break
+                for line in zlib.decompress(block).splitlines():
+                    record = json.loads(line)
+                    self.checkRecord(record, line)
+                    self.loadJournalRecord(record)
+                self.numCheckpoints += 1
+
+
+    ## Apply a single record from a journal.
+    def loadJournalRecord(self, record):
+        objectId = self.convertToNumeric(record['id'])
+        if self.buffer is not None:
+            oldType = self.idToRecord.get(objectId, (None,))[0]
+        elif objectId in self.idToObject:
+            oldType = self.idToObject[objectId].__class__.__name__
+        else:
+            oldType = None
+        if oldType is None:
+            if self.buffer is not None:
+                self.idToRecord[objectId] = (record['type'], None, None)
+                self.idToObjectData[objectId] = record['data']
+            else:
+                self.loadObject(objectId, record, gameMap = self.newMap)
+        elif oldType != record['type']:
+            raise ValueError("Journal changes type of object %s from %s to %s" % (objectId, oldType, record['type']))
+        else:
+            self.getRecordData(objectId).update(record['data'])
+
+
+    ## Make certain the given savefile record (from the given line) has
+    # exactly the fields we expect, and a type we know how to deserialize.
+    def checkRecord(self, record, line):
+        if (not isinstance(record, dict) or
+                sorted(record.keys()) != ['data', 'id', 'type'] or
+                not isinstance(record['data'], dict)):
+            raise ValueError("Malformed savefile record: %s" % line[:100])
+        self.checkObjectType(record)
+
+
+    ## Get the (unfixed) data for the object with the given ID, parsing its
+    # record if necessary.
+    def getRecordData(self, objectId):
+        if objectId not in self.idToObjectData:
+            objectType, start, end = self.idToRecord[objectId]
+            line = self.buffer[start:end]
+            record = json.loads(line)
+            self.checkRecord(record, line)
+            self.idToRecord[objectId] = (objectType, None, None)
+            self.idToObjectData[objectId] = record['data']
+        return self.idToObjectData[objectId]
+
+
+    ## Create the GameMap, given its ID and serialization dict.
+    # \todo This is pretty hackish, the way we know which parameters to
+    # pull out and pass to the GameMap constructor.
+    def loadGameMap(self, objectId, objectData):
+        if objectData['type'] != mapgen.gameMap.GameMap.__name__:
+            raise ValueError("Expected a GameMap, but got a %s" % objectData['type'])
+        self.newMap = self.loadObject(objectId, objectData,
+                width = objectData['data']['width'],
+                height = objectData['data']['height'])
+
+
+    ## Make certain we know how to deserialize the given object.
+    def checkObjectType(self, objectData):
+        if objectData['type'] not in NAME_TO_DESERIALIZATION_FUNCS:
+            raise KeyError('Attempted to deserialize unregistered object type %s' % objectData['type'])
 
 
     ## Load a single object, given its serialization dict and ID.
     def loadObject(self, objectId, objectData, **kwargs):
+        newObject = self.createObject(objectId, objectData['type'], **kwargs)
+        self.idToObjectData[newObject.id] = objectData['data']
+        return newObject
+
+
+    ## Create a blank object of the given type, with the given ID.
+    def createObject(self, objectId, objectType, **kwargs):
         if not objectId:
-            raise ValueError("Trying to load an object of type %s with invalid/blank object ID" % (objectData['type']))
+            raise ValueError("Trying to load an object of type %s with invalid/blank object ID" % (objectType))
         objectId = self.convertToNumeric(objectId)
-        createFunc = NAME_TO_DESERIALIZATION_FUNCS[objectData['type']][0]
+        createFunc = NAME_TO_DESERIALIZATION_FUNCS[objectType][0]
         try:
             newObject = createFunc(**kwargs)
         except Exception, e:
-            raise RuntimeError("Failed to create object of type [%s]: %s\n%s" % (objectData['type'], e, traceback.format_exc()))
+            raise RuntimeError("Failed to create object of type [%s]: %s\n%s" % (objectType, e, traceback.format_exc()))
         util.id.setId(newObject, objectId)
         self.idToObject[objectId] = newObject
-        self.idToObjectData[objectId] = objectData['data']
         return newObject
 
 
-    ## Retrieve the newly-created GameMap
+    ## Fix the references in the given data, and fill in the given object
+    # with it.
+    def fillObject(self, obj, objectData):
+        objectData = self.fixData(objectData)
+        fillFunc = NAME_TO_DESERIALIZATION_FUNCS[obj.__class__.__name__][1]
+        fillFunc(obj, objectData, self.newMap)
+
+
+    ## Fill in every object that has been created but not filled in yet,
+    # creating (and filling in) anything they refer to as we go.
+    def fillObjects(self):
+        while self.unfilledIds:
+            objectId = self.unfilledIds.popleft()
+            objectData = self.getRecordData(objectId)
+            del self.idToObjectData[objectId]
+            self.fillObject(self.idToObject[objectId], objectData)
+
+
+    ## Get the object with the given ID, creating it if we're loading lazily
+    # and haven't done so yet (it gets filled in by fillObjects()). Returns
+    # None if there's no such object.
+    def findObject(self, objectId):
+        result = self.idToObject.get(objectId, None)
+        if result is None and objectId in self.idToRecord:
+            result = self.createObject(objectId, self.idToRecord[objectId][0],
+                    gameMap = self.newMap)
+            self.unfilledIds.append(objectId)
+        return result
+
+
+    ## Retrieve the newly-created GameMap, filling it in (along with
+    # everything it refers to) if necessary.
     def getGameMap(self):
+        if not self.isGameMapFilled:
+            self.isGameMapFilled = True
+            self.unfilledIds.append(self.newMap.id)
+            self.fillObjects()
         return self.newMap
 
 
-    ## Retrieve the specified object by its ID.
+    ## Retrieve the specified object by its ID, filling it in (along with
+    # everything it refers to) if necessary. Objects that refer to the GameMap
+    # get one that won't be filled in until getGameMap() is called.
     def getObject(self, id):
-        if id not in self.idToObject:
+        if self.newMap is not None and id == self.newMap.id:
+            return self.getGameMap()
+        result = self.findObject(id)
+        if result is None:
             raise ValueError("Tried to access nonexistent object with id [%s]" % id)
-        return self.idToObject[id]
+        self.fillObjects()
+        return result
+
+
+    ## Get the IDs of every object in the savefile (and journal), whether
+    # we've loaded them or not. See SaveJournal.
+    def getSavedIds(self):
+        return set(self.idToObject).union(self.idToRecord)
 
 
     ## Given a dict generated by deserializing an object earlier, fix any 
@@ -396,6 +886,9 @@ class Deserializer:
             # individually.
             if len(value) > 0 and value[0] == '__pyrelSet':
                 return set([self.fixValue(v) for v in value[1:]])
+            # Likewise for inlined tuples.
+            if len(value) > 0 and value[0] == '__pyrelTuple':
+                return tuple([self.fixValue(v) for v in value[1:]])
             return [self.fixValue(v) for v in value]
         # Default: return value as-is.
         return value
@@ -411,25 +904,39 @@ class Deserializer:
             # is the name of the function. 
             junk, objectId, funcName = magicString.split(':')
             objectId = self.convertToNumeric(objectId)
-            return getattr(self.idToObject[objectId], funcName)
+            return getattr(self.findObject(objectId), funcName)
         elif magicString.startswith('__pyrelObjectReference'):
             # Generate an object reference. First and only arg is the object ID.
             junk, objectId = magicString.split(':')
             objectId = self.convertToNumeric(objectId)
-            result = self.idToObject.get(objectId, None)
+            result = self.findObject(objectId)
             if result is None:
                 # Couldn't find the object in either location.
                 raise ValueError("Object reference to nonexistent object with ID [%s]" % objectId)
             return result
+        elif magicString.startswith('__pyrelTupleKey'):
+            # An inlined tuple that was used as a dict key, encoded as JSON.
+            junk, contents = magicString.split(':', 1)
+            return self.fixValue(json.loads(contents))
         elif magicString.startswith('__pyrelTuple'):
             junk, tupleId = magicString.split(':')
-            if tupleId not in self.tupleIdToContents:
-                raise ValueError("Tuple reference to nonexistent tuple with ID [%s]" % tupleId)
-            return self.tupleIdToContents[tupleId]
+            return self.getTuple(tupleId)
         else:
             raise RuntimeError("Unrecognized special deserialization string [%s]" % magicString)
 
 
+    ## Get the tuple with the given ID, fixing its contents if we haven't
+    # already. Tuples can contain other tuples, so this may happen before
+    # loadDict() gets around to them.
+    def getTuple(self, tupleId):
+        if tupleId not in self.tupleIdToContents:
+            if tupleId not in self.tupleIdToData:
+                raise ValueError("Tuple reference to nonexistent tuple with ID [%s]" % tupleId)
+            self.tupleIdToContents[tupleId] = tuple(
+                    [self.fixValue(v) for v in self.tupleIdToData[tupleId]])
+        return self.tupleIdToContents[tupleId]
+
+
     # HACK: JSON keys can only be strings, but most of our object IDs (which
     # we use as keys in the serialization) are integers, as may be other 
     # dictionary keys we load. So any time we load a key, we try to convert
@@ -0,0 +1,388 @@
+import pyximport; pyximport.install()
+import mapgen.gameMap
+
+import container
+import util.id
+import util.serializer
+
+import gzip
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+
+## Minimal Thing with a variety of awkward data to serialize.
+class Trinket:
+    def __init__(self, gameMap, pos):
+        self.id = util.id.getId()
+        self.name = 'trinket'
+        self.pos = pos
+        self.friend = None
+        self.callback = None
+        self.data = {}
+        if gameMap is not None:
+            gameMap.addSubscriber(self, pos)
+
+
+    def getGreeting(self):
+        return "Hello from %s" % (self.pos,)
+
+
+    def getSerializationDict(self):
+        return dict(self.__dict__)
+
+
+
+util.serializer.registerObjectClass(Trinket.__name__,
+        lambda gameMap: Trinket(None, None))
+
+
+## Make a small GameMap with some Trinkets in it.
+def makeTrinketMap():
+    gameMap = mapgen.gameMap.GameMap(6, 5)
+    first = Trinket(gameMap, (1, 2))
+    second = Trinket(gameMap, (3, 4))
+    first.friend = second
+    second.callback = first.getGreeting
+    first.data = {(1, (2, 3)): ['nested', (4, 5)], 'flags': set([1, 2]),
+            7: (first, None)}
+    return gameMap, first, second
+
+
+## Write the given GameMap out with the given function, read it back in, and
+# return the new map.
+def roundTrip(gameMap, writeFunc):
+    handle, filename = tempfile.mkstemp()
+    os.close(handle)
+    try:
+        serializer = util.serializer.Serializer()
+        serializer.addObject(gameMap)
+        writeFunc(serializer, filename)
+        deserializer = util.serializer.Deserializer()
+        deserializer.loadFile(filename)
+        return deserializer.getGameMap()
+    finally:
+        os.remove(filename)
+
+
+## Both formats, compressed or not, preserve object references, function
+# pointers, tuples (including as dict keys), and sets.
+def test_roundTrip():
+    for writeFunc in [
+            lambda serializer, filename: serializer.writeFile(filename),
+            lambda serializer, filename: serializer.writeStreamFile(filename),
+            lambda serializer, filename: serializer.writeStreamFile(
+                filename, shouldCompress = True)]:
+        gameMap, first, second = makeTrinketMap()
+        newMap = roundTrip(gameMap, writeFunc)
+        newFirst = newMap.getContainer((1, 2))[0]
+        newSecond = newMap.getContainer((3, 4))[0]
+        assert newFirst.id == first.id and newSecond.id == second.id
+        assert newFirst.pos == (1, 2)
+        assert newFirst.friend is newSecond
+        assert newSecond.callback() == "Hello from (1, 2)"
+        assert newFirst.data == {(1, (2, 3)): ['nested', (4, 5)],
+                'flags': set([1, 2]), 7: (newFirst, None)}
+        assert (newMap.width, newMap.height) == (6, 5)
+
+
+## Stream savefiles are one compact record per line, with the GameMap first.
+def test_streamFormat():
+    gameMap, first, second = makeTrinketMap()
+    handle, filename = tempfile.mkstemp()
+    os.close(handle)
+    try:
+        serializer = util.serializer.Serializer()
+        serializer.addObject(first)
+        serializer.addObject(gameMap)
+        serializer.writeStreamFile(filename)
+        lines = open(filename).readlines()
+    finally:
+        os.remove(filename)
+    assert lines[0] == util.serializer.STREAM_HEADER
+    records = [json.loads(line) for line in lines[1:]]
+    assert records[0]['type'] == 'GameMap'
+    assert len(set(record['id'] for record in records)) == len(records)
+    assert not any(line.startswith(' ') or ': ' in line for line in lines)
+
+
+## Loading a savefile with unregistered types, or records that aren't what
+# we expect, fails.
+def test_refuseBadRecords():
+    gameMap, first, second = makeTrinketMap()
+    for badRecord, errorType in [
+            ({'id': 1, 'type': 'Popen', 'data': {}}, KeyError),
+            ({'id': 1, 'type': 'Trinket', 'data': {}, 'code': 'rm'},
+                ValueError),
+            (['Trinket', 1], ValueError)]:
+        handle, filename = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            serializer = util.serializer.Serializer()
+            serializer.addObject(gameMap)
+            serializer.writeStreamFile(filename, shouldCompress = True)
+            filehandle = gzip.open(filename, 'ab')
+            filehandle.write(json.dumps(badRecord) + '\n')
+            filehandle.close()
+            try:
+                util.serializer.Deserializer().loadFile(filename)
+                assert False
+            except errorType:
+                pass
+        finally:
+            os.remove(filename)
+
+
+## Load the savefile with the given name, and return the new GameMap.
+def loadMap(filename):
+    deserializer = util.serializer.Deserializer()
+    deserializer.loadFile(filename)
+    return deserializer.getGameMap()
+
+
+## A SaveJournal writes a base savefile, then checkpoints with only what has
+# changed, which load back in correctly; and eventually starts over with a new
+# base savefile.
+def test_saveJournal():
+    handle, filename = tempfile.mkstemp()
+    os.close(handle)
+    os.remove(filename)
+    journalFilename = filename + util.serializer.JOURNAL_SUFFIX
+    try:
+        gameMap, first, second = makeTrinketMap()
+        journal = util.serializer.SaveJournal(filename)
+        assert journal.save(gameMap)
+        assert not os.path.exists(journalFilename)
+        gameMap.moveMe(second, (3, 4), (0, 0))
+        third = Trinket(gameMap, (5, 4))
+        first.friend = third
+        util.serializer.markDirty(first)
+        assert not journal.save(gameMap)
+        gameMap.destroy(third)
+        first.data = {'new': True}
+        util.serializer.markDirty(first)
+        assert not journal.save(gameMap)
+        # Only the changed objects went into the journal.
+        journalData = open(journalFilename, 'rb').read()
+        assert len(journalData) < os.path.getsize(filename)
+        # A partially-written checkpoint is ignored.
+        with open(journalFilename, 'ab') as handle:
+            handle.write('500\n' + journalData[-100:])
+        newMap = loadMap(filename)
+        newFirst = newMap.getContainer((1, 2))[0]
+        newSecond = newMap.getContainer((0, 0))[0]
+        assert not newMap.getContainer((3, 4))
+        assert not newMap.getContainer((5, 4))
+        assert newSecond.id == second.id and newSecond.pos == (0, 0)
+        assert newFirst.friend.id == third.id
+        assert newFirst.data == {'new': True}
+        # Eventually we write a new base savefile.
+        for i in xrange(util.serializer.MAX_JOURNAL_CHECKPOINTS):
+            if journal.save(gameMap):
+                break
+        else:
+            assert False
+        assert not os.path.exists(journalFilename)
+    finally:
+        for name in [filename, journalFilename]:
+            if os.path.exists(name):
+                os.remove(name)
+
+
+## A lazy Deserializer gives the same results, from compressed or uncompressed
+# savefiles, with or without a journal, but only creates objects that are
+# asked for or referred to.
+def test_lazyLoad():
+    for shouldCompress in [False, True]:
+        gameMap, first, second = makeTrinketMap()
+        orphan = Trinket(None, None)
+        handle, filename = tempfile.mkstemp()
+        os.close(handle)
+        os.remove(filename)
+        journalFilename = filename + util.serializer.JOURNAL_SUFFIX
+        try:
+            serializer = util.serializer.Serializer()
+            serializer.addObject(gameMap)
+            serializer.addObject(orphan)
+            serializer.writeStreamFile(filename, shouldCompress)
+            journal = util.serializer.SaveJournal(filename,
+                    set(serializer.idToObject))
+            gameMap.moveMe(second, (3, 4), (0, 0))
+            assert not journal.save(gameMap)
+            deserializer = util.serializer.Deserializer(isLazy = True)
+            deserializer.loadFile(filename)
+            assert len(deserializer.idToObject) == 1
+            # New objects won't collide with ones we haven't loaded.
+            assert util.id.getId() > orphan.id
+            newMap = deserializer.getGameMap()
+            newFirst = newMap.getContainer((1, 2))[0]
+            newSecond = newMap.getContainer((0, 0))[0]
+            assert newSecond.id == second.id and newSecond.pos == (0, 0)
+            assert newFirst.friend is newSecond
+            assert newSecond.callback() == "Hello from (1, 2)"
+            assert newFirst.data == {(1, (2, 3)): ['nested', (4, 5)],
+                    'flags': set([1, 2]), 7: (newFirst, None)}
+            assert newMap.getContainer((1, 2)).updateCellFuncs == set()
+            assert orphan.id not in deserializer.idToObject
+            assert deserializer.getObject(orphan.id).name == 'trinket'
+            assert orphan.id in deserializer.getSavedIds()
+        finally:
+            for name in [filename, journalFilename]:
+                if os.path.exists(name):
+                    os.remove(name)
+
+
+## Load the data files needed to make levels.
+def loadDataFiles():
+    import procs.procLoader
+    procs.procLoader.loadFiles()
+    import procs.procData
+    procs.procData.loadFiles()
+    import things.items.itemLoader
+    things.items.itemLoader.loadFiles()
+    import things.creatures.creatureLoader
+    things.creatures.creatureLoader.loadFiles()
+    import things.terrain.terrainLoader
+    things.terrain.terrainLoader.loadFiles()
+
+
+## Make a 120x120 level.
+def makeLevel():
+    loadDataFiles()
+    import things.creatures.player
+    random.seed(0)
+    gameMap = mapgen.gameMap.GameMap(120, 120)
+    things.creatures.player.debugMakePlayer(gameMap)
+    gameMap.makeLevel(1)
+    return gameMap
+
+
+## Time saving and loading a 120x120 level with 10,000 extra items in it, in
+# each savefile format.
+def speedTest_saveLoad():
+    gameMap = makeLevel()
+    openCells = [(x, y) for x in xrange(120) for y in xrange(120)
+            if not gameMap.getHasIntersection((x, y), container.BLOCKERS)]
+    import things.items.itemLoader
+    for i in xrange(10000):
+        things.items.itemLoader.makeItem(('potion', 'Cure Light Wounds'), 0,
+                gameMap, random.choice(openCells))
+    handle, filename = tempfile.mkstemp()
+    os.close(handle)
+    try:
+        for label, writeFunc in [
+                ('JSON', lambda serializer: serializer.writeFile(filename)),
+                ('stream', lambda serializer: serializer.writeStreamFile(filename)),
+                ('compressed stream', lambda serializer:
+                    serializer.writeStreamFile(filename, shouldCompress = True))]:
+            start = time.time()
+            serializer = util.serializer.Serializer()
+            serializer.addObject(gameMap)
+            writeFunc(serializer)
+            saveTime = time.time() - start
+            start = time.time()
+            util.serializer.Deserializer().loadFile(filename)
+            loadTime = time.time() - start
+            print "%s: saving took %.2fs, loading took %.2fs, %.1fMB" % (
+                    label, saveTime, loadTime,
+                    os.path.getsize(filename) / 1000000.0)
+    finally:
+        os.remove(filename)
+
+
+## Loads the savefile named by the first argument, lazily if the second
+# argument is "lazy", and prints how long that took, and how much memory
+# (in kilobytes) we were using before and at most while doing so.
+LOAD_SCRIPT = """
+import pyximport; pyximport.install()
+import mapgen.gameMap
+
+import resource
+import sys
+import time
+import procs.proc
+import util.serializer
+import util.serializer_test
+util.serializer_test.loadDataFiles()
+# Procs register themselves for deserialization when they're first made.
+for procClass in set(procs.proc.PROC_NAME_MAP.values()):
+    procClass(triggerCondition = None, params = None, procLevel = None)
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.time()
+deserializer = util.serializer.Deserializer(isLazy = sys.argv[2] == 'lazy')
+deserializer.loadFile(sys.argv[1])
+deserializer.getGameMap()
+print time.time() - start, baseline, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+"""
+
+
+## Time loading a 120x120 level with 10,000 extra items in it, from a
+# compressed stream savefile, eagerly and lazily, and measure peak memory
+# use while doing so. Each load happens in a fresh process, so that they
+# don't affect each other's peak memory use.
+def speedTest_lazyLoad():
+    gameMap = makeLevel()
+    openCells = [(x, y) for x in xrange(120) for y in xrange(120)
+            if not gameMap.getHasIntersection((x, y), container.BLOCKERS)]
+    import things.items.itemLoader
+    for i in xrange(10000):
+        things.items.itemLoader.makeItem(('potion', 'Cure Light Wounds'), 0,
+                gameMap, random.choice(openCells))
+    handle, filename = tempfile.mkstemp()
+    os.close(handle)
+    try:
+        serializer = util.serializer.Serializer()
+        serializer.addObject(gameMap)
+        serializer.writeStreamFile(filename, shouldCompress = True)
+        rootDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        for mode in ['eager', 'lazy']:
+            output = subprocess.check_output(
+                    [sys.executable, '-c', LOAD_SCRIPT, filename, mode],
+                    cwd = rootDir)
+            loadTime, baseline, peak = output.splitlines()[-1].split()
+            print "%s: loading took %.2fs, peak memory use %.1fMB" % (mode,
+                    float(loadTime), (int(peak) - int(baseline)) / 1000.0)
+    finally:
+        os.remove(filename)
+
+
+## Time saving a 120x120 level over 30 turns of monsters moving around, with a
+# SaveJournal: one full save, then mostly checkpoints.
+def speedTest_saveJournal():
+    gameMap = makeLevel()
+    handle, filename = tempfile.mkstemp()
+    os.close(handle)
+    journal = util.serializer.SaveJournal(filename)
+    timings = {True: [], False: []}
+    try:
+        for turn in xrange(30):
+            for creature in list(gameMap.getContainer(container.CREATURES)):
+                x, y = creature.pos
+                target = (x + random.randint(-1, 1), y + random.randint(-1, 1))
+                if gameMap.getIsInBounds(target):
+                    gameMap.moveMe(creature, creature.pos, target)
+            start = time.time()
+            isFullSave = journal.save(gameMap)
+            timings[isFullSave].append(time.time() - start)
+        for label, isFullSave in [('Full saves', True), ('Checkpoints', False)]:
+            print "%s: %d, %.3fs each" % (label, len(timings[isFullSave]),
+                    sum(timings[isFullSave]) / len(timings[isFullSave]))
+    finally:
+        for name in [filename, filename + util.serializer.JOURNAL_SUFFIX]:
+            if os.path.exists(name):
+                os.remove(name)
+
+
+if __name__ == '__main__':
+    test_roundTrip()
+    test_streamFormat()
+    test_refuseBadRecords()
+    test_saveJournal()
+    test_lazyLoad()
+    speedTest_saveLoad()
+    speedTest_lazyLoad()
+    speedTest_saveJournal()
@@ -0,0 +1,109 @@
+## Weighted random selection, for the allocators. A WeightedTable holds a list
+# of options, each with a weight, and picks among them with probability
+# proportional to their weights. It keeps running totals of the weights, so
+# a pick is a binary search rather than a walk down the list, and takes
+# O(log n) time however many options there are.
+#
+# Building a table still means looking at every possible option, so
+# allocators keep the tables they build in a TableCache, keyed on everything
+# that decides which options are valid and how likely they are, and reuse
+# them for later allocations.
+
+import bisect
+import collections
+import random
+
+
+## Maximum number of tables a TableCache holds by default.
+MAX_CACHED_TABLES = 256
+
+
+
+class WeightedTable:
+    ## \param weightedOptions List of (weight, option) tuples. The order of
+    #         the options doesn't affect how likely each one is, but does
+    #         affect which one a specific roll picks (see getOptionForRoll()).
+    def __init__(self, weightedOptions = []):
+        ## The options, in order.
+        self.options = []
+        ## Running totals of the options' weights.
+        self.cumulativeWeights = []
+        for weight, option in weightedOptions:
+            self.add(weight, option)
+
+
+    ## Add an option to the end of the table.
+    def add(self, weight, option):
+        self.options.append(option)
+        self.cumulativeWeights.append(self.getTotalWeight() + weight)
+
+
+    ## Get the sum of all the options' weights.
+    def getTotalWeight(self):
+        if not self.cumulativeWeights:
+            return 0
+        return self.cumulativeWeights[-1]
+
+
+    ## Get the option the given roll (between 0 and our total weight) lands
+    # on: the first one whose running total is at least the roll. This is the
+    # same option you'd get by going through the options in order,
+    # subtracting each one's weight from the roll until it's no longer
+    # positive. Returns None if the roll is more than our total weight.
+    def getOptionForRoll(self, roll):
+        index = bisect.bisect_left(self.cumulativeWeights, roll)
+        if index == len(self.options):
+            return None
+        return self.options[index]
+
+
+    ## Choose an option at random, in proportion to their weights. Returns
+    # None if we're empty.
+    def choose(self):
+        return self.getOptionForRoll(random.random() * self.getTotalWeight())
+
+
+    def __len__(self):
+        return len(self.options)
+
+
+
+## Holds on to the WeightedTables we've made most recently, by key.
+class TableCache:
+    def __init__(self, maxTables = MAX_CACHED_TABLES):
+        self.maxTables = maxTables
+        ## Maps keys to tables, from least to most recently used.
+        self.keyToTable = collections.OrderedDict()
+
+
+    ## Get the table for the given key, or None if we don't have it.
+    def get(self, key):
+        if key not in self.keyToTable:
+            return None
+        table = self.keyToTable.pop(key)
+        self.keyToTable[key] = table
+        return table
+
+
+    ## Store the table for the given key, replacing any existing one, and
+    # forgetting the least recently used table if we have too many.
+    def set(self, key, table):
+        self.keyToTable.pop(key, None)
+        if len(self.keyToTable) >= self.maxTables:
+            self.keyToTable.popitem(last = False)
+        self.keyToTable[key] = table
+
+
+    ## Get the table for the given key, calling makeTable() to make it if we
+    # don't have it.
+    def getTable(self, key, makeTable):
+        table = self.get(key)
+        if table is None:
+            table = makeTable()
+            self.set(key, table)
+        return table
+
+
+    ## Forget all our tables.
+    def clear(self):
+        self.keyToTable.clear()
@@ -0,0 +1,72 @@
+import pyximport; pyximport.install()
+import mapgen.gameMap
+
+import util.weightedTable
+
+import collections
+import random
+
+
+## Pick an option the way the allocators used to: by going through the
+# options in order, subtracting each one's weight from the roll until it's no
+# longer positive.
+def getOptionByWalking(weightedOptions, roll):
+    for weight, option in weightedOptions:
+        roll -= weight
+        if roll <= 0:
+            return option
+    return None
+
+
+## WeightedTables pick the same option for a given roll as walking the list
+# does, including for rolls at the very ends of the range, and for rolls
+# that are too large.
+def test_getOptionForRoll():
+    rng = random.Random(0)
+    for trial in xrange(200):
+        weightedOptions = [(rng.randint(0, 20), i)
+                for i in xrange(rng.randint(0, 30))]
+        table = util.weightedTable.WeightedTable(weightedOptions)
+        assert len(table) == len(weightedOptions)
+        total = sum(weight for weight, option in weightedOptions)
+        assert table.getTotalWeight() == total
+        rolls = [0, total, total + 1] + [rng.randint(0, total)
+                for i in xrange(20)]
+        for roll in rolls:
+            assert (table.getOptionForRoll(roll) ==
+                    getOptionByWalking(weightedOptions, roll))
+
+
+## Options come up about as often as their weights say they should, and
+# empty tables choose nothing.
+def test_choose():
+    random.seed(0)
+    table = util.weightedTable.WeightedTable([(1, 'a'), (0, 'b'), (3, 'c')])
+    counts = collections.Counter(table.choose() for i in xrange(10000))
+    assert counts['b'] == 0
+    assert 2.7 < counts['c'] / float(counts['a']) < 3.3
+    assert util.weightedTable.WeightedTable().choose() is None
+
+
+## TableCaches hold on to the most recently used tables.
+def test_tableCache():
+    cache = util.weightedTable.TableCache(maxTables = 3)
+    numMade = [0]
+    def makeTable():
+        numMade[0] += 1
+        return util.weightedTable.WeightedTable()
+    tables = [cache.getTable(i, makeTable) for i in xrange(3)]
+    assert numMade[0] == 3
+    assert cache.getTable(0, makeTable) is tables[0]
+    # Key 1 is now the least recently used, so it goes first.
+    cache.getTable(3, makeTable)
+    assert cache.get(1) is None
+    assert cache.get(0) is tables[0] and cache.get(2) is tables[2]
+    cache.clear()
+    assert cache.get(0) is None
+
+
+if __name__ == '__main__':
+    test_getOptionForRoll()
+    test_choose()
+    test_tableCache()